@@ -0,0 +1,597 @@
+"""
+Analítica de ventas sobre resúmenes diarios.
+
+Los reportes (ingresos por día, producto y categoría, promoción contra
+precio de lista y conversión de las transacciones Webpay) se responden solo
+desde tres tablas de resumen:
+
+- sales_daily: unidades y montos por día y producto
+- order_daily: órdenes, unidades, montos y promoción por día
+- payment_daily: transacciones resueltas por día y estado
+
+así un rango de un año lee a lo sumo unos cientos de filas por producto en
+vez de agrupar orders y order_items en la base de datos del checkout.
+
+Los resúmenes se mantienen de forma incremental. Triggers de Postgres
+registran en analytics_events cada orden que pasa a completed y
+cada transacción que llega a un estado final, en la misma transacción del
+cambio: cubren el retorno de Webpay, la conciliación y cualquier otra
+escritura. El checkout solo paga un INSERT en una tabla sin filas
+compartidas; la agregación (ON CONFLICT ... DO UPDATE sobre las filas del
+día) la hace drain() en el worker (ver worker.py --rollup-interval). Cada
+lote borra sus eventos y suma sus montos en una sola sentencia, de modo que
+un evento se cuenta exactamente una vez.
+
+El día es el de creación de la orden (o de la transacción) en
+ANALYTICS_TIMEZONE. El precio de lista de una unidad vendida en promoción
+es el del producto al consolidar la orden, segundos después del pago.
+Cambiar ANALYTICS_TIMEZONE requiere reconstruir los resúmenes:
+
+    python analytics.py --rebuild
+    python analytics.py --export ventas.csv --group-by product --from 2024-01-01 --to 2024-12-31
+"""
+import argparse
+import io
+import logging
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from flask import current_app
+from sqlalchemy import DDL, event
+
+from catalog_service import InvalidQueryError
+from extensions import db
+from models import AnalyticsEvent, Category, OrderDaily, PaymentDaily, ProductListing, SalesDaily
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'America/Santiago'
+
+FINAL_PAYMENT_STATUSES = ('completed', 'failed', 'cancelled')
+
+GROUP_BY = ('day', 'product', 'category')
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 3 * 366
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# Eventos consolidados por sentencia
+DRAIN_BATCH = 5000
+
+# Clave de pg_advisory_xact_lock: una sola consolidación (o reconstrucción) a la vez
+ROLLUP_LOCK = 7_204_511
+
+
+class ExportError(RuntimeError):
+    """Exportación no disponible (falta pandas/openpyxl) o formato no soportado"""
+
+
+def event_trigger_sql(table, kind, statuses):
+    """Triggers que registran en analytics_events las filas de `table` que llegan a `statuses`"""
+    statuses_sql = ', '.join(f"'{status}'" for status in statuses)
+    return f"""
+DROP TRIGGER IF EXISTS {table}_analytics_insert ON {table};
+CREATE TRIGGER {table}_analytics_insert AFTER INSERT ON {table}
+    FOR EACH ROW WHEN (NEW.status IN ({statuses_sql}))
+    EXECUTE FUNCTION analytics_event('{kind}');
+
+DROP TRIGGER IF EXISTS {table}_analytics_update ON {table};
+CREATE TRIGGER {table}_analytics_update AFTER UPDATE OF status ON {table}
+    FOR EACH ROW WHEN (NEW.status IN ({statuses_sql}) AND OLD.status NOT IN ({statuses_sql}))
+    EXECUTE FUNCTION analytics_event('{kind}');
+"""
+
+
+# Triggers por fila con WHEN y no por sentencia con tablas de transición: las filas que no cambian
+# de estado no ejecutan la función, y un UPDATE masivo no depende del plan de un JOIN entre
+# old_rows y new_rows (sin estadísticas)
+TRIGGERS_SQL = """
+CREATE OR REPLACE FUNCTION analytics_event() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO analytics_events (kind, ref_id) VALUES (TG_ARGV[0], NEW.id);
+    RETURN NULL;
+END $$;
+""" + (event_trigger_sql('orders', 'order', ('completed',))
+       + event_trigger_sql('webpay_transactions', 'payment', FINAL_PAYMENT_STATUSES))
+
+DROP_TRIGGERS_SQL = ''.join(f"""
+DROP TRIGGER IF EXISTS {table}_analytics_update ON {table};
+DROP TRIGGER IF EXISTS {table}_analytics_insert ON {table};
+""" for table in ('webpay_transactions', 'orders')) + 'DROP FUNCTION IF EXISTS analytics_event();\n'
+
+# db.create_all() también instala los triggers; en producción los crea la migración
+event.listen(AnalyticsEvent.__table__, 'after_create', DDL(TRIGGERS_SQL).execute_if(dialect='postgresql'))
+event.listen(AnalyticsEvent.__table__, 'before_drop', DDL(DROP_TRIGGERS_SQL).execute_if(dialect='postgresql'))
+
+
+def rollup_sql(batch, orders, payments):
+    """
+    Sentencia que consume eventos y suma sus órdenes y transacciones a los resúmenes.
+
+    Todo ocurre en una sola sentencia (CTEs que modifican datos, una sola
+    instantánea): los eventos borrados son exactamente los de las órdenes y
+    transacciones sumadas.
+
+    Args:
+        batch (str): DELETE FROM analytics_events ... RETURNING kind, ref_id
+        orders (str): SELECT id, created_at de las órdenes a sumar (puede usar batch)
+        payments (str): SELECT created_at, status, amount de las transacciones a sumar
+    """
+    promo = 'i.price_at_time < p.price::numeric'
+    promo_sums = ('coalesce(sum(quantity) FILTER (WHERE promo), 0), '
+                  'coalesce(sum(revenue) FILTER (WHERE promo), 0), sum(list_value)')
+    return f"""
+    WITH batch AS ({batch}),
+    completed_orders AS ({orders}),
+    resolved_payments AS ({payments}),
+    lines AS (
+        SELECT o.id AS order_id, (o.created_at AT TIME ZONE :tz)::date AS day,
+               coalesce(i.product_id, 0) AS product_id, p.category_id, i.quantity,
+               i.quantity * i.price_at_time AS revenue, {promo} AS promo,
+               i.quantity * CASE WHEN {promo} THEN p.price::numeric ELSE i.price_at_time END AS list_value
+        FROM completed_orders o
+        JOIN order_items i ON i.order_id = o.id
+        LEFT JOIN products p ON p.id = i.product_id
+    ),
+    sales AS (
+        INSERT INTO sales_daily (day, product_id, category_id, order_lines, units, revenue,
+                                 promo_units, promo_revenue, list_value)
+        SELECT day, product_id, category_id, count(*), sum(quantity), sum(revenue), {promo_sums}
+        FROM lines GROUP BY day, product_id, category_id
+        ON CONFLICT (day, product_id) DO UPDATE SET
+            category_id = EXCLUDED.category_id,
+            order_lines = sales_daily.order_lines + EXCLUDED.order_lines,
+            units = sales_daily.units + EXCLUDED.units,
+            revenue = sales_daily.revenue + EXCLUDED.revenue,
+            promo_units = sales_daily.promo_units + EXCLUDED.promo_units,
+            promo_revenue = sales_daily.promo_revenue + EXCLUDED.promo_revenue,
+            list_value = sales_daily.list_value + EXCLUDED.list_value
+        RETURNING 1
+    ),
+    order_totals AS (
+        INSERT INTO order_daily (day, orders, units, revenue, promo_units, promo_revenue, list_value)
+        SELECT day, count(DISTINCT order_id), sum(quantity), sum(revenue), {promo_sums}
+        FROM lines GROUP BY day
+        ON CONFLICT (day) DO UPDATE SET
+            orders = order_daily.orders + EXCLUDED.orders,
+            units = order_daily.units + EXCLUDED.units,
+            revenue = order_daily.revenue + EXCLUDED.revenue,
+            promo_units = order_daily.promo_units + EXCLUDED.promo_units,
+            promo_revenue = order_daily.promo_revenue + EXCLUDED.promo_revenue,
+            list_value = order_daily.list_value + EXCLUDED.list_value
+        RETURNING 1
+    ),
+    payment_totals AS (
+        INSERT INTO payment_daily (day, status, transactions, amount)
+        SELECT (created_at AT TIME ZONE :tz)::date, status, count(*), coalesce(sum(amount), 0)
+        FROM resolved_payments GROUP BY 1, 2
+        ON CONFLICT (day, status) DO UPDATE SET
+            transactions = payment_daily.transactions + EXCLUDED.transactions,
+            amount = payment_daily.amount + EXCLUDED.amount
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM batch) AS events,
+           (SELECT count(*) FROM completed_orders) AS orders,
+           (SELECT count(*) FROM resolved_payments) AS payments"""
+
+
+FINAL_STATUSES_SQL = ', '.join(f"'{status}'" for status in FINAL_PAYMENT_STATUSES)
+
+DRAIN_SQL = rollup_sql(
+    'DELETE FROM analytics_events WHERE id IN (SELECT id FROM analytics_events ORDER BY id LIMIT :limit) '
+    'RETURNING kind, ref_id',
+    "SELECT o.id, o.created_at FROM orders o "
+    "WHERE o.status = 'completed' AND o.id IN (SELECT ref_id FROM batch WHERE kind = 'order')",
+    "SELECT t.created_at, t.status, t.amount FROM webpay_transactions t "
+    f"WHERE t.status IN ({FINAL_STATUSES_SQL}) AND t.id IN (SELECT ref_id FROM batch WHERE kind = 'payment')"
+)
+
+REBUILD_SQL = rollup_sql(
+    'DELETE FROM analytics_events RETURNING kind, ref_id',
+    "SELECT id, created_at FROM orders WHERE status = 'completed'",
+    f"SELECT created_at, status, amount FROM webpay_transactions WHERE status IN ({FINAL_STATUSES_SQL})"
+)
+
+
+def timezone():
+    return current_app.config.get('ANALYTICS_TIMEZONE') or DEFAULT_TIMEZONE
+
+
+def drain(batch_size=DRAIN_BATCH):
+    """
+    Consolida los eventos pendientes en los resúmenes, en lotes de batch_size.
+
+    Cada lote es una transacción; si otro proceso está consolidando, espera
+    su turno (pg_advisory_xact_lock).
+
+    Returns:
+        dict: events, orders y payments consolidados
+    """
+    totals = {'events': 0, 'orders': 0, 'payments': 0}
+    while True:
+        try:
+            db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': ROLLUP_LOCK})
+            row = db.session.execute(db.text(DRAIN_SQL), {'limit': batch_size, 'tz': timezone()}).one()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for name in totals:
+            totals[name] += getattr(row, name)
+        if row.events < batch_size:
+            break
+    if totals['events']:
+        logger.info("Resúmenes de ventas actualizados", extra=totals)
+    return totals
+
+
+def rebuild():
+    """
+    Recalcula todos los resúmenes desde orders y webpay_transactions y hace commit.
+
+    Returns:
+        dict: events descartados, orders y payments sumados
+    """
+    try:
+        db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': ROLLUP_LOCK})
+        for model in (SalesDaily, OrderDaily, PaymentDaily):
+            db.session.execute(db.delete(model))
+        row = db.session.execute(db.text(REBUILD_SQL), {'tz': timezone()}).one()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'events': row.events, 'orders': row.orders, 'payments': row.payments}
+
+
+class AnalyticsRollup(threading.Thread):
+    """Hilo que consolida los eventos pendientes cada `interval` segundos"""
+
+    def __init__(self, app, interval=30):
+        super().__init__(name='analytics-rollup', daemon=True)
+        self.app = app
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    drain()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error al actualizar los resúmenes de ventas: {str(e)}")
+                self._stopping.wait(self.interval)
+
+
+def today():
+    """Fecha actual en ANALYTICS_TIMEZONE"""
+    return db.session.scalar(db.text('SELECT (now() AT TIME ZONE :tz)::date'), {'tz': timezone()})
+
+
+def parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise InvalidQueryError(f"{name} debe ser una fecha YYYY-MM-DD")
+
+
+def parse_range(args):
+    """
+    Rango de días (ambos inclusive) de date_from y date_to; por defecto los
+    últimos DEFAULT_RANGE_DAYS días.
+
+    Returns:
+        tuple: (date_from, date_to)
+    """
+    date_to = parse_date(args.get('date_to'), 'date_to') or today()
+    date_from = parse_date(args.get('date_from'), 'date_from') or date_to - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if date_from > date_to:
+        raise InvalidQueryError("date_from no puede ser posterior a date_to")
+    if (date_to - date_from).days >= MAX_RANGE_DAYS:
+        raise InvalidQueryError(f"El rango no puede superar {MAX_RANGE_DAYS} días")
+    return date_from, date_to
+
+
+def parse_sales_args(args):
+    """
+    Valida los parámetros de /api/admin/analytics/sales.
+
+    Args:
+        args (MultiDict): request.args
+
+    Returns:
+        dict: Parámetros normalizados para sales_report
+    """
+    date_from, date_to = parse_range(args)
+    group_by = args.get('group_by', 'day')
+    if group_by not in GROUP_BY:
+        raise InvalidQueryError(f"group_by no soportado: {group_by}. Use {', '.join(GROUP_BY)}")
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        category_id = int(args['category_id']) if args.get('category_id') else None
+    except ValueError:
+        raise InvalidQueryError("limit y category_id deben ser enteros")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit debe estar entre 1 y {MAX_LIMIT}")
+    if category_id is not None and group_by != 'product':
+        raise InvalidQueryError("category_id solo se admite con group_by=product")
+    return {'date_from': date_from, 'date_to': date_to, 'group_by': group_by,
+            'limit': limit, 'category_id': category_id}
+
+
+def amount(value):
+    return float(value) if value is not None else 0.0
+
+
+def sales_figures(values):
+    """
+    Unidades y montos de una fila agregada, separando las ventas en promoción
+    de las ventas a precio de lista.
+
+    Args:
+        values (Mapping): units, revenue, promo_units, promo_revenue y list_value (None cuenta como 0)
+    """
+    units = int(values.get('units') or 0)
+    revenue = amount(values.get('revenue'))
+    promo_units = int(values.get('promo_units') or 0)
+    promo_revenue = amount(values.get('promo_revenue'))
+    return {
+        'units': units,
+        'revenue': revenue,
+        'promo_units': promo_units,
+        'promo_revenue': promo_revenue,
+        'list_units': units - promo_units,
+        'list_revenue': round(revenue - promo_revenue, 2),
+        # Diferencia con el precio de lista de las unidades vendidas en promoción
+        'discount': round(amount(values.get('list_value')) - revenue, 2),
+        'promo_share': round(promo_revenue / revenue, 4) if revenue else 0.0
+    }
+
+
+ORDER_DAILY_FIGURES = ('orders', 'units', 'revenue', 'promo_units', 'promo_revenue', 'list_value')
+
+
+def sales_by_day(date_from, date_to):
+    rows = db.session.execute(
+        db.select(OrderDaily.day, *(getattr(OrderDaily, name) for name in ORDER_DAILY_FIGURES))
+        .where(OrderDaily.day.between(date_from, date_to))
+    ).all()
+    by_day = {row.day: row for row in rows}
+
+    # Los días sin ventas también aparecen, en cero
+    items = []
+    day = date_from
+    while day <= date_to:
+        values = by_day[day]._mapping if day in by_day else {}
+        items.append({'day': day.isoformat(), 'orders': values.get('orders', 0), **sales_figures(values)})
+        day += timedelta(days=1)
+    return items
+
+
+def sales_by_product(date_from, date_to, limit=DEFAULT_LIMIT, category_id=None):
+    revenue = db.func.sum(SalesDaily.revenue)
+    stmt = (
+        db.select(SalesDaily.product_id,
+                  db.func.max(SalesDaily.category_id).label('category_id'),
+                  db.func.sum(SalesDaily.order_lines).label('orders'),
+                  db.func.sum(SalesDaily.units).label('units'),
+                  revenue.label('revenue'),
+                  db.func.sum(SalesDaily.promo_units).label('promo_units'),
+                  db.func.sum(SalesDaily.promo_revenue).label('promo_revenue'),
+                  db.func.sum(SalesDaily.list_value).label('list_value'))
+        .where(SalesDaily.day.between(date_from, date_to))
+        .group_by(SalesDaily.product_id)
+        .order_by(revenue.desc(), SalesDaily.product_id)
+    )
+    if category_id is not None:
+        stmt = stmt.where(SalesDaily.category_id == category_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    rows = db.session.execute(stmt).all()
+
+    names = dict(db.session.execute(
+        db.select(ProductListing.id, ProductListing.name)
+        .where(ProductListing.id.in_([row.product_id for row in rows]))
+    ).all())
+    return [{'product_id': row.product_id or None, 'name': names.get(row.product_id),
+             'category_id': row.category_id, 'orders': int(row.orders), **sales_figures(row._mapping)}
+            for row in rows]
+
+
+def sales_by_category(date_from, date_to):
+    revenue = db.func.sum(SalesDaily.revenue)
+    rows = db.session.execute(
+        db.select(SalesDaily.category_id,
+                  db.func.sum(SalesDaily.order_lines).label('order_lines'),
+                  db.func.count(db.distinct(SalesDaily.product_id)).label('products'),
+                  db.func.sum(SalesDaily.units).label('units'),
+                  revenue.label('revenue'),
+                  db.func.sum(SalesDaily.promo_units).label('promo_units'),
+                  db.func.sum(SalesDaily.promo_revenue).label('promo_revenue'),
+                  db.func.sum(SalesDaily.list_value).label('list_value'))
+        .where(SalesDaily.day.between(date_from, date_to))
+        .group_by(SalesDaily.category_id)
+        .order_by(revenue.desc(), SalesDaily.category_id)
+    ).all()
+
+    categories = dict(db.session.execute(db.select(Category.id, Category.name)).all())
+    return [{'category_id': row.category_id, 'name': categories.get(row.category_id),
+             'order_lines': int(row.order_lines), 'products': row.products, **sales_figures(row._mapping)}
+            for row in rows]
+
+
+def sales_totals(date_from, date_to):
+    totals = db.session.execute(
+        db.select(*(db.func.sum(getattr(OrderDaily, name)).label(name) for name in ORDER_DAILY_FIGURES))
+        .where(OrderDaily.day.between(date_from, date_to))
+    ).one()
+    figures = sales_figures(totals._mapping)
+    order_count = int(totals.orders or 0)
+    return {'orders': order_count, **figures,
+            'average_order_value': round(figures['revenue'] / order_count, 2) if order_count else 0.0}
+
+
+def pending_events():
+    """Eventos aún no consolidados: los reportes no incluyen esas órdenes y transacciones"""
+    return db.session.scalar(db.select(db.func.count()).select_from(AnalyticsEvent))
+
+
+def sales_report(date_from, date_to, group_by='day', limit=DEFAULT_LIMIT, category_id=None):
+    """
+    Ventas de las órdenes completadas en un rango de días, solo desde los resúmenes.
+
+    Args:
+        date_from (date): Primer día (inclusive)
+        date_to (date): Último día (inclusive)
+        group_by (str): day, product (los `limit` de mayor ingreso) o category
+        limit (int, optional): Productos a entregar con group_by=product (None: todos)
+        category_id (int, optional): Solo productos de esta categoría (group_by=product)
+
+    Returns:
+        dict: items, totals del rango y pending_events
+    """
+    if group_by == 'day':
+        items = sales_by_day(date_from, date_to)
+    elif group_by == 'product':
+        items = sales_by_product(date_from, date_to, limit, category_id)
+    else:
+        items = sales_by_category(date_from, date_to)
+    return {
+        'date_from': date_from.isoformat(),
+        'date_to': date_to.isoformat(),
+        'group_by': group_by,
+        'items': items,
+        'totals': sales_totals(date_from, date_to),
+        'pending_events': pending_events()
+    }
+
+
+def payment_report(date_from, date_to, by_day=False):
+    """
+    Transacciones Webpay resueltas por estado y tasa de conversión
+    (completed / resueltas) en un rango de días, solo desde payment_daily.
+
+    Returns:
+        dict: statuses, resolved, conversion_rate, days (si by_day) y pending_events
+    """
+    rows = db.session.execute(
+        db.select(PaymentDaily.day, PaymentDaily.status, PaymentDaily.transactions, PaymentDaily.amount)
+        .where(PaymentDaily.day.between(date_from, date_to))
+        .order_by(PaymentDaily.day)
+    ).all()
+
+    def summarize(day_rows):
+        statuses = {status: {'transactions': 0, 'amount': 0.0} for status in FINAL_PAYMENT_STATUSES}
+        for row in day_rows:
+            statuses[row.status]['transactions'] += row.transactions
+            statuses[row.status]['amount'] += amount(row.amount)
+        resolved = sum(status['transactions'] for status in statuses.values())
+        completed = statuses['completed']['transactions']
+        return {'statuses': statuses, 'resolved': resolved,
+                'conversion_rate': round(completed / resolved, 4) if resolved else None}
+
+    report = {'date_from': date_from.isoformat(), 'date_to': date_to.isoformat(), **summarize(rows)}
+    if by_day:
+        days = {}
+        for row in rows:
+            days.setdefault(row.day, []).append(row)
+        report['days'] = [{'day': day.isoformat(), **summarize(day_rows)} for day, day_rows in days.items()]
+    report['pending_events'] = pending_events()
+    return report
+
+
+def sales_frame(date_from, date_to, group_by='day', category_id=None):
+    """
+    Reporte de ventas completo (todos los productos) como DataFrame de pandas.
+
+    Raises:
+        ExportError: Si pandas no está instalado
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ExportError("Exportar requiere instalar el paquete 'pandas'")
+
+    items = sales_report(date_from, date_to, group_by, limit=None, category_id=category_id)['items']
+    frame = pd.DataFrame(items)
+    if group_by == 'day':
+        frame['day'] = pd.to_datetime(frame['day'])
+    return frame
+
+
+def export_csv(date_from, date_to, group_by='day', category_id=None):
+    """Reporte de ventas como texto CSV"""
+    buffer = io.StringIO()
+    sales_frame(date_from, date_to, group_by, category_id).to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def export_sales(path, date_from, date_to, group_by='day', category_id=None):
+    """
+    Escribe el reporte de ventas en un archivo .csv o .xlsx.
+
+    Returns:
+        int: Filas escritas
+
+    Raises:
+        ExportError: Si el formato no está soportado o falta pandas/openpyxl
+    """
+    frame = sales_frame(date_from, date_to, group_by, category_id)
+    if path.lower().endswith('.csv'):
+        frame.to_csv(path, index=False)
+    elif path.lower().endswith('.xlsx'):
+        try:
+            frame.to_excel(path, index=False)
+        except ImportError:
+            raise ExportError("Exportar a .xlsx requiere instalar el paquete 'openpyxl'")
+    else:
+        raise ExportError(f"Formato no soportado: {path}. Use .csv o .xlsx")
+    return len(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resúmenes diarios de ventas y pagos')
+    parser.add_argument('--drain', action='store_true', help='Consolida los eventos pendientes')
+    parser.add_argument('--rebuild', action='store_true', help='Recalcula los resúmenes desde las órdenes')
+    parser.add_argument('--export', metavar='ARCHIVO', help='Exporta el reporte de ventas (.csv o .xlsx)')
+    parser.add_argument('--group-by', choices=GROUP_BY, default='day')
+    parser.add_argument('--from', dest='date_from', help='Primer día (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', help='Último día (YYYY-MM-DD)')
+    args = parser.parse_args()
+    if not (args.drain or args.rebuild or args.export):
+        parser.print_help()
+        return 0
+
+    from app import app
+
+    with app.app_context():
+        if args.rebuild:
+            start = time.perf_counter()
+            result = rebuild()
+            print(f"Resúmenes recalculados en {time.perf_counter() - start:.2f} s: "
+                  f"{result['orders']} órdenes, {result['payments']} transacciones")
+        if args.drain:
+            result = drain()
+            print(f"Eventos consolidados: {result['events']} ({result['orders']} órdenes, "
+                  f"{result['payments']} transacciones)")
+        if args.export:
+            try:
+                date_from, date_to = parse_range({'date_from': args.date_from, 'date_to': args.date_to})
+                rows = export_sales(args.export, date_from, date_to, args.group_by)
+            except (InvalidQueryError, ExportError) as e:
+                print(f"Error: {str(e)}", file=sys.stderr)
+                return 1
+            print(f'{rows} filas exportadas a {args.export}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,22 +2,30 @@ from flask import Flask, render_template, request, redirect, url_for, flash, ses
 from werkzeug.security import generate_password_hash, check_password_hash
 from marshmallow import Schema, fields
 import os
-from werkzeug.utils import secure_filename
 from auth import auth_bp
 from dotenv import load_dotenv
 from webpay_plus import WebpayPlus
 from decimal import Decimal
 import json
+import time
 from extensions import db
 from flask_mail import Mail, Message
 from datetime import datetime
+from functools import wraps
 from flask_migrate import Migrate
-from currency_converter import CurrencyConverter
+from currency_converter import CurrencyConverter, RateRefresher, RateUnavailableError, CURRENCY_SERIES
 import logging
 from flasgger import Swagger
+from page_cache import page_cache
+from db_config import engine_options_from_env, dispose_pool_after_fork
+from query_metrics import query_metrics
+from metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from http_client import outbound
+from assets import assets
+from log_config import configure_logging
 
-# Configuración del logger
-logging.basicConfig(level=logging.INFO)
+# Configuración del logger (asíncrono, con redacción de credenciales; ver log_config.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Cargar variables de entorno
@@ -30,7 +38,7 @@ app.secret_key = os.getenv("SECRET_KEY", "dev")
 app.register_blueprint(auth_bp)
 
 # Configuración para subida de archivos
-UPLOAD_FOLDER = 'static/uploads'
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
@@ -64,12 +72,68 @@ swagger_template = {
                 "name": {"type": "string"},
                 "price": {"type": "number"},
                 "image": {"type": "string"},
+                "image_variants": {"type": "object", "description": "Anchos y formatos de las variantes de la imagen (null mientras se generan)"},
                 "description": {"type": "string"},
                 "stock": {"type": "integer"},
                 "is_featured": {"type": "boolean"},
                 "is_promotion": {"type": "boolean"},
                 "promotion_price": {"type": "number"},
-                "category_id": {"type": "integer"}
+                "category_id": {"type": "integer"},
+                "effective_price": {"type": "number", "description": "Precio de venta: el de promoción si corresponde (solo en /api/products con fields)"},
+                "discount_percent": {"type": "integer"},
+                "in_stock": {"type": "boolean"},
+                "category_name": {"type": "string"},
+                "category_icon": {"type": "string"}
+            }
+        },
+        "Order": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "integer"},
+                "status": {"type": "string", "enum": ["pending", "completed", "failed", "cancelled"]},
+                "total_amount": {"type": "number"},
+                "created_at": {"type": "string", "format": "date-time"},
+                "updated_at": {"type": "string", "format": "date-time"},
+                "items": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "product_id": {"type": "integer"},
+                            "name": {"type": "string"},
+                            "image": {"type": "string"},
+                            "quantity": {"type": "integer"},
+                            "price_at_time": {"type": "number"},
+                            "subtotal": {"type": "number"}
+                        }
+                    }
+                },
+                "transactions": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "buy_order": {"type": "string"},
+                            "status": {"type": "string"},
+                            "amount": {"type": "number"},
+                            "authorization_code": {"type": "string"},
+                            "payment_type_code": {"type": "string"},
+                            "card_number": {"type": "string"},
+                            "transaction_date": {"type": "string", "format": "date-time"},
+                            "created_at": {"type": "string", "format": "date-time"}
+                        }
+                    }
+                },
+                "user": {
+                    "type": "object",
+                    "description": "Solo en /api/admin/orders",
+                    "properties": {
+                        "id": {"type": "integer"},
+                        "username": {"type": "string"},
+                        "email": {"type": "string"}
+                    }
+                }
             }
         },
         "CartItem": {
@@ -107,12 +171,80 @@ app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = 86400  # 24 horas
 
+# Pool de conexiones y timeouts (ver db_config.py para las variables de entorno)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env()
+
+# Instrumentación de consultas SQL por endpoint
+app.config['DB_METRICS_ENABLED'] = os.getenv('DB_METRICS_ENABLED', '1') == '1'
+app.config['DB_SLOW_QUERY_MS'] = int(os.getenv('DB_SLOW_QUERY_MS', 200))
+
+# Métricas en formato Prometheus en /metrics
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', '1') == '1'
+# Quién puede leer /metrics: direcciones o redes permitidas y, opcionalmente, un token Bearer
+app.config['METRICS_ALLOWED_IPS'] = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
 # Configuración de la URL base para Webpay
 app.config['BASE_URL'] = os.getenv('BASE_URL', 'http://localhost:5000')
 
+# Credenciales y servidor de Webpay (WEBPAY_BASE_URL apunta a un Webpay falso en pruebas de carga)
+app.config['WEBPAY_COMMERCE_CODE'] = os.getenv('WEBPAY_COMMERCE_CODE')
+app.config['WEBPAY_API_KEY'] = os.getenv('WEBPAY_API_KEY')
+app.config['WEBPAY_INTEGRATION_TYPE'] = os.getenv('WEBPAY_INTEGRATION_TYPE', 'TEST').upper()
+app.config['WEBPAY_BASE_URL'] = os.getenv('WEBPAY_BASE_URL')
+app.config['WEBPAY_TIMEOUT'] = float(os.getenv('WEBPAY_TIMEOUT', 10))
+app.config['WEBPAY_POOL_SIZE'] = int(os.getenv('WEBPAY_POOL_SIZE', 10))
+# Segundos que un retorno repetido espera el resultado del que está confirmando el pago
+app.config['WEBPAY_RETURN_WAIT'] = float(os.getenv('WEBPAY_RETURN_WAIT', 10))
+
+# Llamadas salientes (ver http_client.py): timeout de lectura y conexiones por servicio,
+# timeout de conexión, reintentos y circuit breaker comunes
+app.config['BCENTRAL_TIMEOUT'] = float(os.getenv('BCENTRAL_TIMEOUT', 10))
+app.config['BCENTRAL_POOL_SIZE'] = int(os.getenv('BCENTRAL_POOL_SIZE', 4))
+app.config['GOOGLE_TIMEOUT'] = float(os.getenv('GOOGLE_TIMEOUT', 5))
+app.config['GOOGLE_POOL_SIZE'] = int(os.getenv('GOOGLE_POOL_SIZE', 4))
+app.config['OUTBOUND_CONNECT_TIMEOUT'] = float(os.getenv('OUTBOUND_CONNECT_TIMEOUT', 3.05))
+app.config['OUTBOUND_MAX_RETRIES'] = int(os.getenv('OUTBOUND_MAX_RETRIES', 2))
+app.config['OUTBOUND_RETRY_RATIO'] = float(os.getenv('OUTBOUND_RETRY_RATIO', 0.2))
+app.config['OUTBOUND_BREAKER_FAILURES'] = int(os.getenv('OUTBOUND_BREAKER_FAILURES', 5))
+app.config['OUTBOUND_BREAKER_RESET'] = float(os.getenv('OUTBOUND_BREAKER_RESET', 30))
+
+# Conciliación de transacciones Webpay sin retorno (ver payment_reconciler.py)
+app.config['PAYMENT_RECONCILE_AFTER'] = int(os.getenv('PAYMENT_RECONCILE_AFTER', 15 * 60))
+app.config['PAYMENT_ABANDON_AFTER'] = int(os.getenv('PAYMENT_ABANDON_AFTER', 60 * 60))
+
+# Configuración de la caché de páginas del catálogo
+app.config['PAGE_CACHE_ENABLED'] = os.getenv('PAGE_CACHE_ENABLED', '1') == '1'
+app.config['PAGE_CACHE_BACKEND'] = os.getenv('PAGE_CACHE_BACKEND', 'lru')
+app.config['PAGE_CACHE_REDIS_URL'] = os.getenv('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['PAGE_CACHE_TTL'] = int(os.getenv('PAGE_CACHE_TTL', 300))
+
+# Almacén de carritos y escritura diferida a cart_items
+app.config['CART_FLUSH_INTERVAL'] = float(os.getenv('CART_FLUSH_INTERVAL', 2))
+app.config['CART_ANONYMOUS_TTL'] = int(os.getenv('CART_ANONYMOUS_TTL', 7 * 86400))
+
+# Caché de precios efectivos por producto (carrito y totales)
+app.config['PRICE_CACHE_TTL'] = int(os.getenv('PRICE_CACHE_TTL', 300))
+
+# Límite de la búsqueda de órdenes de administración (ver order_service.py); 0 lo desactiva
+app.config['ORDERS_ADMIN_TIMEOUT_MS'] = int(os.getenv('ORDERS_ADMIN_TIMEOUT_MS', 2000))
+
+# Día de los resúmenes de ventas (ver analytics.py); al cambiarla hay que reconstruirlos
+app.config['ANALYTICS_TIMEZONE'] = os.getenv('ANALYTICS_TIMEZONE', 'America/Santiago')
+
+# Paquetes estáticos con hash (ver assets.py); ASSETS_WATCH los regenera al editar las fuentes
+app.config['ASSETS_AUTO_BUILD'] = os.getenv('ASSETS_AUTO_BUILD', '1') == '1'
+app.config['ASSETS_WATCH'] = os.getenv('ASSETS_WATCH', '0') == '1'
+
 # Inicializar extensiones
 db.init_app(app)
 migrate = Migrate(app, db)
+page_cache.init_app(app)
+query_metrics.init_app(app)
+metrics.init_app(app)
+outbound.init_app(app)
+assets.init_app(app)
+dispose_pool_after_fork(app)
 
 # Inicializar Webpay Plus
 webpay = WebpayPlus(app)
@@ -120,8 +252,45 @@ webpay = WebpayPlus(app)
 # Inicializar el conversor de monedas
 currency_converter = CurrencyConverter()
 
+# Refresco de tasas en segundo plano: /api/convert solo lee el almacén local
+if os.getenv('RATE_REFRESHER_ENABLED', '1') == '1':
+    rate_refresher = RateRefresher(currency_converter)
+    rate_refresher.start()
+
+def collect_rate_ages():
+    """Antigüedad de la última descarga de cada tasa de cambio"""
+    samples = []
+    for code in CURRENCY_SERIES:
+        fetched_at = currency_converter.store.last_fetch(code)
+        if fetched_at is not None:
+            samples.append(({'currency': code}, round(time.time() - fetched_at, 1)))
+    return [{'name': 'exchange_rate_age_seconds', 'type': 'gauge',
+             'help': 'Segundos desde la última descarga de cada tasa', 'samples': samples}]
+
+metrics.register_collector(collect_rate_ages)
+
 # Importar modelos después de inicializar db
-from models import Order, OrderItem, WebpayTransaction, Product, User, CartItem, Category
+from models import Order, Product, ProductListing, User, CartItem, Category
+from cart_service import (get_store_items, parse_cart_operations, apply_cart_operations, cart_totals,
+                          InvalidCartOperationError, UnknownProductError)
+from cart_store import cart_store, merge_session_cart, session_cart_key, user_key
+from catalog_service import list_products, parse_listing_args, parse_bool, InvalidQueryError
+from search_service import search_products, parse_search_args
+from order_service import list_orders, parse_history_args, parse_admin_args, OrderSearchTimeoutError
+from analytics import sales_report, payment_report, export_csv, parse_sales_args, parse_range, ExportError
+from checkout_service import create_order, release_stock, EmptyCartError, InsufficientStockError
+from payment_service import confirm_payment, cancel_payment, UnknownTransactionError
+from jobs import enqueue, job_handler
+from pricing import price_cache, price_lines
+from product_images import attach_image, store_upload, image_url, picture_sources, grid_sizes
+import product_listing  # triggers de product_listings para db.create_all()
+
+cart_store.init_app(app)
+price_cache.init_app(app)
+
+# Datos de <picture>/srcset de las imágenes de productos en las plantillas
+app.jinja_env.globals.update(product_image_url=image_url, product_picture_sources=picture_sources,
+                             grid_sizes=grid_sizes)
 
 # Esquemas para serialización
 class ProductSchema(Schema):
@@ -129,6 +298,7 @@ class ProductSchema(Schema):
     name = fields.Str(required=True)
     price = fields.Float(required=True)
     image = fields.Str()
+    image_variants = fields.Dict(dump_only=True)
     is_promotion = fields.Bool()
     promotion_price = fields.Float()
 
@@ -147,6 +317,7 @@ cart_items_schema = CartItemSchema(many=True)
 # rutas
 # HOME
 @app.route('/')
+@page_cache.cached('catalog')
 def home():
     # Obtener información del usuario desde la sesión
     user = session.get('user') if 'user' in session else None
@@ -154,11 +325,9 @@ def home():
     # Obtener todas las categorías
     categories = Category.query.all()
     
-    # Obtener productos destacados
-    featured_products = Product.query.filter_by(is_featured=True).limit(8).all()
-    
-    # Obtener productos en promoción
-    promotion_products = Product.query.filter_by(is_promotion=True).limit(6).all()
+    # Productos destacados y en promoción, desde la proyección de listados
+    featured_products = ProductListing.query.filter_by(is_featured=True).order_by(ProductListing.id).limit(8).all()
+    promotion_products = ProductListing.query.filter_by(is_promotion=True).order_by(ProductListing.id).limit(6).all()
     
     return render_template('index.html', 
                          user=user,
@@ -168,9 +337,10 @@ def home():
 
 # Ruta para ver productos por categoría
 @app.route('/categoria/<int:category_id>')
+@page_cache.cached('catalog')
 def category_products(category_id):
     category = Category.query.get_or_404(category_id)
-    products = Product.query.filter_by(category_id=category_id).all()
+    products = ProductListing.query.filter_by(category_id=category_id).order_by(ProductListing.id).all()
     user = session.get('user') if 'user' in session else None
     
     return render_template('category_products.html',
@@ -180,6 +350,7 @@ def category_products(category_id):
 
 # PRODUCT DETAIL
 @app.route('/product/<int:product_id>')
+@page_cache.cached('catalog')
 def product_detail(product_id):
     product = Product.query.get_or_404(product_id)
     # Obtener información del usuario desde la sesión
@@ -207,6 +378,7 @@ def login():
                  "auth_type": "local"
              }
              session['user_id'] = user.id
+             merge_session_cart(user.id)
              flash('¡Inicio de sesión exitoso!', 'success')
              return redirect(url_for('home'))
          else:
@@ -287,20 +459,135 @@ def register():
 @app.route('/api/products', methods=['GET'])
 def get_products():
     """
-    Obtener todos los productos
+    Listar productos con paginación por cursor y filtros
     ---
     tags:
       - Productos
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        description: Productos por página (1 a 500, por defecto 50)
+      - name: cursor
+        in: query
+        type: string
+        description: Valor next_cursor de la página anterior
+      - name: sort
+        in: query
+        type: string
+        enum: [id, -updated_at, price, -price]
+        description: >
+          Orden (por defecto id ascendente). price y -price ordenan por precio
+          efectivo; -updated_at, por el último cambio visible en el listado
+      - name: fields
+        in: query
+        type: string
+        description: >
+          Campos separados por coma (por ejemplo id,name,price). Además de los
+          de Product: effective_price, discount_percent, in_stock,
+          category_name y category_icon
+      - name: category_id
+        in: query
+        type: integer
+      - name: is_promotion
+        in: query
+        type: boolean
+      - name: is_featured
+        in: query
+        type: boolean
+      - name: min_price
+        in: query
+        type: number
+        description: Precio efectivo mínimo (el de promoción si corresponde)
+      - name: max_price
+        in: query
+        type: number
+        description: Precio efectivo máximo
+      - name: in_stock
+        in: query
+        type: boolean
     responses:
       200:
-        description: Lista de productos
+        description: Página de productos
         schema:
-          type: array
-          items:
-            $ref: '#/definitions/Product'
+          type: object
+          properties:
+            items:
+              type: array
+              items:
+                $ref: '#/definitions/Product'
+            next_cursor:
+              type: string
+            limit:
+              type: integer
+      400:
+        description: Parámetros inválidos
     """
-    products = Product.query.all()
-    return jsonify(products_schema.dump(products))
+    try:
+        params = parse_listing_args(request.args)
+    except InvalidQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(list_products(**params))
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """
+    Buscar productos por nombre y descripción
+    ---
+    tags:
+      - Productos
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Texto a buscar (admite "frases", -exclusiones y OR)
+      - name: category_id
+        in: query
+        type: integer
+      - name: page
+        in: query
+        type: integer
+        description: Página (por defecto 1)
+      - name: limit
+        in: query
+        type: integer
+        description: Resultados por página (1 a 100, por defecto 20)
+      - name: mode
+        in: query
+        type: string
+        enum: [fulltext, fuzzy]
+        description: Tipo de búsqueda. Por defecto texto completo, con búsqueda aproximada si no hay resultados
+    responses:
+      200:
+        description: Resultados ordenados por relevancia
+        schema:
+          type: object
+          properties:
+            query:
+              type: string
+            mode:
+              type: string
+            items:
+              type: array
+              items:
+                $ref: '#/definitions/Product'
+            page:
+              type: integer
+            limit:
+              type: integer
+            has_more:
+              type: boolean
+      400:
+        description: Parámetros inválidos
+    """
+    try:
+        params = parse_search_args(request.args)
+    except InvalidQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(search_products(**params))
 
 @app.route('/api/products/<int:id>', methods=['GET'])
 def get_product(id):
@@ -331,28 +618,23 @@ def create_product():
     name = request.form.get('name')
     price = float(request.form.get('price'))
     
-    # Manejar la imagen
-    image_path = ''
-    if 'imageFile' in request.files:
-        file = request.files['imageFile']
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Asegurarse de que el directorio existe
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            image_path = f'uploads/{filename}'
-    elif 'imageUrl' in request.form and request.form.get('imageUrl'):
-        image_path = request.form.get('imageUrl')
-    
     new_product = Product(
         name=name,
         price=price,
-        image=image_path
+        image=''
     )
     
+    # Manejar la imagen: se guarda por hash de contenido y las variantes se generan en un job
+    if 'imageFile' in request.files:
+        file = request.files['imageFile']
+        if file and allowed_file(file.filename):
+            attach_image(new_product, store_upload(file))
+    elif 'imageUrl' in request.form and request.form.get('imageUrl'):
+        new_product.image = request.form.get('imageUrl')
+    
     db.session.add(new_product)
     db.session.commit()
+    page_cache.invalidate('catalog')
     
     return jsonify(product_schema.dump(new_product)), 201
 
@@ -363,20 +645,17 @@ def update_product(id):
     product.name = request.form.get('name', product.name)
     product.price = float(request.form.get('price', product.price))
     
-    # Manejar la imagen
+    # Manejar la imagen: se guarda por hash de contenido y las variantes se generan en un job
     if 'imageFile' in request.files:
         file = request.files['imageFile']
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Asegurarse de que el directorio existe
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            product.image = f'uploads/{filename}'
+            attach_image(product, store_upload(file))
     elif 'imageUrl' in request.form and request.form.get('imageUrl'):
         product.image = request.form.get('imageUrl')
+        product.image_variants = None
     
     db.session.commit()
+    page_cache.invalidate('catalog')
     return jsonify(product_schema.dump(product))
 
 @app.route('/api/products/<int:id>', methods=['DELETE'])
@@ -384,50 +663,47 @@ def delete_product(id):
     product = Product.query.get_or_404(id)
     db.session.delete(product)
     db.session.commit()
+    page_cache.invalidate('catalog')
     return '', 204
 
 # API para el Carrito de Compras
+# Los carritos viven en cart_store (anónimos y de usuarios); los cambios de
+# usuarios autenticados se escriben en cart_items en lotes, en segundo plano
 @app.route('/api/cart', methods=['GET'])
 def get_cart():
     """
-    Obtener el carrito del usuario autenticado
+    Obtener el carrito de la sesión (usuario autenticado o anónimo)
     ---
     tags:
       - Carrito
+    parameters:
+      - name: totals
+        in: query
+        type: boolean
+        required: false
+        description: Si es true, retorna un objeto con items y totals (igual que /api/cart/batch)
     responses:
       200:
-        description: Lista de items en el carrito
+        description: Lista de items en el carrito (el id de cada item es el ID del producto)
         schema:
           type: array
           items:
             $ref: '#/definitions/CartItem'
-      401:
-        description: Usuario no autenticado
     """
-    if not session.get('user_id'):
-        return jsonify({"error": "Usuario no autenticado"}), 401
+    lines = cart_store.get(session_cart_key())
     
-    user_id = session.get('user_id')
-    cart_items = CartItem.query.filter_by(user_id=user_id).all()
-    
-    # Incluir información del producto en cada item del carrito
-    result = []
-    for item in cart_items:
-        item_data = cart_item_schema.dump(item)
-        product = Product.query.get(item.product_id)
-        item_data['product'] = product_schema.dump(product)
-        result.append(item_data)
+    # Productos y precios desde la caché de precios (una consulta para los que falten)
+    result = get_store_items(lines, session.get('user_id'))
     
+    if request.args.get('totals', '').lower() in ('1', 'true'):
+        return jsonify({"items": result, "totals": cart_totals(result)})
     return jsonify(result)
 
 @app.route('/api/cart/add', methods=['POST'])
 def add_to_cart():
-    if not session.get('user_id'):
-        return jsonify({"error": "Usuario no autenticado"}), 401
-    
     try:
         data = request.get_json()
-        logger.info(f"Datos recibidos en add_to_cart: {data}")
+        logger.debug("Datos recibidos en add_to_cart: %s", data)
         
         if not data:
             logger.error("No se recibieron datos JSON")
@@ -440,11 +716,13 @@ def add_to_cart():
         user_id = session.get('user_id')
         product_id = int(data['product_id'])
         quantity = int(data.get('quantity', 1))
+        if quantity < 1:
+            return jsonify({"error": "La cantidad debe ser mayor a 0"}), 400
         
-        logger.info(f"Intentando añadir producto {product_id} al carrito del usuario {user_id}")
+        logger.debug("Intentando añadir producto %s al carrito del usuario %s", product_id, user_id)
         
         # Validar que el producto existe
-        product = Product.query.get(product_id)
+        product = db.session.get(Product, product_id)
         if not product:
             logger.error(f"Producto {product_id} no encontrado")
             return jsonify({"error": "Producto no encontrado"}), 404
@@ -454,357 +732,580 @@ def add_to_cart():
             logger.error(f"Stock insuficiente para el producto {product_id}")
             return jsonify({"error": "No hay suficiente stock disponible"}), 400
         
-        # Verificar si el producto ya está en el carrito
-        cart_item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
-        
-        if cart_item:
-            # Actualizar cantidad si ya existe
-            cart_item.quantity += quantity
-            logger.info(f"Actualizada cantidad del producto {product_id} en el carrito")
-        else:
-            # Crear nuevo item en el carrito
-            cart_item = CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
-            db.session.add(cart_item)
-            logger.info(f"Añadido nuevo producto {product_id} al carrito")
-        
-        db.session.commit()
+        # Si el producto ya está en el carrito se suma la cantidad
+        new_quantity = cart_store.add(session_cart_key(), product_id, quantity)
         
         # Incluir información del producto en la respuesta
-        item_data = cart_item_schema.dump(cart_item)
+        item_data = {'id': product_id, 'user_id': user_id, 'product_id': product_id, 'quantity': new_quantity}
         item_data['product'] = product_schema.dump(product)
         
-        logger.info(f"Producto {product_id} añadido exitosamente al carrito")
+        logger.debug("Producto %s añadido al carrito", product_id)
         return jsonify(item_data), 201
         
     except ValueError as e:
         logger.error(f"Error de valor: {str(e)}")
         return jsonify({"error": "Datos inválidos"}), 400
     except Exception as e:
-        logger.error(f"Error al añadir al carrito: {str(e)}")
+        logger.exception(f"Error al añadir al carrito: {str(e)}")
         db.session.rollback()
         return jsonify({"error": "Error interno del servidor"}), 500
 
 @app.route('/api/cart/update/<int:item_id>', methods=['PUT'])
 def update_cart_item(item_id):
-    if not session.get('user_id'):
-        return jsonify({"error": "Usuario no autenticado"}), 401
-    
+    # item_id es el ID del producto (ver get_cart)
     data = request.json
     if not data or 'quantity' not in data:
         return jsonify({"error": "Se requiere quantity"}), 400
     
-    user_id = session.get('user_id')
-    quantity = data['quantity']
+    try:
+        quantity = int(data['quantity'])
+    except (TypeError, ValueError):
+        return jsonify({"error": "Datos inválidos"}), 400
     
-    # Buscar el item en el carrito
-    cart_item = CartItem.query.filter_by(id=item_id, user_id=user_id).first()
-    if not cart_item:
+    cart_key = session_cart_key()
+    if not cart_store.quantity(cart_key, item_id):
         return jsonify({"error": "Item no encontrado en el carrito"}), 404
     
     if quantity <= 0:
         # Eliminar el item si la cantidad es 0 o negativa
-        db.session.delete(cart_item)
-        db.session.commit()
+        cart_store.remove(cart_key, item_id)
         return '', 204
     
     # Actualizar la cantidad
-    cart_item.quantity = quantity
-    db.session.commit()
+    cart_store.set(cart_key, item_id, quantity)
     
     # Incluir información del producto en la respuesta
-    product = Product.query.get(cart_item.product_id)
-    item_data = cart_item_schema.dump(cart_item)
+    product = db.session.get(Product, item_id)
+    item_data = {'id': item_id, 'user_id': session.get('user_id'), 'product_id': item_id, 'quantity': quantity}
     item_data['product'] = product_schema.dump(product)
     
     return jsonify(item_data)
 
 @app.route('/api/cart/remove/<int:item_id>', methods=['DELETE'])
 def remove_from_cart(item_id):
-    if not session.get('user_id'):
-        return jsonify({"error": "Usuario no autenticado"}), 401
-    
-    user_id = session.get('user_id')
-    
-    # Buscar el item en el carrito
-    cart_item = CartItem.query.filter_by(id=item_id, user_id=user_id).first()
-    if not cart_item:
+    # item_id es el ID del producto (ver get_cart)
+    cart_key = session_cart_key()
+    if not cart_store.quantity(cart_key, item_id):
         return jsonify({"error": "Item no encontrado en el carrito"}), 404
     
     # Eliminar el item
-    db.session.delete(cart_item)
-    db.session.commit()
+    cart_store.remove(cart_key, item_id)
     
     return '', 204
 
 @app.route('/api/cart/clear', methods=['DELETE'])
 def clear_cart():
-    if not session.get('user_id'):
-        return jsonify({"error": "Usuario no autenticado"}), 401
+    # Eliminar todos los items del carrito de la sesión
+    cart_store.clear(session_cart_key())
     
-    user_id = session.get('user_id')
+    return '', 204
+
+@app.route('/api/cart/batch', methods=['POST'])
+def batch_cart():
+    """
+    Aplicar varias operaciones al carrito en una sola solicitud
+    ---
+    tags:
+      - Carrito
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            operations:
+              type: array
+              description: Se aplican en orden, en una sola transacción (máximo 500)
+              items:
+                type: object
+                properties:
+                  op:
+                    type: string
+                    enum: [add, set, remove]
+                  product_id:
+                    type: integer
+                  quantity:
+                    type: integer
+                    description: Cantidad a sumar (add) o cantidad final (set; 0 elimina la línea)
+    responses:
+      200:
+        description: Carrito actualizado y sus totales
+        schema:
+          type: object
+          properties:
+            items:
+              type: array
+              items:
+                $ref: '#/definitions/CartItem'
+            totals:
+              type: object
+              properties:
+                item_count:
+                  type: integer
+                subtotal:
+                  type: number
+                tax:
+                  type: number
+                total:
+                  type: number
+      400:
+        description: Operaciones inválidas
+      404:
+        description: Productos no encontrados (no se aplicó ninguna operación)
+      409:
+        description: Stock insuficiente (no se aplicó ninguna operación)
+    """
+    try:
+        operations = parse_cart_operations(request.get_json(silent=True))
+    except InvalidCartOperationError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Eliminar todos los items del carrito para este usuario
-    CartItem.query.filter_by(user_id=user_id).delete()
-    db.session.commit()
+    cart_key = session_cart_key()
+    try:
+        # Una consulta de stock y una transacción para todo el lote
+        apply_cart_operations(cart_store, cart_key, operations)
+    except UnknownProductError as e:
+        return jsonify({"error": "Producto no encontrado", "product_ids": e.product_ids}), 404
+    except InsufficientStockError as e:
+        return jsonify({"error": "No hay suficiente stock disponible", "product_ids": e.product_ids}), 409
     
-    return '', 204
+    items = get_store_items(cart_store.get(cart_key), session.get('user_id'))
+    return jsonify({"items": items, "totals": cart_totals(items)})
+
+# Órdenes
+def admin_required(view):
+    """Restringe una ruta de la API a usuarios con is_admin"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({'error': 'Usuario no autenticado'}), 401
+        if not db.session.scalar(db.select(User.is_admin).where(User.id == user_id)):
+            return jsonify({'error': 'Acceso restringido a administradores'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/api/orders', methods=['GET'])
+def get_orders():
+    """
+    Historial de órdenes del usuario autenticado
+    ---
+    tags:
+      - Órdenes
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        description: Órdenes por página (1 a 100, por defecto 20)
+      - name: cursor
+        in: query
+        type: string
+        description: Valor next_cursor de la página anterior
+      - name: status
+        in: query
+        type: string
+        enum: [pending, completed, failed, cancelled]
+    responses:
+      200:
+        description: Página de órdenes, de la más reciente a la más antigua, con sus ítems y transacciones
+        schema:
+          type: object
+          properties:
+            items:
+              type: array
+              items:
+                $ref: '#/definitions/Order'
+            next_cursor:
+              type: string
+            limit:
+              type: integer
+      400:
+        description: Parámetros inválidos
+      401:
+        description: Usuario no autenticado
+    """
+    if not session.get('user_id'):
+        return jsonify({'error': 'Usuario no autenticado'}), 401
+    try:
+        params = parse_history_args(request.args)
+    except InvalidQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(list_orders(user_id=session['user_id'], **params))
+
+@app.route('/api/admin/orders', methods=['GET'])
+@admin_required
+def search_orders():
+    """
+    Buscar órdenes (administración)
+    ---
+    tags:
+      - Órdenes
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        description: Órdenes por página (1 a 100, por defecto 20)
+      - name: cursor
+        in: query
+        type: string
+        description: Valor next_cursor de la página anterior
+      - name: status
+        in: query
+        type: string
+        enum: [pending, completed, failed, cancelled]
+      - name: user_id
+        in: query
+        type: integer
+      - name: email
+        in: query
+        type: string
+        description: Correo exacto del usuario
+      - name: buy_order
+        in: query
+        type: string
+        description: Orden de compra de Webpay
+      - name: date_from
+        in: query
+        type: string
+        description: Fecha de creación desde (ISO 8601, inclusive)
+      - name: date_to
+        in: query
+        type: string
+        description: Fecha de creación hasta (ISO 8601, exclusive)
+      - name: min_total
+        in: query
+        type: number
+      - name: max_total
+        in: query
+        type: number
+    responses:
+      200:
+        description: Página de órdenes, de la más reciente a la más antigua, con usuario, ítems y transacciones
+        schema:
+          type: object
+          properties:
+            items:
+              type: array
+              items:
+                $ref: '#/definitions/Order'
+            next_cursor:
+              type: string
+            limit:
+              type: integer
+      400:
+        description: Parámetros inválidos
+      401:
+        description: Usuario no autenticado
+      403:
+        description: El usuario no es administrador
+      503:
+        description: La búsqueda superó ORDERS_ADMIN_TIMEOUT_MS; se deben agregar filtros más específicos
+    """
+    try:
+        params = parse_admin_args(request.args)
+    except InvalidQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        return jsonify(list_orders(include_user=True, timeout_ms=app.config['ORDERS_ADMIN_TIMEOUT_MS'], **params))
+    except OrderSearchTimeoutError as e:
+        return jsonify({'error': str(e)}), 503
+
+@app.route('/api/admin/analytics/sales', methods=['GET'])
+@admin_required
+def analytics_sales():
+    """
+    Ventas por día, producto o categoría (administración)
+    ---
+    tags:
+      - Analítica
+    parameters:
+      - name: date_from
+        in: query
+        type: string
+        description: Primer día YYYY-MM-DD (por defecto, 29 días antes de date_to)
+      - name: date_to
+        in: query
+        type: string
+        description: Último día YYYY-MM-DD, inclusive (por defecto hoy en ANALYTICS_TIMEZONE)
+      - name: group_by
+        in: query
+        type: string
+        enum: [day, product, category]
+      - name: category_id
+        in: query
+        type: integer
+        description: Solo con group_by=product
+      - name: limit
+        in: query
+        type: integer
+        description: Productos de mayor ingreso con group_by=product (1 a 500, por defecto 50)
+    responses:
+      200:
+        description: >
+          Unidades, ingresos, ventas en promoción y a precio de lista y descuento
+          otorgado de las órdenes completadas, desde los resúmenes diarios.
+          pending_events son órdenes y pagos aún no consolidados
+      400:
+        description: Parámetros inválidos
+      401:
+        description: Usuario no autenticado
+      403:
+        description: El usuario no es administrador
+    """
+    try:
+        params = parse_sales_args(request.args)
+    except InvalidQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(sales_report(**params))
+
+@app.route('/api/admin/analytics/payments', methods=['GET'])
+@admin_required
+def analytics_payments():
+    """
+    Conversión de las transacciones Webpay (administración)
+    ---
+    tags:
+      - Analítica
+    parameters:
+      - name: date_from
+        in: query
+        type: string
+        description: Primer día YYYY-MM-DD (por defecto, 29 días antes de date_to)
+      - name: date_to
+        in: query
+        type: string
+        description: Último día YYYY-MM-DD, inclusive
+      - name: by_day
+        in: query
+        type: boolean
+        description: Incluir el detalle por día
+    responses:
+      200:
+        description: Transacciones y montos por estado final y conversion_rate (completed / resueltas)
+      400:
+        description: Parámetros inválidos
+      401:
+        description: Usuario no autenticado
+      403:
+        description: El usuario no es administrador
+    """
+    try:
+        date_from, date_to = parse_range(request.args)
+        by_day = parse_bool(request.args.get('by_day')) or False
+    except InvalidQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(payment_report(date_from, date_to, by_day))
+
+@app.route('/api/admin/analytics/export', methods=['GET'])
+@admin_required
+def analytics_export():
+    """
+    Exportar el reporte de ventas en CSV (administración)
+    ---
+    tags:
+      - Analítica
+    produces:
+      - text/csv
+    parameters:
+      - name: date_from
+        in: query
+        type: string
+      - name: date_to
+        in: query
+        type: string
+      - name: group_by
+        in: query
+        type: string
+        enum: [day, product, category]
+      - name: category_id
+        in: query
+        type: integer
+    responses:
+      200:
+        description: Reporte completo (todos los productos con group_by=product)
+      400:
+        description: Parámetros inválidos
+      501:
+        description: pandas no está instalado
+    """
+    try:
+        params = parse_sales_args(request.args)
+    except InvalidQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        body = export_csv(params['date_from'], params['date_to'], params['group_by'], params['category_id'])
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 501
+    filename = f"ventas_{params['group_by']}_{params['date_from']}_{params['date_to']}.csv"
+    return body, 200, {'Content-Type': 'text/csv; charset=utf-8',
+                       'Content-Disposition': f'attachment; filename={filename}'}
 
 # Rutas de Webpay
 @app.route('/iniciar-pago', methods=['POST'])
 def iniciar_pago():
-    print("\n=== INICIANDO PROCESO DE PAGO ===")
     if not session.get('user_id'):
-        print("Error: Usuario no autenticado")
+        logger.info("Inicio de pago sin usuario autenticado")
         return jsonify({'error': 'Usuario no autenticado'}), 401
     
+    user_id = session['user_id']
     try:
-        print(f"Usuario autenticado: {session['user_id']}")
-        # Obtener items del carrito
-        cart_items = CartItem.query.filter_by(user_id=session['user_id']).all()
-        if not cart_items:
-            print("Error: Carrito vacío")
+        try:
+            # El checkout lee cart_items: se escriben antes los cambios pendientes del carrito
+            cart_store.flush(cart_key=user_key(user_id))
+            
+            # Precios, reserva de stock, orden e items en una sola transacción
+            order, transaction = create_order(
+                user_id=user_id,
+                session_id=str(user_id)
+            )
+        except EmptyCartError:
+            logger.info("Inicio de pago con carrito vacío", extra={'user_id': user_id})
             return jsonify({'error': 'Carrito vacío'}), 400
+        except InsufficientStockError as e:
+            logger.info("Inicio de pago sin stock suficiente",
+                        extra={'user_id': user_id, 'product_ids': e.product_ids})
+            return jsonify({
+                'error': 'No hay suficiente stock disponible',
+                'product_ids': e.product_ids
+            }), 409
+        except Exception:
+            logger.exception("Error al crear la orden", extra={'user_id': user_id})
+            return jsonify({'error': 'Error al crear la orden'}), 500
         
-        print("Calculando total de la compra...")
-        # Calcular total usando precio de promoción si corresponde
-        def get_precio_producto(item):
-            producto = item.product
-            if getattr(producto, 'is_promotion', False) and getattr(producto, 'promotion_price', None) is not None:
-                return item.quantity * producto.promotion_price
-            return item.quantity * producto.price
-        total = sum(get_precio_producto(item) for item in cart_items)
-        print(f"Total calculado: {total}")
+        total = order.total_amount
+        buy_order = transaction.buy_order
+        logger.info("Orden creada", extra={'user_id': user_id, 'order_id': order.id,
+                                            'buy_order': buy_order, 'total': str(total)})
+        
+        # Iniciar transacción en Webpay
+        return_url = url_for('retorno_webpay', _external=True)
         
-        print("Creando orden en la base de datos...")
         try:
-            # Crear orden
-            order = Order(
-                user_id=session['user_id'],
-                total_amount=total,
-                status='pending'
+            webpay_response = webpay.create_transaction(
+                amount=int(total),
+                buy_order=buy_order,
+                session_id=str(user_id),
+                return_url=return_url
             )
-            db.session.add(order)
-            db.session.flush()
-            print(f"Orden creada con ID: {order.id}")
-            
-            # Crear items de la orden
-            print("Creando items de la orden...")
-            for cart_item in cart_items:
-                producto = cart_item.product
-                if getattr(producto, 'is_promotion', False) and getattr(producto, 'promotion_price', None) is not None:
-                    precio_usado = producto.promotion_price
-                else:
-                    precio_usado = producto.price
-                order_item = OrderItem(
-                    order=order,
-                    product_id=cart_item.product_id,
-                    quantity=cart_item.quantity,
-                    price_at_time=precio_usado
-                )
-                db.session.add(order_item)
             
-            # Generar orden de compra única
-            buy_order = f"OC-{order.id}"
-            print(f"Número de orden generado: {buy_order}")
+            if not webpay_response or 'token' not in webpay_response or 'url' not in webpay_response:
+                raise ValueError("Respuesta inválida de Webpay")
             
-            print("Creando transacción en la base de datos...")
-            # Crear transacción en la base de datos
-            transaction = WebpayTransaction(
-                order=order,
-                buy_order=buy_order,
-                amount=total,
-                session_id=str(session['user_id'])
-            )
-            db.session.add(transaction)
+            # Actualizar transacción con el token
+            transaction.token_ws = webpay_response['token']
             db.session.commit()
-            print("Transacción creada en la base de datos")
             
-            # Iniciar transacción en Webpay
-            return_url = url_for('retorno_webpay', _external=True)
-            print(f"URL de retorno configurada: {return_url}")
+            # Vaciar el carrito (en cart_items y en el almacén local)
+            CartItem.query.filter_by(user_id=user_id).delete()
+            db.session.commit()
+            cart_store.forget(user_key(user_id))
             
-            try:
-                print("\n=== INICIANDO TRANSACCIÓN EN WEBPAY ===")
-                print("Datos que se enviarán a Webpay:")
-                print(f"- Monto: {int(total)}")
-                print(f"- Orden de compra: {buy_order}")
-                print(f"- ID de sesión: {str(session['user_id'])}")
-                print(f"- URL de retorno: {return_url}")
-                
-                webpay_response = webpay.create_transaction(
-                    amount=int(total),
-                    buy_order=buy_order,
-                    session_id=str(session['user_id']),
-                    return_url=return_url
-                )
-                
-                print("\nRespuesta de Webpay recibida:")
-                print(webpay_response)
-                
-                if not webpay_response or 'token' not in webpay_response or 'url' not in webpay_response:
-                    raise ValueError("Respuesta inválida de Webpay")
-                
-                # Actualizar transacción con el token
-                transaction.token_ws = webpay_response['token']
-                db.session.commit()
-                print("Token guardado en la base de datos")
-                
-                # Vaciar el carrito
-                CartItem.query.filter_by(user_id=session['user_id']).delete()
-                db.session.commit()
-                print("Carrito vaciado")
-                
-                print("\n=== PROCESO DE INICIO DE PAGO COMPLETADO ===")
-                return jsonify(webpay_response)
-                
-            except Exception as e:
-                print("\n=== ERROR AL CREAR TRANSACCIÓN WEBPAY ===")
-                print(f"Error: {str(e)}")
-                print(f"Tipo de error: {type(e)}")
-                import traceback
-                print("Traceback completo:")
-                print(traceback.format_exc())
-                db.session.rollback()
-                return jsonify({'error': 'Error al procesar el pago con Webpay'}), 500
+            logger.info("Pago iniciado en Webpay", extra={'order_id': order.id, 'buy_order': buy_order})
+            return jsonify(webpay_response)
             
-        except Exception as e:
-            print("\n=== ERROR AL CREAR ORDEN ===")
-            print(f"Error: {str(e)}")
-            print(f"Tipo de error: {type(e)}")
-            import traceback
-            print("Traceback completo:")
-            print(traceback.format_exc())
+        except Exception:
+            logger.exception("Error al crear la transacción en Webpay",
+                             extra={'order_id': order.id, 'buy_order': buy_order})
             db.session.rollback()
-            return jsonify({'error': 'Error al crear la orden'}), 500
+            # Liberar el stock reservado: la orden no llegó a Webpay
+            release_stock(order.id)
+            transaction.status = 'failed'
+            order.status = 'failed'
+            db.session.commit()
+            return jsonify({'error': 'Error al procesar el pago con Webpay'}), 500
             
-    except Exception as e:
-        print("\n=== ERROR GENERAL ===")
-        print(f"Error: {str(e)}")
-        print(f"Tipo de error: {type(e)}")
-        import traceback
-        print("Traceback completo:")
-        print(traceback.format_exc())
+    except Exception:
+        logger.exception("Error general al iniciar el pago", extra={'user_id': user_id})
         db.session.rollback()
         return jsonify({'error': 'Error al procesar el pago'}), 500
 
 def enviar_comprobante(order, user_email):
-    """Envía el comprobante de pago por correo electrónico"""
+    """Envía el comprobante de pago por correo electrónico (se ejecuta en el worker de jobs)"""
     try:
-        print("\n=== ENVIANDO COMPROBANTE POR EMAIL ===")
-        print(f"Enviando comprobante a: {user_email}")
-        
         msg = Message(
             'Comprobante de Pago - Ferremas',
             recipients=[user_email]
         )
         
+        # Líneas, neto e IVA calculados con el motor de precios
+        pricing = price_lines((item.product_id, item.quantity, item.price_at_time) for item in order.items)
+        
         # Renderizar el template HTML con los datos de la orden
         html = render_template(
             'email/comprobante.html',
             order=order,
+            pricing=pricing,
             current_year=datetime.now().year
         )
         
         msg.html = html
-        mail.send(msg)
-        print("Correo enviado exitosamente")
+        with metrics.timer('smtp', 'send'):
+            mail.send(msg)
+        logger.info("Comprobante enviado", extra={'order_id': order.id})
         
-    except Exception as e:
-        print("\n=== ERROR AL ENVIAR CORREO ===")
-        print(f"Error: {str(e)}")
-        print(f"Tipo de error: {type(e)}")
-        import traceback
-        print("Traceback completo:")
-        print(traceback.format_exc())
+    except Exception:
+        logger.exception("Error al enviar el comprobante", extra={'order_id': order.id})
+        # Relanzar para que la cola de jobs reintente el envío
+        raise
+
+@job_handler('send_receipt')
+def send_receipt_job(payload):
+    """Job: envía el comprobante de una orden pagada"""
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        logger.warning(f"Orden {payload['order_id']} no encontrada, comprobante descartado")
+        return
+    enviar_comprobante(order, payload['email'])
+
+@job_handler('send_mail')
+def send_mail_job(payload):
+    """Job: envía un correo HTML ya renderizado"""
+    msg = Message(
+        subject=payload['subject'],
+        recipients=payload['recipients'],
+        reply_to=payload.get('reply_to')
+    )
+    msg.html = payload['html']
+    with metrics.timer('smtp', 'send'):
+        mail.send(msg)
 
 @app.route('/retorno-webpay', methods=['GET', 'POST'])
 def retorno_webpay():
-    print("\n=== PROCESANDO RETORNO DE WEBPAY ===")
-    print("Método:", request.method)
-    print("Args:", request.args)
-    print("Form:", request.form)
-    
-    # Obtener token_ws de POST o GET
-    token_ws = request.form.get('token_ws') or request.args.get('token_ws')
-    tbk_token = request.form.get('TBK_TOKEN')
-    
-    print("Token WS:", token_ws)
-    print("TBK Token:", tbk_token)
+    # Webpay envía token_ws al pagar; TBK_TOKEN (y TBK_ORDEN_COMPRA) si el
+    # usuario abortó, y solo TBK_ORDEN_COMPRA si el formulario expiró
+    token_ws = request.values.get('token_ws')
+    tbk_token = request.values.get('TBK_TOKEN')
+    tbk_buy_order = request.values.get('TBK_ORDEN_COMPRA')
     
-    if tbk_token:
-        print("Pago abortado por el usuario")
-        # Pago abortado por el usuario
-        transaction = WebpayTransaction.query.filter_by(token_ws=token_ws).first()
-        if transaction:
-            transaction.status = 'cancelled'
-            transaction.order.status = 'cancelled'
-            db.session.commit()
-            print("Transacción marcada como cancelada")
-        return redirect(url_for('comprobante_pago', status='cancelled'))
+    if tbk_token or (tbk_buy_order and not token_ws):
+        try:
+            status = cancel_payment(token_ws=tbk_token, buy_order=tbk_buy_order)
+        except Exception:
+            logger.exception("Error al anular el pago", extra={'buy_order': tbk_buy_order})
+            status = 'error'
+        return redirect(url_for('comprobante_pago', status=status))
     
     if not token_ws:
-        print("Error: No se recibió token_ws")
+        logger.warning("Retorno de Webpay sin token_ws", extra={'method': request.method})
         return redirect(url_for('comprobante_pago', status='error'))
     
     try:
-        print("\nConsultando resultado de la transacción...")
-        # Confirmar transacción con Webpay
-        response = webpay.commit_transaction(token_ws)
-        print("Respuesta de commit:", response)
-        
-        # Buscar la transacción en la base de datos
-        transaction = WebpayTransaction.query.filter_by(token_ws=token_ws).first()
-        if not transaction:
-            print("Error: Transacción no encontrada en la base de datos")
-            raise Exception('Transacción no encontrada')
-        
-        # Verificar si la respuesta es un diccionario
-        if isinstance(response, dict):
-            response_code = response.get('response_code')
-            amount = response.get('amount')
-        else:
-            # Si es un objeto, intentar acceder a los atributos
-            response_code = getattr(response, 'response_code', None)
-            amount = getattr(response, 'amount', None)
-        
-        print(f"Código de respuesta: {response_code}")
-        print(f"Monto: {amount}")
-        
-        # Actualizar la transacción con la respuesta
-        if response_code == 0:
-            print("Transacción exitosa")
-            transaction.status = 'completed'
-            transaction.response_code = response_code
-            transaction.amount = amount
-            transaction.order.status = 'completed'
-            
-            # Obtener el correo del usuario
-            user = User.query.get(transaction.order.user_id)
-            if user:
-                # Enviar comprobante por correo
-                enviar_comprobante(transaction.order, user.email)
-            
-            status = 'success'
-        else:
-            print(f"Transacción fallida con código: {response_code}")
-            transaction.status = 'failed'
-            transaction.response_code = response_code
-            transaction.order.status = 'failed'
-            status = 'error'
-        
-        db.session.commit()
-        print("Base de datos actualizada")
-        
-        return redirect(url_for('comprobante_pago', status=status))
-        
-    except Exception as e:
-        print(f"\n=== ERROR EN RETORNO WEBPAY ===")
-        print(f"Error: {str(e)}")
-        print(f"Tipo de error: {type(e)}")
-        import traceback
-        print("Traceback completo:")
-        print(traceback.format_exc())
-        return redirect(url_for('comprobante_pago', status='error'))
+        # Idempotente: solo el primer retorno de cada token confirma en Transbank
+        status = confirm_payment(token_ws, webpay, wait=app.config['WEBPAY_RETURN_WAIT'])
+    except UnknownTransactionError:
+        logger.warning("Retorno de Webpay con token desconocido")
+        status = 'error'
+    except Exception:
+        logger.exception("Error en el retorno de Webpay")
+        status = 'error'
+    
+    return redirect(url_for('comprobante_pago', status=status))
 
 @app.route('/comprobante-pago')
 def comprobante_pago():
@@ -833,7 +1334,7 @@ def convert_currency():
             return jsonify({'error': 'Se requiere formato JSON'}), 400
 
         data = request.get_json()
-        logger.info(f"Datos recibidos en /api/convert: {data}")
+        logger.debug("Datos recibidos en /api/convert: %s", data)
         
         if not data:
             logger.error("No se recibieron datos JSON")
@@ -842,7 +1343,7 @@ def convert_currency():
         amount = data.get('amount')
         from_currency = data.get('currency')
         
-        logger.info(f"Procesando conversión: amount={amount}, currency={from_currency}")
+        logger.debug("Procesando conversión: amount=%s, currency=%s", amount, from_currency)
         
         if not amount or not from_currency:
             logger.error("Faltan datos requeridos")
@@ -857,7 +1358,7 @@ def convert_currency():
             logger.error(f"Error al convertir monto a float: {amount}")
             return jsonify({'error': 'El monto debe ser un número válido'}), 400
             
-        logger.info(f"Intentando convertir {amount} {from_currency} a CLP")
+        logger.debug("Intentando convertir %s %s a CLP", amount, from_currency)
         
         try:
             # Verificar que el conversor esté inicializado correctamente
@@ -866,8 +1367,13 @@ def convert_currency():
                 return jsonify({'error': 'Error en la configuración del conversor'}), 500
 
             result = currency_converter.convert_to_clp(amount, from_currency)
-            logger.info(f"Conversión exitosa: {result}")
+            # Evento frecuente: se registra solo una muestra
+            logger.info("Conversión exitosa", extra={'currency': from_currency, 'amount_clp': result['amount_clp'],
+                                                     'sample_rate': 0.01})
             return jsonify(result)
+        except RateUnavailableError as e:
+            logger.warning(f"Tasa no disponible: {str(e)}")
+            return jsonify({'error': str(e)}), 503
         except ValueError as e:
             logger.error(f"Error en la conversión: {str(e)}")
             return jsonify({'error': str(e)}), 400
@@ -879,6 +1385,151 @@ def convert_currency():
         logger.error(f"Error general en /api/convert: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
 
+@app.route('/api/convert/batch', methods=['POST'])
+def convert_currency_batch():
+    """
+    Convertir muchos montos a varias monedas en una sola solicitud
+    ---
+    tags:
+      - Conversor de Divisas
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - amounts
+            - currencies
+          properties:
+            amounts:
+              type: array
+              items:
+                type: number
+              example: [15990, 24990, 89990]
+            currencies:
+              type: array
+              items:
+                type: string
+              example: [USD, EUR, UF]
+            from:
+              type: string
+              example: CLP
+    responses:
+      200:
+        description: Montos convertidos por moneda y tasas utilizadas
+      400:
+        description: Datos inválidos o moneda no soportada
+      503:
+        description: Alguna tasa aún no está disponible
+    """
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data, dict):
+        return jsonify({'error': 'Se requiere un objeto JSON'}), 400
+    
+    try:
+        result = currency_converter.convert_batch(
+            data.get('amounts'),
+            data.get('currencies'),
+            from_currency=data.get('from', 'CLP')
+        )
+        return jsonify(result)
+    except RateUnavailableError as e:
+        return jsonify({'error': str(e)}), 503
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error en /api/convert/batch: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+def parse_iso_date(value):
+    """Valida una fecha YYYY-MM-DD y la retorna como string, o None si es inválida"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+@app.route('/api/rates/<currency>', methods=['GET'])
+def get_historical_rate(currency):
+    """
+    Obtener la tasa vigente de una moneda en una fecha (datos locales)
+    ---
+    tags:
+      - Conversor de Divisas
+    parameters:
+      - name: currency
+        in: path
+        type: string
+        required: true
+        description: Código de la moneda (USD, EUR, UF, UTM)
+      - name: date
+        in: query
+        type: string
+        required: false
+        description: Fecha YYYY-MM-DD. Por defecto, hoy
+    responses:
+      200:
+        description: Tasa vigente (última observación igual o anterior a la fecha)
+      400:
+        description: Moneda o fecha inválida
+      404:
+        description: Sin datos históricos para la fecha
+    """
+    if currency not in CURRENCY_SERIES:
+        return jsonify({'error': f'Moneda no soportada: {currency}'}), 400
+    
+    date = parse_iso_date(request.args.get('date', datetime.now().strftime('%Y-%m-%d')))
+    if not date:
+        return jsonify({'error': 'La fecha debe tener formato YYYY-MM-DD'}), 400
+    
+    rate = currency_converter.history.rate_on(currency, date)
+    if not rate:
+        return jsonify({'error': f'Sin datos históricos de {currency} para {date}'}), 404
+    
+    return jsonify({'currency': currency, 'requested_date': date, **rate})
+
+@app.route('/api/rates/<currency>/range', methods=['GET'])
+def get_historical_rate_range(currency):
+    """
+    Obtener las observaciones de una moneda entre dos fechas (datos locales)
+    ---
+    tags:
+      - Conversor de Divisas
+    parameters:
+      - name: currency
+        in: path
+        type: string
+        required: true
+        description: Código de la moneda (USD, EUR, UF, UTM)
+      - name: start
+        in: query
+        type: string
+        required: true
+        description: Fecha inicial YYYY-MM-DD
+      - name: end
+        in: query
+        type: string
+        required: true
+        description: Fecha final YYYY-MM-DD (inclusive)
+    responses:
+      200:
+        description: Observaciones ordenadas por fecha
+      400:
+        description: Moneda o fechas inválidas
+    """
+    if currency not in CURRENCY_SERIES:
+        return jsonify({'error': f'Moneda no soportada: {currency}'}), 400
+    
+    start = parse_iso_date(request.args.get('start'))
+    end = parse_iso_date(request.args.get('end'))
+    if not start or not end or start > end:
+        return jsonify({'error': 'Se requieren start y end con formato YYYY-MM-DD y start <= end'}), 400
+    
+    observations = currency_converter.history.range(currency, start, end)
+    return jsonify({'currency': currency, 'start': start, 'end': end, 'observations': observations})
+
 @app.route('/api/currencies', methods=['GET'])
 def get_currencies():
     """
@@ -975,13 +1626,6 @@ def send_contact_email():
             if not data.get(field):
                 return jsonify({'error': f'El campo {field} es requerido'}), 400
         
-        # Crear el mensaje
-        msg = Message(
-            subject=f"Contacto Ferremas: {data['subject']}",
-            recipients=[os.getenv('MAIL_DEFAULT_SENDER')],
-            reply_to=data['email']
-        )
-        
         # Renderizar el template HTML
         html = render_template(
             'email/contact.html',
@@ -991,13 +1635,20 @@ def send_contact_email():
             message=data['message']
         )
         
-        msg.html = html
-        mail.send(msg)
+        # Encolar el correo para que el worker lo envíe
+        enqueue('send_mail', {
+            'subject': f"Contacto Ferremas: {data['subject']}",
+            'recipients': [os.getenv('MAIL_DEFAULT_SENDER')],
+            'reply_to': data['email'],
+            'html': html
+        })
+        db.session.commit()
         
         return jsonify({'message': 'Mensaje enviado correctamente'}), 200
         
     except Exception as e:
         logger.error(f"Error al enviar correo de contacto: {str(e)}")
+        db.session.rollback()
         return jsonify({'error': 'Error al enviar el mensaje'}), 500
 
 @app.route('/api/categories', methods=['GET'])
@@ -1026,6 +1677,72 @@ def get_categories():
         })
     return jsonify(result)
 
+@app.route('/api/cache/stats', methods=['GET'])
+@admin_required
+def get_cache_stats():
+    """
+    Obtener los contadores de la caché de páginas (solo administradores)
+    ---
+    tags:
+      - Interno
+    responses:
+      200:
+        description: Aciertos, fallos, respuestas 304 y omisiones por namespace (de este proceso)
+      401:
+        description: Usuario no autenticado
+      403:
+        description: El usuario no es administrador
+    """
+    return jsonify(page_cache.stats())
+
+@app.route('/api/metrics/db', methods=['GET'])
+@admin_required
+def get_db_metrics():
+    """
+    Obtener las métricas de consultas SQL por endpoint (solo administradores)
+    ---
+    tags:
+      - Interno
+    responses:
+      200:
+        description: Consultas, tiempo en la base de datos y sentencias más lentas por endpoint, más el estado del pool (de este proceso)
+      401:
+        description: Usuario no autenticado
+      403:
+        description: El usuario no es administrador
+    """
+    return jsonify(query_metrics.snapshot())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Métricas en formato de texto de Prometheus
+    ---
+    tags:
+      - Interno
+    produces:
+      - text/plain
+    parameters:
+      - name: Authorization
+        in: header
+        type: string
+        required: false
+        description: Bearer METRICS_TOKEN, si la petición no viene de METRICS_ALLOWED_IPS
+    responses:
+      200:
+        description: Latencia por ruta, llamadas a Webpay, Banco Central y SMTP, caché y pool de conexiones (de este proceso)
+      403:
+        description: Dirección no permitida y token ausente o inválido
+      404:
+        description: Métricas desactivadas (METRICS_ENABLED=0)
+    """
+    if not metrics.enabled:
+        return jsonify({'error': 'Métricas desactivadas'}), 404
+    if not metrics.allows(request.remote_addr, request.headers.get('Authorization')):
+        logger.warning("Acceso denegado a /metrics", extra={'remote_addr': request.remote_addr})
+        return jsonify({'error': 'Acceso no permitido'}), 403
+    return metrics.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+
 # SIEMPRE DEBE ESTAR AL FINAL O EL PROGRAMA NO FUNCIONA
 if __name__ == '__main__':
     # Crear las tablas si no existen
@@ -0,0 +1,357 @@
+"""
+Paquetes de CSS y JS minificados, con el hash del contenido en el nombre.
+
+Cada paquete de BUNDLES se escribe en static/dist como
+site.<hash>.css junto a sus versiones .gz y .br ya comprimidas, y
+static/dist/manifest.json relaciona el nombre lógico con el archivo. Como
+el nombre cambia con el contenido, las URL de static/dist se sirven con
+Cache-Control immutable de un año: el navegador no vuelve a preguntar por
+ellas hasta que un despliegue cambie el archivo (y con él la URL).
+
+En las plantillas, asset_url('site.css') reemplaza a
+url_for('static', filename='css/style.css'); con un nombre que no es un
+paquete retorna lo mismo que url_for('static', ...).
+
+Los paquetes se generan en el despliegue:
+
+    python assets.py build
+
+Si al iniciar la aplicación falta el manifiesto o alguna fuente es más
+nueva, se generan en ese momento (ASSETS_AUTO_BUILD). brotli es opcional:
+sin él solo se generan las versiones .gz.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+import threading
+
+from flask import abort, request, send_from_directory, url_for
+
+logger = logging.getLogger(__name__)
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# Nombre lógico -> archivos de static que lo componen, en orden
+BUNDLES = {
+    # base.html
+    'site.css': ('css/style.css',),
+    'site.js': ('js/cart.js',),
+    # Páginas que no extienden base.html
+    'login.css': ('css/login.css',),
+    'register.css': ('css/register.css',),
+    'payment.css': ('css/navbar.css',),
+}
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 12
+MAX_AGE = 365 * 86400
+
+# Subidas guardadas por hash de contenido (product_images.UPLOAD_PREFIX): tampoco cambian
+IMMUTABLE_PREFIXES = ('uploads/',)
+
+CSS_URL = re.compile(r'url\(\s*("[^"]*"|\'[^\']*\'|[^)\'"\s]+)\s*\)')
+CSS_STRING_OR_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+
+# Después de estos caracteres o palabras, una / abre una expresión regular y no es una división
+REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'instanceof', 'new', 'void', 'delete', 'throw'}
+
+
+def rewrite_css_urls(text, source, static_url_path):
+    """Convierte las url() relativas de un CSS en rutas absolutas, ya que el paquete vive en otro directorio"""
+    def absolute(match):
+        url = match.group(1).strip('\'"')
+        if url.startswith(('/', 'data:', 'http:', 'https:', '#')):
+            return match.group(0)
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return f"url('{static_url_path}/{resolved}')"
+    return CSS_URL.sub(absolute, text)
+
+
+def minify_css(text):
+    """Quita comentarios y espacios sobrantes de un CSS sin tocar los strings"""
+    text = ''.join(part for part in CSS_STRING_OR_COMMENT.split(text) if not part.startswith('/*'))
+    parts = CSS_STRING_OR_COMMENT.split(text)
+    for i in range(0, len(parts), 2):
+        code = re.sub(r'\s+', ' ', parts[i])
+        code = re.sub(r'\s*([{};,>])\s*', r'\1', code)
+        parts[i] = re.sub(r':\s+', ':', code).replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+def _starts_regex(last, preceding):
+    """Si una / que sigue al carácter last y al código preceding abre una expresión regular"""
+    if not last or last in REGEX_PRECEDERS:
+        return True
+    word = re.search(r'(\w+)\s*$', preceding)
+    return word is not None and word.group(1) in REGEX_KEYWORDS
+
+
+def _js_segments(text):
+    """
+    Separa un JS en código y literales (strings, plantillas y expresiones regulares),
+    descartando los comentarios.
+
+    Returns:
+        list: Pares (es_literal, texto)
+    """
+    segments = []
+    code = []
+    i, n = 0, len(text)
+    last = ''
+
+    def flush():
+        if code:
+            segments.append((False, ''.join(code)))
+            code.clear()
+
+    while i < n:
+        c = text[i]
+        if c in '\'"`':
+            j = i + 1
+            while j < n and text[j] != c:
+                j += 2 if text[j] == '\\' else 1
+            flush()
+            segments.append((True, text[i:j + 1]))
+            last, i = c, j + 1
+        elif text.startswith('//', i):
+            j = text.find('\n', i)
+            i = n if j < 0 else j
+        elif text.startswith('/*', i):
+            j = text.find('*/', i + 2)
+            j = n if j < 0 else j + 2
+            # Un comentario con saltos de línea separa sentencias (inserción automática de ;)
+            code.append('\n' if '\n' in text[i:j] else ' ')
+            i = j
+        elif c == '/' and _starts_regex(last, ''.join(code[-16:])):
+            j, in_class = i + 1, False
+            while j < n and (text[j] != '/' or in_class):
+                if text[j] == '\\':
+                    j += 1
+                elif text[j] in '[]':
+                    in_class = text[j] == '['
+                j += 1
+            j += 1
+            while j < n and text[j].isalpha():
+                j += 1
+            flush()
+            segments.append((True, text[i:j]))
+            last, i = '/', j
+        else:
+            code.append(c)
+            if not c.isspace():
+                last = c
+            i += 1
+    flush()
+    return segments
+
+
+def minify_js(text):
+    """
+    Quita comentarios, sangría y líneas vacías de un JS.
+
+    Conserva los saltos de línea (el código existente depende de la inserción
+    automática de punto y coma) y el contenido de strings, plantillas y
+    expresiones regulares.
+    """
+    parts = []
+    for literal, segment in _js_segments(text):
+        if not literal:
+            segment = re.sub(r'[ \t]*\n\s*', '\n', segment)
+            segment = re.sub(r'[ \t]+', ' ', segment)
+        parts.append(segment)
+    return ''.join(parts).strip()
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def bundle(static_folder, name, sources, static_url_path='/static'):
+    """Contenido minificado de un paquete"""
+    extension = os.path.splitext(name)[1]
+    parts = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            text = f.read()
+        if extension == '.css':
+            text = rewrite_css_urls(text, source, static_url_path)
+        parts.append(MINIFIERS[extension](text))
+    # ; entre archivos JS por si alguno termina sin punto y coma
+    return (';\n' if extension == '.js' else '\n').join(parts) + '\n'
+
+
+def compressors():
+    """Pares (sufijo, función) de las codificaciones disponibles"""
+    available = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+    except ImportError:
+        return available
+    return [('.br', lambda data: brotli.compress(data, quality=11))] + available
+
+
+def write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.asset-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def build(static_folder=STATIC_FOLDER, static_url_path='/static', bundles=BUNDLES):
+    """
+    Genera los paquetes, sus versiones comprimidas y el manifiesto.
+
+    Los archivos de compilaciones anteriores se mantienen: las páginas en
+    caché de los navegadores aún pueden referenciarlos.
+
+    Returns:
+        dict: Nombre lógico -> archivo en static/dist
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for name, sources in bundles.items():
+        content = bundle(static_folder, name, sources, static_url_path).encode('utf-8')
+        stem, extension = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{extension}'
+        path = os.path.join(dist, filename)
+        if not os.path.exists(path):
+            # Primero las versiones comprimidas: el archivo base indica que el paquete está completo
+            for suffix, compress in compressors():
+                data = compress(content)
+                if len(data) < len(content):
+                    write_atomic(path + suffix, data)
+            write_atomic(path, content)
+        manifest[name] = filename
+    write_atomic(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+class Assets:
+    """Extensión Flask: asset_url en las plantillas y envío de static/dist con caché de un año"""
+
+    def __init__(self):
+        self.manifest = {}
+        self.static_folder = STATIC_FOLDER
+        self.static_url_path = '/static'
+        self.max_age = MAX_AGE
+        self.watch = False
+        self._manifest_mtime = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.static_url_path = app.static_url_path
+        self.max_age = app.config.get('ASSETS_MAX_AGE', MAX_AGE)
+        self.watch = app.config.get('ASSETS_WATCH', False)
+        self.auto_build = app.config.get('ASSETS_AUTO_BUILD', True)
+        app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'assets', self.send_asset)
+        app.after_request(self._cache_immutable_static)
+        app.jinja_env.globals['asset_url'] = self.url
+        self.refresh()
+        logger.info(f"Paquetes estáticos cargados: {len(self.manifest)}")
+
+    def _manifest_path(self):
+        return os.path.join(self.static_folder, DIST_DIR, MANIFEST)
+
+    def _stale(self):
+        try:
+            built = os.stat(self._manifest_path()).st_mtime
+        except FileNotFoundError:
+            return True
+        return any(os.stat(os.path.join(self.static_folder, source)).st_mtime > built
+                   for sources in BUNDLES.values() for source in sources)
+
+    def refresh(self):
+        """Carga el manifiesto, regenerando los paquetes si falta o si cambió alguna fuente"""
+        with self._lock:
+            if self.auto_build and self._stale():
+                build(self.static_folder, self.static_url_path)
+                logger.info("Paquetes estáticos regenerados")
+            try:
+                mtime = os.stat(self._manifest_path()).st_mtime
+                if mtime != self._manifest_mtime:
+                    with open(self._manifest_path(), encoding='utf-8') as f:
+                        self.manifest = json.load(f)
+                    self._manifest_mtime = mtime
+            except FileNotFoundError:
+                logger.warning("No existe static/dist/manifest.json; ejecute 'python assets.py build'")
+
+    def url(self, filename, **values):
+        """
+        Equivalente a url_for('static', filename=...) que usa la versión con hash de los paquetes.
+
+        Args:
+            filename (str): Nombre de un paquete de BUNDLES o ruta relativa a static
+            **values: Argumentos adicionales de url_for (por ejemplo _external=True)
+
+        Returns:
+            str: URL inmutable del paquete, o la URL estática normal
+        """
+        if self.watch:
+            self.refresh()
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename, **values)
+        return url_for('assets', filename=hashed, **values)
+
+    def send_asset(self, filename):
+        """Envía un paquete, ya comprimido en la mejor codificación que acepte el cliente"""
+        if filename == MANIFEST:
+            abort(404)
+        directory = os.path.join(self.static_folder, DIST_DIR)
+        mimetype = mimetypes.guess_type(filename)[0]
+        for suffix, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+            if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+                response = send_from_directory(directory, filename + suffix, mimetype=mimetype,
+                                               max_age=self.max_age)
+                response.content_encoding = encoding
+                break
+        else:
+            response = send_from_directory(directory, filename, mimetype=mimetype, max_age=self.max_age)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        return response
+
+    def _cache_immutable_static(self, response):
+        """Caché de un año para los archivos de static cuyo nombre depende del contenido"""
+        if (request.endpoint == 'static' and response.status_code in (200, 206, 304)
+                and request.view_args['filename'].startswith(IMMUTABLE_PREFIXES)):
+            response.cache_control.public = True
+            response.cache_control.no_cache = None
+            response.cache_control.max_age = self.max_age
+            response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Paquetes de CSS y JS estáticos')
+    parser.add_argument('command', choices=['build'], help='build: genera static/dist y su manifiesto')
+    parser.parse_args()
+    manifest = build()
+    for name, filename in sorted(manifest.items()):
+        path = os.path.join(STATIC_FOLDER, DIST_DIR, filename)
+        sizes = [f'{suffix[1:]} {os.path.getsize(path + suffix)} B' for suffix, _ in compressors()
+                 if os.path.exists(path + suffix)]
+        print(f"{name} -> {filename} ({os.path.getsize(path)} B{''.join(', ' + size for size in sizes)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,19 @@ from flask_dance.contrib.google import make_google_blueprint, google
 from flask_dance.consumer import oauth_authorized
 from flask_dance.consumer.storage import MemoryStorage
 import os
+import logging
+import requests
 from dotenv import load_dotenv
 from models import User, db
+from cart_store import merge_session_cart
+from http_client import outbound
 from werkzeug.security import generate_password_hash
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configuración del blueprint de autenticación
 auth_bp = Blueprint('auth', __name__)
 
@@ -39,7 +45,13 @@ def google_logged_in(blueprint, token):
         return False
     
     # Obtener información del usuario
-    resp = google.get("/oauth2/v2/userinfo")
+    # Con el timeout, pool de conexiones y circuit breaker del servicio (ver http_client.py)
+    try:
+        resp = outbound.client('google').get("/oauth2/v2/userinfo", session=google)
+    except requests.RequestException as e:
+        logger.error(f"Error al consultar la información del usuario en Google: {str(e)}")
+        flash('Error al obtener información del usuario', 'danger')
+        return False
     if not resp.ok:
         flash('Error al obtener información del usuario', 'danger')
         return False
@@ -60,9 +72,9 @@ def google_logged_in(blueprint, token):
         db.session.add(user)
         try:
             db.session.commit()
-        except Exception as e:
+        except Exception:
             db.session.rollback()
-            print(f"Error al crear usuario: {str(e)}")
+            logger.exception("Error al crear usuario desde Google")
             flash('Error al crear cuenta de usuario', 'danger')
             return False
     
@@ -76,6 +88,7 @@ def google_logged_in(blueprint, token):
     
     # Usar el ID real del usuario de la base de datos
     session["user_id"] = user.id
+    merge_session_cart(user.id)
     
     flash('¡Inicio de sesión exitoso con Google!', 'success')
     return redirect(url_for("home"))
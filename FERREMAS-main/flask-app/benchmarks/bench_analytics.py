@@ -0,0 +1,303 @@
+"""
+Benchmark de la analítica de ventas (analytics.py).
+
+Siembra órdenes de benchmark con bench_orders.seed_orders (sin triggers, por
+lo que no generan eventos), recalcula los resúmenes con rebuild() y mide:
+
+1. Que los resúmenes coincidan con agregar orders, order_items y
+   webpay_transactions directamente.
+2. Los reportes de los últimos 7, 30 y 365 días por día, producto y
+   categoría, y la conversión de pagos: el GROUP BY sobre las tablas del
+   checkout, como se haría sin resúmenes, contra sales_report y
+   payment_report.
+3. La latencia de completar una orden (UPDATE + commit) sin reportes en
+   paralelo, con REPORT_PROCESSES procesos que piden el reporte anual por
+   producto cada REPORT_INTERVAL segundos (un tablero abierto) con el GROUP
+   BY sobre las tablas del checkout, y con los mismos procesos consultando
+   los resúmenes.
+4. El costo de los triggers de eventos al completar una orden o una
+   transacción (session_replication_role = replica los desactiva, requiere
+   superusuario) y el rendimiento de drain() sobre un lote grande.
+5. La exportación CSV del año por producto.
+
+Las órdenes, usuarios y productos sembrados se eliminan al terminar y los
+resúmenes se recalculan sin ellos.
+
+    python -m benchmarks.bench_analytics [cantidad]
+"""
+import multiprocessing
+import random
+import sys
+import time
+from datetime import timedelta
+
+from analytics import (FINAL_STATUSES_SQL, drain, export_csv, payment_report, rebuild, sales_report, timezone,
+                       today)
+from app import app
+from benchmarks.bench_orders import delete_orders, seed_buyers, seed_orders
+from benchmarks.common import BENCH_PREFIX, bench_data, create_bench_products, measure, print_table
+from extensions import db
+from models import Order, User
+
+DEFAULT_ORDERS = 1_000_000
+BUYERS = 10_000
+PRODUCTS = 200
+REPEAT = 20
+RAW_REPEAT = 5
+RANGES = (7, 30, 365)
+WRITES = 200
+REPORT_PROCESSES = 4
+REPORT_INTERVAL = 0.5
+DRAIN_ORDERS = 50_000
+
+PROMO = 'i.price_at_time < p.price::numeric'
+
+# Los mismos reportes agrupando las tablas del checkout en cada consulta
+RAW_SALES = f"""
+    SELECT {{key}} AS key, count(DISTINCT o.id) AS orders, sum(i.quantity) AS units,
+           sum(i.quantity * i.price_at_time) AS revenue,
+           coalesce(sum(i.quantity) FILTER (WHERE {PROMO}), 0) AS promo_units,
+           coalesce(sum(i.quantity * i.price_at_time) FILTER (WHERE {PROMO}), 0) AS promo_revenue
+    FROM orders o
+    JOIN order_items i ON i.order_id = o.id
+    LEFT JOIN products p ON p.id = i.product_id
+    WHERE o.status = 'completed'
+      AND o.created_at >= (CAST(:date_from AS date)::timestamp AT TIME ZONE :tz)
+      AND o.created_at < ((CAST(:date_to AS date) + 1)::timestamp AT TIME ZONE :tz)
+    GROUP BY 1 ORDER BY revenue DESC {{limit}}"""
+
+RAW_QUERIES = {
+    'day': RAW_SALES.format(key='(o.created_at AT TIME ZONE :tz)::date', limit=''),
+    'product': RAW_SALES.format(key='i.product_id', limit='LIMIT 50'),
+    'category': RAW_SALES.format(key='p.category_id', limit=''),
+    'payments': f"""
+        SELECT (created_at AT TIME ZONE :tz)::date, status, count(*), sum(amount) FROM webpay_transactions
+        WHERE status IN ({FINAL_STATUSES_SQL})
+          AND created_at >= (CAST(:date_from AS date)::timestamp AT TIME ZONE :tz)
+          AND created_at < ((CAST(:date_to AS date) + 1)::timestamp AT TIME ZONE :tz)
+        GROUP BY 1, 2""",
+}
+
+
+def raw_report(name, date_from, date_to):
+    rows = db.session.execute(db.text(RAW_QUERIES[name]),
+                              {'date_from': date_from, 'date_to': date_to, 'tz': timezone()}).all()
+    db.session.rollback()
+    return rows
+
+
+def rollup_report(name, date_from, date_to):
+    if name == 'payments':
+        report = payment_report(date_from, date_to, by_day=True)
+    else:
+        report = sales_report(date_from, date_to, group_by=name)
+    db.session.rollback()
+    return report
+
+
+def check_totals():
+    """Totales de todo el historial: agregando las tablas del checkout y desde los resúmenes"""
+    raw = db.session.execute(db.text(f"""
+        SELECT (SELECT count(*) FROM orders WHERE status = 'completed') AS orders,
+               sum(i.quantity) AS units, sum(i.quantity * i.price_at_time) AS revenue,
+               coalesce(sum(i.quantity * i.price_at_time) FILTER (WHERE {PROMO}), 0) AS promo_revenue,
+               (SELECT count(*) FROM webpay_transactions WHERE status = 'completed') AS payments_completed,
+               (SELECT count(*) FROM webpay_transactions WHERE status IN ({FINAL_STATUSES_SQL})) AS payments_resolved
+        FROM orders o
+        JOIN order_items i ON i.order_id = o.id
+        LEFT JOIN products p ON p.id = i.product_id
+        WHERE o.status = 'completed'
+    """)).one()
+    rollup = db.session.execute(db.text("""
+        SELECT (SELECT sum(orders) FROM order_daily) AS orders,
+               (SELECT sum(units) FROM order_daily) AS units,
+               (SELECT sum(revenue) FROM order_daily) AS revenue,
+               (SELECT sum(promo_revenue) FROM sales_daily) AS promo_revenue,
+               (SELECT sum(transactions) FROM payment_daily WHERE status = 'completed') AS payments_completed,
+               (SELECT sum(transactions) FROM payment_daily) AS payments_resolved
+    """)).one()
+    db.session.rollback()
+    return [(name, raw._mapping[name], rollup._mapping[name],
+             'sí' if raw._mapping[name] == rollup._mapping[name] else 'NO')
+            for name in raw._mapping.keys()]
+
+
+def bench_reports():
+    date_to = today()
+    rows = []
+    for days in RANGES:
+        date_from = date_to - timedelta(days=days - 1)
+        for name in RAW_QUERIES:
+            raw = measure(lambda: raw_report(name, date_from, date_to), RAW_REPEAT)
+            rollup = measure(lambda: rollup_report(name, date_from, date_to), REPEAT)
+            rows.append((f'{days} días', name, f"{raw['p50']:.1f}", f"{rollup['p50']:.2f}",
+                         f"{rollup['p95']:.2f}", f"{raw['p50'] / rollup['p50']:.0f}x"))
+    return rows
+
+
+def pending_orders(count):
+    """IDs de órdenes pendientes de benchmark, en orden aleatorio"""
+    ids = db.session.scalars(
+        db.select(Order.id).join(User, User.id == Order.user_id)
+        .where(Order.status == 'pending', User.username.like(f'{BENCH_PREFIX}%'))
+        .limit(count)
+    ).all()
+    db.session.rollback()
+    random.shuffle(ids)
+    return ids
+
+
+def timed_write(statement, params, triggers=True):
+    """Ejecuta y confirma una escritura; retorna milisegundos"""
+    start = time.perf_counter()
+    if not triggers:
+        db.session.execute(db.text('SET LOCAL session_replication_role = replica'))
+    db.session.execute(db.text(statement), params)
+    db.session.commit()
+    return (time.perf_counter() - start) * 1000
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+COMPLETE_ORDER = "UPDATE orders SET status = 'completed', updated_at = now() WHERE id = :id"
+COMPLETE_PAYMENT = ("UPDATE webpay_transactions SET status = 'completed', updated_at = now() "
+                    "WHERE order_id = :id AND status = 'initiated'")
+
+
+def report_loop(report, stop):
+    """Pide el reporte anual por producto cada REPORT_INTERVAL segundos hasta que se active `stop`"""
+    with app.app_context():
+        # Las conexiones heredadas del proceso padre no se comparten
+        db.engine.dispose(close=False)
+        date_to = today()
+        date_from = date_to - timedelta(days=364)
+        while not stop.is_set():
+            start = time.perf_counter()
+            report('product', date_from, date_to)
+            stop.wait(max(0.0, REPORT_INTERVAL - (time.perf_counter() - start)))
+        db.session.remove()
+
+
+def bench_contention(order_ids):
+    rows = []
+    for name, report in (('sin reportes', None), ('GROUP BY sobre orders', raw_report),
+                         ('desde los resúmenes', rollup_report)):
+        ids, order_ids = order_ids[:WRITES], order_ids[WRITES:]
+        # Procesos y no hilos: el GIL no debe sumarse a la latencia medida
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        processes = [context.Process(target=report_loop, args=(report, stop))
+                     for _ in range(REPORT_PROCESSES if report else 0)]
+        for process in processes:
+            process.start()
+        time.sleep(1 if processes else 0)
+        try:
+            samples = []
+            for order_id in ids:
+                samples.append(timed_write(COMPLETE_ORDER, {'id': order_id}))
+                # Escrituras repartidas en varios ciclos de los reportes
+                time.sleep(0.01)
+        finally:
+            stop.set()
+            for process in processes:
+                process.join()
+        p50, p95 = percentiles(samples)
+        rows.append((name, len(samples), f'{p50:.2f}', f'{p95:.2f}'))
+    return rows, order_ids
+
+
+def bench_triggers(order_ids):
+    rows = []
+    for name, statement in (('orden pending -> completed', COMPLETE_ORDER),
+                            ('transacción initiated -> completed', COMPLETE_PAYMENT)):
+        ids, order_ids = order_ids[:2 * WRITES], order_ids[2 * WRITES:]
+        without, _ = percentiles([timed_write(statement, {'id': order_id}, False) for order_id in ids[:WRITES]])
+        with_triggers, _ = percentiles([timed_write(statement, {'id': order_id}) for order_id in ids[WRITES:]])
+        rows.append((name, WRITES, f'{without:.2f}', f'{with_triggers:.2f}', f'{with_triggers - without:+.2f}'))
+    return rows, order_ids
+
+
+def bench_drain(order_ids):
+    """Completa DRAIN_ORDERS órdenes y sus transacciones en una sentencia cada una y consolida los eventos"""
+    drain()
+    ids = order_ids[:DRAIN_ORDERS]
+    db.session.execute(db.text("UPDATE orders o SET status = 'completed' FROM unnest(CAST(:ids AS int[])) s(id) "
+                               "WHERE o.id = s.id"), {'ids': ids})
+    db.session.execute(db.text("UPDATE webpay_transactions t SET status = 'completed' "
+                               "FROM unnest(CAST(:ids AS int[])) s(id) "
+                               "WHERE t.order_id = s.id AND t.status = 'initiated'"), {'ids': ids})
+    db.session.commit()
+    start = time.perf_counter()
+    result = drain()
+    elapsed = time.perf_counter() - start
+    return [(result['events'], result['orders'], result['payments'], f'{elapsed:.2f}',
+             f"{result['events'] / elapsed:.0f}")]
+
+
+def bench_export():
+    date_to = today()
+    date_from = date_to - timedelta(days=364)
+    # La primera llamada importa pandas
+    export_csv(date_to, date_to)
+    rows = []
+    for group_by in ('day', 'product'):
+        start = time.perf_counter()
+        lines = export_csv(date_from, date_to, group_by).count('\n') - 1
+        rows.append((group_by, lines, f'{(time.perf_counter() - start) * 1000:.1f}'))
+    db.session.rollback()
+    return rows
+
+
+def run(count=DEFAULT_ORDERS):
+    with app.app_context(), bench_data():
+        try:
+            user_ids = seed_buyers(BUYERS)
+            product_ids = create_bench_products(PRODUCTS)
+            # Los ítems se siembran a 1990: la mitad de los productos se vende a precio de lista y el
+            # resto bajo él (promoción)
+            db.session.execute(db.text('UPDATE products SET price = 1990 WHERE id = ANY(:ids)'),
+                               {'ids': product_ids[::2]})
+            db.session.commit()
+
+            print(f'Sembrando {count} órdenes de {BUYERS} usuarios (sin eventos)...')
+            print(f'Sembrado en {seed_orders(count, user_ids, product_ids):.1f}s')
+
+            start = time.perf_counter()
+            result = rebuild()
+            print(f"rebuild(): {result['orders']} órdenes y {result['payments']} transacciones "
+                  f"en {time.perf_counter() - start:.1f}s")
+            for table in ('sales_daily', 'order_daily', 'payment_daily'):
+                db.session.execute(db.text(f'ANALYZE {table}'))
+            db.session.commit()
+
+            print('\n1. Totales de todo el historial')
+            print_table(('total', 'raw', 'rollup', 'equal'), check_totals())
+
+            print('\n2. Reportes: GROUP BY sobre las tablas del checkout contra los resúmenes (ms)')
+            print_table(('range', 'report', 'raw_p50', 'rollup_p50', 'rollup_p95', 'speedup'), bench_reports())
+
+            order_ids = pending_orders(3 * WRITES + 4 * WRITES + DRAIN_ORDERS)
+
+            print(f'\n3. Completar una orden (UPDATE + commit, ms) con {REPORT_PROCESSES} procesos pidiendo el '
+                  f'reporte anual por producto cada {REPORT_INTERVAL}s')
+            rows, order_ids = bench_contention(order_ids)
+            print_table(('concurrent_reports', 'samples', 'p50_ms', 'p95_ms'), rows)
+
+            print('\n4. Triggers de eventos (p50 en ms, con commit) y consolidación')
+            rows, order_ids = bench_triggers(order_ids)
+            print_table(('write', 'samples', 'no_triggers_ms', 'triggers_ms', 'overhead_ms'), rows)
+            print_table(('events', 'orders', 'payments', 'drain_s', 'events_per_s'), bench_drain(order_ids))
+
+            print('\n5. Exportación CSV del último año')
+            print_table(('group_by', 'rows', 'ms'), bench_export())
+        finally:
+            db.session.rollback()
+            delete_orders()
+            rebuild()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ORDERS)
@@ -0,0 +1,110 @@
+"""
+Benchmark de los paquetes estáticos (assets.py).
+
+1. Bytes y solicitudes de CSS/JS propios por página: los archivos originales
+   servidos por el handler static de Flask (sin compresión y con
+   Cache-Control no-cache, así que en cada visita el navegador los vuelve a
+   validar con un 304) contra los paquetes de static/dist, en la primera
+   visita y en las siguientes, para navegadores con brotli, solo gzip y
+   sin compresión.
+2. Latencia del servidor por archivo: handler static contra el envío del
+   paquete ya comprimido, y la revalidación 304 que los paquetes evitan.
+3. Tiempo de `python assets.py build`.
+
+    python -m benchmarks.bench_assets
+"""
+import re
+import tempfile
+import shutil
+import time
+import os
+
+from app import app
+from assets import BUNDLES, build
+from benchmarks.common import measure, print_table
+
+PAGES = (('inicio (base.html)', '/'), ('login', '/login'), ('registro', '/register'))
+ENCODINGS = (('br', 'br, gzip'), ('gzip', 'gzip'), ('identity', ''))
+REQUESTS = 500
+
+ORIGINAL_URL = re.compile(r'(?:href|src)="(/static/(?:css|js)/[^"]+)"')
+ASSET_URL = re.compile(r'(?:href|src)="(/static/dist/[^"]+)"')
+
+
+def original_urls(page_urls):
+    """URLs que la plantilla usaba antes: las fuentes de cada paquete, servidas por static"""
+    urls = []
+    for url in page_urls:
+        name = url.rsplit('/', 1)[1]
+        stem, _, extension = name.split('.')
+        urls.extend(f'/static/{source}' for source in BUNDLES[f'{stem}.{extension}'])
+    return urls
+
+
+def transfer(client, urls, accept_encoding):
+    total = 0
+    for url in dict.fromkeys(urls):
+        response = client.get(url, headers={'Accept-Encoding': accept_encoding})
+        assert response.status_code == 200, url
+        total += len(response.data)
+    return total
+
+
+def bench_pages(client):
+    rows = []
+    for name, path in PAGES:
+        html = client.get(path).get_data(as_text=True)
+        assets = list(dict.fromkeys(ASSET_URL.findall(html)))
+        originals = original_urls(assets)
+        assert not ORIGINAL_URL.findall(html)
+        before = transfer(client, originals, '')
+        for browser, accept_encoding in ENCODINGS:
+            after = transfer(client, assets, accept_encoding)
+            # Visitas siguientes: no-cache obliga a revalidar cada archivo; immutable no
+            rows.append((name, browser, len(originals), f'{before / 1024:.1f}', f'{after / 1024:.1f}',
+                         f'{100 * (1 - after / before):.0f}%', len(originals), 0))
+    return rows
+
+
+def bench_latency(client):
+    html = client.get('/').get_data(as_text=True)
+    asset = next(url for url in ASSET_URL.findall(html) if url.endswith('.js'))
+    original = '/static/js/cart.js'
+    etag = client.get(original).headers['ETag']
+    cases = (
+        ('static cart.js', lambda: client.get(original)),
+        ('static cart.js revalidación 304', lambda: client.get(original, headers={'If-None-Match': etag})),
+        ('dist site.js br', lambda: client.get(asset, headers={'Accept-Encoding': 'br, gzip'})),
+        ('dist site.js gzip', lambda: client.get(asset, headers={'Accept-Encoding': 'gzip'})),
+    )
+    rows = []
+    for name, func in cases:
+        stats = measure(lambda: func().close(), REQUESTS)
+        rows.append((name, f"{stats['p50']:.3f}", f"{stats['p95']:.3f}"))
+    return rows
+
+
+def bench_build():
+    with tempfile.TemporaryDirectory() as directory:
+        for sources in BUNDLES.values():
+            for source in sources:
+                os.makedirs(os.path.join(directory, os.path.dirname(source)), exist_ok=True)
+                shutil.copy(os.path.join(app.static_folder, source), os.path.join(directory, source))
+        start = time.perf_counter()
+        manifest = build(directory)
+        return len(manifest), time.perf_counter() - start
+
+
+def run():
+    client = app.test_client()
+    print('1. CSS/JS propios por página (KB transferidos)')
+    print_table(('page', 'browser', 'files', 'original_kb', 'bundle_kb', 'saved',
+                 'repeat_requests_before', 'repeat_requests_after'), bench_pages(client))
+    print(f'\n2. Latencia del servidor por archivo ({REQUESTS} solicitudes, ms)')
+    print_table(('request', 'p50_ms', 'p95_ms'), bench_latency(client))
+    bundles, seconds = bench_build()
+    print(f'\n3. Build de {bundles} paquetes con sus versiones .br y .gz: {seconds:.2f} s')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,82 @@
+"""
+Benchmark de lectura del carrito (GET /api/cart).
+
+Compara la ruta original (una consulta por producto y serialización con
+marshmallow sobre cart_items) con la actual: líneas del almacén local de
+carritos (cart_store) y productos y precios desde la caché de precios
+(cart_service.get_store_items), para distintos tamaños de carrito.
+
+    python -m benchmarks.bench_cart
+"""
+from app import app, cart_item_schema, product_schema
+from benchmarks.common import (QueryCounter, bench_data, create_bench_products,
+                               create_bench_user, measure, print_table)
+from cart_service import get_store_items
+from cart_store import cart_store, user_key
+from extensions import db
+from models import CartItem, Product
+
+CART_SIZES = (1, 5, 10, 20, 40, 80)
+
+
+def legacy_get_cart(user_id):
+    """Implementación original de get_cart (N+1 consultas)"""
+    result = []
+    for item in CartItem.query.filter_by(user_id=user_id).all():
+        item_data = cart_item_schema.dump(item)
+        product = db.session.get(Product, item.product_id)
+        item_data['product'] = product_schema.dump(product)
+        result.append(item_data)
+    return result
+
+
+def run():
+    with app.app_context(), bench_data():
+        user = create_bench_user('cart')
+        user_id = user.id
+        cart_key = user_key(user_id)
+        product_ids = create_bench_products(max(CART_SIZES))
+
+        rows = []
+        try:
+            for size in CART_SIZES:
+                cart_store.clear(cart_key)
+                for pid in product_ids[:size]:
+                    cart_store.set(cart_key, pid, 2)
+                # La ruta original lee cart_items: se escriben las mismas líneas
+                cart_store.flush(cart_key=cart_key)
+
+                def legacy():
+                    legacy_get_cart(user_id)
+                    db.session.expunge_all()
+
+                def store():
+                    get_store_items(cart_store.get(cart_key), user_id)
+
+                with QueryCounter(db.engine) as legacy_queries:
+                    legacy()
+                # La primera lectura carga los precios en la caché; se cuentan las siguientes
+                store()
+                with QueryCounter(db.engine) as store_queries:
+                    store()
+
+                legacy_stats = measure(legacy)
+                store_stats = measure(store)
+                rows.append((
+                    size,
+                    legacy_queries.count, f"{legacy_stats['p50']:.2f}", f"{legacy_stats['p95']:.2f}",
+                    store_queries.count, f"{store_stats['p50']:.2f}", f"{store_stats['p95']:.2f}",
+                ))
+        finally:
+            cart_store.clear(cart_key)
+            cart_store.flush(cart_key=cart_key)
+            cart_store.forget(cart_key)
+
+        print_table(
+            ('items', 'legacy_q', 'legacy_p50', 'legacy_p95', 'store_q', 'store_p50', 'store_p95'),
+            rows
+        )
+
+
+if __name__ == '__main__':
+    run()
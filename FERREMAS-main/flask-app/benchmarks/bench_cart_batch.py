@@ -0,0 +1,57 @@
+"""
+Benchmark de carga masiva del carrito ("repetir mi última compra", cotizaciones).
+
+Compara agregar N líneas con una solicitud por línea (POST /api/cart/add
+seguido de GET /api/cart, como hacía cart.js) contra una sola solicitud a
+POST /api/cart/batch, para distintos tamaños de lote.
+
+    python -m benchmarks.bench_cart_batch
+"""
+import os
+import tempfile
+import time
+
+from app import app
+from benchmarks.common import QueryCounter, bench_data, create_bench_products, print_table
+from cart_store import cart_store
+from extensions import db
+
+LINE_COUNTS = (10, 50, 100, 200)
+
+
+def run():
+    with tempfile.TemporaryDirectory() as directory:
+        # Almacén temporal para no mezclar con los carritos reales
+        app.config['CART_STORE_PATH'] = os.path.join(directory, 'carts.db')
+        cart_store.init_app(app)
+        with app.app_context(), bench_data():
+            product_ids = create_bench_products(max(LINE_COUNTS))
+            rows = []
+            for count in LINE_COUNTS:
+                lines = product_ids[:count]
+
+                client = app.test_client()
+                with QueryCounter(db.engine) as single_queries:
+                    start = time.perf_counter()
+                    for product_id in lines:
+                        client.post('/api/cart/add', json={'product_id': product_id, 'quantity': 2})
+                        client.get('/api/cart')
+                    single_ms = (time.perf_counter() - start) * 1000
+
+                client = app.test_client()
+                operations = [{'op': 'add', 'product_id': product_id, 'quantity': 2} for product_id in lines]
+                with QueryCounter(db.engine) as batch_queries:
+                    start = time.perf_counter()
+                    response = client.post('/api/cart/batch', json={'operations': operations})
+                    batch_ms = (time.perf_counter() - start) * 1000
+                assert response.status_code == 200 and len(response.json['items']) == count
+
+                rows.append((count, count * 2, single_queries.count, f'{single_ms:.1f}',
+                             1, batch_queries.count, f'{batch_ms:.1f}'))
+
+            print_table(('lines', 'single_req', 'single_q', 'single_ms', 'batch_req', 'batch_q', 'batch_ms'),
+                        rows)
+
+
+if __name__ == '__main__':
+    run()
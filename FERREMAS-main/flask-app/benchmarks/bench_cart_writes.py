@@ -0,0 +1,92 @@
+"""
+Benchmark de escrituras del carrito (clics en "+" y cambios de cantidad).
+
+Simula sesiones que cambian la cantidad de varios productos muchas veces
+seguidas y compara la implementación anterior (una consulta y un commit a
+cart_items por cambio) con cart_store (almacén local más escritura diferida
+en lotes). Reporta latencia por cambio y sentencias enviadas a Postgres,
+incluyendo el flush final.
+
+    python -m benchmarks.bench_cart_writes
+"""
+import os
+import tempfile
+import time
+
+from app import app
+from benchmarks.common import QueryCounter, bench_data, create_bench_products, create_bench_user, print_table
+from cart_store import CartStore, user_key
+from extensions import db
+from models import CartItem
+
+USERS = 20
+PRODUCTS_PER_CART = 5
+CHANGES_PER_PRODUCT = 10
+
+
+def legacy_add(user_id, product_id, quantity):
+    """Implementación original de /api/cart/add: lectura, modificación y commit por cambio"""
+    cart_item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).first()
+    if cart_item:
+        cart_item.quantity += quantity
+    else:
+        db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+    db.session.commit()
+
+
+def run_changes(apply, user_ids, product_ids):
+    samples = []
+    for _ in range(CHANGES_PER_PRODUCT):
+        for user_id in user_ids:
+            for product_id in product_ids:
+                start = time.perf_counter()
+                apply(user_id, product_id)
+                samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples
+
+
+def run():
+    with app.app_context(), bench_data(), tempfile.TemporaryDirectory() as directory:
+        user_ids = [create_bench_user(f'cartw{i}').id for i in range(USERS)]
+        product_ids = create_bench_products(PRODUCTS_PER_CART)
+
+        def reset():
+            CartItem.query.filter(CartItem.user_id.in_(user_ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+        rows = []
+        reset()
+        with QueryCounter(db.engine) as legacy_queries:
+            start = time.perf_counter()
+            samples = run_changes(lambda u, p: legacy_add(u, p, 1), user_ids, product_ids)
+            total = time.perf_counter() - start
+        rows.append(('commit por cambio', len(samples), f'{samples[len(samples) // 2]:.3f}',
+                     f'{samples[int(len(samples) * 0.95)]:.3f}', legacy_queries.count, f'{total:.2f}'))
+
+        reset()
+        store = CartStore(path=os.path.join(directory, 'carts.db'))
+        store.init_app(app)
+        # Sin hilo en segundo plano: el flush final se mide explícitamente
+        store.flusher_enabled = False
+        with QueryCounter(db.engine) as store_queries:
+            start = time.perf_counter()
+            samples = run_changes(lambda u, p: store.add(user_key(u), p, 1), user_ids, product_ids)
+            store.flush()
+            total = time.perf_counter() - start
+        rows.append(('cart_store + flush', len(samples), f'{samples[len(samples) // 2]:.3f}',
+                     f'{samples[int(len(samples) * 0.95)]:.3f}', store_queries.count, f'{total:.2f}'))
+
+        # Ambas implementaciones deben dejar el mismo estado en cart_items
+        expected = CHANGES_PER_PRODUCT * USERS * PRODUCTS_PER_CART
+        stored = db.session.scalar(
+            db.select(db.func.sum(CartItem.quantity)).where(CartItem.user_id.in_(user_ids))
+        )
+        assert stored == expected, (stored, expected)
+        reset()
+
+        print_table(('implementación', 'cambios', 'p50_ms', 'p95_ms', 'sentencias_pg', 'total_s'), rows)
+
+
+if __name__ == '__main__':
+    run()
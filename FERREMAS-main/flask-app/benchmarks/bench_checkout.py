@@ -0,0 +1,128 @@
+"""
+Benchmark de concurrencia del checkout.
+
+Muchos compradores simulados compiten por un producto con poco stock. Compara
+la creación de orden original (items uno a uno, sin descontar stock) con
+checkout_service.create_order (precios en una consulta, reserva atómica de
+stock e inserción masiva de items).
+
+    python -m benchmarks.bench_checkout
+"""
+import threading
+import time
+
+from app import app
+from benchmarks.common import (bench_data, create_bench_products,
+                               create_bench_user, print_table)
+from checkout_service import InsufficientStockError, create_order
+from extensions import db
+from models import CartItem, Order, OrderItem, Product, WebpayTransaction
+
+BUYERS = 50
+STOCK = 5
+FILLER_LINES = 10
+
+
+def legacy_create_order(user_id):
+    """Implementación original: lazy load del producto por línea e items uno a uno"""
+    cart_items = CartItem.query.filter_by(user_id=user_id).all()
+
+    def get_precio_producto(item):
+        producto = item.product
+        if producto.is_promotion and producto.promotion_price is not None:
+            return item.quantity * producto.promotion_price
+        return item.quantity * producto.price
+
+    total = sum(get_precio_producto(item) for item in cart_items)
+    order = Order(user_id=user_id, total_amount=total, status='pending')
+    db.session.add(order)
+    db.session.flush()
+    for cart_item in cart_items:
+        producto = cart_item.product
+        if producto.is_promotion and producto.promotion_price is not None:
+            precio_usado = producto.promotion_price
+        else:
+            precio_usado = producto.price
+        db.session.add(OrderItem(order=order, product_id=cart_item.product_id,
+                                 quantity=cart_item.quantity, price_at_time=precio_usado))
+    db.session.add(WebpayTransaction(order=order, buy_order=f"OC-{order.id}",
+                                     amount=total, session_id=str(user_id)))
+    db.session.commit()
+
+
+def prepare(buyer_ids, hot_product_id, filler_ids):
+    """Deja el producto disputado con STOCK unidades y un carrito por comprador"""
+    Product.query.filter_by(id=hot_product_id).update({'stock': STOCK})
+    CartItem.query.filter(CartItem.user_id.in_(buyer_ids)).delete(synchronize_session=False)
+    db.session.add_all(
+        CartItem(user_id=user_id, product_id=product_id, quantity=1)
+        for user_id in buyer_ids
+        for product_id in [hot_product_id, *filler_ids]
+    )
+    db.session.commit()
+
+
+def run_buyers(buyer_ids, checkout):
+    """Lanza un hilo por comprador y retorna (ventas, rechazos, errores, segundos)"""
+    results = {'sold': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(buyer_ids))
+
+    def buyer(user_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                checkout(user_id)
+                outcome = 'sold'
+            except InsufficientStockError:
+                outcome = 'rejected'
+            except Exception:
+                db.session.rollback()
+                outcome = 'errors'
+            with lock:
+                results[outcome] += 1
+
+    threads = [threading.Thread(target=buyer, args=(user_id,)) for user_id in buyer_ids]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results['sold'], results['rejected'], results['errors'], time.perf_counter() - start
+
+
+def delete_orders(buyer_ids):
+    order_ids = db.session.query(Order.id).filter(Order.user_id.in_(buyer_ids)).scalar_subquery()
+    WebpayTransaction.query.filter(WebpayTransaction.order_id.in_(order_ids)).delete(synchronize_session=False)
+    Order.query.filter(Order.user_id.in_(buyer_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def run():
+    with app.app_context(), bench_data():
+        buyer_ids = [create_bench_user(f'buyer{i}').id for i in range(BUYERS)]
+        hot_product_id, *filler_ids = create_bench_products(1 + FILLER_LINES, stock=10 ** 6)
+
+        rows = []
+        try:
+            for name, checkout in (('legacy', legacy_create_order),
+                                   ('set-based', lambda user_id: create_order(user_id, str(user_id)))):
+                prepare(buyer_ids, hot_product_id, filler_ids)
+                sold, rejected, errors, elapsed = run_buyers(buyer_ids, checkout)
+                db.session.expire_all()
+                final_stock = db.session.get(Product, hot_product_id).stock
+                units_ordered = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)) \
+                    .join(Order).filter(Order.user_id.in_(buyer_ids),
+                                        OrderItem.product_id == hot_product_id).scalar()
+                rows.append((name, BUYERS, STOCK, sold, rejected, errors, final_stock,
+                             max(0, units_ordered - STOCK), f'{BUYERS / elapsed:.1f}'))
+                delete_orders(buyer_ids)
+        finally:
+            delete_orders(buyer_ids)
+
+        print_table(('path', 'buyers', 'stock', 'sold', 'rejected', 'errors',
+                     'final_stock', 'oversold', 'checkouts/s'), rows)
+
+
+if __name__ == '__main__':
+    run()
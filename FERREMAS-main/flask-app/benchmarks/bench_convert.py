@@ -0,0 +1,62 @@
+"""
+Benchmark de conversión de monedas: N llamadas a /api/convert contra una
+llamada a /api/convert/batch con los mismos montos y monedas.
+
+Usa un almacén de tasas temporal con valores fijos, por lo que no accede al
+Banco Central. El logging de la aplicación queda activo (es parte del costo
+de la ruta individual); conviene descartarlo:
+
+    python -m benchmarks.bench_convert 2>/dev/null
+"""
+import os
+import random
+import tempfile
+import time
+
+import app as ferremas
+from benchmarks.common import print_table
+from rate_store import RateStore
+
+SIZES = (10, 100, 1000, 5000)
+CURRENCIES = ['USD', 'EUR', 'UF']
+RATES = {'USD': 942.1, 'EUR': 1021.7, 'UF': 38912.45, 'UTM': 67294.0}
+
+
+def seeded_store(directory):
+    store = RateStore(os.path.join(directory, 'rates.db'))
+    for code, value in RATES.items():
+        store.save(code, [(time.strftime('%Y-%m-%d'), value)])
+    return store
+
+
+def run():
+    client = ferremas.app.test_client()
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        ferremas.currency_converter.store = seeded_store(directory)
+        ferremas.currency_converter.refresher = None
+
+        for size in SIZES:
+            amounts = [random.randint(990, 500000) for _ in range(size)]
+
+            # La API individual convierte a CLP, así que se mide una llamada
+            # por monto y moneda, que es lo que necesita hoy el frontend
+            start = time.perf_counter()
+            for amount in amounts:
+                for code in CURRENCIES:
+                    client.post('/api/convert', json={'amount': amount, 'currency': code})
+            single = time.perf_counter() - start
+
+            start = time.perf_counter()
+            response = client.post('/api/convert/batch', json={'amounts': amounts, 'currencies': CURRENCIES})
+            batch = time.perf_counter() - start
+            assert response.status_code == 200, response.get_json()
+
+            rows.append((size, size * len(CURRENCIES), f'{single * 1000:.1f}',
+                         f'{batch * 1000:.2f}', f'{single / batch:.0f}x'))
+
+    print_table(('amounts', 'single_calls', 'single_ms', 'batch_ms', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,191 @@
+"""
+Benchmark del pipeline de imágenes de productos (product_images.py).
+
+1. Latencia de subida: el guardado original (file.save con secure_filename)
+   contra store_upload (hash de contenido por bloques), para una foto
+   mediana y una de cámara, más el POST /api/products completo. También se
+   mide cuánto tardaría generar las variantes dentro de la petición, que es
+   lo que el job product_image_variants saca del request.
+2. Peso de página: una categoría con los productos de ejemplo
+   (static/images/products), con las imágenes originales y con sus
+   variantes. El peso se calcula eligiendo, como un navegador, el candidato
+   más pequeño del srcset que cubre el ancho de la imagen según `sizes`, en
+   dos escritorios (1366 px DPR 1, 1920 px DPR 2) y un teléfono (390 px, DPR 3), para
+   navegadores con AVIF, solo WebP y solo JPEG.
+
+    python -m benchmarks.bench_images
+"""
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from app import app
+from benchmarks.common import BENCH_PREFIX, bench_data, measure, print_table
+from extensions import db
+from jobs import work_once
+from models import Category, Job, Product
+from product_images import LEGACY_PREFIX, attach_image, generate_variants, store_file, store_upload
+
+UPLOADS = 20
+PHOTOS = (('mediana 1600x1200', (1600, 1200)), ('cámara 4000x3000', (4000, 3000)))
+VIEWPORTS = (('escritorio 1366px x1', 1366, 1), ('escritorio 1920px x2', 1920, 2), ('teléfono 390px x3', 390, 3))
+BROWSERS = (('avif', ('image/avif', 'image/webp')), ('webp', ('image/webp',)), ('jpeg', ()))
+
+
+def photo(size):
+    """JPEG con detalle de foto (fractal más ruido), para que el tamaño sea realista"""
+    noise = Image.effect_noise(size, 40).convert('RGB')
+    fractal = Image.effect_mandelbrot(size, (-2.2, -1.2, 1.0, 1.2), 60).convert('RGB')
+    buffer = io.BytesIO()
+    Image.blend(fractal, noise, 0.25).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def legacy_save(data, filename, directory):
+    """Guardado original de create_product: nombre del archivo, sin hash"""
+    file = FileStorage(io.BytesIO(data), filename=filename)
+    file.save(os.path.join(directory, secure_filename(file.filename)))
+
+
+def bench_uploads(legacy_dir):
+    rows = []
+    client = app.test_client()
+    for name, size in PHOTOS:
+        data = photo(size)
+        legacy = measure(lambda: legacy_save(data, 'foto.jpg', legacy_dir), UPLOADS)
+        hashed = measure(lambda: store_upload(FileStorage(io.BytesIO(data), filename='foto.jpg')), UPLOADS)
+
+        def post():
+            response = client.post('/api/products', data={
+                'name': f'{BENCH_PREFIX}upload', 'price': '1990',
+                'imageFile': (io.BytesIO(data), 'foto.jpg')
+            })
+            assert response.status_code == 201
+        endpoint = measure(post, UPLOADS)
+
+        image = store_upload(FileStorage(io.BytesIO(data), filename='foto.jpg'))
+        start = time.perf_counter()
+        generate_variants(image)
+        inline = (time.perf_counter() - start) * 1000
+        rows.append((name, f'{len(data) / 1024:.0f}', f"{legacy['p50']:.2f}", f"{hashed['p50']:.2f}",
+                     f"{endpoint['p50']:.2f}", f'{inline:.0f}'))
+    return rows
+
+
+def parse_sizes(sizes, viewport):
+    """Ancho en px de la imagen para un atributo sizes de la forma '(min-width: Npx) Wpx, ..., Xvw'"""
+    for part in sizes.split(','):
+        match = re.fullmatch(r'\s*(?:\(min-width:\s*(\d+)px\)\s*)?(\d+)(px|vw)\s*', part)
+        if match and (match.group(1) is None or viewport >= int(match.group(1))):
+            value = int(match.group(2))
+            return value if match.group(3) == 'px' else viewport * value / 100
+    return viewport
+
+
+def pick(srcset, slot):
+    """Candidato más pequeño del srcset que cubre el ancho pedido (o el mayor)"""
+    candidates = sorted((int(width), url) for url, width in re.findall(r'(\S+) (\d+)w', srcset))
+    for width, url in candidates:
+        if width >= slot:
+            return url
+    return candidates[-1][1]
+
+
+def static_size(url):
+    return os.path.getsize(os.path.join(app.static_folder, url.split('/static/', 1)[1]))
+
+
+def page_weight(html, viewport, dpr, accepted):
+    """Bytes de imágenes de producto que descargaría un navegador con esos formatos"""
+    total = count = 0
+    for picture in re.findall(r'<picture>(.*?)</picture>', html, re.S):
+        url = None
+        for mime, srcset, sizes in re.findall(r'<source type="([^"]+)" srcset="([^"]+)" sizes="([^"]+)"', picture):
+            if mime in accepted:
+                url = pick(srcset, parse_sizes(sizes, viewport) * dpr)
+                break
+        if url is None:
+            img = re.search(r'<img src="([^"]+)"(?: srcset="([^"]+)" sizes="([^"]+)")?', picture)
+            url = pick(img.group(2), parse_sizes(img.group(3), viewport) * dpr) if img.group(2) else img.group(1)
+        total += static_size(url)
+        count += 1
+    return total, count
+
+
+def bench_page_weight(category_id):
+    client = app.test_client()
+    url = f'/categoria/{category_id}'
+    before = client.get(url).get_data(as_text=True)
+
+    # Mismas imágenes por el pipeline: original por hash y variantes en el job
+    for product in Product.query.filter_by(category_id=category_id):
+        with open(os.path.join(app.static_folder, LEGACY_PREFIX, product.image), 'rb') as stream:
+            image = store_file(stream, 'jpg')
+        attach_image(product, image)
+    db.session.commit()
+    start = time.perf_counter()
+    while work_once(50):
+        pass
+    processing = time.perf_counter() - start
+    after = client.get(url).get_data(as_text=True)
+
+    rows = []
+    for viewport_name, viewport, dpr in VIEWPORTS:
+        original, count = page_weight(before, viewport, dpr, ())
+        for browser, accepted in BROWSERS:
+            weight, _ = page_weight(after, viewport, dpr, accepted)
+            rows.append((viewport_name, browser, count, f'{original / 1024:.0f}', f'{weight / 1024:.0f}',
+                         f'{100 * (1 - weight / original):.0f}%'))
+    return rows, processing
+
+
+def hash_directories():
+    """Directorios uploads/<ab>/<hash> existentes"""
+    root = app.config['UPLOAD_FOLDER']
+    return {os.path.join(root, shard, key)
+            for shard in os.listdir(root) if os.path.isdir(os.path.join(root, shard))
+            for key in os.listdir(os.path.join(root, shard))}
+
+
+def run():
+    seeds = sorted(name for name in os.listdir(os.path.join(app.static_folder, LEGACY_PREFIX))
+                   if name.endswith('.jpg') and name != 'no-image.jpg')
+    existing = hash_directories()
+    with app.app_context(), bench_data(), tempfile.TemporaryDirectory() as legacy_dir:
+        category = Category(name=f'{BENCH_PREFIX}imagenes')
+        db.session.add(category)
+        db.session.commit()
+        try:
+            db.session.add_all([Product(name=f'{BENCH_PREFIX}{name}', price=1990, stock=10, image=name,
+                                        category_id=category.id) for name in seeds])
+            db.session.commit()
+            weight_rows, processing = bench_page_weight(category.id)
+            upload_rows = bench_uploads(legacy_dir)
+        finally:
+            Job.query.filter_by(kind='product_image_variants').delete()
+            Product.query.filter(Product.name.like(f'{BENCH_PREFIX}%')).delete(synchronize_session=False)
+            db.session.delete(category)
+            db.session.commit()
+            # Solo los directorios de hash creados por el benchmark
+            for directory in hash_directories() - existing:
+                shutil.rmtree(directory)
+                if not os.listdir(os.path.dirname(directory)):
+                    os.rmdir(os.path.dirname(directory))
+
+    print(f'1. Subida de una imagen ({UPLOADS} repeticiones, p50 en ms)')
+    print_table(('photo', 'kb', 'legacy_save_ms', 'store_upload_ms', 'post_endpoint_ms', 'inline_variants_ms'),
+                upload_rows)
+    print(f'\n2. Peso de imágenes de una categoría con {len(seeds)} productos de ejemplo '
+          f'(variantes generadas en {processing:.2f} s por el job)')
+    print_table(('viewport', 'browser', 'images', 'original_kb', 'variants_kb', 'saved'), weight_rows)
+
+
+if __name__ == '__main__':
+    run()
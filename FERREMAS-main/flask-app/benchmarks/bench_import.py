@@ -0,0 +1,122 @@
+"""
+Benchmark de la importación masiva de productos (product_import).
+
+Genera planillas CSV sintéticas y mide filas por segundo para la carga
+inicial, la reimportación con cambios de precio y stock, y la reimportación
+sin cambios. Compara con la carga original de init_products (un
+db.session.add por producto) y mide el pico de memoria de Python para
+dos tamaños de archivo, que debe mantenerse constante. Los productos
+sembrados se eliminan al terminar.
+
+    python -m benchmarks.bench_import [filas]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from app import app
+from benchmarks.common import BENCH_PREFIX, bench_data, cleanup, print_table
+from extensions import db
+from models import Category, Product
+from product_import import ProductImporter
+
+DEFAULT_ROWS = 100_000
+LEGACY_ROWS = 5_000
+
+
+def write_csv(path, rows, categories, price_factor=1.0, seed=0):
+    """Escribe una planilla como las de los proveedores, fila a fila"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['codigo', 'nombre', 'precio', 'categoria', 'stock', 'descripcion'])
+        for i in range(rows):
+            # Con price_factor != 1 solo cambia una de cada cinco filas
+            factor = price_factor if i % 5 == 0 else 1.0
+            writer.writerow([
+                f'{BENCH_PREFIX}{i:07d}',
+                f'{BENCH_PREFIX}Producto {i}',
+                f'${round((1000 + i % 90000) * factor):,}'.replace(',', '.'),
+                categories[i % len(categories)],
+                rng.randint(0, 200) if factor != 1.0 else i % 200,
+                'Producto importado desde planilla de proveedor'
+            ])
+
+
+def legacy_import(path, category_ids):
+    """Carga al estilo de init_products: un objeto ORM por fila y un commit al final"""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter=';')
+        next(reader)
+        for sku, name, price, category, stock, description in reader:
+            db.session.add(Product(
+                sku=sku.replace(BENCH_PREFIX, f'{BENCH_PREFIX}L'), name=name,
+                price=float(price.replace('$', '').replace('.', '')),
+                category_id=category_ids[category.lower()], stock=int(stock), description=description
+            ))
+    db.session.commit()
+
+
+def timed_import(path):
+    start = time.perf_counter()
+    stats = ProductImporter().import_file(path)
+    return stats, time.perf_counter() - start
+
+
+def peak_memory(path):
+    """Pico de memoria asignada por Python durante la importación, en MB"""
+    tracemalloc.start()
+    ProductImporter().import_file(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def run(rows=DEFAULT_ROWS):
+    with app.app_context(), bench_data(), tempfile.TemporaryDirectory() as tmp:
+        category_ids = {c.name.lower(): c.id for c in Category.query.all()}
+        categories = [c.name for c in Category.query.all()]
+        if not categories:
+            print("Se necesitan categorías en la base de datos (python init_categories.py)")
+            return
+
+        base = os.path.join(tmp, 'base.csv')
+        changed = os.path.join(tmp, 'changed.csv')
+        small = os.path.join(tmp, 'small.csv')
+        write_csv(base, rows, categories)
+        write_csv(changed, rows, categories, price_factor=1.1, seed=1)
+        write_csv(small, LEGACY_ROWS, categories)
+        print(f"Planilla de {rows} filas: {os.path.getsize(base) / 1024 / 1024:.1f} MB")
+
+        results = []
+        for name, path in (('initial load', base), ('reimport, 20% changed', changed),
+                           ('reimport, unchanged', changed)):
+            stats, seconds = timed_import(path)
+            results.append((name, stats['rows'], f'{seconds:.2f}', stats['rows_per_sec'],
+                            stats['inserted'], stats['updated'], stats['unchanged']))
+
+        cleanup()
+        start = time.perf_counter()
+        legacy_import(small, category_ids)
+        seconds = time.perf_counter() - start
+        results.append((f'legacy session.add ({LEGACY_ROWS})', LEGACY_ROWS, f'{seconds:.2f}',
+                        round(LEGACY_ROWS / seconds), LEGACY_ROWS, 0, 0))
+        print_table(('case', 'rows', 'seconds', 'rows/s', 'inserted', 'updated', 'unchanged'), results)
+
+        cleanup()
+        print("\nPico de memoria de Python (tracemalloc):")
+        memory = []
+        for size in (rows // 10, rows):
+            path = os.path.join(tmp, f'mem_{size}.csv')
+            write_csv(path, size, categories)
+            memory.append((size, f'{peak_memory(path):.1f}'))
+            cleanup()
+        print_table(('rows', 'peak_mb'), memory)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS)
@@ -0,0 +1,182 @@
+"""
+Benchmark de la proyección product_listings (product_listing.py).
+
+1. Consultas de los listados: las consultas sobre products/categories que
+   calculaban el precio efectivo, el descuento y la categoría en cada
+   petición, contra las mismas sobre product_listings.
+2. Costo de mantenerla: escrituras de products con los triggers activos y
+   desactivados (session_replication_role = replica, requiere superusuario),
+   la reconstrucción completa y, como alternativa descartada, una vista
+   materializada equivalente con REFRESH MATERIALIZED VIEW (CONCURRENTLY).
+
+Los productos sembrados (BENCH_PREFIX) se eliminan al terminar.
+
+    python -m benchmarks.bench_listing [cantidad]
+"""
+import random
+import sys
+import time
+
+from app import app
+from benchmarks.bench_products import seed_products
+from benchmarks.common import BENCH_PREFIX, bench_data, measure, print_table
+from extensions import db
+from models import Category, Product, ProductListing
+from product_listing import LISTING_COLUMNS as PROJECTION_COLUMNS, listing_select, rebuild
+
+DEFAULT_PRODUCTS = 100_000
+REPEAT = 30
+WRITES = 200
+BULK_ROWS = 5_000
+
+# Precio efectivo y descuento calculados al leer, como antes de la proyección
+EFFECTIVE = db.case((db.and_(Product.is_promotion, Product.promotion_price.isnot(None)), Product.promotion_price),
+                    else_=Product.price)
+DISCOUNT = db.case((db.and_(Product.price > 0, EFFECTIVE < Product.price),
+                    db.func.round(100 * (1 - EFFECTIVE / Product.price))), else_=0)
+
+API_COLUMNS = (Product.id, Product.name, Product.price, Product.image, Product.is_promotion, Product.promotion_price)
+LISTING_COLUMNS = (ProductListing.id, ProductListing.name, ProductListing.price, ProductListing.image,
+                   ProductListing.is_promotion, ProductListing.promotion_price)
+
+
+def fetch(stmt):
+    return lambda: (db.session.execute(stmt).all(), db.session.rollback())
+
+
+def orm(query):
+    return lambda: (query().all(), db.session.rollback())
+
+
+def bench_queries(category_id):
+    cases = [
+        ('portada: destacados + promociones',
+         lambda: (Product.query.filter_by(is_featured=True).limit(8).all(),
+                  Product.query.filter_by(is_promotion=True).limit(6).all(), db.session.rollback()),
+         lambda: (ProductListing.query.filter_by(is_featured=True).order_by(ProductListing.id).limit(8).all(),
+                  ProductListing.query.filter_by(is_promotion=True).order_by(ProductListing.id).limit(6).all(),
+                  db.session.rollback())),
+        ('categoría completa (ORM)',
+         orm(lambda: Product.query.filter_by(category_id=category_id)),
+         orm(lambda: ProductListing.query.filter_by(category_id=category_id).order_by(ProductListing.id))),
+        ('API categoría + en stock (50)',
+         fetch(db.select(*API_COLUMNS).where(Product.category_id == category_id, Product.stock > 0)
+               .order_by(Product.id).limit(51)),
+         fetch(db.select(*LISTING_COLUMNS).where(ProductListing.category_id == category_id, ProductListing.in_stock)
+               .order_by(ProductListing.id).limit(51))),
+        ('API por precio efectivo (50)',
+         fetch(db.select(*API_COLUMNS, EFFECTIVE.label('effective_price')).order_by(EFFECTIVE, Product.id).limit(51)),
+         fetch(db.select(*LISTING_COLUMNS, ProductListing.effective_price)
+               .order_by(ProductListing.effective_price, ProductListing.id).limit(51))),
+        ('API rango de precio efectivo (50)',
+         fetch(db.select(*API_COLUMNS).where(EFFECTIVE.between(10000, 50000)).order_by(Product.id).limit(51)),
+         fetch(db.select(*LISTING_COLUMNS).where(ProductListing.effective_price.between(10000, 50000))
+               .order_by(ProductListing.id).limit(51))),
+        ('API con descuento y categoría (50)',
+         fetch(db.select(*API_COLUMNS, DISCOUNT.label('discount_percent'), Category.name, Category.icon)
+               .outerjoin(Category, Category.id == Product.category_id)
+               .where(Product.is_promotion).order_by(Product.id).limit(51)),
+         fetch(db.select(*LISTING_COLUMNS, ProductListing.discount_percent, ProductListing.category_name,
+                         ProductListing.category_icon)
+               .where(ProductListing.is_promotion).order_by(ProductListing.id).limit(51))),
+    ]
+    rows = []
+    for name, normalized, projected in cases:
+        before = measure(normalized, REPEAT)
+        after = measure(projected, REPEAT)
+        rows.append((name, f"{before['p50']:.2f}", f"{after['p50']:.2f}", f"{before['p50'] / after['p50']:.1f}x"))
+    return rows
+
+
+def timed_write(statement, triggers):
+    """Ejecuta y confirma una escritura; retorna milisegundos"""
+    start = time.perf_counter()
+    if not triggers:
+        db.session.execute(db.text('SET LOCAL session_replication_role = replica'))
+    db.session.execute(statement)
+    db.session.commit()
+    return (time.perf_counter() - start) * 1000
+
+
+def p50(samples):
+    return sorted(samples)[len(samples) // 2]
+
+
+def bench_writes(product_ids):
+    sample = random.sample(product_ids, WRITES)
+    bulk = product_ids[:BULK_ROWS]
+    cases = [
+        ('precio de 1 producto', sample, lambda pid: db.update(Product).where(Product.id == pid)
+         .values(price=Product.price + 10)),
+        ('stock de 1 producto (sigue > 0)', sample, lambda pid: db.update(Product).where(Product.id == pid)
+         .values(stock=Product.stock + 1)),
+        (f'precio de {BULK_ROWS} productos', sample[:10], lambda pid: db.update(Product).where(Product.id.in_(bulk))
+         .values(price=Product.price + 1)),
+    ]
+    rows = []
+    for name, ids, statement in cases:
+        # El stock de los productos sembrados con 0 se sube primero para no cruzar el cero
+        db.session.execute(db.update(Product).where(Product.id.in_(ids), Product.stock <= 0).values(stock=5))
+        db.session.commit()
+        without = p50([timed_write(statement(pid), False) for pid in ids])
+        with_triggers = p50([timed_write(statement(pid), True) for pid in ids])
+        rows.append((name, len(ids), f'{without:.2f}', f'{with_triggers:.2f}', f'{with_triggers - without:+.2f}'))
+    return rows
+
+
+def bench_refresh():
+    db.session.execute(db.text(f"CREATE MATERIALIZED VIEW bench_listing_mv ({', '.join(PROJECTION_COLUMNS)}) "
+                               f"AS {listing_select('products')}"))
+    db.session.execute(db.text('CREATE UNIQUE INDEX ON bench_listing_mv (id)'))
+    # Los mismos índices de product_listings, para comparar en igualdad de condiciones
+    for index in ProductListing.__table__.indexes:
+        include = ', '.join(index.dialect_options['postgresql']['include'])
+        where = index.dialect_options['postgresql']['where']
+        db.session.execute(db.text(
+            f"CREATE INDEX ON bench_listing_mv ({', '.join(column.name for column in index.columns)}) "
+            f"INCLUDE ({include})" + (f' WHERE {where}' if where is not None else '')
+        ))
+    db.session.commit()
+    try:
+        rows = []
+        start = time.perf_counter()
+        rebuild()
+        rows.append(('product_listing.rebuild()', f'{time.perf_counter() - start:.2f}'))
+        for name, sql in (('REFRESH MATERIALIZED VIEW', 'REFRESH MATERIALIZED VIEW bench_listing_mv'),
+                          ('REFRESH ... CONCURRENTLY', 'REFRESH MATERIALIZED VIEW CONCURRENTLY bench_listing_mv')):
+            start = time.perf_counter()
+            db.session.execute(db.text(sql))
+            db.session.commit()
+            rows.append((name, f'{time.perf_counter() - start:.2f}'))
+    finally:
+        db.session.rollback()
+        db.session.execute(db.text('DROP MATERIALIZED VIEW IF EXISTS bench_listing_mv'))
+        db.session.commit()
+    return rows
+
+
+def run(count=DEFAULT_PRODUCTS):
+    with app.app_context(), bench_data():
+        print(f"Sembrando {count} productos (los triggers escriben la proyección)...")
+        print(f"Sembrado en {seed_products(count):.1f}s")
+        db.session.execute(db.text('ANALYZE product_listings'))
+        db.session.commit()
+        product_ids = db.session.scalars(
+            db.select(Product.id).where(Product.name.like(f'{BENCH_PREFIX}%')).order_by(Product.id)
+        ).all()
+        category_id = db.session.scalar(
+            db.select(Product.category_id).where(Product.id == product_ids[0])
+        )
+
+        print(f'\n1. Consultas de listados sobre {count} productos (p50 en ms, {REPEAT} repeticiones)')
+        print_table(('query', 'products_ms', 'listing_ms', 'speedup'), bench_queries(category_id))
+
+        print('\n2. Escrituras con y sin los triggers de la proyección (p50 en ms, con commit)')
+        print_table(('write', 'samples', 'no_triggers_ms', 'triggers_ms', 'overhead_ms'), bench_writes(product_ids))
+
+        print(f'\n3. Recalcular la proyección completa ({len(product_ids)} productos de benchmark más el catálogo)')
+        print_table(('refresh', 'seconds'), bench_refresh())
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PRODUCTS)
@@ -0,0 +1,118 @@
+"""
+Benchmark del costo del logging en rutas y llamadas frecuentes.
+
+Mide operaciones por segundo de POST /api/convert y del ciclo
+create/commit de WebpayPlus (con un Transaction falso, sin red) con tres
+configuraciones de logging, escribiendo siempre a un archivo real:
+
+- sync DEBUG: handler sincrónico en el hilo de la petición y todo el
+  detalle (respuestas completas), equivalente a los print() anteriores
+- async INFO: configuración por defecto (cola + hilo de escritura, JSON,
+  muestreo y redacción)
+- off: logging deshabilitado
+
+    python -m benchmarks.bench_logging
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import app as ferremas
+from benchmarks.bench_convert import seeded_store
+from benchmarks.common import print_table
+from log_config import TextFormatter, configure_logging, shutdown_logging
+
+REQUESTS = 3000
+PAYMENTS = 3000
+THREADS = 4
+
+
+class FakeTransaction:
+    """Responde como el SDK de Transbank, sin acceder a la red"""
+
+    def create(self, buy_order, session_id, amount, return_url):
+        return {'token': 'e9d5' * 16, 'url': 'https://webpay3gint.transbank.cl/webpayserver/initTransaction'}
+
+    def commit(self, token):
+        return {
+            'vci': 'TSY', 'amount': 15990, 'status': 'AUTHORIZED', 'buy_order': 'OC-1',
+            'session_id': '1', 'card_detail': {'card_number': '6623'}, 'accounting_date': '1018',
+            'transaction_date': '2026-10-18T12:00:00.000Z', 'authorization_code': '1213',
+            'payment_type_code': 'VN', 'response_code': 0, 'installments_number': 0
+        }
+
+
+def use_sync_debug(path):
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logging.FileHandler(path, encoding='utf-8')
+    handler.setFormatter(TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    logging.disable(logging.NOTSET)
+
+
+def use_async_default(path):
+    logging.disable(logging.NOTSET)
+    configure_logging(level='INFO', levels={}, sampling={}, stream=open(path, 'a', encoding='utf-8'))
+
+
+def use_off(path):
+    logging.disable(logging.CRITICAL)
+
+
+def parallel(func, total):
+    """Ejecuta func total veces repartidas en THREADS hilos; retorna ops/s"""
+    def worker():
+        for _ in range(total // THREADS):
+            func()
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return total / (time.perf_counter() - start)
+
+
+def run():
+    client = ferremas.app.test_client()
+    webpay = ferremas.webpay
+    webpay.tx = FakeTransaction()
+
+    def convert():
+        client.post('/api/convert', json={'amount': 100, 'currency': 'USD'})
+
+    def payment():
+        webpay.create_transaction(15990, 'OC-1', '1', 'http://localhost:5000/retorno-webpay')
+        webpay.commit_transaction('e9d5' * 16)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        ferremas.currency_converter.store = seeded_store(directory)
+        ferremas.currency_converter.refresher = None
+
+        for name, setup in (('sync DEBUG', use_sync_debug), ('async INFO', use_async_default), ('off', use_off)):
+            path = os.path.join(directory, f"{name.replace(' ', '_')}.log")
+            open(path, 'w').close()
+            setup(path)
+            convert_ops = parallel(convert, REQUESTS)
+            payment_ops = parallel(payment, PAYMENTS)
+            # Vacía la cola antes de medir el archivo
+            shutdown_logging()
+            for handler in logging.getLogger().handlers:
+                handler.flush()
+            size = os.path.getsize(path)
+            rows.append((name, f'{convert_ops:.0f}', f'{payment_ops:.0f}', f'{size / 1024:.0f}'))
+
+    logging.disable(logging.NOTSET)
+    print_table(('logging', 'convert req/s', 'webpay create+commit/s', 'log_kb'), rows)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,258 @@
+"""
+Benchmark del historial y la búsqueda de órdenes (order_service.py).
+
+Siembra órdenes de benchmark (por defecto 1.000.000, con 2 ítems y una
+transacción de Webpay cada una, repartidas entre BUYERS usuarios y dos
+años) con INSERT ... SELECT generate_series, y mide:
+
+1. La búsqueda de administración con cada filtro, con y sin los índices
+   de la migración f1a6c8e4d392 (se eliminan dentro de una transacción que
+   se revierte), contra el presupuesto BUDGET_MS en p95.
+2. Consultas y latencia de una página según cómo se cargan las relaciones
+   (lazy, como antes, contra selectinload) y según cómo se pagina
+   (OFFSET contra cursor) en una página profunda.
+3. Los endpoints completos /api/orders y /api/admin/orders, y el corte por
+   ORDERS_ADMIN_TIMEOUT_MS de un filtro que los índices no acotan.
+
+Las órdenes, transacciones, usuarios y productos sembrados se eliminan al
+terminar.
+
+    python -m benchmarks.bench_orders [cantidad]
+"""
+import sys
+import time
+from datetime import timedelta
+
+from app import app
+from benchmarks.common import (BENCH_PREFIX, QueryCounter, bench_data, create_bench_products, create_bench_user,
+                               measure, print_table)
+from extensions import db
+from models import Order, User, WebpayTransaction
+from order_service import OrderSearchTimeoutError, list_orders, orders_query, serialize_order
+
+DEFAULT_ORDERS = 1_000_000
+BUYERS = 10_000
+PRODUCTS = 50
+LIMIT = 20
+REPEAT = 30
+DEEP_PAGES = 500
+# Latencia máxima aceptada (p95) de una página de la búsqueda de administración
+BUDGET_MS = 50
+
+ORDER_INDEXES = ('idx_orders_user_id_created_at_id', 'idx_orders_status_created_at_id', 'idx_orders_created_at_id',
+                 'idx_order_items_order_id', 'idx_webpay_transactions_order_id')
+
+
+def seed_buyers(count):
+    """Crea `count` usuarios de benchmark y retorna sus IDs"""
+    db.session.execute(db.text("""
+        INSERT INTO users (username, email, password, is_admin)
+        SELECT :prefix || 'buyer' || g, 'bench-buyer' || g || '@bench.local', 'x', false
+        FROM generate_series(1, :count) g
+    """), {'prefix': BENCH_PREFIX, 'count': count})
+    db.session.commit()
+    return db.session.scalars(
+        db.select(User.id).where(User.username.like(f'{BENCH_PREFIX}buyer%')).order_by(User.id)
+    ).all()
+
+
+def seed_orders(count, user_ids, product_ids):
+    """Inserta `count` órdenes con 2 ítems y una transacción cada una; retorna segundos"""
+    start = time.perf_counter()
+    # Las órdenes sembradas son las de ID mayor al último existente
+    last_id = db.session.scalar(db.select(db.func.coalesce(db.func.max(Order.id), 0)))
+    # Sin las verificaciones de claves foráneas fila a fila (requiere superusuario): los IDs
+    # sembrados existen por construcción
+    db.session.execute(db.text('SET LOCAL session_replication_role = replica'))
+    db.session.execute(db.text("""
+        INSERT INTO orders (user_id, total_amount, status, created_at, updated_at)
+        SELECT (:users)[1 + g % cardinality(:users)], round((990 + random() * 500000)::numeric),
+               CASE WHEN r < 0.70 THEN 'completed' WHEN r < 0.80 THEN 'pending'
+                    WHEN r < 0.95 THEN 'failed' ELSE 'cancelled' END,
+               t, t
+        FROM (SELECT g, random() AS r, now() - random() * interval '730 days' AS t
+              FROM generate_series(1, :count) g) s
+    """), {'users': user_ids, 'count': count})
+    bench_orders = 'SELECT id, total_amount, status, created_at FROM orders WHERE id > :last_id'
+    db.session.execute(db.text(f"""
+        INSERT INTO order_items (order_id, product_id, quantity, price_at_time, created_at)
+        SELECT o.id, (:products)[1 + (o.id * k) % cardinality(:products)], 1 + o.id % 3, 1990, o.created_at
+        FROM ({bench_orders}) o CROSS JOIN generate_series(1, 2) k
+    """), {'last_id': last_id, 'products': product_ids})
+    db.session.execute(db.text(f"""
+        INSERT INTO webpay_transactions (order_id, buy_order, token_ws, amount, status, session_id,
+                                         created_at, updated_at)
+        SELECT o.id, '{BENCH_PREFIX}' || o.id, md5(o.id::text), o.total_amount,
+               CASE o.status WHEN 'pending' THEN 'initiated' ELSE o.status END, o.id::text, o.created_at, o.created_at
+        FROM ({bench_orders}) o
+    """), {'last_id': last_id})
+    db.session.commit()
+    for table in ('orders', 'order_items', 'webpay_transactions'):
+        db.session.execute(db.text(f'ANALYZE {table}'))
+    db.session.commit()
+    return time.perf_counter() - start
+
+
+def delete_orders():
+    users = db.select(User.id).where(User.username.like(f'{BENCH_PREFIX}%')).scalar_subquery()
+    orders = db.select(Order.id).where(Order.user_id.in_(users)).scalar_subquery()
+    db.session.execute(db.delete(WebpayTransaction).where(WebpayTransaction.order_id.in_(orders)))
+    db.session.execute(db.delete(Order).where(Order.user_id.in_(users)))
+    db.session.commit()
+
+
+def fetch_page(params, include_user=True):
+    """Una página de la búsqueda con sus relaciones, sin terminar la transacción"""
+    orders = db.session.scalars(orders_query(LIMIT, include_user=include_user, **params)).all()
+    page = [serialize_order(order, include_user) for order in orders[:LIMIT]]
+    db.session.expunge_all()
+    return page
+
+
+def cursor_after(pages, status=None):
+    """Clave (created_at, id) de la última orden tras recorrer `pages` páginas"""
+    stmt = db.select(Order.created_at, Order.id)
+    if status is not None:
+        stmt = stmt.where(Order.status == status)
+    stmt = stmt.order_by(Order.created_at.desc(), Order.id.desc()).offset(pages * LIMIT - 1).limit(1)
+    return tuple(db.session.execute(stmt).one())
+
+
+def bench_search(cases):
+    rows = []
+    indexed = {name: measure(lambda: fetch_page(params), REPEAT) for name, params in cases}
+    db.session.rollback()
+    try:
+        for index in ORDER_INDEXES:
+            db.session.execute(db.text(f'DROP INDEX {index}'))
+        for name, params in cases:
+            without = measure(lambda: fetch_page(params), 5)
+            stats = indexed[name]
+            rows.append((name, f"{without['p50']:.1f}", f"{stats['p50']:.2f}", f"{stats['p95']:.2f}",
+                         'sí' if stats['p95'] <= BUDGET_MS else 'NO'))
+    finally:
+        # Revierte el DROP INDEX
+        db.session.rollback()
+    return rows
+
+
+def lazy_page(offset=0):
+    """Como se habría listado sin order_service: OFFSET y relaciones lazy=True"""
+    orders = Order.query.order_by(Order.created_at.desc(), Order.id.desc()).offset(offset).limit(LIMIT).all()
+    page = []
+    for order in orders:
+        page.append((order.user.email if order.user else None,
+                     [(item.product.name if item.product else None, item.quantity) for item in order.items],
+                     [transaction.status for transaction in order.transactions]))
+    db.session.expunge_all()
+    return page
+
+
+def bench_loading(deep_cursor):
+    cases = (
+        ('página 1, relaciones lazy (N+1)', lambda: lazy_page()),
+        ('página 1, selectinload', lambda: fetch_page({})),
+        (f'página {DEEP_PAGES + 1}, OFFSET + lazy', lambda: lazy_page(DEEP_PAGES * LIMIT)),
+        (f'página {DEEP_PAGES + 1}, cursor + selectinload', lambda: fetch_page({'cursor': deep_cursor})),
+    )
+    rows = []
+    for name, func in cases:
+        with QueryCounter(db.engine) as counter:
+            func()
+        stats = measure(func, REPEAT)
+        rows.append((name, counter.count, f"{stats['p50']:.2f}", f"{stats['p95']:.2f}"))
+    db.session.rollback()
+    return rows
+
+
+def bench_endpoints(admin_id, buyer_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = admin_id
+    buyer = app.test_client()
+    with buyer.session_transaction() as session:
+        session['user_id'] = buyer_id
+
+    cases = (
+        ('GET /api/orders (historial)', buyer, '/api/orders'),
+        ('GET /api/admin/orders', client, '/api/admin/orders'),
+        ('GET /api/admin/orders?status=failed', client, '/api/admin/orders?status=failed'),
+    )
+    rows = []
+    for name, test_client, url in cases:
+        assert test_client.get(url).status_code == 200, url
+        stats = measure(lambda: test_client.get(url).close(), REPEAT)
+        rows.append((name, f"{stats['p50']:.2f}", f"{stats['p95']:.2f}"))
+    return rows
+
+
+def bench_timeout():
+    """Un monto que ninguna orden cumple recorre todo idx_orders_created_at_id"""
+    params = {'min_total': 10 ** 7}
+    rows = []
+    for timeout_ms in (None, app.config['ORDERS_ADMIN_TIMEOUT_MS'], BUDGET_MS):
+        start = time.perf_counter()
+        try:
+            list_orders(LIMIT, include_user=True, timeout_ms=timeout_ms, **params)
+            result = 'completa'
+        except OrderSearchTimeoutError:
+            result = '503'
+        rows.append((timeout_ms or 'sin límite', result, f'{(time.perf_counter() - start) * 1000:.1f}'))
+    return rows
+
+
+def run(count=DEFAULT_ORDERS):
+    with app.app_context(), bench_data():
+        try:
+            user_ids = seed_buyers(BUYERS)
+            admin = create_bench_user('admin')
+            admin.is_admin = True
+            admin_id = admin.id
+            db.session.commit()
+            product_ids = create_bench_products(PRODUCTS)
+
+            print(f'Sembrando {count} órdenes de {BUYERS} usuarios...')
+            print(f'Sembrado en {seed_orders(count, user_ids, product_ids):.1f}s')
+
+            buyer_id = user_ids[len(user_ids) // 2]
+            buyer_email = db.session.scalar(db.select(User.email).where(User.id == buyer_id))
+            buy_order = db.session.scalar(
+                db.select(WebpayTransaction.buy_order).where(WebpayTransaction.buy_order.like(f'{BENCH_PREFIX}%'))
+                .order_by(WebpayTransaction.id.desc()).limit(1)
+            )
+            newest = db.session.scalar(db.select(db.func.max(Order.created_at)))
+            month = {'date_from': newest - timedelta(days=30), 'date_to': newest + timedelta(seconds=1)}
+            deep_cursor = cursor_after(DEEP_PAGES)
+            deep_completed = cursor_after(DEEP_PAGES, 'completed')
+            db.session.rollback()
+
+            cases = (
+                ('sin filtros', {}),
+                ('status=failed', {'status': 'failed'}),
+                ('status=cancelled + último mes', {'status': 'cancelled', **month}),
+                ('último mes', month),
+                ('user_id', {'user_id': buyer_id}),
+                ('email', {'email': buyer_email}),
+                ('buy_order', {'buy_order': buy_order}),
+                (f'página {DEEP_PAGES + 1} (cursor)', {'cursor': deep_cursor}),
+                (f'status=completed, página {DEEP_PAGES + 1}', {'status': 'completed', 'cursor': deep_completed}),
+            )
+            print(f'\n1. Búsqueda de administración sobre {count} órdenes, {LIMIT} por página con usuario, '
+                  f'ítems y transacciones (ms; presupuesto p95 {BUDGET_MS} ms)')
+            print_table(('filter', 'no_index_p50', 'p50', 'p95', 'within_budget'), bench_search(cases))
+
+            print(f'\n2. Carga de relaciones y paginación ({LIMIT} órdenes por página)')
+            print_table(('page', 'queries', 'p50_ms', 'p95_ms'), bench_loading(deep_cursor))
+
+            print('\n3. Endpoints completos (ms)')
+            print_table(('request', 'p50_ms', 'p95_ms'), bench_endpoints(admin_id, buyer_id))
+
+            print('\n4. Filtro que los índices no acotan (min_total sin coincidencias) según ORDERS_ADMIN_TIMEOUT_MS')
+            print_table(('timeout_ms', 'result', 'elapsed_ms'), bench_timeout())
+        finally:
+            db.session.rollback()
+            delete_orders()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ORDERS)
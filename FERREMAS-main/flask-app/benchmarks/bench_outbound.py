@@ -0,0 +1,154 @@
+"""
+Benchmark de la capa de llamadas salientes (http_client.py) contra los servidores falsos.
+
+1. Keep-alive: CALLS consultas seguidas al SieteRestWS falso abriendo una
+   conexión por llamada (requests.get) y con el pool del ServiceClient.
+2. Series en paralelo: las cuatro monedas con fetch_observations una tras
+   otra y con CurrencyConverter.fetch_many (asyncio), con SERIES_LATENCY de latencia.
+3. Circuit breaker: OUTAGE_CALLS llamadas a un servicio que no responde
+   dentro del timeout, con y sin breaker.
+4. Presupuesto de reintentos: FLAKY_CALLS llamadas con un FLAKY_RATE de
+   errores 500 (los reintentos recuperan casi todas) y con el servicio
+   caído (el presupuesto limita la carga extra que generan los reintentos).
+
+    python -m benchmarks.bench_outbound
+"""
+import tempfile
+import time
+import os
+
+import requests
+
+from benchmarks.common import measure, print_table
+from currency_converter import CURRENCY_SERIES, CurrencyConverter
+from fakes.bcentral import FakeBcentralServer
+from fakes.server import FakeBehavior, start_in_thread
+from http_client import CircuitBreaker, RetryBudget, ServiceClient
+from rate_history import RateHistory
+from rate_store import RateStore
+
+CALLS = 200
+SERIES_LATENCY = 0.2
+OUTAGE_CALLS = 30
+OUTAGE_TIMEOUT = 0.2
+FLAKY_CALLS = 300
+FLAKY_RATE = 0.2
+
+PARAMS = {'user': 'bench', 'pass': 'bench', 'function': 'GetSeries', 'timeseries': 'F073.UF.PRE.Z.D',
+          'firstdate': '2024-01-01', 'lastdate': '2024-01-05'}
+
+
+def server_calls(server):
+    return sum(server.counters.values())
+
+
+def bench_keep_alive():
+    server = start_in_thread(FakeBcentralServer(behavior=FakeBehavior()))
+    client = ServiceClient('bench', base_url=server.service_url)
+    try:
+        fresh = measure(lambda: requests.get(server.service_url, params=PARAMS, timeout=5).raise_for_status(), CALLS)
+        pooled = measure(lambda: client.get('', params=PARAMS).raise_for_status(), CALLS)
+    finally:
+        client.close()
+        server.shutdown()
+    return [('conexión por llamada', f"{fresh['p50']:.2f}", f"{fresh['p95']:.2f}"),
+            ('pool keep-alive', f"{pooled['p50']:.2f}", f"{pooled['p95']:.2f}")]
+
+
+def bench_parallel_series(directory):
+    server = start_in_thread(FakeBcentralServer(behavior=FakeBehavior(latency=SERIES_LATENCY)))
+    converter = CurrencyConverter(store=RateStore(os.path.join(directory, 'rates.db')),
+                                  history=RateHistory(os.path.join(directory, 'rate_history')),
+                                  base_url=server.service_url)
+    codes = list(CURRENCY_SERIES)
+    try:
+        start = time.perf_counter()
+        sequential = {code: converter.fetch_observations(code) for code in codes}
+        sequential_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = converter.fetch_many(codes)
+        parallel_seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    same = parallel == sequential
+    return [('secuencial', len(codes), f'{sequential_seconds:.2f}', True),
+            ('fetch_many (asyncio)', len(codes), f'{parallel_seconds:.2f}', same)]
+
+
+def run_calls(client, calls):
+    """Retorna (exitosas, rechazadas por el breaker, segundos)"""
+    ok = rejected = 0
+    start = time.perf_counter()
+    for _ in range(calls):
+        try:
+            if client.get('', params=PARAMS).ok:
+                ok += 1
+        except requests.ConnectionError as e:
+            rejected += 'Circuito abierto' in str(e)
+        except requests.RequestException:
+            pass
+    return ok, rejected, time.perf_counter() - start
+
+
+def bench_breaker():
+    # El servicio tarda 5 veces el timeout: cada llamada falla por timeout
+    server = start_in_thread(FakeBcentralServer(behavior=FakeBehavior(latency=OUTAGE_TIMEOUT * 5)))
+    rows = []
+    try:
+        for name, threshold in (('sin breaker', 10 ** 9), ('con breaker', 5)):
+            client = ServiceClient('bench', base_url=server.service_url, timeout=OUTAGE_TIMEOUT,
+                                   breaker=CircuitBreaker(failure_threshold=threshold, reset_timeout=60))
+            before = server_calls(server)
+            ok, rejected, seconds = run_calls(client, OUTAGE_CALLS)
+            # Las solicitudes que expiraron aún se están atendiendo en el servidor
+            time.sleep(OUTAGE_TIMEOUT * 5)
+            rows.append((name, OUTAGE_CALLS, client.counters['requests'], rejected,
+                         f'{seconds:.2f}', f'{seconds / OUTAGE_CALLS * 1000:.0f}'))
+            client.close()
+            assert server_calls(server) - before == client.counters['requests']
+    finally:
+        server.shutdown()
+    return rows
+
+
+def bench_retry_budget():
+    rows = []
+    for scenario, error_rate in (('errores 20 %', FLAKY_RATE), ('servicio caído', 1.0)):
+        server = start_in_thread(FakeBcentralServer(behavior=FakeBehavior(error_rate=error_rate, seed=1)))
+        try:
+            for name, max_retries, budget in (('sin reintentos', 0, RetryBudget()),
+                                              ('reintentos sin límite', 2, RetryBudget(ratio=10 ** 9)),
+                                              ('reintentos con presupuesto', 2, RetryBudget(ratio=0.2))):
+                client = ServiceClient('bench', base_url=server.service_url, max_retries=max_retries,
+                                       backoff=0.001, budget=budget,
+                                       breaker=CircuitBreaker(failure_threshold=10 ** 9))
+                before = server_calls(server)
+                ok, _, _ = run_calls(client, FLAKY_CALLS)
+                sent = server_calls(server) - before
+                rows.append((scenario, name, f'{ok}/{FLAKY_CALLS}', sent, f'{sent / FLAKY_CALLS:.2f}',
+                             client.counters['retries_denied']))
+                client.close()
+        finally:
+            server.shutdown()
+    return rows
+
+
+def run():
+    print(f'1. Keep-alive: {CALLS} consultas seguidas al SieteRestWS falso (ms)')
+    print_table(('client', 'p50_ms', 'p95_ms'), bench_keep_alive())
+
+    print(f'\n2. Cuatro series con {SERIES_LATENCY * 1000:.0f} ms de latencia')
+    with tempfile.TemporaryDirectory() as directory:
+        print_table(('path', 'series', 'seconds', 'same_result'), bench_parallel_series(directory))
+
+    print(f'\n3. Servicio sin respuesta, timeout de {OUTAGE_TIMEOUT * 1000:.0f} ms, {OUTAGE_CALLS} llamadas')
+    print_table(('client', 'calls', 'sent', 'rejected', 'seconds', 'ms_per_call'), bench_breaker())
+
+    print(f'\n4. Reintentos, {FLAKY_CALLS} llamadas GET')
+    print_table(('scenario', 'client', 'ok', 'server_calls', 'amplification', 'retries_denied'),
+                bench_retry_budget())
+
+
+if __name__ == '__main__':
+    run()
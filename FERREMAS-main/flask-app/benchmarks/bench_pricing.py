@@ -0,0 +1,123 @@
+"""
+Micro-benchmarks del motor de precios (pricing.py).
+
+1. Valorización de N líneas: suma en Decimal como hacía create_order,
+   el motor en modo escalar (Decimal) y vectorizado (centavos en NumPy). Los tres deben dar
+   exactamente el mismo total.
+2. Regla de promoción + valorización a partir de columnas de Product
+   (price_products), escalar contra vectorizada.
+3. Caché de precios: get_many en frío (consulta) y en caliente.
+4. GET /api/cart?totals=1 con la caché en caliente y con la caché
+   invalidada antes de cada lectura.
+
+    python -m benchmarks.bench_pricing
+"""
+import os
+import random
+import tempfile
+from decimal import Decimal
+
+from app import app
+from benchmarks.common import bench_data, create_bench_products, measure, print_table
+from cart_store import cart_store
+from pricing import price_cache, price_lines, price_products, to_decimal
+
+LINE_COUNTS = (1, 10, 64, 1000, 10000)
+CART_SIZE = 40
+
+
+def random_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for product_id in range(count):
+        price = rng.choice((990, 1990, 24990, 89990.5, 12345.67))
+        on_promotion = rng.random() < 0.3
+        rows.append((product_id, rng.randint(1, 20), price, on_promotion,
+                     round(price * 0.85, 2) if on_promotion else None))
+    return rows
+
+
+def legacy_total(lines):
+    """Suma en Decimal de create_order antes del motor de precios"""
+    return sum((Decimal(quantity) * unit_price for _, quantity, unit_price in lines), Decimal('0'))
+
+
+def bench_lines():
+    rows = []
+    for count in LINE_COUNTS:
+        lines = [(product_id, quantity, to_decimal(price))
+                 for product_id, quantity, price, _, _ in random_rows(count)]
+        repeat = 200 if count <= 1000 else 20
+        expected = legacy_total(lines)
+        assert price_lines(lines, vectorize=False).total == expected
+        assert price_lines(lines, vectorize=True).total == expected
+
+        legacy = measure(lambda: legacy_total(lines), repeat)
+        scalar = measure(lambda: price_lines(lines, vectorize=False).total, repeat)
+        vector = measure(lambda: price_lines(lines, vectorize=True).total, repeat)
+        rows.append((count, f"{legacy['p50'] * 1000:.1f}", f"{scalar['p50'] * 1000:.1f}",
+                     f"{vector['p50'] * 1000:.1f}"))
+    print('Valorización de líneas (p50 en µs)')
+    print_table(('lines', 'decimal_sum', 'engine_scalar', 'engine_numpy'), rows)
+
+
+def bench_products():
+    rows = []
+    for count in LINE_COUNTS:
+        product_rows = random_rows(count)
+        repeat = 200 if count <= 1000 else 20
+        assert price_products(product_rows, vectorize=False).total == \
+            price_products(product_rows, vectorize=True).total
+
+        scalar = measure(lambda: price_products(product_rows, vectorize=False).total, repeat)
+        vector = measure(lambda: price_products(product_rows, vectorize=True).total, repeat)
+        rows.append((count, f"{scalar['p50'] * 1000:.1f}", f"{vector['p50'] * 1000:.1f}"))
+    print('\nRegla de promoción + valorización (p50 en µs)')
+    print_table(('lines', 'scalar', 'numpy'), rows)
+
+
+def bench_cache_and_cart(product_ids):
+    def cold():
+        price_cache.invalidate()
+        price_cache.get_many(product_ids)
+
+    warm_ids = list(product_ids)
+    price_cache.get_many(warm_ids)
+    cold_stats = measure(cold, 50)
+    warm_stats = measure(lambda: price_cache.get_many(warm_ids), 200)
+
+    client = app.test_client()
+    client.post('/api/cart/batch', json={'operations': [
+        {'op': 'add', 'product_id': product_id, 'quantity': 2} for product_id in product_ids
+    ]})
+
+    def cart_cold():
+        price_cache.invalidate()
+        client.get('/api/cart?totals=1')
+
+    client.get('/api/cart?totals=1')
+    cart_warm = measure(lambda: client.get('/api/cart?totals=1'), 100)
+    cart_cold_stats = measure(cart_cold, 100)
+
+    print(f'\nCaché de precios y GET /api/cart?totals=1 ({len(product_ids)} productos, p50/p95 en ms)')
+    print_table(('caso', 'p50', 'p95'), [
+        ('get_many en frío', f"{cold_stats['p50']:.3f}", f"{cold_stats['p95']:.3f}"),
+        ('get_many en caliente', f"{warm_stats['p50']:.3f}", f"{warm_stats['p95']:.3f}"),
+        ('GET /api/cart, caché invalidada', f"{cart_cold_stats['p50']:.3f}", f"{cart_cold_stats['p95']:.3f}"),
+        ('GET /api/cart, caché en caliente', f"{cart_warm['p50']:.3f}", f"{cart_warm['p95']:.3f}"),
+    ])
+
+
+def run():
+    bench_lines()
+    bench_products()
+    with tempfile.TemporaryDirectory() as directory:
+        # Almacén de carritos temporal para no mezclar con los carritos reales
+        app.config['CART_STORE_PATH'] = os.path.join(directory, 'carts.db')
+        cart_store.init_app(app)
+        with app.app_context(), bench_data():
+            bench_cache_and_cart(create_bench_products(CART_SIZE))
+
+
+if __name__ == '__main__':
+    run()
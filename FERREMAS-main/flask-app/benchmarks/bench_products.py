@@ -0,0 +1,118 @@
+"""
+Benchmark de carga de GET /api/products sobre un catálogo de 100.000 productos.
+
+Compara la respuesta completa original (Product.query.all() + marshmallow)
+con páginas por cursor, páginas profundas, filtros y selección de campos.
+Los productos sembrados se eliminan al terminar.
+
+    python -m benchmarks.bench_products [cantidad]
+"""
+import random
+import sys
+import threading
+import time
+
+from app import app, products_schema
+from benchmarks.common import BENCH_PREFIX, bench_data, measure, print_table
+from extensions import db
+from models import Category, Product
+
+DEFAULT_PRODUCTS = 100_000
+CHUNK = 5_000
+THREADS = 8
+REQUESTS_PER_THREAD = 50
+
+
+def seed_products(count):
+    """Inserta `count` productos de benchmark en lotes"""
+    category_ids = [c.id for c in Category.query.all()] or [None]
+    start = time.perf_counter()
+    for offset in range(0, count, CHUNK):
+        rows = []
+        for i in range(offset, min(offset + CHUNK, count)):
+            price = random.randint(990, 300000)
+            promotion = random.random() < 0.1
+            rows.append({
+                'name': f'{BENCH_PREFIX}{i}',
+                'description': 'Producto de benchmark',
+                'price': price,
+                'stock': random.choice([0, 5, 20, 100]),
+                'is_featured': random.random() < 0.05,
+                'is_promotion': promotion,
+                'promotion_price': round(price * 0.85) if promotion else None,
+                'category_id': random.choice(category_ids),
+                'image': 'no-image.jpg'
+            })
+        db.session.execute(db.insert(Product), rows)
+        db.session.commit()
+    db.session.execute(db.text('ANALYZE products'))
+    db.session.commit()
+    return time.perf_counter() - start
+
+
+def legacy_get_products():
+    return products_schema.dump(Product.query.all())
+
+
+def walk_pages(client, query, pages):
+    """Recorre `pages` páginas siguiendo next_cursor y retorna el último cursor"""
+    cursor = None
+    for _ in range(pages):
+        url = query + (f'&cursor={cursor}' if cursor else '')
+        cursor = client.get(url).get_json()['next_cursor']
+        if not cursor:
+            break
+    return cursor
+
+
+def throughput(url):
+    """Peticiones por segundo con THREADS clientes concurrentes"""
+    def worker():
+        client = app.test_client()
+        for _ in range(REQUESTS_PER_THREAD):
+            client.get(url)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return THREADS * REQUESTS_PER_THREAD / (time.perf_counter() - start)
+
+
+def run(count=DEFAULT_PRODUCTS):
+    with app.app_context(), bench_data():
+        print(f"Sembrando {count} productos...")
+        print(f"Sembrado en {seed_products(count):.1f}s")
+        client = app.test_client()
+
+        # Cursor a mitad del catálogo para medir una página profunda
+        deep_cursor = walk_pages(client, '/api/products?limit=500', count // 1000)
+        category_id = db.session.query(Product.category_id).filter(Product.category_id.isnot(None)).limit(1).scalar()
+
+        cases = [
+            ('first page (50)', '/api/products'),
+            ('deep page (50)', f'/api/products?cursor={deep_cursor}'),
+            ('page of 500', '/api/products?limit=500'),
+            ('fields=id,name,price', '/api/products?limit=500&fields=id,name,price'),
+            ('sort=-updated_at', '/api/products?sort=-updated_at'),
+            ('category+in_stock', f'/api/products?category_id={category_id}&in_stock=true'),
+            ('promo+price range', '/api/products?is_promotion=true&min_price=10000&max_price=50000'),
+        ]
+
+        rows = []
+        legacy_size = len(app.json.dumps(legacy_get_products()))
+        stats = measure(lambda: (legacy_get_products(), db.session.expunge_all()), repeat=3)
+        rows.append(('legacy all()', f"{stats['p50']:.1f}", f"{stats['p95']:.1f}", legacy_size, '-'))
+
+        for name, url in cases:
+            size = len(client.get(url).data)
+            stats = measure(lambda: client.get(url), repeat=30)
+            rows.append((name, f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", size, f'{throughput(url):.0f}'))
+
+        print_table(('case', 'p50_ms', 'p95_ms', 'bytes', 'req/s'), rows)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PRODUCTS)
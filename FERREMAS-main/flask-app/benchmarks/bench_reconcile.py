@@ -0,0 +1,143 @@
+"""
+Benchmark y verificación de la conciliación de pagos contra el Webpay falso.
+
+Crea TRANSACTIONS transacciones "olvidadas" (el usuario cerró el navegador)
+con stock reservado, repartidas entre:
+
+- pagadas en Transbank pero sin resultado en la base de datos -> completed
+- rechazadas en Transbank -> failed, se libera el stock
+- sin pago y más antiguas que el plazo de abandono -> cancelled, se libera el stock
+- sin pago pero recientes -> siguen en initiated
+- sin token (nunca llegaron a Webpay) -> failed, se libera el stock
+
+y ejecuta una pasada de reconcile_payments con distinta concurrencia,
+reportando estados, stock final y comprobantes encolados. La consulta de
+estado del Webpay falso tiene STATUS_LATENCY segundos de latencia. Las
+aserciones sobre estos resultados están en tests/test_payment_reconciler.py.
+
+    python -m benchmarks.bench_reconcile
+"""
+import time
+from collections import Counter
+
+from app import app, webpay
+from benchmarks.common import bench_data, create_bench_products, create_bench_user, print_table
+from extensions import db
+from fakes.server import FakeBehavior, start_in_thread
+from fakes.webpay import FakeWebpayServer
+from models import Job, Order, OrderItem, Product, WebpayTransaction
+from payment_reconciler import ABANDON_AFTER_SECONDS, RECONCILE_AFTER_SECONDS, reconcile_payments
+
+TRANSACTIONS = 400
+STATUS_LATENCY = 0.05
+CONCURRENCY = (1, 8, 32)
+BATCH_SIZE = 100
+STOCK = 10 ** 6
+
+# (escenario, proporción, estado esperado)
+SCENARIOS = (
+    ('paid', 0.40, 'completed'),
+    ('declined', 0.20, 'failed'),
+    ('abandoned', 0.25, 'cancelled'),
+    ('recent', 0.10, 'initiated'),
+    ('no_token', 0.05, 'failed'),
+)
+
+
+def create_stuck_payments(server, user_id, product_id):
+    """Órdenes pendientes con una unidad reservada y su transacción según el escenario"""
+    kinds = [name for name, share, _ in SCENARIOS for _ in range(int(TRANSACTIONS * share))]
+    order_ids = db.session.execute(
+        db.insert(Order).returning(Order.id),
+        [{'user_id': user_id, 'total_amount': 1990, 'status': 'pending'} for _ in kinds]
+    ).scalars().all()
+    db.session.execute(db.insert(OrderItem), [
+        {'order_id': order_id, 'product_id': product_id, 'quantity': 1, 'price_at_time': 1990}
+        for order_id in order_ids
+    ])
+    db.session.execute(db.update(Product).where(Product.id == product_id).values(stock=STOCK - len(order_ids)))
+
+    rows = []
+    for order_id, kind in zip(order_ids, kinds):
+        buy_order = f'OC-{order_id}'
+        token = None
+        if kind != 'no_token':
+            token = webpay.tx.create(buy_order, str(user_id), 1990, 'http://localhost/retorno-webpay')['token']
+            if kind == 'paid':
+                webpay.tx.commit(token)
+            elif kind == 'declined':
+                server.state.transactions[token]['status'] = 'FAILED'
+        age = RECONCILE_AFTER_SECONDS + 60 if kind == 'recent' else ABANDON_AFTER_SECONDS + 60
+        rows.append({'order_id': order_id, 'buy_order': buy_order, 'token_ws': token, 'amount': 1990,
+                     'session_id': str(user_id), 'status': 'initiated',
+                     'created_at': db.func.now() - db.text(f"interval '{age} seconds'")})
+    for row in rows:
+        db.session.execute(db.insert(WebpayTransaction).values(**row))
+    db.session.commit()
+    return dict(zip(order_ids, kinds))
+
+
+def delete_payments(user_id):
+    order_ids = db.session.query(Order.id).filter(Order.user_id == user_id).scalar_subquery()
+    WebpayTransaction.query.filter(WebpayTransaction.order_id.in_(order_ids)).delete(synchronize_session=False)
+    Order.query.filter(Order.user_id == user_id).delete(synchronize_session=False)
+    Job.query.filter(Job.payload.like('%@bench.local%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def verify(kinds, product_id):
+    """Compara estados, stock y comprobantes con lo esperado; retorna (correctas, stock_ok, comprobantes)"""
+    expected = {name: status for name, _, status in SCENARIOS}
+    statuses = dict(db.session.execute(
+        db.select(WebpayTransaction.order_id, WebpayTransaction.status)
+        .where(WebpayTransaction.order_id.in_(kinds))
+    ).all())
+    correct = sum(1 for order_id, kind in kinds.items() if statuses[order_id] == expected[kind])
+    # Quedan reservadas las unidades de las pagadas y de las que siguen en initiated
+    still_reserved = sum(1 for kind in kinds.values() if expected[kind] in ('completed', 'initiated'))
+    stock = db.session.scalar(db.select(Product.stock).where(Product.id == product_id))
+    receipts = Job.query.filter(Job.kind == 'send_receipt', Job.payload.like('%@bench.local%')).count()
+    return correct, stock == STOCK - still_reserved, receipts
+
+
+def run():
+    server = start_in_thread(FakeWebpayServer(behavior=FakeBehavior(latency={'status': STATUS_LATENCY})))
+    app.config['WEBPAY_BASE_URL'] = server.base_url
+    app.config['WEBPAY_POOL_SIZE'] = max(CONCURRENCY)
+    webpay.init_app(app)
+
+    with app.app_context(), bench_data():
+        user_id = create_bench_user('reconcile').id
+        product_id = create_bench_products(1, stock=STOCK)[0]
+        rows = []
+        try:
+            for concurrency in CONCURRENCY:
+                delete_payments(user_id)
+                kinds = create_stuck_payments(server, user_id, product_id)
+                server.counters.clear()
+
+                start = time.perf_counter()
+                counts = reconcile_payments(webpay, batch_size=BATCH_SIZE, concurrency=concurrency)
+                elapsed = time.perf_counter() - start
+
+                correct, stock_ok, receipts = verify(kinds, product_id)
+                status_calls = sum(count for (operation, _), count in server.counters.items() if operation == 'status')
+                rows.append((concurrency, TRANSACTIONS, status_calls, f'{elapsed:.2f}',
+                             f'{TRANSACTIONS / elapsed:.0f}', f'{correct}/{TRANSACTIONS}', stock_ok, receipts,
+                             ' '.join(f'{key}={value}' for key, value in sorted(counts.items()))))
+
+            # Segunda pasada: solo quedan las recientes, que vuelven a initiated sin cambios
+            again = reconcile_payments(webpay, batch_size=BATCH_SIZE, concurrency=max(CONCURRENCY))
+        finally:
+            delete_payments(user_id)
+            server.shutdown()
+
+        print(f'{TRANSACTIONS} transacciones pendientes, lotes de {BATCH_SIZE}, '
+              f'status de Webpay con {STATUS_LATENCY * 1000:.0f} ms')
+        print_table(('concurrency', 'transactions', 'status_calls', 'seconds', 'tx/s', 'correct',
+                     'stock_ok', 'receipts', 'result'), rows)
+        print(f'\nSegunda pasada: {dict(Counter(again))}')
+
+
+if __name__ == '__main__':
+    run()
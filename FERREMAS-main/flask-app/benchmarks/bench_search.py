@@ -0,0 +1,119 @@
+"""
+Benchmark de GET /api/search sobre un catálogo grande.
+
+Siembra productos con nombres y descripciones en español y compara la
+búsqueda de texto completo (índice GIN sobre search_vector), la búsqueda
+aproximada por trigramas y un ILIKE '%texto%' como referencia, que es lo
+que haría una búsqueda ingenua. Los productos sembrados se eliminan al terminar.
+
+    python -m benchmarks.bench_search [cantidad]
+"""
+import random
+import sys
+import time
+
+from app import app
+from benchmarks.common import BENCH_PREFIX, bench_data, measure, print_table
+from extensions import db
+from models import Category, Product
+
+DEFAULT_PRODUCTS = 100_000
+CHUNK = 5_000
+
+NOUNS = ['taladro', 'martillo', 'destornillador', 'sierra', 'llave', 'alicate', 'lijadora',
+         'esmeril', 'pintura', 'brocha', 'rodillo', 'tornillo', 'clavo', 'cemento', 'manguera',
+         'escalera', 'candado', 'cinta', 'nivel', 'huincha', 'guante', 'casco', 'pegamento']
+ADJECTIVES = ['inalámbrico', 'profesional', 'industrial', 'reforzado', 'eléctrico', 'compacto',
+              'galvanizado', 'ajustable', 'magnético', 'antideslizante', 'impermeable']
+BRANDS = ['Bosch', 'Makita', 'Stanley', 'DeWalt', 'Truper', 'Black+Decker', 'Sipa', 'Tricolor']
+DESCRIPTIONS = [
+    'Ideal para trabajos de construcción y mantenimiento del hogar.',
+    'Fabricado en acero de alta resistencia con mango ergonómico.',
+    'Incluye estuche de transporte y garantía de un año.',
+    'Recomendado para uso en exteriores e interiores.',
+    'Compatible con accesorios estándar del mercado.'
+]
+
+QUERIES = [
+    ('single word', 'taladro'),
+    ('two words', 'sierra eléctrica'),
+    ('brand + noun', 'makita lijadora'),
+    ('phrase', '"martillo profesional"'),
+    ('description term', 'acero'),
+]
+FUZZY_QUERIES = [('typo', 'talador'), ('typo brand', 'makitta esmerill')]
+
+
+def seed_products(count):
+    """Inserta `count` productos de benchmark en lotes"""
+    category_ids = [c.id for c in Category.query.all()] or [None]
+    start = time.perf_counter()
+    for offset in range(0, count, CHUNK):
+        rows = []
+        for i in range(offset, min(offset + CHUNK, count)):
+            name = f'{random.choice(NOUNS).capitalize()} {random.choice(ADJECTIVES)} {random.choice(BRANDS)}'
+            rows.append({
+                'name': f'{BENCH_PREFIX}{i} {name}',
+                'description': ' '.join(random.sample(DESCRIPTIONS, 2)),
+                'price': random.randint(990, 300000),
+                'stock': random.choice([0, 5, 20, 100]),
+                'category_id': random.choice(category_ids),
+                'image': 'no-image.jpg'
+            })
+        db.session.execute(db.insert(Product), rows)
+        db.session.commit()
+    db.session.execute(db.text('ANALYZE products'))
+    db.session.commit()
+    return time.perf_counter() - start
+
+
+def ilike_search(query, limit=20):
+    """
+    Búsqueda ingenua: ILIKE sobre ambas columnas, con las coincidencias en
+    el nombre primero para que sea comparable con un resultado ordenado
+    """
+    pattern = f'%{query}%'
+    stmt = (
+        db.select(Product.id, Product.name)
+        .where(db.or_(Product.name.ilike(pattern), Product.description.ilike(pattern)))
+        .order_by(db.case((Product.name.ilike(pattern), 0), else_=1), Product.id)
+        .limit(limit)
+    )
+    return db.session.execute(stmt).all()
+
+
+def run(count=DEFAULT_PRODUCTS):
+    with app.app_context(), bench_data():
+        print(f"Sembrando {count} productos...")
+        print(f"Sembrado en {seed_products(count):.1f}s")
+        client = app.test_client()
+        category_id = db.session.query(Product.category_id).filter(Product.category_id.isnot(None)).limit(1).scalar()
+
+        rows = []
+        for name, query in QUERIES:
+            url = f'/api/search?q={query}'
+            hits = len(client.get(url).get_json()['items'])
+            stats = measure(lambda: client.get(url), repeat=50)
+            rows.append((f'fulltext: {name}', f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", hits))
+
+        url = f'/api/search?q=taladro&category_id={category_id}&page=5'
+        stats = measure(lambda: client.get(url), repeat=50)
+        rows.append(('fulltext: category, page 5', f"{stats['p50']:.2f}", f"{stats['p95']:.2f}",
+                     len(client.get(url).get_json()['items'])))
+
+        for name, query in FUZZY_QUERIES:
+            url = f'/api/search?q={query}'
+            body = client.get(url).get_json()
+            stats = measure(lambda: client.get(url), repeat=50)
+            rows.append((f"{body['mode']}: {name}", f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", len(body['items'])))
+
+        for name, query in (('ILIKE: single word', 'taladro'), ('ILIKE: description term', 'acero')):
+            hits = len(ilike_search(query))
+            stats = measure(lambda: ilike_search(query), repeat=20)
+            rows.append((name, f"{stats['p50']:.2f}", f"{stats['p95']:.2f}", hits))
+
+        print_table(('case', 'p50_ms', 'p95_ms', 'hits'), rows)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PRODUCTS)
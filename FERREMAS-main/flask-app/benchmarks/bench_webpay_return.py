@@ -0,0 +1,148 @@
+"""
+Prueba de concurrencia del retorno de Webpay (reintentos de Transbank y doble envío).
+
+Para cada orden se lanzan CALLBACKS retornos simultáneos con el mismo
+token_ws contra el Webpay falso (commit con latencia) y se compara el
+retorno original (commit en cada retorno) con payment_service.confirm_payment:
+commits en Transbank por token, comprobantes encolados por orden y si todos
+los retornos del mismo token entregan el mismo resultado. Luego se mide un
+retorno repetido con la transacción ya cerrada. Las mismas condiciones se
+verifican con aserciones en tests/test_payment_service.py.
+
+    python -m benchmarks.bench_webpay_return
+"""
+import threading
+import time
+from collections import Counter
+
+from app import app, webpay
+from benchmarks.common import bench_data, create_bench_user, measure, print_table
+from extensions import db
+from fakes.server import FakeBehavior, start_in_thread
+from fakes.webpay import FakeWebpayServer
+from jobs import enqueue
+from models import Job, Order, User, WebpayTransaction
+
+ORDERS = 20
+CALLBACKS = 8
+COMMIT_LATENCY = 0.2
+
+
+def legacy_return(token_ws):
+    """Retorno original: commit en Transbank en cada llamada, sin bloqueo"""
+    try:
+        response = webpay.commit_transaction(token_ws)
+        transaction = WebpayTransaction.query.filter_by(token_ws=token_ws).first()
+        if response.get('response_code') == 0:
+            transaction.status = 'completed'
+            transaction.order.status = 'completed'
+            user = db.session.get(User, transaction.order.user_id)
+            enqueue('send_receipt', {'order_id': transaction.order_id, 'email': user.email})
+            status = 'success'
+        else:
+            transaction.status = 'failed'
+            transaction.order.status = 'failed'
+            status = 'error'
+        db.session.commit()
+        return status
+    except Exception:
+        db.session.rollback()
+        return 'error'
+
+
+def http_return(client, token_ws):
+    response = client.get('/retorno-webpay', query_string={'token_ws': token_ws})
+    return response.headers['Location'].rsplit('status=', 1)[-1]
+
+
+def create_payments(user_id):
+    """Órdenes pendientes con su transacción creada en el Webpay falso"""
+    tokens = []
+    for _ in range(ORDERS):
+        order = Order(user_id=user_id, total_amount=1990, status='pending')
+        db.session.add(order)
+        db.session.flush()
+        buy_order = f'OC-{order.id}'
+        created = webpay.create_transaction(amount=1990, buy_order=buy_order, session_id=str(user_id),
+                                            return_url='http://localhost/retorno-webpay')
+        db.session.add(WebpayTransaction(order=order, buy_order=buy_order, token_ws=created['token'],
+                                         amount=1990, session_id=str(user_id)))
+        tokens.append(created['token'])
+    db.session.commit()
+    return tokens
+
+
+def run_callbacks(tokens, callback):
+    """CALLBACKS hilos por token, liberados a la vez; retorna (resultados por token, segundos)"""
+    outcomes = {token: [] for token in tokens}
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(tokens) * CALLBACKS)
+
+    def worker(token):
+        with app.app_context():
+            barrier.wait()
+            outcome = callback(token)
+            with lock:
+                outcomes[token].append(outcome)
+
+    threads = [threading.Thread(target=worker, args=(token,)) for token in tokens for _ in range(CALLBACKS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes, time.perf_counter() - start
+
+
+def delete_payments(user_id):
+    order_ids = db.session.query(Order.id).filter(Order.user_id == user_id).scalar_subquery()
+    WebpayTransaction.query.filter(WebpayTransaction.order_id.in_(order_ids)).delete(synchronize_session=False)
+    Order.query.filter(Order.user_id == user_id).delete(synchronize_session=False)
+    Job.query.filter(Job.payload.like('%@bench.local%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def run():
+    server = start_in_thread(FakeWebpayServer(behavior=FakeBehavior(latency={'commit': COMMIT_LATENCY})))
+    app.config['WEBPAY_BASE_URL'] = server.base_url
+    webpay.init_app(app)
+    client = app.test_client()
+
+    with app.app_context(), bench_data():
+        user_id = create_bench_user('webpay-return').id
+        rows = []
+        try:
+            for name, callback in (('legacy', legacy_return),
+                                   ('confirm_payment', lambda token: http_return(client, token))):
+                delete_payments(user_id)
+                server.counters.clear()
+                tokens = create_payments(user_id)
+                outcomes, elapsed = run_callbacks(tokens, callback)
+
+                commits = sum(count for (operation, _), count in server.counters.items() if operation == 'commit')
+                receipts = Job.query.filter(Job.kind == 'send_receipt', Job.payload.like('%@bench.local%')).count()
+                consistent = sum(1 for results in outcomes.values() if len(set(results)) == 1)
+                shown = Counter(outcome for results in outcomes.values() for outcome in results)
+                completed = WebpayTransaction.query.filter(WebpayTransaction.token_ws.in_(tokens),
+                                                           WebpayTransaction.status == 'completed').count()
+                rows.append((name, ORDERS * CALLBACKS, commits, receipts, completed, f'{consistent}/{ORDERS}',
+                             ' '.join(f'{key}={value}' for key, value in sorted(shown.items())),
+                             f'{elapsed:.2f}'))
+
+            # Retorno repetido con la transacción ya cerrada: sin llamada a Transbank
+            server.counters.clear()
+            repeat = measure(lambda: http_return(client, tokens[0]), 50)
+            repeat_commits = sum(count for (operation, _), count in server.counters.items())
+        finally:
+            delete_payments(user_id)
+            server.shutdown()
+
+        print(f'{ORDERS} órdenes x {CALLBACKS} retornos simultáneos, commit de Webpay con {COMMIT_LATENCY * 1000:.0f} ms')
+        print_table(('path', 'callbacks', 'tbk_commits', 'receipts', 'completed', 'consistent',
+                     'outcomes', 'seconds'), rows)
+        print(f'\nRetorno repetido (ya cerrado): p50 {repeat["p50"]:.2f} ms, p95 {repeat["p95"]:.2f} ms, '
+              f'llamadas a Webpay: {repeat_commits}')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,118 @@
+"""
+Utilidades compartidas por los benchmarks.
+
+Los benchmarks se ejecutan desde la carpeta flask-app, por ejemplo:
+
+    python -m benchmarks.bench_cart
+
+Usan la base de datos configurada en .env y marcan todos los datos que crean
+con el prefijo BENCH_PREFIX para poder eliminarlos al terminar.
+"""
+import statistics
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from extensions import db
+from models import CartItem, Product, User
+
+BENCH_PREFIX = 'BENCH-'
+
+
+class QueryCounter:
+    """Cuenta las sentencias SQL ejecutadas por el engine mientras está activo"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def measure(func, repeat=20):
+    """
+    Ejecuta func varias veces y retorna estadísticas de latencia en milisegundos.
+
+    Returns:
+        dict: mean, p50 y p95 en milisegundos
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean': statistics.mean(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95)
+    }
+
+
+def percentile(sorted_samples, pct):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_samples:
+        return 0.0
+    index = max(0, min(len(sorted_samples) - 1, round(pct / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def create_bench_user(name='user'):
+    """Crea (o reutiliza) un usuario de benchmark"""
+    username = f'{BENCH_PREFIX}{name}'
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        user = User(username=username, email=f'{username.lower()}@bench.local', password='x')
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def create_bench_products(count, stock=1000, price=1990):
+    """Crea count productos de benchmark y retorna sus IDs"""
+    products = [
+        Product(name=f'{BENCH_PREFIX}{i}', price=price + i, stock=stock,
+                is_promotion=(i % 3 == 0), promotion_price=(price if i % 3 == 0 else None))
+        for i in range(count)
+    ]
+    db.session.add_all(products)
+    db.session.commit()
+    return [product.id for product in products]
+
+
+@contextmanager
+def bench_data():
+    """Elimina los datos de benchmark al salir, incluso si hubo errores"""
+    try:
+        yield
+    finally:
+        db.session.rollback()
+        cleanup()
+
+
+def cleanup():
+    """Borra usuarios, carritos y productos creados por los benchmarks"""
+    users = db.session.query(User.id).filter(User.username.like(f'{BENCH_PREFIX}%'))
+    products = db.session.query(Product.id).filter(Product.name.like(f'{BENCH_PREFIX}%'))
+    CartItem.query.filter(CartItem.user_id.in_(users.scalar_subquery())).delete(synchronize_session=False)
+    CartItem.query.filter(CartItem.product_id.in_(products.scalar_subquery())).delete(synchronize_session=False)
+    Product.query.filter(Product.name.like(f'{BENCH_PREFIX}%')).delete(synchronize_session=False)
+    User.query.filter(User.username.like(f'{BENCH_PREFIX}%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def print_table(headers, rows):
+    """Imprime una tabla simple alineada a la derecha"""
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(v).rjust(w) for v, w in zip(row, widths)))
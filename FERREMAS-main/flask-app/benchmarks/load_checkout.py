@@ -0,0 +1,244 @@
+"""
+Prueba de carga del flujo de compra completo contra Webpay y Banco Central falsos.
+
+Cada usuario virtual (un hilo con su propia sesión HTTP) repite el guion:
+
+1. browse: portada y detalle de un producto
+2. convert: precio del producto en dólares (/api/convert)
+3. add_to_cart: tres productos en una solicitud a /api/cart/batch
+4. login: solo en la primera vuelta; fusiona el carrito anónimo
+5. checkout: POST /iniciar-pago (reserva stock y crea la transacción en Webpay)
+6. webpay_form: el formulario de pago del Webpay falso, que redirige al comercio
+7. return: GET /retorno-webpay (commit en Webpay y cierre de la orden)
+
+y se reportan solicitudes, errores, throughput y p50/p95/p99 por paso.
+
+Por defecto la aplicación se sirve en este mismo proceso (servidor de
+desarrollo multihilo) junto con fakes/webpay.py y fakes/bcentral.py. Para
+medir un despliegue real, se levantan los falsos por separado, se inicia la
+aplicación con WEBPAY_BASE_URL y BCENTRAL_BASE_URL apuntando a ellos y se
+usa --url:
+
+    python -m benchmarks.load_checkout --users 20 --iterations 10 --webpay-latency commit=0.4,default=0.15
+    python -m benchmarks.load_checkout --url http://127.0.0.1:8000 --users 50
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server
+
+from app import app, currency_converter, webpay
+from benchmarks.common import BENCH_PREFIX, bench_data, create_bench_products, create_bench_user, percentile, print_table
+from cart_store import cart_store
+from currency_converter import CURRENCY_SERIES
+from extensions import db
+from fakes.bcentral import FakeBcentralServer
+from fakes.server import FakeBehavior, parse_latency, start_in_thread
+from fakes.webpay import FakeWebpayServer
+from models import Job, Order, User, WebpayTransaction
+from rate_history import RateHistory
+from rate_store import RateStore
+
+PASSWORD = 'load-test'
+STEPS = ('browse', 'convert', 'add_to_cart', 'login', 'checkout', 'webpay_form', 'return')
+
+
+class StepRecorder:
+    """Latencias y errores por paso, compartidos por todos los usuarios virtuales"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.outcomes = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, step, elapsed, ok):
+        with self.lock:
+            self.samples[step].append(elapsed * 1000)
+            if not ok:
+                self.errors[step] += 1
+
+    def outcome(self, name):
+        with self.lock:
+            self.outcomes[name] += 1
+
+    def rows(self, wall_seconds):
+        rows = []
+        for step in STEPS:
+            samples = sorted(self.samples.get(step, []))
+            if not samples:
+                continue
+            rows.append((step, len(samples), self.errors[step], f'{len(samples) / wall_seconds:.1f}',
+                         f'{percentile(samples, 50):.1f}', f'{percentile(samples, 95):.1f}',
+                         f'{percentile(samples, 99):.1f}'))
+        return rows
+
+
+def timed(recorder, step, func, expected):
+    start = time.perf_counter()
+    try:
+        response = func()
+        ok = response.status_code in expected
+    except requests.RequestException:
+        response, ok = None, False
+    recorder.record(step, time.perf_counter() - start, ok)
+    return response if ok else None
+
+
+def virtual_user(base_url, email, product_ids, iterations, offset, recorder):
+    """Guion de compra de un usuario virtual"""
+    http = requests.Session()
+    logged_in = False
+    for iteration in range(iterations):
+        first = product_ids[(offset + iteration) % len(product_ids)]
+        lines = [product_ids[(offset + iteration + k) % len(product_ids)] for k in range(3)]
+
+        def browse():
+            response = http.get(f'{base_url}/')
+            if response.status_code != 200:
+                return response
+            return http.get(f'{base_url}/product/{first}')
+
+        timed(recorder, 'browse', browse, (200,))
+        timed(recorder, 'convert',
+              lambda: http.post(f'{base_url}/api/convert', json={'amount': 19990, 'currency': 'USD'}), (200,))
+        if timed(recorder, 'add_to_cart', lambda: http.post(f'{base_url}/api/cart/batch', json={
+            'operations': [{'op': 'add', 'product_id': product_id, 'quantity': 1} for product_id in lines]
+        }), (200,)) is None:
+            recorder.outcome('abandoned')
+            continue
+
+        if not logged_in:
+            logged_in = timed(recorder, 'login', lambda: http.post(
+                f'{base_url}/login', data={'email': email, 'password': PASSWORD}, allow_redirects=False
+            ), (302,)) is not None
+            if not logged_in:
+                recorder.outcome('abandoned')
+                continue
+
+        checkout = timed(recorder, 'checkout', lambda: http.post(f'{base_url}/iniciar-pago'), (200,))
+        if checkout is None:
+            recorder.outcome('checkout_failed')
+            continue
+        payment = checkout.json()
+
+        form = timed(recorder, 'webpay_form', lambda: http.get(
+            payment['url'], params={'token_ws': payment['token']}, allow_redirects=False
+        ), (302,))
+        if form is None:
+            recorder.outcome('payment_failed')
+            continue
+
+        result = timed(recorder, 'return',
+                       lambda: http.get(form.headers['Location'], allow_redirects=False), (302,))
+        if result is None:
+            recorder.outcome('payment_failed')
+        elif 'status=success' in result.headers.get('Location', ''):
+            recorder.outcome('paid')
+        else:
+            recorder.outcome('declined')
+
+
+def prepare_users(count):
+    password = generate_password_hash(PASSWORD, method='pbkdf2:sha256')
+    users = [create_bench_user(f'load{i}') for i in range(count)]
+    for user in users:
+        user.password = password
+    db.session.commit()
+    return [user.email for user in users]
+
+
+def delete_orders():
+    users = db.session.query(User.id).filter(User.username.like(f'{BENCH_PREFIX}%')).scalar_subquery()
+    order_ids = db.session.query(Order.id).filter(Order.user_id.in_(users)).scalar_subquery()
+    WebpayTransaction.query.filter(WebpayTransaction.order_id.in_(order_ids)).delete(synchronize_session=False)
+    Order.query.filter(Order.user_id.in_(users)).delete(synchronize_session=False)
+    Job.query.filter(Job.payload.like('%@bench.local%')).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def start_local(args, directory):
+    """Falsos y aplicación en este proceso; retorna (url_base, servidores a detener)"""
+    webpay_server = start_in_thread(FakeWebpayServer(behavior=FakeBehavior(
+        latency=args.webpay_latency, jitter=args.jitter, error_rate=args.webpay_error_rate,
+        decline_rate=args.decline_rate, seed=args.seed)))
+    bcentral_server = start_in_thread(FakeBcentralServer(behavior=FakeBehavior(
+        latency=args.bcentral_latency, jitter=args.jitter, seed=args.seed)))
+
+    app.config['WEBPAY_BASE_URL'] = webpay_server.base_url
+    webpay.init_app(app)
+    # Carritos y tasas en almacenes temporales para no mezclar con los reales
+    app.config['CART_STORE_PATH'] = os.path.join(directory, 'carts.db')
+    cart_store.init_app(app)
+    currency_converter.base_url = bcentral_server.service_url
+    currency_converter.store = RateStore(os.path.join(directory, 'rates.db'))
+    currency_converter.history = RateHistory(os.path.join(directory, 'rate_history'))
+    for code in CURRENCY_SERIES:
+        currency_converter.refresh(code)
+
+    app_server = make_server('127.0.0.1', 0, app, threaded=True)
+    start_in_thread(app_server)
+    return f'http://127.0.0.1:{app_server.server_port}', [webpay_server, bcentral_server, app_server]
+
+
+def run(args):
+    with app.app_context(), bench_data(), tempfile.TemporaryDirectory() as directory:
+        emails = prepare_users(args.users)
+        product_ids = create_bench_products(args.products, stock=10 ** 6)
+        servers = []
+        try:
+            if args.url:
+                base_url = args.url.rstrip('/')
+            else:
+                base_url, servers = start_local(args, directory)
+
+            recorder = StepRecorder()
+            threads = [
+                threading.Thread(target=virtual_user,
+                                 args=(base_url, email, product_ids, args.iterations, i, recorder))
+                for i, email in enumerate(emails)
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - start
+
+            print(f'{args.users} usuarios x {args.iterations} vueltas en {wall:.1f} s '
+                  f'({recorder.outcomes["paid"] / wall:.1f} compras pagadas/s)')
+            print_table(('step', 'requests', 'errors', 'req/s', 'p50_ms', 'p95_ms', 'p99_ms'), recorder.rows(wall))
+            print('\nResultados: ' + ', '.join(f'{name}={count}' for name, count in sorted(recorder.outcomes.items())))
+            for server in servers[:2]:
+                counters = ', '.join(f'{operation}:{status}={count}'
+                                     for (operation, status), count in sorted(server.counters.items()))
+                print(f'{type(server).__name__}: {counters}')
+        finally:
+            for server in servers:
+                server.shutdown()
+            delete_orders()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del flujo de compra')
+    parser.add_argument('--users', type=int, default=10, help='usuarios virtuales concurrentes')
+    parser.add_argument('--iterations', type=int, default=5, help='compras por usuario')
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--url', help='aplicación ya desplegada (sin falsos locales)')
+    parser.add_argument('--webpay-latency', type=parse_latency, default=parse_latency('commit=0.3,default=0.1'))
+    parser.add_argument('--webpay-error-rate', type=float, default=0.0)
+    parser.add_argument('--decline-rate', type=float, default=0.05)
+    parser.add_argument('--bcentral-latency', type=parse_latency, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=1)
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+from checkout_service import InsufficientStockError
+from extensions import db
+from models import Product
+from pricing import price_cache, price_lines
+
+# Operaciones aceptadas por /api/cart/batch
+CART_OPERATIONS = ('add', 'set', 'remove')
+MAX_BATCH_OPERATIONS = 500
+
+
+def get_store_items(lines, user_id=None):
+    """
+    Serializa las líneas del almacén de carritos con sus productos y precios.
+
+    Los productos se leen de la caché de precios (una sola consulta para
+    los que falten). El id de cada item es el ID del producto: una línea
+    por producto y carrito, y las líneas de carritos anónimos no tienen
+    fila en cart_items.
+
+    Args:
+        lines (list): Tuplas (product_id, quantity) como las de cart_store.get
+        user_id (int, optional): ID del usuario, None para carritos anónimos
+
+    Returns:
+        list: Items del carrito serializados, en el orden de las líneas, con
+              unit_price (precio efectivo) y line_total
+    """
+    if not lines:
+        return []
+    entries = price_cache.get_many(product_id for product_id, _ in lines)
+    # Productos eliminados del catálogo después de agregarse al carrito se omiten
+    lines = [(product_id, quantity) for product_id, quantity in lines if product_id in entries]
+    pricing = price_lines((product_id, quantity, entries[product_id].effective_price)
+                          for product_id, quantity in lines)
+
+    items = []
+    for line in pricing.lines:
+        entry = entries[line.product_id]
+        items.append({
+            'id': line.product_id,
+            'user_id': user_id,
+            'product_id': line.product_id,
+            'quantity': line.quantity,
+            'unit_price': float(line.unit_price),
+            'line_total': float(line.line_total),
+            'product': {
+                'id': line.product_id,
+                'name': entry.name,
+                'price': float(entry.price),
+                'image': entry.image,
+                'is_promotion': entry.is_promotion,
+                'promotion_price': float(entry.promotion_price) if entry.promotion_price is not None else None
+            }
+        })
+    return items
+
+
+class InvalidCartOperationError(ValueError):
+    """Operaciones de carrito inválidas"""
+
+
+class UnknownProductError(ValueError):
+    """Una o más operaciones se refieren a productos que no existen"""
+
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Productos no encontrados: {self.product_ids}")
+
+
+def parse_cart_operations(data):
+    """
+    Valida el cuerpo de /api/cart/batch.
+
+    Args:
+        data (dict): JSON con la lista operations; cada operación tiene op
+                     (add, set o remove), product_id y quantity (no requerido en remove)
+
+    Returns:
+        list: Tuplas (op, product_id, quantity)
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise InvalidCartOperationError("Se requiere una lista operations no vacía")
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise InvalidCartOperationError(f"Máximo {MAX_BATCH_OPERATIONS} operaciones por solicitud")
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise InvalidCartOperationError(f"Operación {index}: debe ser un objeto")
+        op = operation.get('op')
+        if op not in CART_OPERATIONS:
+            raise InvalidCartOperationError(f"Operación {index}: op debe ser {', '.join(CART_OPERATIONS)}")
+        try:
+            product_id = int(operation['product_id'])
+            quantity = int(operation.get('quantity', 1 if op == 'add' else 0))
+        except (KeyError, TypeError, ValueError):
+            raise InvalidCartOperationError(f"Operación {index}: product_id y quantity deben ser enteros")
+        if op == 'add' and quantity < 1:
+            raise InvalidCartOperationError(f"Operación {index}: quantity debe ser mayor a 0")
+        if op == 'set' and quantity < 0:
+            raise InvalidCartOperationError(f"Operación {index}: quantity no puede ser negativa")
+        parsed.append((op, product_id, quantity))
+    return parsed
+
+
+def apply_cart_operations(store, cart_key, operations):
+    """
+    Aplica un lote de operaciones al carrito validando el stock con una sola consulta.
+
+    Se valida la cantidad final de cada línea que aumenta o se crea; si
+    algún producto no existe o no alcanza el stock, no se aplica ninguna.
+
+    Args:
+        store (CartStore): Almacén de carritos
+        cart_key (str): Clave del carrito
+        operations (list): Tuplas (op, product_id, quantity) de parse_cart_operations
+
+    Returns:
+        dict: Cantidad final de cada línea modificada
+
+    Raises:
+        UnknownProductError: Si algún producto no existe
+        InsufficientStockError: Si algún producto no tiene stock suficiente
+    """
+    product_ids = {product_id for _, product_id, _ in operations}
+    stock = dict(db.session.execute(
+        db.select(Product.id, Product.stock).where(Product.id.in_(product_ids))
+    ).all())
+
+    missing = {product_id for op, product_id, _ in operations if op != 'remove'} - stock.keys()
+    if missing:
+        raise UnknownProductError(missing)
+
+    def validate(changed):
+        short = [product_id for product_id, quantity in changed.items()
+                 if quantity > 0 and quantity > stock.get(product_id, 0)]
+        if short:
+            raise InsufficientStockError(short)
+
+    return store.apply(cart_key, operations, validate=validate)
+
+
+def cart_totals(items):
+    """
+    Totales del carrito calculados por el motor de precios.
+
+    Args:
+        items (list): Items serializados por get_store_items
+
+    Returns:
+        dict: item_count, subtotal (neto), tax (IVA) y total
+    """
+    return price_lines((item['product_id'], item['quantity'], item['unit_price']) for item in items).to_dict()
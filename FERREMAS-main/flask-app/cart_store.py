@@ -0,0 +1,538 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from flask import has_app_context, session
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from extensions import db
+from models import CartItem, Product, User
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Archivo SQLite compartido por todos los procesos de la aplicación
+CART_STORE_PATH = os.getenv(
+    'CART_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'carts.db')
+)
+
+
+def user_key(user_id):
+    return f'u:{user_id}'
+
+
+def anonymous_key(token):
+    return f'a:{token}'
+
+
+def session_cart_key():
+    """
+    Clave del carrito de la sesión actual.
+
+    Los usuarios autenticados usan su ID; los anónimos reciben un
+    identificador aleatorio que se guarda en la sesión (session['cart_id']).
+    """
+    user_id = session.get('user_id')
+    if user_id:
+        return user_key(user_id)
+    if 'cart_id' not in session:
+        session['cart_id'] = uuid.uuid4().hex
+    return anonymous_key(session['cart_id'])
+
+
+def merge_session_cart(user_id):
+    """
+    Fusiona el carrito anónimo de la sesión con el del usuario que acaba de
+    iniciar sesión. Un error aquí no debe impedir el inicio de sesión.
+
+    Returns:
+        int: Cantidad de líneas fusionadas
+    """
+    token = session.pop('cart_id', None)
+    if token is None:
+        return 0
+    try:
+        return cart_store.merge(anonymous_key(token), user_id)
+    except Exception:
+        logger.exception("Error al fusionar el carrito anónimo", extra={'user_id': user_id})
+        return 0
+
+
+class CartStore:
+    """
+    Carritos de compra en un almacén local (SQLite) con escritura diferida a Postgres.
+
+    Cada línea guarda la cantidad actual y dos contadores: version aumenta
+    con cada cambio y flushed_version indica la última versión escrita en
+    cart_items. Así, diez clics seguidos en "+" se reducen a una sola
+    escritura, que un hilo en segundo plano hace en lotes con INSERT ...
+    ON CONFLICT (user_id, product_id). Si la línea cambia mientras se
+    escribe, queda pendiente para el siguiente lote.
+
+    Los carritos anónimos solo viven en el almacén local y se fusionan con
+    el del usuario al iniciar sesión. El carrito de un usuario se carga
+    desde cart_items la primera vez que se usa en este servidor.
+
+    El archivo es compartido por los workers de un mismo servidor; con
+    varios servidores las sesiones deben ser afines (sticky) o el archivo
+    debe estar en almacenamiento compartido.
+    """
+
+    def __init__(self, path=CART_STORE_PATH, app=None):
+        self.path = path
+        self.flush_interval = 2
+        self.batch_size = 500
+        self.anonymous_ttl = 7 * 86400
+        self.idle_ttl = 86400
+        self.flusher_enabled = True
+        self._app = None
+        self._local = threading.local()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._app = app
+        self.path = app.config.get('CART_STORE_PATH', self.path)
+        self.flush_interval = app.config.get('CART_FLUSH_INTERVAL', self.flush_interval)
+        self.anonymous_ttl = app.config.get('CART_ANONYMOUS_TTL', self.anonymous_ttl)
+        self.flusher_enabled = app.config.get('CART_FLUSHER_ENABLED', True)
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._local = threading.local()
+        self._init_schema()
+
+    def _connection(self):
+        # Una conexión por hilo; SQLite en modo WAL permite lectores concurrentes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        # BEGIN IMMEDIATE toma el bloqueo de escritura al inicio: las lecturas
+        # dentro de la transacción ven el estado que se va a modificar
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _init_schema(self):
+        with self._write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS carts (
+                    cart_key TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cart_lines (
+                    cart_key TEXT NOT NULL,
+                    product_id INTEGER NOT NULL,
+                    quantity INTEGER NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    flushed_version INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (cart_key, product_id)
+                )
+            """)
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_cart_lines_dirty ON cart_lines (cart_key) '
+                'WHERE version > flushed_version'
+            )
+
+    # Lectura
+
+    def get(self, cart_key):
+        """
+        Líneas del carrito en el orden en que se agregaron.
+
+        Args:
+            cart_key (str): Clave del carrito (user_key o anonymous_key)
+
+        Returns:
+            list: Tuplas (product_id, quantity), solo con cantidad positiva
+        """
+        self._ensure_loaded(cart_key)
+        self._ensure_flusher()
+        return self._connection().execute(
+            'SELECT product_id, quantity FROM cart_lines WHERE cart_key = ? AND quantity > 0 ORDER BY rowid',
+            (cart_key,)
+        ).fetchall()
+
+    def quantity(self, cart_key, product_id):
+        self._ensure_loaded(cart_key)
+        row = self._connection().execute(
+            'SELECT quantity FROM cart_lines WHERE cart_key = ? AND product_id = ?',
+            (cart_key, product_id)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _ensure_loaded(self, cart_key):
+        """Carga el carrito del usuario desde cart_items si no está en el almacén local"""
+        conn = self._connection()
+        if conn.execute('SELECT 1 FROM carts WHERE cart_key = ?', (cart_key,)).fetchone():
+            return
+        user_id = int(cart_key[2:]) if cart_key.startswith('u:') else None
+        rows = []
+        if user_id is not None:
+            with self._app_context():
+                rows = db.session.execute(
+                    db.select(CartItem.product_id, CartItem.quantity)
+                    .where(CartItem.user_id == user_id)
+                    .order_by(CartItem.id)
+                ).all()
+        with self._write() as conn:
+            # Otro proceso pudo haberlo cargado mientras se consultaba Postgres
+            if conn.execute('SELECT 1 FROM carts WHERE cart_key = ?', (cart_key,)).fetchone():
+                return
+            conn.execute('INSERT INTO carts (cart_key, user_id, updated_at) VALUES (?, ?, ?)',
+                         (cart_key, user_id, time.time()))
+            conn.executemany(
+                'INSERT OR IGNORE INTO cart_lines (cart_key, product_id, quantity, version, flushed_version) '
+                'VALUES (?, ?, ?, 0, 0)',
+                [(cart_key, product_id, quantity) for product_id, quantity in rows]
+            )
+
+    # Escritura
+
+    def add(self, cart_key, product_id, quantity):
+        """Suma quantity a la línea del producto. Retorna la cantidad resultante"""
+        return self._mutate(cart_key, product_id, quantity, relative=True)
+
+    def set(self, cart_key, product_id, quantity):
+        """Fija la cantidad de la línea; 0 o menos la elimina. Retorna la cantidad resultante"""
+        return self._mutate(cart_key, product_id, quantity, relative=False)
+
+    def remove(self, cart_key, product_id):
+        return self._mutate(cart_key, product_id, 0, relative=False)
+
+    def _mutate(self, cart_key, product_id, quantity, relative):
+        self._ensure_loaded(cart_key)
+        new_quantity = 'MAX(cart_lines.quantity + excluded.quantity, 0)' if relative else 'excluded.quantity'
+        with self._write() as conn:
+            conn.execute(
+                'INSERT INTO cart_lines (cart_key, product_id, quantity) VALUES (?, ?, ?) '
+                f'ON CONFLICT (cart_key, product_id) DO UPDATE SET quantity = {new_quantity}, '
+                'version = cart_lines.version + 1',
+                (cart_key, product_id, max(quantity, 0))
+            )
+            conn.execute('UPDATE carts SET updated_at = ? WHERE cart_key = ?', (time.time(), cart_key))
+            result = conn.execute(
+                'SELECT quantity FROM cart_lines WHERE cart_key = ? AND product_id = ?',
+                (cart_key, product_id)
+            ).fetchone()[0]
+        self._ensure_flusher()
+        return result
+
+    def apply(self, cart_key, operations, validate=None):
+        """
+        Aplica varias operaciones al carrito en una sola transacción.
+
+        Las operaciones se aplican en orden sobre las cantidades actuales;
+        solo se escriben las líneas cuya cantidad final cambió. Si validate
+        lanza una excepción, no se aplica ninguna.
+
+        Args:
+            cart_key (str): Clave del carrito
+            operations (list): Tuplas (op, product_id, quantity) con op en add, set o remove
+            validate (callable, optional): Recibe {product_id: cantidad final} de las líneas
+                                           modificadas antes de escribirlas
+
+        Returns:
+            dict: Cantidad final de cada línea modificada
+        """
+        self._ensure_loaded(cart_key)
+        product_ids = list({product_id for _, product_id, _ in operations})
+        with self._write() as conn:
+            placeholders = ','.join('?' * len(product_ids))
+            current = dict(conn.execute(
+                f'SELECT product_id, quantity FROM cart_lines WHERE cart_key = ? AND product_id IN ({placeholders})',
+                [cart_key] + product_ids
+            ).fetchall())
+            final = dict(current)
+            for op, product_id, quantity in operations:
+                if op == 'add':
+                    final[product_id] = max(final.get(product_id, 0) + quantity, 0)
+                elif op == 'set':
+                    final[product_id] = max(quantity, 0)
+                else:
+                    final[product_id] = 0
+            changed = {product_id: quantity for product_id, quantity in final.items()
+                       if quantity != current.get(product_id, 0)}
+            if validate is not None:
+                validate(changed)
+            conn.executemany(
+                'INSERT INTO cart_lines (cart_key, product_id, quantity) VALUES (?, ?, ?) '
+                'ON CONFLICT (cart_key, product_id) DO UPDATE SET quantity = excluded.quantity, '
+                'version = cart_lines.version + 1',
+                [(cart_key, product_id, quantity) for product_id, quantity in changed.items()]
+            )
+            conn.execute('UPDATE carts SET updated_at = ? WHERE cart_key = ?', (time.time(), cart_key))
+        self._ensure_flusher()
+        return changed
+
+    def clear(self, cart_key):
+        """Vacía el carrito; las líneas se eliminan de cart_items en el siguiente lote"""
+        self._ensure_loaded(cart_key)
+        with self._write() as conn:
+            conn.execute(
+                'UPDATE cart_lines SET quantity = 0, version = version + 1 WHERE cart_key = ? AND quantity > 0',
+                (cart_key,)
+            )
+            conn.execute('UPDATE carts SET updated_at = ? WHERE cart_key = ?', (time.time(), cart_key))
+        self._ensure_flusher()
+
+    def forget(self, cart_key):
+        """
+        Descarta la copia local del carrito sin escribir nada en Postgres.
+
+        Se usa cuando cart_items ya se modificó directamente (por ejemplo,
+        al vaciar el carrito después de iniciar el pago).
+        """
+        with self._write() as conn:
+            conn.execute('DELETE FROM cart_lines WHERE cart_key = ?', (cart_key,))
+            conn.execute('DELETE FROM carts WHERE cart_key = ?', (cart_key,))
+
+    def merge(self, source_key, user_id):
+        """
+        Fusiona un carrito anónimo con el del usuario al iniciar sesión.
+
+        Las cantidades de un mismo producto se suman. El resultado se escribe
+        de inmediato en cart_items para que el checkout lo vea.
+
+        Args:
+            source_key (str): Clave del carrito anónimo
+            user_id (int): ID del usuario que inició sesión
+
+        Returns:
+            int: Cantidad de líneas fusionadas
+        """
+        target_key = user_key(user_id)
+        conn = self._connection()
+        if not conn.execute('SELECT 1 FROM cart_lines WHERE cart_key = ? AND quantity > 0',
+                            (source_key,)).fetchone():
+            self.forget(source_key)
+            return 0
+
+        self._ensure_loaded(target_key)
+        with self._write() as conn:
+            merged = conn.execute(
+                'INSERT INTO cart_lines (cart_key, product_id, quantity) '
+                'SELECT ?, product_id, quantity FROM cart_lines WHERE cart_key = ? AND quantity > 0 '
+                'ON CONFLICT (cart_key, product_id) DO UPDATE SET '
+                'quantity = cart_lines.quantity + excluded.quantity, version = cart_lines.version + 1',
+                (target_key, source_key)
+            ).rowcount
+            conn.execute('DELETE FROM cart_lines WHERE cart_key = ?', (source_key,))
+            conn.execute('DELETE FROM carts WHERE cart_key = ?', (source_key,))
+            conn.execute('UPDATE carts SET updated_at = ? WHERE cart_key = ?', (time.time(), target_key))
+        self.flush(cart_key=target_key)
+        logger.info("Carrito anónimo fusionado", extra={'user_id': user_id, 'lines': merged})
+        return merged
+
+    # Escritura diferida a Postgres
+
+    def pending(self):
+        """Cantidad de líneas de usuarios con cambios sin escribir en cart_items"""
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM cart_lines l JOIN carts c ON c.cart_key = l.cart_key '
+            'WHERE c.user_id IS NOT NULL AND l.version > l.flushed_version'
+        ).fetchone()[0]
+
+    def flush(self, cart_key=None, blocking=True):
+        """
+        Escribe en cart_items las líneas modificadas, en lotes de batch_size.
+
+        Un bloqueo de archivo evita que dos procesos escriban la misma línea
+        con valores en distinto orden.
+
+        Args:
+            cart_key (str, optional): Solo este carrito. Por defecto, todos
+            blocking (bool): Si es False y otro proceso está escribiendo, retorna 0
+
+        Returns:
+            int: Líneas escritas
+        """
+        total = 0
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    return 0
+            while True:
+                written = self._flush_batch(cart_key)
+                total += written
+                if written < self.batch_size:
+                    return total
+
+    def _flush_batch(self, cart_key):
+        query = (
+            'SELECT l.cart_key, c.user_id, l.product_id, l.quantity, l.version '
+            'FROM cart_lines l JOIN carts c ON c.cart_key = l.cart_key '
+            'WHERE c.user_id IS NOT NULL AND l.version > l.flushed_version'
+        )
+        params = []
+        if cart_key is not None:
+            query += ' AND l.cart_key = ?'
+            params.append(cart_key)
+        rows = self._connection().execute(query + ' LIMIT ?', params + [self.batch_size]).fetchall()
+        if not rows:
+            return 0
+
+        with self._app_context():
+            try:
+                # Usuarios y productos eliminados mientras había líneas pendientes: sus filas de
+                # cart_items ya no existen (o no pueden existir) y las líneas se descartan
+                users = set(db.session.scalars(
+                    db.select(User.id).where(User.id.in_({row[1] for row in rows}))
+                ))
+                products = set(db.session.scalars(
+                    db.select(Product.id).where(Product.id.in_({row[2] for row in rows}))
+                ))
+            except Exception:
+                db.session.rollback()
+                raise
+            lines = [(user_id, product_id, quantity) for _, user_id, product_id, quantity, _ in rows
+                     if user_id in users]
+            dropped = len(rows) - len(lines)
+            if dropped:
+                logger.warning("Líneas de carrito de usuarios eliminados descartadas", extra={'lines': dropped})
+            try:
+                self._write_lines(lines, products)
+            except (IntegrityError, DataError) as e:
+                # Un lote que aún falla (por ejemplo, un usuario eliminado entre la consulta y la
+                # escritura) no debe bloquear a los demás carritos: se reintenta línea por línea
+                logger.warning(f"Lote de carritos rechazado, se reintenta por línea: {str(e.orig).strip()}",
+                               extra={'lines': len(lines)})
+                for line in lines:
+                    try:
+                        self._write_lines([line], products)
+                    except (IntegrityError, DataError) as e:
+                        logger.error(f"Línea de carrito descartada: {str(e.orig).strip()}",
+                                     extra={'user_id': line[0], 'product_id': line[1]})
+
+        with self._write() as conn:
+            conn.executemany(
+                'UPDATE cart_lines SET flushed_version = ? '
+                'WHERE cart_key = ? AND product_id = ? AND flushed_version < ?',
+                [(version, key, product_id, version) for key, _, product_id, _, version in rows]
+            )
+            # Líneas eliminadas que ya están al día en Postgres
+            conn.execute('DELETE FROM cart_lines WHERE quantity <= 0 AND version = flushed_version')
+        return len(rows)
+
+    def _write_lines(self, lines, products):
+        """
+        Escribe líneas (user_id, product_id, quantity) en cart_items en una transacción.
+
+        Las de cantidad 0 o de productos que no están en `products` se eliminan.
+        """
+        upserts = [{'user_id': user_id, 'product_id': product_id, 'quantity': quantity}
+                   for user_id, product_id, quantity in lines
+                   if quantity > 0 and product_id in products]
+        deletes = [(user_id, product_id) for user_id, product_id, quantity in lines
+                   if quantity <= 0 or product_id not in products]
+        try:
+            if upserts:
+                stmt = insert(CartItem).values(upserts)
+                db.session.execute(stmt.on_conflict_do_update(
+                    index_elements=[CartItem.user_id, CartItem.product_id],
+                    set_={'quantity': stmt.excluded.quantity}
+                ))
+            if deletes:
+                db.session.execute(
+                    db.delete(CartItem)
+                    .where(db.tuple_(CartItem.user_id, CartItem.product_id).in_(deletes))
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def evict(self, now=None):
+        """
+        Elimina del almacén local los carritos anónimos vencidos y los de
+        usuarios inactivos sin cambios pendientes (siguen en cart_items).
+
+        Returns:
+            int: Carritos eliminados
+        """
+        now = now or time.time()
+        with self._write() as conn:
+            stale = [row[0] for row in conn.execute(
+                'SELECT cart_key FROM carts c WHERE '
+                '(c.user_id IS NULL AND c.updated_at < ?) OR '
+                '(c.user_id IS NOT NULL AND c.updated_at < ? AND NOT EXISTS ('
+                ' SELECT 1 FROM cart_lines l WHERE l.cart_key = c.cart_key AND l.version > l.flushed_version))',
+                (now - self.anonymous_ttl, now - self.idle_ttl)
+            )]
+            conn.executemany('DELETE FROM cart_lines WHERE cart_key = ?', [(key,) for key in stale])
+            conn.executemany('DELETE FROM carts WHERE cart_key = ?', [(key,) for key in stale])
+        return len(stale)
+
+    def _app_context(self):
+        return nullcontext() if has_app_context() else self._app.app_context()
+
+    def _ensure_flusher(self):
+        # El hilo se crea en el primer cambio, así cada worker (después de fork) tiene el suyo
+        if not self.flusher_enabled or self._app is None:
+            return
+        flusher = self._flusher
+        if flusher is not None and flusher.is_alive() and flusher.pid == os.getpid():
+            return
+        with self._flusher_lock:
+            flusher = self._flusher
+            if flusher is None or not flusher.is_alive() or flusher.pid != os.getpid():
+                self._flusher = CartFlusher(self)
+                self._flusher.start()
+
+
+class CartFlusher(threading.Thread):
+    """Hilo que escribe en cart_items los cambios de los carritos cada flush_interval segundos"""
+
+    # Cada cuántas pasadas se limpian los carritos vencidos
+    EVICT_EVERY = 300
+
+    def __init__(self, store):
+        super().__init__(name='cart-flusher', daemon=True)
+        self.store = store
+        self.pid = os.getpid()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        passes = 0
+        while not self._stopping.wait(self.store.flush_interval):
+            try:
+                self.store.flush(blocking=False)
+                passes += 1
+                if passes % self.EVICT_EVERY == 0:
+                    self.store.evict()
+            except Exception:
+                logger.exception("Error al escribir los carritos en la base de datos")
+
+
+cart_store = CartStore()
@@ -0,0 +1,213 @@
+import base64
+import json
+import math
+from datetime import datetime
+
+from extensions import db
+from models import Product, ProductListing
+
+# Campos que se pueden pedir con ?fields=. Se leen de la proyección product_listings;
+# los que solo están en products (description, stock, created_at) agregan un JOIN
+PRODUCT_FIELDS = {
+    'id': ProductListing.id,
+    'name': ProductListing.name,
+    'price': ProductListing.price,
+    'image': ProductListing.image,
+    'description': Product.description,
+    'stock': Product.stock,
+    'is_featured': ProductListing.is_featured,
+    'is_promotion': ProductListing.is_promotion,
+    'promotion_price': ProductListing.promotion_price,
+    'effective_price': ProductListing.effective_price,
+    'discount_percent': ProductListing.discount_percent,
+    'in_stock': ProductListing.in_stock,
+    'category_id': ProductListing.category_id,
+    'category_name': ProductListing.category_name,
+    'category_icon': ProductListing.category_icon,
+    'created_at': Product.created_at,
+    'updated_at': ProductListing.updated_at
+}
+
+# Campos por defecto: los mismos que entrega ProductSchema
+DEFAULT_FIELDS = ('id', 'name', 'price', 'image', 'is_promotion', 'promotion_price')
+
+# Orden soportado y columnas que forman su clave de paginación
+SORT_KEYS = {
+    'id': ('id',),
+    '-updated_at': ('updated_at', 'id'),
+    'price': ('effective_price', 'id'),
+    '-price': ('effective_price', 'id')
+}
+
+# Tipo de cada columna de la clave al decodificar un cursor
+KEY_TYPES = {
+    'id': int,
+    'updated_at': datetime.fromisoformat,
+    'effective_price': float
+}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class InvalidQueryError(ValueError):
+    """Parámetros de listado inválidos"""
+
+
+def encode_cursor(sort, row):
+    """Codifica la clave de la última fila de una página como cursor opaco"""
+    values = []
+    for name in SORT_KEYS[sort]:
+        value = row[name]
+        values.append(value.isoformat() if isinstance(value, datetime) else value)
+    raw = json.dumps({'s': sort, 'k': values}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(sort, cursor):
+    """Decodifica un cursor. Lanza InvalidQueryError si no corresponde al orden pedido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if data['s'] != sort or len(data['k']) != len(SORT_KEYS[sort]):
+            raise ValueError
+        return [KEY_TYPES[name](value) for name, value in zip(SORT_KEYS[sort], data['k'])]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidQueryError("Cursor inválido")
+
+
+def parse_bool(value):
+    if value is None:
+        return None
+    if value.lower() in ('1', 'true', 'yes', 'si'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise InvalidQueryError(f"Valor booleano inválido: {value}")
+
+
+def parse_number(value, name):
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise InvalidQueryError(f"{name} debe ser un número")
+    # nan o inf pasan float() pero dejan el filtro sin sentido
+    if not math.isfinite(number):
+        raise InvalidQueryError(f"{name} debe ser un número")
+    return number
+
+
+def parse_listing_args(args):
+    """
+    Valida los parámetros de /api/products.
+
+    Args:
+        args (MultiDict): request.args
+
+    Returns:
+        dict: Parámetros normalizados para list_products
+    """
+    fields = DEFAULT_FIELDS
+    if args.get('fields'):
+        fields = tuple(dict.fromkeys(f.strip() for f in args['fields'].split(',') if f.strip()))
+        unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+        if unknown or not fields:
+            raise InvalidQueryError(f"Campos no soportados: {', '.join(unknown)}")
+
+    sort = args.get('sort', 'id')
+    if sort not in SORT_KEYS:
+        raise InvalidQueryError(f"Orden no soportado: {sort}. Use {', '.join(SORT_KEYS)}")
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        category_id = int(args['category_id']) if args.get('category_id') else None
+    except ValueError:
+        raise InvalidQueryError("limit y category_id deben ser enteros")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit debe estar entre 1 y {MAX_LIMIT}")
+
+    return {
+        'fields': fields,
+        'sort': sort,
+        'limit': limit,
+        'cursor': decode_cursor(sort, args['cursor']) if args.get('cursor') else None,
+        'category_id': category_id,
+        'is_promotion': parse_bool(args.get('is_promotion')),
+        'is_featured': parse_bool(args.get('is_featured')),
+        'min_price': parse_number(args.get('min_price'), 'min_price'),
+        'max_price': parse_number(args.get('max_price'), 'max_price'),
+        'in_stock': parse_bool(args.get('in_stock'))
+    }
+
+
+def serialize_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def list_products(fields=DEFAULT_FIELDS, sort='id', limit=DEFAULT_LIMIT, cursor=None,
+                  category_id=None, is_promotion=None, is_featured=None,
+                  min_price=None, max_price=None, in_stock=None):
+    """
+    Lista productos con paginación por cursor (keyset) y filtros.
+
+    Lee la proyección product_listings: el precio efectivo, el descuento y
+    la disponibilidad ya están calculados, y cada orden tiene un índice que
+    incluye los campos por defecto. Solo se seleccionan las columnas pedidas
+    más las de la clave de orden. Se pide una fila extra para saber si hay
+    una página siguiente.
+
+    Returns:
+        dict: items, next_cursor (None en la última página) y limit
+    """
+    key_fields = SORT_KEYS[sort]
+    selected = tuple(dict.fromkeys((*fields, *key_fields)))
+    stmt = db.select(*[PRODUCT_FIELDS[name].label(name) for name in selected])
+    if any(PRODUCT_FIELDS[name].class_ is Product for name in selected):
+        stmt = stmt.join(Product, Product.id == ProductListing.id)
+
+    if category_id is not None:
+        stmt = stmt.where(ProductListing.category_id == category_id)
+    if is_promotion is not None:
+        stmt = stmt.where(ProductListing.is_promotion.is_(is_promotion))
+    if is_featured is not None:
+        stmt = stmt.where(ProductListing.is_featured.is_(is_featured))
+    if min_price is not None:
+        stmt = stmt.where(ProductListing.effective_price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(ProductListing.effective_price <= max_price)
+    if in_stock is not None:
+        stmt = stmt.where(ProductListing.in_stock.is_(in_stock))
+
+    if sort == 'id':
+        if cursor:
+            stmt = stmt.where(ProductListing.id > cursor[0])
+        stmt = stmt.order_by(ProductListing.id)
+    elif sort == '-updated_at':
+        stmt = stmt.where(ProductListing.updated_at.isnot(None))
+        if cursor:
+            stmt = stmt.where(db.tuple_(ProductListing.updated_at, ProductListing.id) < db.tuple_(*cursor))
+        stmt = stmt.order_by(ProductListing.updated_at.desc(), ProductListing.id.desc())
+    else:
+        key = db.tuple_(ProductListing.effective_price, ProductListing.id)
+        if sort == 'price':
+            if cursor:
+                stmt = stmt.where(key > db.tuple_(*cursor))
+            stmt = stmt.order_by(ProductListing.effective_price, ProductListing.id)
+        else:
+            if cursor:
+                stmt = stmt.where(key < db.tuple_(*cursor))
+            stmt = stmt.order_by(ProductListing.effective_price.desc(), ProductListing.id.desc())
+
+    rows = db.session.execute(stmt.limit(limit + 1)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        'items': [{name: serialize_value(row[name]) for name in fields} for row in rows],
+        'next_cursor': encode_cursor(sort, rows[-1]) if has_more else None,
+        'limit': limit
+    }
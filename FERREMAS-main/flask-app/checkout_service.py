@@ -0,0 +1,176 @@
+from extensions import db
+from models import CartItem, Order, OrderItem, Product, WebpayTransaction
+from pricing import price_products
+
+
+class EmptyCartError(ValueError):
+    """El usuario no tiene productos en el carrito"""
+
+
+class InsufficientStockError(ValueError):
+    """Uno o más productos del carrito no tienen stock suficiente"""
+
+    def __init__(self, product_ids):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Stock insuficiente para los productos: {self.product_ids}")
+
+
+def price_cart(user_id):
+    """
+    Calcula el precio de todas las líneas del carrito en una sola consulta.
+
+    Los precios se leen de Product en la misma transacción de la compra (no
+    de la caché de precios) y se valorizan con el motor de precios.
+
+    Args:
+        user_id (int): ID del usuario
+
+    Returns:
+        CartPricing: Líneas (product_id, quantity, unit_price, line_total) y total en Decimal
+    """
+    stmt = (
+        db.select(CartItem.product_id, CartItem.quantity, Product.price,
+                  Product.is_promotion, Product.promotion_price)
+        .join(Product, CartItem.product_id == Product.id)
+        .where(CartItem.user_id == user_id)
+        .order_by(CartItem.product_id)
+    )
+    return price_products(tuple(row) for row in db.session.execute(stmt))
+
+
+def reserve_stock(lines):
+    """
+    Descuenta el stock de todas las líneas con un único UPDATE condicional.
+
+    Las filas se bloquean en orden de ID antes de actualizar para que dos
+    compras concurrentes con productos en común no se bloqueen mutuamente.
+    Solo se descuentan las filas con stock >= cantidad; si alguna no cumple,
+    se lanza InsufficientStockError y el llamador debe hacer rollback.
+
+    Args:
+        lines (list): Tuplas (product_id, quantity, ...) como CartPricing.lines de price_cart
+
+    Raises:
+        InsufficientStockError: Si algún producto no tiene stock suficiente
+    """
+    quantities = {}
+    for product_id, quantity, *_ in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+    requested = db.values(
+        db.column('product_id', db.Integer),
+        db.column('quantity', db.Integer),
+        name='requested'
+    ).data(sorted(quantities.items()))
+
+    locked = (
+        db.select(Product.id)
+        .where(Product.id.in_(quantities))
+        .order_by(Product.id)
+        .with_for_update()
+        .cte('locked')
+    )
+
+    stmt = (
+        db.update(Product)
+        .where(Product.id == requested.c.product_id)
+        .where(Product.id.in_(db.select(locked.c.id)))
+        .where(Product.stock >= requested.c.quantity)
+        .values(stock=Product.stock - requested.c.quantity)
+        .returning(Product.id)
+    )
+    reserved = set(db.session.execute(stmt, execution_options={'synchronize_session': False}).scalars())
+
+    missing = set(quantities) - reserved
+    if missing:
+        raise InsufficientStockError(missing)
+
+
+def release_stock(order_id):
+    """
+    Devuelve al inventario el stock reservado por una orden en un solo UPDATE.
+
+    Args:
+        order_id (int): ID de la orden
+    """
+    release_orders_stock([order_id])
+
+
+def release_orders_stock(order_ids):
+    """
+    Devuelve al inventario el stock reservado por varias órdenes en un solo UPDATE.
+
+    Args:
+        order_ids (list): IDs de las órdenes
+    """
+    if not order_ids:
+        return
+    reserved = (
+        db.select(OrderItem.product_id, db.func.sum(OrderItem.quantity).label('quantity'))
+        .where(OrderItem.order_id.in_(order_ids))
+        .group_by(OrderItem.product_id)
+        .subquery()
+    )
+    stmt = (
+        db.update(Product)
+        .where(Product.id == reserved.c.product_id)
+        .values(stock=Product.stock + reserved.c.quantity)
+    )
+    db.session.execute(stmt, execution_options={'synchronize_session': False})
+
+
+def create_order(user_id, session_id):
+    """
+    Crea la orden, sus items y la transacción Webpay reservando el stock.
+
+    Todo ocurre en una sola transacción: una consulta para precios, un UPDATE
+    para el stock, un INSERT masivo para los items. Si algo falla no queda
+    ni la orden ni el stock descontado.
+
+    Args:
+        user_id (int): ID del usuario que compra
+        session_id (str): ID de sesión enviado a Webpay
+
+    Returns:
+        tuple: (Order, WebpayTransaction) ya confirmados en la base de datos
+
+    Raises:
+        EmptyCartError: Si el carrito está vacío
+        InsufficientStockError: Si algún producto no tiene stock suficiente
+    """
+    try:
+        pricing = price_cart(user_id)
+        lines = pricing.lines
+        if not lines:
+            raise EmptyCartError("Carrito vacío")
+
+        total = pricing.total
+
+        reserve_stock(lines)
+
+        order = Order(user_id=user_id, total_amount=total, status='pending')
+        db.session.add(order)
+        db.session.flush()
+
+        db.session.execute(db.insert(OrderItem), [
+            {
+                'order_id': order.id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'price_at_time': unit_price
+            }
+            for product_id, quantity, unit_price, _ in lines
+        ])
+
+        transaction = WebpayTransaction(
+            order=order,
+            buy_order=f"OC-{order.id}",
+            amount=total,
+            session_id=session_id
+        )
+        db.session.add(transaction)
+        db.session.commit()
+        return order, transaction
+    except Exception:
+        db.session.rollback()
+        raise
@@ -1,13 +1,26 @@
 import requests
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 import os
 from dotenv import load_dotenv
-from functools import lru_cache
 import json
+import asyncio
 import logging
+import threading
+import time
+from contextlib import nullcontext
+import numpy as np
+from rate_store import RateStore
+from rate_history import RateHistory
+from metrics import metrics
+from http_client import outbound
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
 
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Cargar variables de entorno
@@ -16,7 +29,8 @@ load_dotenv()
 # Configuración
 BDE_EMAIL = os.getenv('BDE_EMAIL')
 BDE_PASSWORD = os.getenv('BDE_PASSWORD')
-BASE_URL = "https://si3.bcentral.cl/SieteRestWS/SieteRestWS.ashx"
+# BCENTRAL_BASE_URL permite apuntar a un SieteRestWS falso (fakes/bcentral.py)
+BASE_URL = os.getenv('BCENTRAL_BASE_URL', "https://si3.bcentral.cl/SieteRestWS/SieteRestWS.ashx")
 
 # Códigos de series para diferentes monedas
 CURRENCY_SERIES = {
@@ -26,10 +40,38 @@ CURRENCY_SERIES = {
     'UTM': 'F073.UTM.PRE.Z.D'   # UTM
 }
 
+# Calendario de refresco por serie. Una tasa se considera vencida si pasó su
+# TTL o si se descargó antes de la última publicación del Banco Central
+# (hora local de Santiago). El dólar y el euro se publican cada día hábil;
+# UF y UTM se publican por adelantado, por lo que basta un refresco diario.
+SANTIAGO_TZ = ZoneInfo('America/Santiago')
+SERIES_SCHEDULE = {
+    'USD': {'ttl': 6 * 3600, 'publish_hour': 19},
+    'EUR': {'ttl': 6 * 3600, 'publish_hour': 19},
+    'UF': {'ttl': 24 * 3600, 'publish_hour': 9},
+    'UTM': {'ttl': 24 * 3600, 'publish_hour': 9}
+}
+
+
+# Límite de montos por solicitud de conversión en lote
+MAX_BATCH_AMOUNTS = 10000
+
+# Decimales con que se redondea cada moneda en las conversiones en lote
+CURRENCY_DECIMALS = {'CLP': 2, 'USD': 2, 'EUR': 2, 'UF': 4, 'UTM': 4}
+
+
+class RateUnavailableError(ValueError):
+    """La tasa aún no está en el almacén local y se solicitó su descarga"""
+
 class CurrencyConverter:
-    def __init__(self):
+    def __init__(self, store=None, history=None, base_url=None):
         try:
-            self.session = requests.Session()
+            # Pool de conexiones, timeouts, breaker y reintentos del servicio (ver http_client.py)
+            self.http = outbound.client('bcentral')
+            self.base_url = base_url or BASE_URL
+            self.store = store or RateStore()
+            self.history = history or RateHistory()
+            self.refresher = None
             if not BDE_EMAIL or not BDE_PASSWORD:
                 logger.error("Credenciales de la API del Banco Central no configuradas")
                 raise ValueError("Credenciales de la API del Banco Central no configuradas")
@@ -38,11 +80,14 @@ class CurrencyConverter:
             logger.error(f"Error al inicializar CurrencyConverter: {str(e)}")
             raise
 
-    @lru_cache(maxsize=32)
+    @metrics.timed('bcentral', 'get_exchange_rate')
     def get_exchange_rate(self, currency_code, date=None):
         """
         Obtiene la tasa de cambio para una moneda específica.
         
+        Usa el almacén local si tiene una observación para la fecha; si no,
+        la descarga del Banco Central y la guarda.
+        
         Args:
             currency_code (str): Código de la moneda (USD, EUR, etc.)
             date (datetime, optional): Fecha específica. Por defecto, None (usa fecha actual)
@@ -50,11 +95,168 @@ class CurrencyConverter:
         Returns:
             float: Tasa de cambio
             
+        Raises:
+            ValueError: Si la moneda no está soportada o hay un error en la API
+        """
+        if currency_code not in CURRENCY_SERIES:
+            logger.error(f"Moneda no soportada: {currency_code}")
+            raise ValueError(f"Moneda no soportada: {currency_code}")
+
+        on_date = date.strftime('%Y-%m-%d') if date else None
+        cached = self.store.latest(currency_code, on_date)
+        if cached and (date is not None or not self.is_stale(currency_code)):
+            return cached['value']
+
+        # Fechas pasadas: la serie histórica local evita ir al Banco Central
+        if date is not None:
+            first_date, last_date = self.history.bounds(currency_code)
+            if first_date and first_date <= on_date <= last_date:
+                return self.history.rate_on(currency_code, on_date)['value']
+
+        observations = self.fetch_observations(currency_code, date)
+        self.store.save(currency_code, observations)
+        return observations[-1][1]
+
+    def get_cached_rate(self, currency_code):
+        """
+        Obtiene la última tasa del almacén local sin acceder a la red.
+        
+        Si la tasa está vencida se entrega igual (marcada como stale) y se pide
+        al refresher que la actualice en segundo plano.
+        
+        Args:
+            currency_code (str): Código de la moneda
+            
+        Returns:
+            dict: value, date, fetched_at, age_seconds y stale
+            
+        Raises:
+            ValueError: Si la moneda no está soportada
+            RateUnavailableError: Si aún no hay datos locales para la moneda
+        """
+        if currency_code not in CURRENCY_SERIES:
+            logger.error(f"Moneda no soportada: {currency_code}")
+            raise ValueError(f"Moneda no soportada: {currency_code}")
+
+        cached = self.store.latest(currency_code)
+        stale = cached is None or self.is_stale(currency_code)
+        if stale and self.refresher:
+            self.refresher.wake()
+        if cached is None:
+            raise RateUnavailableError(
+                f"La tasa de {currency_code} aún no está disponible, intente en unos segundos"
+            )
+
+        cached['age_seconds'] = round(time.time() - cached['fetched_at'], 1)
+        cached['stale'] = stale
+        return cached
+
+    def is_stale(self, currency_code, now=None):
+        """
+        Indica si la tasa local de una moneda debe volver a descargarse.
+        
+        Args:
+            currency_code (str): Código de la moneda
+            now (datetime, optional): Momento de referencia (con zona horaria)
+            
+        Returns:
+            bool: True si no hay descarga previa, pasó el TTL o hubo una publicación posterior
+        """
+        fetched_at = self.store.last_fetch(currency_code)
+        if fetched_at is None:
+            return True
+
+        now = now or datetime.now(SANTIAGO_TZ)
+        schedule = SERIES_SCHEDULE[currency_code]
+        if now.timestamp() - fetched_at > schedule['ttl']:
+            return True
+
+        last_publication = now.replace(hour=schedule['publish_hour'], minute=0, second=0, microsecond=0)
+        if last_publication > now:
+            last_publication -= timedelta(days=1)
+        return fetched_at < last_publication.timestamp()
+
+    def refresh(self, currency_code):
+        """Descarga las observaciones recientes de una moneda y las guarda en el almacén y la serie histórica"""
+        self.save_observations(currency_code, self.fetch_observations(currency_code))
+
+    def save_observations(self, currency_code, observations):
+        """Guarda observaciones descargadas en el almacén y la serie histórica"""
+        self.store.save(currency_code, observations)
+        self.history.ingest(currency_code, observations)
+
+    async def fetch_observations_async(self, currency_code, date=None, start_date=None):
+        """Variante asyncio de fetch_observations: corre en el pool de hilos del cliente del Banco Central"""
+        return await self.http.run(self.fetch_observations, currency_code, date, start_date)
+
+    def fetch_many(self, currency_codes):
+        """
+        Descarga en paralelo las observaciones recientes de varias monedas.
+        
+        Las consultas a SieteRestWS se hacen de forma concurrente (a lo más
+        BCENTRAL_POOL_SIZE a la vez), así que el tiempo total es el de la
+        serie más lenta y no la suma de todas.
+        
+        Args:
+            currency_codes (list): Códigos de las monedas
+            
+        Returns:
+            dict: Moneda -> lista de observaciones, o la excepción (ValueError) si falló
+        """
+        async def gather():
+            return await asyncio.gather(*(self.fetch_observations_async(code) for code in currency_codes),
+                                        return_exceptions=True)
+        return dict(zip(currency_codes, asyncio.run(gather())))
+
+    def ingest_history(self, currency_code, start_date, end_date=None, chunk_years=5):
+        """
+        Descarga la historia completa de una moneda y la agrega a la serie local.
+        
+        La descarga se hace en tramos de `chunk_years` años para no pedir
+        respuestas demasiado grandes a SieteRestWS.
+        
+        Args:
+            currency_code (str): Código de la moneda
+            start_date (datetime): Primera fecha a descargar
+            end_date (datetime, optional): Última fecha. Por defecto, hoy
+            chunk_years (int): Años por petición
+            
+        Returns:
+            int: Observaciones válidas descargadas
+        """
+        end_date = end_date or datetime.now()
+        total = 0
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            chunk_end = min(datetime(chunk_start.year + chunk_years - 1, 12, 31), end_date)
+            try:
+                observations = self.fetch_observations(currency_code, chunk_end, start_date=chunk_start)
+            except ValueError as e:
+                # Tramos sin datos (por ejemplo, antes de que existiera la serie)
+                logger.warning(f"Sin datos para {currency_code} entre {chunk_start:%Y-%m-%d} y {chunk_end:%Y-%m-%d}: {str(e)}")
+                observations = []
+            self.history.ingest(currency_code, observations)
+            total += len(observations)
+            chunk_start = chunk_end + timedelta(days=1)
+        return total
+
+    def fetch_observations(self, currency_code, date=None, start_date=None):
+        """
+        Descarga del Banco Central las observaciones válidas de una ventana de fechas.
+        
+        Args:
+            currency_code (str): Código de la moneda (USD, EUR, etc.)
+            date (datetime, optional): Fecha final de la ventana. Por defecto, hoy
+            start_date (datetime, optional): Fecha inicial. Por defecto, 5 días antes de `date`
+            
+        Returns:
+            list: Tuplas (fecha 'YYYY-MM-DD', valor) ordenadas por fecha
+            
         Raises:
             ValueError: Si la moneda no está soportada o hay un error en la API
         """
         try:
-            logger.info(f"Obteniendo tasa de cambio para {currency_code}")
+            logger.debug(f"Obteniendo tasa de cambio para {currency_code}")
             
             if currency_code not in CURRENCY_SERIES:
                 logger.error(f"Moneda no soportada: {currency_code}")
@@ -66,7 +268,7 @@ class CurrencyConverter:
 
             # Formatear fechas para la API
             end_date = date.strftime('%Y-%m-%d')
-            start_date = (date - timedelta(days=5)).strftime('%Y-%m-%d')
+            start_date = (start_date or date - timedelta(days=5)).strftime('%Y-%m-%d')
 
             # Construir los parámetros de la API
             params = {
@@ -78,10 +280,13 @@ class CurrencyConverter:
                 'lastdate': end_date
             }
 
-            logger.info(f"Realizando petición a la API con parámetros: {params}")
+            # Los parámetros incluyen las credenciales: no se registran
+            logger.debug("Consultando SieteRestWS",
+                         extra={'series': params['timeseries'], 'firstdate': start_date, 'lastdate': end_date})
 
             # Realizar la solicitud a la API
-            response = self.session.get(BASE_URL, params=params, timeout=10)
+            with metrics.timer('bcentral', 'fetch'):
+                response = self.http.get(self.base_url, params=params)
             
             # Verificar errores de autenticación
             if response.status_code == 401:
@@ -95,10 +300,11 @@ class CurrencyConverter:
                 data = response.json()
             except json.JSONDecodeError as e:
                 logger.error(f"Error al decodificar JSON de la respuesta: {str(e)}")
-                logger.error(f"Respuesta recibida: {response.text}")
+                logger.error(f"Respuesta recibida: {response.text[:500]}")
                 raise ValueError("Error al procesar la respuesta de la API")
 
-            logger.info(f"Respuesta de la API: {data}")
+            logger.debug("Respuesta de SieteRestWS", extra={'series': params['timeseries'],
+                                                              'observations': len(((data or {}).get('Series') or {}).get('Obs') or [])})
             
             # Verificar si hay datos
             if not data or 'Series' not in data or not data['Series']:
@@ -118,19 +324,25 @@ class CurrencyConverter:
                 logger.error(f"No hay observaciones válidas para {currency_code}")
                 raise ValueError(f"No hay observaciones válidas para {currency_code}")
 
-            # Tomar el valor más reciente
+            # Convertir las observaciones (indexDateString viene como DD-MM-YYYY)
             try:
-                latest_value = float(valid_observations[-1]['value'])
-            except (KeyError, ValueError, IndexError) as e:
+                observations = [
+                    (datetime.strptime(obs['indexDateString'], '%d-%m-%Y').strftime('%Y-%m-%d'),
+                     float(obs['value']))
+                    for obs in valid_observations
+                ]
+            except (KeyError, ValueError) as e:
                 logger.error(f"Error al obtener el valor más reciente: {str(e)}")
                 raise ValueError("Error al procesar el valor de la tasa de cambio")
 
-            logger.info(f"Tasa de cambio obtenida para {currency_code}: {latest_value}")
-            return latest_value
+            observations.sort()
+            logger.info(f"Tasa de cambio obtenida para {currency_code}: {observations[-1][1]}")
+            return observations
 
         except requests.RequestException as e:
+            # El detalle incluye la URL con las credenciales: solo va al log, que las redacta
             logger.error(f"Error de conexión con la API: {str(e)}")
-            raise ValueError(f"Error al conectar con la API del Banco Central: {str(e)}")
+            raise ValueError("Error al conectar con la API del Banco Central")
         except Exception as e:
             logger.error(f"Error inesperado: {str(e)}")
             raise ValueError(f"Error inesperado: {str(e)}")
@@ -150,7 +362,7 @@ class CurrencyConverter:
             ValueError: Si hay un error en la conversión
         """
         try:
-            logger.info(f"Iniciando conversión de {amount} {from_currency} a CLP")
+            logger.debug(f"Iniciando conversión de {amount} {from_currency} a CLP")
             
             # Validar el monto
             try:
@@ -163,12 +375,9 @@ class CurrencyConverter:
                 logger.error(f"Monto inválido: {amount}")
                 raise ValueError("El monto debe ser mayor que 0")
 
-            # Obtener la tasa de cambio
-            try:
-                rate = self.get_exchange_rate(from_currency)
-            except ValueError as e:
-                logger.error(f"Error al obtener tasa de cambio: {str(e)}")
-                raise ValueError(f"Error al obtener tasa de cambio: {str(e)}")
+            # Obtener la tasa de cambio desde el almacén local (sin acceso a la red)
+            rate_info = self.get_cached_rate(from_currency)
+            rate = rate_info['value']
             
             # Realizar la conversión
             converted_amount = amount * rate
@@ -178,12 +387,17 @@ class CurrencyConverter:
                 "rate": rate,
                 "currency": from_currency,
                 "original_amount": amount,
-                "date": datetime.now().strftime('%Y-%m-%d')
+                "date": datetime.now().strftime('%Y-%m-%d'),
+                "rate_date": rate_info['date'],
+                "rate_age_seconds": rate_info['age_seconds'],
+                "rate_stale": rate_info['stale']
             }
             
-            logger.info(f"Conversión exitosa: {result}")
+            logger.debug("Conversión exitosa: %s", result)
             return result
             
+        except RateUnavailableError:
+            raise
         except ValueError as e:
             logger.error(f"Error en la conversión: {str(e)}")
             raise ValueError(f"Error en la conversión: {str(e)}")
@@ -191,6 +405,95 @@ class CurrencyConverter:
             logger.error(f"Error inesperado en la conversión: {str(e)}")
             raise ValueError(f"Error inesperado: {str(e)}")
 
+    def rate_snapshot(self, currencies):
+        """
+        Toma de una vez las tasas locales de varias monedas (CLP vale 1).
+        
+        Args:
+            currencies (iterable): Códigos de moneda
+            
+        Returns:
+            dict: Código -> información de la tasa (como get_cached_rate)
+        """
+        snapshot = {}
+        for code in dict.fromkeys(currencies):
+            if code == 'CLP':
+                snapshot[code] = {'value': 1.0, 'date': None, 'age_seconds': 0.0, 'stale': False}
+            else:
+                snapshot[code] = self.get_cached_rate(code)
+        return snapshot
+
+    def convert_batch(self, amounts, to_currencies, from_currency='CLP'):
+        """
+        Convierte muchos montos a varias monedas con una sola foto de las tasas.
+        
+        El cálculo se hace con NumPy sobre todos los montos a la vez:
+        monto * tasa_origen / tasa_destino, usando CLP como moneda puente.
+        
+        Args:
+            amounts (list): Montos en la moneda de origen
+            to_currencies (list): Códigos de las monedas destino
+            from_currency (str): Moneda de origen. Por defecto, CLP
+            
+        Returns:
+            dict: Montos convertidos por moneda destino y las tasas usadas
+            
+        Raises:
+            ValueError: Si los montos o las monedas no son válidos
+            RateUnavailableError: Si falta alguna tasa en el almacén local
+        """
+        if not isinstance(amounts, list) or not amounts:
+            raise ValueError("Se requiere una lista de montos")
+        if len(amounts) > MAX_BATCH_AMOUNTS:
+            raise ValueError(f"Se permiten como máximo {MAX_BATCH_AMOUNTS} montos por solicitud")
+        if not isinstance(to_currencies, list) or not to_currencies:
+            raise ValueError("Se requiere una lista de monedas destino")
+        if not all(isinstance(code, str) for code in [from_currency, *to_currencies]):
+            raise ValueError("Los códigos de moneda deben ser textos")
+
+        unsupported = [code for code in [from_currency, *to_currencies]
+                       if code != 'CLP' and code not in CURRENCY_SERIES]
+        if unsupported:
+            raise ValueError(f"Moneda no soportada: {', '.join(map(str, unsupported))}")
+
+        try:
+            values = np.asarray(amounts, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError("Todos los montos deben ser números válidos")
+        if values.ndim != 1:
+            raise ValueError("Todos los montos deben ser números válidos")
+        invalid = np.flatnonzero(~np.isfinite(values) | (values <= 0))
+        if invalid.size:
+            raise ValueError(f"Los montos deben ser mayores que 0 (posiciones inválidas: {invalid[:10].tolist()})")
+
+        snapshot = self.rate_snapshot([from_currency, *to_currencies])
+        targets = list(dict.fromkeys(to_currencies))
+        target_rates = np.array([snapshot[code]['value'] for code in targets])
+
+        # Matriz montos x monedas destino
+        converted = values[:, np.newaxis] * (snapshot[from_currency]['value'] / target_rates)
+
+        conversions = {}
+        for column, code in enumerate(targets):
+            conversions[code] = np.round(converted[:, column], CURRENCY_DECIMALS.get(code, 2)).tolist()
+
+        logger.info(f"Conversión en lote: {len(values)} montos de {from_currency} a {', '.join(targets)}")
+        return {
+            "from_currency": from_currency,
+            "amounts": values.tolist(),
+            "conversions": conversions,
+            "rates": {
+                code: {
+                    "rate": info['value'],
+                    "rate_date": info['date'],
+                    "rate_age_seconds": info['age_seconds'],
+                    "rate_stale": info['stale']
+                }
+                for code, info in snapshot.items()
+            },
+            "date": datetime.now().strftime('%Y-%m-%d')
+        }
+
     def get_available_currencies(self):
         """
         Retorna la lista de monedas disponibles para conversión.
@@ -203,4 +506,76 @@ class CurrencyConverter:
             {"code": "EUR", "name": "Euro"},
             {"code": "UF", "name": "Unidad de Fomento"},
             {"code": "UTM", "name": "Unidad Tributaria Mensual"}
-        ] 
\ No newline at end of file
+        ]
+
+
+class RateRefresher(threading.Thread):
+    """
+    Hilo que mantiene actualizado el almacén de tasas según SERIES_SCHEDULE.
+    
+    Varios procesos (workers de gunicorn) pueden tener su propio refresher:
+    un bloqueo de archivo garantiza que solo uno descargue a la vez y, como
+    la vigencia se revisa después de tomar el bloqueo, cada publicación se
+    descarga una sola vez.
+    """
+
+    def __init__(self, converter, check_interval=60, retry_interval=300):
+        super().__init__(name='rate-refresher', daemon=True)
+        self.converter = converter
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._failed_at = {}
+        converter.refresher = self
+
+    def wake(self):
+        """Pide una revisión inmediata (por ejemplo, ante una tasa faltante)"""
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh_stale()
+            except Exception as e:
+                logger.error(f"Error en el refresco de tasas: {str(e)}")
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def refresh_stale(self):
+        """Descarga las series vencidas. Retorna la lista de monedas actualizadas"""
+        now = time.time()
+        pending = [
+            code for code in CURRENCY_SERIES
+            if self.converter.is_stale(code)
+            and now - self._failed_at.get(code, 0) > self.retry_interval
+        ]
+        if not pending:
+            return []
+
+        refreshed = []
+        # El bloqueo es el del almacén en uso: dos convertidores con almacenes distintos no se excluyen
+        lock_path = self.converter.store.lock_path
+        with (open(lock_path, 'a') if lock_path else nullcontext()) as lock_file:
+            if fcntl and lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Otro proceso está refrescando
+                    return []
+            # Otro proceso pudo haberlas actualizado mientras esperábamos
+            pending = [code for code in pending if self.converter.is_stale(code)]
+            results = self.converter.fetch_many(pending) if pending else {}
+            for code, observations in results.items():
+                if isinstance(observations, Exception):
+                    self._failed_at[code] = time.time()
+                    logger.error(f"No se pudo refrescar la tasa de {code}: {str(observations)}")
+                    continue
+                self.converter.save_observations(code, observations)
+                self._failed_at.pop(code, None)
+                refreshed.append(code)
+        return refreshed
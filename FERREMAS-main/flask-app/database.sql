@@ -94,7 +94,7 @@ CREATE INDEX idx_orders_user_id ON orders(user_id);
 CREATE INDEX idx_order_items_order_id ON order_items(order_id);
 CREATE INDEX idx_webpay_transactions_order_id ON webpay_transactions(order_id);
 CREATE INDEX idx_webpay_transactions_buy_order ON webpay_transactions(buy_order);
-CREATE INDEX idx_webpay_transactions_token_ws ON webpay_transactions(token_ws);
+CREATE UNIQUE INDEX idx_webpay_transactions_token_ws_unique ON webpay_transactions(token_ws);
 
 -- Crear función para actualizar el timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -0,0 +1,86 @@
+import logging
+import os
+
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} debe ser un número entero, se recibió: {value}")
+
+
+def env_flag(name, default):
+    return os.getenv(name, '1' if default else '0') == '1'
+
+
+def engine_options_from_env():
+    """
+    Opciones del engine de SQLAlchemy (SQLALCHEMY_ENGINE_OPTIONS) desde el entorno.
+
+    Con gunicorn cada worker tiene su propio pool, así que el máximo de
+    conexiones hacia Postgres es workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW),
+    y debe quedar bajo max_connections.
+
+    Variables:
+        DB_POOL_SIZE: Conexiones que el pool mantiene abiertas (por defecto 5)
+        DB_MAX_OVERFLOW: Conexiones extra permitidas en picos (por defecto 10)
+        DB_POOL_TIMEOUT: Segundos de espera por una conexión libre (por defecto 30)
+        DB_POOL_RECYCLE: Segundos tras los que se renueva una conexión (por defecto 1800)
+        DB_POOL_PRE_PING: 1 para verificar la conexión antes de usarla (por defecto 1)
+        DB_CONNECT_TIMEOUT: Segundos para establecer una conexión nueva (por defecto 10)
+        DB_STATEMENT_TIMEOUT_MS: Tiempo máximo por sentencia en ms (por defecto 0, sin límite)
+
+    Returns:
+        dict: Opciones para create_engine
+    """
+    connect_args = {
+        'connect_timeout': env_int('DB_CONNECT_TIMEOUT', 10),
+        # Identifica las conexiones de la app en pg_stat_activity
+        'application_name': os.getenv('DB_APPLICATION_NAME', 'ferremas')
+    }
+    statement_timeout = env_int('DB_STATEMENT_TIMEOUT_MS', 0)
+    if statement_timeout > 0:
+        connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+
+    return {
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+        # Descarta conexiones muertas (por ejemplo tras reiniciar Postgres) antes de usarlas
+        'pool_pre_ping': env_flag('DB_POOL_PRE_PING', True),
+        # LIFO reutiliza siempre las mismas conexiones y deja expirar las sobrantes
+        'pool_use_lifo': True,
+        'connect_args': connect_args
+    }
+
+
+def dispose_pool_after_fork(app):
+    """
+    Evita que un proceso hijo (gunicorn --preload, multiprocessing) use las
+    conexiones abiertas por el padre: el hijo parte con un pool vacío.
+    """
+    if not hasattr(os, 'register_at_fork'):
+        return
+    with app.app_context():
+        engine = db.engine
+    # close=False: las conexiones siguen siendo del padre, el hijo solo las olvida
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def pool_status(engine):
+    """Estado del pool de conexiones (tamaño, en uso, libres y overflow)"""
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
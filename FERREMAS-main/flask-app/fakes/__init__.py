@@ -0,0 +1,11 @@
+"""
+Servidores falsos de los servicios externos (Webpay Plus y SieteRestWS del
+Banco Central) para pruebas de carga y desarrollo sin conexión.
+
+Se ejecutan desde la carpeta flask-app, por ejemplo:
+
+    python -m fakes.webpay --port 8081 --latency 0.2 --error-rate 0.01
+    python -m fakes.bcentral --port 8082
+
+y la aplicación se apunta a ellos con WEBPAY_BASE_URL y BCENTRAL_BASE_URL.
+"""
@@ -0,0 +1,117 @@
+"""
+SieteRestWS falso del Banco Central: responde GetSeries para las series de
+CURRENCY_SERIES con observaciones deterministas (paseo aleatorio a partir de
+la serie y la fecha), sin publicación en fines de semana para dólar y euro,
+como la API real.
+
+    python -m fakes.bcentral --port 8082 --latency 0.3
+
+La aplicación se apunta a este servidor con
+BCENTRAL_BASE_URL=http://127.0.0.1:8082/SieteRestWS/SieteRestWS.ashx.
+"""
+import logging
+import random
+import re
+from datetime import date, datetime, timedelta
+
+from fakes.server import FakeHandler, FakeServer, behavior_arguments, behavior_from_args
+
+logger = logging.getLogger(__name__)
+
+SERVICE_PATH = '/SieteRestWS/SieteRestWS.ashx'
+
+# Valor de referencia y publicación diaria (True) o solo días hábiles (False)
+SERIES = {
+    'F073.TCO.PRE.Z.D': (940.0, False),
+    'F073.TCO.EUR.Z.D': (1020.0, False),
+    'F073.UF.PRE.Z.D': (37500.0, True),
+    'F073.UTM.PRE.Z.D': (66000.0, True)
+}
+
+# Respuestas más largas que esto se rechazan, como hace la API con rangos excesivos
+MAX_OBSERVATIONS = 20000
+
+
+def observation_value(series_id, day):
+    """Valor estable de una serie en un día: el mismo en cada consulta"""
+    base, _ = SERIES[series_id]
+    rng = random.Random(f'{series_id}:{day.isoformat()}')
+    # Tendencia lenta más ruido diario de ±0,5 %
+    trend = 1 + 0.02 * ((day.toordinal() % 365) / 365)
+    return round(base * trend * (1 + rng.uniform(-0.005, 0.005)), 2)
+
+
+def observations(series_id, first, last):
+    _, daily = SERIES[series_id]
+    result = []
+    day = first
+    while day <= last:
+        published = daily or day.weekday() < 5
+        result.append({
+            'indexDateString': day.strftime('%d-%m-%Y'),
+            'value': str(observation_value(series_id, day)) if published else 'NaN',
+            'statusCode': 'OK' if published else 'ND'
+        })
+        day += timedelta(days=1)
+    return result
+
+
+class BcentralHandler(FakeHandler):
+    ROUTES = (
+        ('GET', re.compile(re.escape(SERVICE_PATH)), 'get_series'),
+    )
+
+    def handle_get_series(self, match, query, body):
+        if not query.get('user') or not query.get('pass'):
+            return 200, {'Codigo': -5, 'Descripcion': 'Invalid username or password', 'Series': {'Obs': None}}
+        if query.get('function') != 'GetSeries':
+            return 200, {'Codigo': -1, 'Descripcion': 'Invalid function', 'Series': {'Obs': None}}
+
+        series_id = query.get('timeseries')
+        if series_id not in SERIES:
+            return 200, {'Codigo': -50, 'Descripcion': 'Invalid series', 'Series': {'Obs': None}}
+        try:
+            first = datetime.strptime(query['firstdate'], '%Y-%m-%d').date()
+            last = datetime.strptime(query.get('lastdate') or date.today().isoformat(), '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return 200, {'Codigo': -1, 'Descripcion': 'Invalid date', 'Series': {'Obs': None}}
+        if (last - first).days > MAX_OBSERVATIONS:
+            return 200, {'Codigo': -1, 'Descripcion': 'Range too large', 'Series': {'Obs': None}}
+
+        return 200, {
+            'Codigo': 0,
+            'Descripcion': 'Success',
+            'Series': {
+                'descripEsp': series_id,
+                'descripIng': series_id,
+                'seriesId': series_id,
+                'Obs': observations(series_id, first, last)
+            },
+            'SeriesInfos': []
+        }
+
+
+class FakeBcentralServer(FakeServer):
+    def __init__(self, address=('127.0.0.1', 0), behavior=None):
+        super().__init__(address, BcentralHandler, behavior)
+
+    @property
+    def service_url(self):
+        return self.base_url + SERVICE_PATH
+
+
+def main():
+    args = behavior_arguments('SieteRestWS falso del Banco Central', 8082).parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = FakeBcentralServer((args.host, args.port), behavior_from_args(args))
+    logger.info("SieteRestWS falso escuchando en %s", server.service_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Base común de los servidores falsos: latencia y errores configurables,
+respuestas JSON y arranque en un hilo.
+"""
+import argparse
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class FakeBehavior:
+    """
+    Comportamiento simulado de un servicio externo.
+
+    Args:
+        latency (float | dict): Segundos de latencia base; un dict asigna la
+                                latencia por operación ({'commit': 0.4}) y
+                                la clave 'default' al resto
+        jitter (float): Variación aleatoria uniforme (± segundos) sobre la latencia
+        error_rate (float): Fracción de solicitudes que responden HTTP 500
+        decline_rate (float): Fracción de operaciones de negocio rechazadas
+                              (en Webpay, pagos con status FAILED)
+        seed (int, optional): Semilla para reproducir una corrida
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, decline_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, operation):
+        if isinstance(self.latency, dict):
+            base = self.latency.get(operation, self.latency.get('default', 0.0))
+        else:
+            base = self.latency
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(0.0, base + jitter)
+
+    def chance(self, rate):
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """
+    Handler base. Las subclases definen ROUTES: tuplas (método, regex, operación)
+    y un método handle_<operación>(match, query, body) que retorna (status, payload),
+    o (status, None, headers) para responder sin cuerpo (redirecciones).
+    """
+
+    ROUTES = ()
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo van en escrituras separadas: sin Nagle no esperan el ACK retardado
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        for route_method, pattern, operation in self.ROUTES:
+            match = pattern.fullmatch(url.path)
+            if route_method == method and match:
+                break
+        else:
+            self.send_json(404, {'error_message': f'Ruta no encontrada: {method} {url.path}'})
+            return
+
+        behavior = self.server.behavior
+        time.sleep(behavior.delay(operation))
+        if behavior.chance(behavior.error_rate):
+            self.server.count(operation, 500)
+            self.send_json(500, {'error_message': 'Error simulado'})
+            return
+
+        try:
+            if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                body = {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+            else:
+                body = json.loads(raw) if raw else {}
+        except ValueError:
+            self.send_json(400, {'error_message': 'JSON inválido'})
+            return
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        result = getattr(self, f'handle_{operation}')(match, query, body)
+        status, payload = result[0], result[1]
+        self.server.count(operation, status)
+        if len(result) > 2:
+            self.send_response(status)
+            for name, value in result[2].items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_json(status, payload)
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+
+class FakeServer(ThreadingHTTPServer):
+    """Servidor HTTP multihilo con el comportamiento simulado y contadores por operación"""
+
+    daemon_threads = True
+    # La cola de 5 conexiones de socketserver rechaza ráfagas de clientes concurrentes
+    request_queue_size = 256
+
+    def __init__(self, address, handler_class, behavior=None):
+        super().__init__(address, handler_class)
+        self.behavior = behavior or FakeBehavior()
+        self.counters = {}
+        self._counters_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def handle_error(self, request, client_address):
+        # El cliente cerró la conexión antes de recibir la respuesta (por ejemplo, por timeout)
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, operation, status):
+        with self._counters_lock:
+            key = (operation, status)
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+
+def start_in_thread(server):
+    """
+    Atiende solicitudes en un hilo daemon.
+
+    Returns:
+        FakeServer: El mismo servidor; server.shutdown() lo detiene
+    """
+    thread = threading.Thread(target=server.serve_forever, name=type(server).__name__, daemon=True)
+    thread.start()
+    return server
+
+
+def parse_latency(value):
+    """'0.2' -> 0.2; 'commit=0.4,default=0.1' -> {'commit': 0.4, 'default': 0.1}"""
+    if '=' not in value:
+        return float(value)
+    latency = {}
+    for part in value.split(','):
+        operation, seconds = part.split('=', 1)
+        latency[operation.strip()] = float(seconds)
+    return latency
+
+
+def behavior_arguments(description, default_port):
+    """Argumentos de línea de comandos comunes a los servidores falsos"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=default_port)
+    parser.add_argument('--latency', type=parse_latency, default=0.0,
+                        help="segundos de latencia, o por operación: 'commit=0.4,default=0.1'")
+    parser.add_argument('--jitter', type=float, default=0.0, help='variación de la latencia (± segundos)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fracción de respuestas HTTP 500')
+    parser.add_argument('--decline-rate', type=float, default=0.0, help='fracción de operaciones rechazadas')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser
+
+
+def behavior_from_args(args):
+    return FakeBehavior(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        decline_rate=args.decline_rate, seed=args.seed)
@@ -0,0 +1,185 @@
+"""
+Webpay Plus falso: implementa create, commit, status y refund de la API REST
+v1.2 (mismas rutas, cabeceras y formato de respuesta que el ambiente de
+integración de Transbank) y el formulario de pago, que redirige de inmediato
+a return_url con el token_ws.
+
+    python -m fakes.webpay --port 8081 --latency commit=0.4,default=0.1 --decline-rate 0.05
+
+La aplicación se apunta a este servidor con WEBPAY_BASE_URL=http://127.0.0.1:8081.
+"""
+import logging
+import re
+import secrets
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from fakes.server import FakeHandler, FakeServer, behavior_arguments, behavior_from_args
+
+logger = logging.getLogger(__name__)
+
+TRANSACTIONS = r'/rswebpaytransaction/api/webpay/v1\.2/transactions'
+TOKEN = r'(?P<token>[0-9a-f]{64})'
+FORM_PATH = '/webpayserver/initTransaction'
+
+
+class WebpayState:
+    """Transacciones en memoria del Webpay falso"""
+
+    def __init__(self):
+        self.transactions = {}
+        self.lock = threading.Lock()
+
+    def create(self, buy_order, session_id, amount, return_url):
+        token = secrets.token_hex(32)
+        with self.lock:
+            self.transactions[token] = {
+                'buy_order': buy_order,
+                'session_id': session_id,
+                'amount': amount,
+                'return_url': return_url,
+                'status': 'INITIALIZED',
+                'balance': amount,
+                'created_at': datetime.now(timezone.utc)
+            }
+        return token
+
+    def get(self, token):
+        with self.lock:
+            transaction = self.transactions.get(token)
+            return dict(transaction) if transaction else None
+
+
+def transaction_payload(transaction):
+    """Cuerpo de commit/status con los campos de Webpay Plus"""
+    authorized = transaction['status'] in ('AUTHORIZED', 'REVERSED', 'NULLIFIED', 'PARTIALLY_NULLIFIED')
+    created_at = transaction['created_at']
+    payload = {
+        'vci': 'TSY' if authorized else 'TSN',
+        'amount': transaction['amount'],
+        'status': transaction['status'],
+        'buy_order': transaction['buy_order'],
+        'session_id': transaction['session_id'],
+        'card_detail': {'card_number': '6623'},
+        'accounting_date': created_at.strftime('%m%d'),
+        'transaction_date': created_at.isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+        'installments_number': 0
+    }
+    if transaction['status'] != 'INITIALIZED':
+        payload.update({
+            'authorization_code': transaction.get('authorization_code'),
+            'payment_type_code': 'VD',
+            'response_code': 0 if authorized else -1
+        })
+    return payload
+
+
+class WebpayHandler(FakeHandler):
+    ROUTES = (
+        ('POST', re.compile(TRANSACTIONS + '/?'), 'create'),
+        ('PUT', re.compile(TRANSACTIONS + '/' + TOKEN), 'commit'),
+        ('GET', re.compile(TRANSACTIONS + '/' + TOKEN), 'status'),
+        ('POST', re.compile(TRANSACTIONS + '/' + TOKEN + '/refunds'), 'refund'),
+        ('GET', re.compile(FORM_PATH), 'form'),
+        ('POST', re.compile(FORM_PATH), 'form'),
+    )
+
+    def _authorized(self):
+        return bool(self.headers.get('Tbk-Api-Key-Id') and self.headers.get('Tbk-Api-Key-Secret'))
+
+    def handle_create(self, match, query, body):
+        if not self._authorized():
+            return 401, {'error_message': 'Not Authorized'}
+        missing = [field for field in ('buy_order', 'session_id', 'amount', 'return_url') if not body.get(field)]
+        if missing:
+            return 422, {'error_message': f"{missing[0]} is required!"}
+        token = self.server.state.create(body['buy_order'], body['session_id'], body['amount'], body['return_url'])
+        return 200, {'token': token, 'url': self.server.base_url + FORM_PATH}
+
+    def handle_commit(self, match, query, body):
+        if not self._authorized():
+            return 401, {'error_message': 'Not Authorized'}
+        token = match.group('token')
+        state = self.server.state
+        with state.lock:
+            transaction = state.transactions.get(token)
+            if transaction is None:
+                return 422, {'error_message': 'Invalid value for parameter: token'}
+            if transaction['status'] != 'INITIALIZED':
+                return 422, {'error_message': f"Invalid status '{transaction['status']}' for transaction while authorizing. REJECTED"}
+            if self.server.behavior.chance(self.server.behavior.decline_rate):
+                transaction['status'] = 'FAILED'
+            else:
+                transaction['status'] = 'AUTHORIZED'
+                transaction['authorization_code'] = f'{secrets.randbelow(10 ** 6):06d}'
+            return 200, transaction_payload(transaction)
+
+    def handle_status(self, match, query, body):
+        if not self._authorized():
+            return 401, {'error_message': 'Not Authorized'}
+        transaction = self.server.state.get(match.group('token'))
+        if transaction is None:
+            return 422, {'error_message': 'Invalid value for parameter: token'}
+        return 200, transaction_payload(transaction)
+
+    def handle_refund(self, match, query, body):
+        if not self._authorized():
+            return 401, {'error_message': 'Not Authorized'}
+        token = match.group('token')
+        amount = body.get('amount')
+        state = self.server.state
+        with state.lock:
+            transaction = state.transactions.get(token)
+            if transaction is None:
+                return 422, {'error_message': 'Invalid value for parameter: token'}
+            if transaction['status'] not in ('AUTHORIZED', 'PARTIALLY_NULLIFIED'):
+                return 422, {'error_message': 'Transaction not authorized. Only authorized transactions can be refunded'}
+            if not amount or amount > transaction['balance']:
+                return 422, {'error_message': 'Invalid amount'}
+            if amount == transaction['amount']:
+                # Anulación total el mismo día: reversa
+                transaction['status'] = 'REVERSED'
+                transaction['balance'] = 0
+                return 200, {'type': 'REVERSED'}
+            transaction['balance'] -= amount
+            transaction['status'] = 'NULLIFIED' if transaction['balance'] == 0 else 'PARTIALLY_NULLIFIED'
+            return 200, {
+                'type': 'NULLIFIED',
+                'authorization_code': f'{secrets.randbelow(10 ** 6):06d}',
+                'authorization_date': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                'nullified_amount': amount,
+                'balance': transaction['balance'],
+                'response_code': 0
+            }
+
+    def handle_form(self, match, query, body):
+        # El formulario real recibe token_ws por POST; el pago se "completa" al instante
+        token = query.get('token_ws') or body.get('token_ws')
+        transaction = self.server.state.get(token) if token else None
+        if transaction is None:
+            return 422, {'error_message': 'Invalid value for parameter: token_ws'}
+        return 302, None, {'Location': f"{transaction['return_url']}?{urlencode({'token_ws': token})}"}
+
+
+class FakeWebpayServer(FakeServer):
+    def __init__(self, address=('127.0.0.1', 0), behavior=None):
+        super().__init__(address, WebpayHandler, behavior)
+        self.state = WebpayState()
+
+
+def main():
+    args = behavior_arguments('Webpay Plus falso para pruebas de carga', 8081).parse_args()
+    logging.basicConfig(level=logging.INFO)
+    server = FakeWebpayServer((args.host, args.port), behavior_from_args(args))
+    logger.info("Webpay falso escuchando en %s", server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,428 @@
+"""
+Capa común para las llamadas HTTP salientes (Transbank, Banco Central, Google).
+
+Cada servicio externo tiene su propio ServiceClient con:
+
+- un pool de conexiones keep-alive (requests.Session + HTTPAdapter con
+  pool_block: nunca más de pool_size conexiones simultáneas al servicio)
+- timeouts propios de conexión y de lectura
+- un circuit breaker: tras `failure_threshold` fallas seguidas (errores de
+  red, timeouts o HTTP 5xx) las llamadas fallan de inmediato con
+  CircuitOpenError durante `reset_timeout` segundos, y luego una sola
+  llamada de prueba decide si el circuito se cierra
+- reintentos con backoff exponencial limitados por un presupuesto (RetryBudget):
+  los reintentos no pueden superar una fracción de las solicitudes recientes,
+  así una caída del servicio no multiplica la carga sobre él
+
+Solo se reintentan los métodos idempotentes (GET por defecto); un POST o PUT
+se reintenta únicamente si la conexión no llegó a establecerse.
+
+Variante asyncio: ServiceClient.arequest / ServiceClient.run ejecutan la
+llamada en un pool de hilos propio del servicio (del tamaño del pool de
+conexiones), de modo que varias llamadas pueden esperarse en paralelo con
+asyncio.gather. No requiere aiohttp ni httpx.
+
+Los clientes se obtienen del registro `outbound`, configurado desde app.config
+con outbound.init_app(app).
+"""
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Timeout de conexión por defecto (un poco más de 3 s, múltiplo de la retransmisión TCP)
+CONNECT_TIMEOUT = 3.05
+
+# Respuestas que indican un problema del servicio (cuentan para el breaker y se reintentan)
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
+
+# Configuración por defecto de cada servicio; outbound.init_app la ajusta desde app.config
+SERVICE_DEFAULTS = {
+    'webpay': {'timeout': 10.0, 'pool_size': 10},
+    'bcentral': {'timeout': 10.0, 'pool_size': 4},
+    'google': {'timeout': 5.0, 'pool_size': 4},
+}
+
+# Valor de la métrica outbound_circuit_state por estado
+CIRCUIT_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """El circuito del servicio está abierto: la llamada se rechaza sin salir a la red"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de tres estados (closed, open, half_open).
+
+    Args:
+        failure_threshold (int): Fallas consecutivas que abren el circuito
+        reset_timeout (float): Segundos que el circuito permanece abierto
+        name (str, optional): Servicio protegido, para los logs
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, name=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True si la llamada puede salir; en half_open solo pasa una llamada de prueba a la vez"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record(self, success):
+        """Registra el resultado de una llamada permitida por allow()"""
+        with self._lock:
+            self._probing = False
+            if success:
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning("Circuito abierto", extra={'service': self.name, 'failures': self.failures})
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """
+    Presupuesto de reintentos en una ventana deslizante.
+
+    Permite min_per_second reintentos por segundo más `ratio` reintentos por
+    cada solicitud de los últimos `window` segundos (0.2: a lo más un 20 %
+    de carga extra por reintentos).
+
+    Args:
+        ratio (float): Reintentos permitidos por solicitud
+        min_per_second (float): Reintentos permitidos aunque haya poco tráfico
+        window (int): Segundos de la ventana
+    """
+
+    def __init__(self, ratio=0.2, min_per_second=1.0, window=10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        # [segundo, solicitudes, reintentos] por segundo de la ventana
+        self._buckets = deque()
+        self._lock = threading.Lock()
+
+    def _current(self):
+        now = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= now - self.window:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self):
+        with self._lock:
+            self._current()[1] += 1
+
+    def try_acquire(self):
+        """Reserva un reintento; False si el presupuesto está agotado"""
+        with self._lock:
+            bucket = self._current()
+            requests_ = sum(b[1] for b in self._buckets)
+            retries = sum(b[2] for b in self._buckets)
+            if retries >= self.min_per_second * self.window + self.ratio * requests_:
+                return False
+            bucket[2] += 1
+            return True
+
+
+class ServiceClient:
+    """
+    Cliente HTTP de un servicio externo (ver la documentación del módulo).
+
+    Args:
+        name (str): Nombre del servicio, usado en logs y métricas
+        base_url (str, optional): Prefijo de las rutas; sin él se usan URLs absolutas
+        timeout (float): Segundos máximos de espera de la respuesta
+        connect_timeout (float): Segundos máximos para establecer la conexión
+        pool_size (int): Conexiones simultáneas máximas al servicio
+        max_retries (int): Reintentos por llamada
+        backoff (float): Espera base entre reintentos (se duplica en cada uno, con jitter)
+        retry_methods (tuple): Métodos idempotentes que se reintentan ante cualquier falla
+        breaker (CircuitBreaker, optional): Por defecto, 5 fallas y 30 s
+        budget (RetryBudget, optional): Por defecto, 20 % de las solicitudes
+    """
+
+    def __init__(self, name, base_url=None, timeout=10.0, connect_timeout=CONNECT_TIMEOUT, pool_size=10,
+                 max_retries=2, backoff=0.1, retry_methods=('GET', 'HEAD'), breaker=None, budget=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.timeout = (connect_timeout, timeout)
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retry_methods = frozenset(retry_methods)
+        self.breaker = breaker or CircuitBreaker(name=name)
+        if self.breaker.name is None:
+            self.breaker.name = name
+        self.budget = budget or RetryBudget()
+        self.adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        self.counters = {'requests': 0, 'failures': 0, 'retries': 0, 'retries_denied': 0, 'rejected': 0}
+        self._counters_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _count(self, key):
+        with self._counters_lock:
+            self.counters[key] += 1
+
+    def url(self, path):
+        if self.base_url is None or path.startswith(('http://', 'https://')):
+            return path
+        return self.base_url + path
+
+    def _retryable(self, method, error=None, response=None):
+        if response is not None:
+            return method in self.retry_methods and response.status_code in RETRY_STATUSES
+        # Sin conexión establecida el servicio no recibió nada: se puede reintentar cualquier método
+        return method in self.retry_methods or isinstance(error, requests.ConnectTimeout)
+
+    def request(self, method, path, session=None, **kwargs):
+        """
+        Realiza una llamada con el timeout, breaker y reintentos del servicio.
+
+        Args:
+            method (str): Método HTTP
+            path (str): Ruta relativa a base_url, o URL absoluta
+            session (requests.Session, optional): Sesión a usar en lugar de la
+                del cliente (por ejemplo, una OAuth2Session que firma la
+                solicitud); se le monta el pool de conexiones del servicio
+            **kwargs: Argumentos de requests (params, json, headers...)
+
+        Returns:
+            requests.Response: Respuesta del servicio (incluye respuestas 4xx y 5xx)
+
+        Raises:
+            CircuitOpenError: Si el circuito está abierto
+            requests.RequestException: Si la llamada falla tras los reintentos
+        """
+        method = method.upper()
+        if session is not None and session.get_adapter('https://') is not self.adapter:
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+        session = session or self.session
+        kwargs.setdefault('timeout', self.timeout)
+        url = self.url(path)
+
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count('rejected')
+                if attempt == 0:
+                    raise CircuitOpenError(f"Circuito abierto para {self.name}")
+                # El circuito se abrió entre reintentos: se entrega la última falla
+                break
+            self._count('requests')
+            self.budget.record_request()
+
+            error = response = None
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except Exception:
+                # Error del llamador (URL inválida, etc.): no dice nada de la salud del servicio
+                self.breaker.record(True)
+                raise
+            failed = error is not None or response.status_code >= 500
+            self.breaker.record(not failed)
+            if not failed:
+                return response
+            self._count('failures')
+
+            if attempt >= self.max_retries or not self._retryable(method, error, response):
+                break
+            if not self.budget.try_acquire():
+                # Sin log por llamada: en una caída serían miles; se expone en outbound_requests_total
+                self._count('retries_denied')
+                break
+            attempt += 1
+            self._count('retries')
+            time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+        if error is not None:
+            raise error
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def executor(self):
+        """Pool de hilos de la variante asyncio, del mismo tamaño que el pool de conexiones"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size,
+                                                    thread_name_prefix=f'http-{self.name}')
+            return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Ejecuta una función bloqueante que usa este servicio sin bloquear el event loop.
+
+        Útil para envolver métodos de más alto nivel (por ejemplo,
+        CurrencyConverter.fetch_observations) y esperarlos con asyncio.gather.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor(), functools.partial(func, *args, **kwargs))
+
+    async def arequest(self, method, path, **kwargs):
+        """Variante asyncio de request()"""
+        return await self.run(self.request, method, path, **kwargs)
+
+    async def aget(self, path, **kwargs):
+        return await self.arequest('GET', path, **kwargs)
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {**counters, 'state': self.breaker.state}
+
+    def close(self):
+        self.session.close()
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+class OutboundClients:
+    """
+    Registro de los ServiceClient del proceso, uno por servicio.
+
+    Opciones tomadas de app.config (todas opcionales):
+        WEBPAY_TIMEOUT, WEBPAY_POOL_SIZE, BCENTRAL_TIMEOUT, BCENTRAL_POOL_SIZE,
+        GOOGLE_TIMEOUT, GOOGLE_POOL_SIZE: timeout de lectura y conexiones por servicio
+        OUTBOUND_CONNECT_TIMEOUT: timeout de conexión
+        OUTBOUND_MAX_RETRIES: reintentos por llamada idempotente
+        OUTBOUND_RETRY_RATIO: fracción de las solicitudes que pueden ser reintentos
+        OUTBOUND_BREAKER_FAILURES: fallas seguidas que abren el circuito
+        OUTBOUND_BREAKER_RESET: segundos que el circuito permanece abierto
+    """
+
+    def __init__(self, app=None):
+        self.options = {name: dict(options) for name, options in SERVICE_DEFAULTS.items()}
+        self.common = {}
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._collector_registered = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        for name, options in self.options.items():
+            prefix = name.upper()
+            if config.get(f'{prefix}_TIMEOUT') is not None:
+                options['timeout'] = float(config[f'{prefix}_TIMEOUT'])
+            if config.get(f'{prefix}_POOL_SIZE') is not None:
+                options['pool_size'] = int(config[f'{prefix}_POOL_SIZE'])
+        self.common = {
+            'connect_timeout': config.get('OUTBOUND_CONNECT_TIMEOUT', CONNECT_TIMEOUT),
+            'max_retries': config.get('OUTBOUND_MAX_RETRIES', 2),
+            'retry_ratio': config.get('OUTBOUND_RETRY_RATIO', 0.2),
+            'breaker_failures': config.get('OUTBOUND_BREAKER_FAILURES', 5),
+            'breaker_reset': config.get('OUTBOUND_BREAKER_RESET', 30.0),
+        }
+        if not self._collector_registered:
+            metrics.register_collector(self.collect)
+            self._collector_registered = True
+
+    def _build(self, name, **overrides):
+        options = {**self.options.get(name, {}), **overrides}
+        common = self.common
+        return ServiceClient(
+            name,
+            base_url=options.get('base_url'),
+            timeout=options.get('timeout', 10.0),
+            connect_timeout=options.get('connect_timeout', common.get('connect_timeout', CONNECT_TIMEOUT)),
+            pool_size=options.get('pool_size', 10),
+            max_retries=options.get('max_retries', common.get('max_retries', 2)),
+            breaker=CircuitBreaker(common.get('breaker_failures', 5), common.get('breaker_reset', 30.0)),
+            budget=RetryBudget(ratio=common.get('retry_ratio', 0.2)),
+        )
+
+    def client(self, name):
+        """Cliente del servicio; se crea con la configuración vigente la primera vez"""
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._clients[name] = self._build(name)
+            return client
+
+    def configure(self, name, **overrides):
+        """
+        Reemplaza el cliente de un servicio (por ejemplo, al cambiar el
+        servidor de Webpay) y cierra el anterior.
+
+        Returns:
+            ServiceClient: El cliente nuevo
+        """
+        client = self._build(name, **overrides)
+        with self._lock:
+            previous = self._clients.get(name)
+            self._clients[name] = client
+        if previous is not None:
+            previous.close()
+        return client
+
+    def stats(self):
+        with self._lock:
+            clients = dict(self._clients)
+        return {name: client.stats() for name, client in clients.items()}
+
+    def collect(self):
+        """Métricas de las llamadas salientes por servicio, para /metrics"""
+        stats = self.stats()
+        return [
+            {'name': 'outbound_requests_total', 'type': 'counter',
+             'help': 'Llamadas salientes por servicio y resultado',
+             'samples': [({'service': name, 'result': result}, counters[result])
+                         for name, counters in stats.items()
+                         for result in ('requests', 'failures', 'retries', 'retries_denied', 'rejected')]},
+            {'name': 'outbound_circuit_state', 'type': 'gauge',
+             'help': 'Estado del circuit breaker por servicio (0 cerrado, 1 semiabierto, 2 abierto)',
+             'samples': [({'service': name}, CIRCUIT_STATE_VALUES[counters['state']])
+                         for name, counters in stats.items()]},
+        ]
+
+
+outbound = OutboundClients()
@@ -0,0 +1,54 @@
+"""
+Importa o actualiza productos desde una planilla de proveedor (CSV o XLSX).
+
+Los productos se identifican por su sku: los nuevos se crean y los
+existentes se actualizan solo en las columnas que trae el archivo.
+
+Columnas reconocidas (se aceptan también los nombres en español):
+    sku, name, price                        obligatorias
+    description, stock, category, image,
+    is_featured, is_promotion, promotion_price
+
+Uso:
+    python import_products.py proveedor.csv
+    python import_products.py proveedor.xlsx --chunk-size 10000 --create-categories
+"""
+import argparse
+import sys
+
+from app import app
+from product_import import DEFAULT_CHUNK_SIZE, ImportFormatError, ProductImporter
+
+
+def print_progress(stats):
+    print(f"  {stats['rows']} filas procesadas ({stats['rows_per_sec']} filas/s)", flush=True)
+
+
+def import_products(path, chunk_size, create_categories):
+    with app.app_context():
+        importer = ProductImporter(chunk_size=chunk_size, create_categories=create_categories)
+        try:
+            stats = importer.import_file(path, progress=print_progress)
+        except ImportFormatError as e:
+            print(f"Error: {str(e)}", file=sys.stderr)
+            return 1
+
+    print(f"{stats['rows']} filas en {stats['seconds']:.1f}s ({stats['rows_per_sec']} filas/s): "
+          f"{stats['inserted']} creados, {stats['updated']} actualizados, "
+          f"{stats['unchanged']} sin cambios, {stats['skipped']} con errores")
+    for error in stats['errors']:
+        print(f"  línea {error['line']}: {error['error']}")
+    if stats['skipped'] > len(stats['errors']):
+        print(f"  ... y {stats['skipped'] - len(stats['errors'])} errores más")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importación masiva de productos')
+    parser.add_argument('path', help='Archivo .csv o .xlsx')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Filas por bloque (por defecto %(default)s)')
+    parser.add_argument('--create-categories', action='store_true',
+                        help='Crear las categorías que no existan en vez de rechazar la fila')
+    args = parser.parse_args()
+    sys.exit(import_products(args.path, args.chunk_size, args.create_categories))
@@ -0,0 +1,34 @@
+"""
+Descarga la historia completa de las series del Banco Central a la serie
+histórica local (rate_history).
+
+Uso:
+    python ingest_rates.py --since 2000-01-01
+    python ingest_rates.py --since 2024-01-01 --currency USD --currency UF
+"""
+import argparse
+import time
+from datetime import datetime
+
+from currency_converter import CurrencyConverter, CURRENCY_SERIES
+from log_config import configure_logging
+
+
+def ingest_rates(since, currencies):
+    converter = CurrencyConverter()
+    for code in currencies:
+        start = time.perf_counter()
+        count = converter.ingest_history(code, since)
+        first_date, last_date = converter.history.bounds(code)
+        print(f"{code}: {count} observaciones descargadas en {time.perf_counter() - start:.1f}s "
+              f"(serie local: {first_date} a {last_date})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingesta de series históricas de tasas')
+    parser.add_argument('--since', default='2000-01-01', help='Primera fecha (YYYY-MM-DD)')
+    parser.add_argument('--currency', action='append', choices=sorted(CURRENCY_SERIES),
+                        help='Moneda a ingerir (por defecto, todas)')
+    args = parser.parse_args()
+    configure_logging()
+    ingest_rates(datetime.strptime(args.since, '%Y-%m-%d'), args.currency or list(CURRENCY_SERIES))
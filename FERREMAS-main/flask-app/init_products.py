@@ -170,10 +170,8 @@ def init_products():
         # Eliminar productos existentes
         Product.query.delete()
         
-        # Crear nuevos productos
-        for prod_data in products:
-            product = Product(**prod_data)
-            db.session.add(product)
+        # Crear nuevos productos en un solo INSERT
+        db.session.execute(db.insert(Product), products)
         
         # Guardar cambios
         db.session.commit()
@@ -0,0 +1,232 @@
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from extensions import db
+from models import Job
+
+logger = logging.getLogger(__name__)
+
+# Reintentos: 30s, 60s, 120s, ... hasta un máximo de una hora
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+# Un job en 'running' más antiguo que esto se considera abandonado (worker caído)
+LEASE_SECONDS = 300
+
+# Registro de handlers por tipo de job
+HANDLERS = {}
+
+
+def job_handler(kind):
+    """
+    Decorador que registra la función que procesa los jobs de un tipo.
+
+    El handler recibe el payload (dict) y se ejecuta dentro de un app context.
+    Si lanza una excepción el job se reintenta con backoff exponencial.
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, max_attempts=5, delay=0):
+    """
+    Agrega un job a la cola usando la sesión actual.
+
+    No hace commit: el job queda en la misma transacción que el llamador, de
+    modo que solo se encola si el resto de los cambios también se guardan.
+
+    Args:
+        kind (str): Tipo de job (debe tener un handler registrado)
+        payload (dict, optional): Datos serializables a JSON para el handler
+        max_attempts (int): Intentos antes de pasar a 'dead'
+        delay (int): Segundos a esperar antes de la primera ejecución
+
+    Returns:
+        Job: El job creado
+    """
+    job = Job(kind=kind, payload=json.dumps(payload or {}), max_attempts=max_attempts)
+    if delay:
+        job.run_at = db.func.now() + timedelta(seconds=delay)
+    db.session.add(job)
+    return job
+
+
+def backoff_delay(attempts):
+    """Segundos de espera antes del siguiente intento"""
+    return min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS)
+
+
+def claim_jobs(limit=10):
+    """
+    Toma hasta `limit` jobs listos para ejecutar y los marca como 'running'.
+
+    Usa SELECT ... FOR UPDATE SKIP LOCKED para que varios workers puedan
+    consumir la cola en paralelo sin tomar el mismo job.
+
+    Returns:
+        list: Jobs reclamados por este worker
+    """
+    now = db.func.now()
+    stmt = (
+        db.select(Job)
+        .where(db.or_(
+            db.and_(Job.status == 'pending', Job.run_at <= now),
+            db.and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=LEASE_SECONDS))
+        ))
+        .order_by(Job.run_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    jobs = db.session.execute(stmt).scalars().all()
+    for job in jobs:
+        job.status = 'running'
+        job.locked_at = now
+        job.attempts += 1
+    db.session.commit()
+    return jobs
+
+
+def renew_lease(job, attempts):
+    """
+    Renueva el lease de un job reclamado justo antes de ejecutarlo.
+
+    Un lote se ejecuta en serie: sin renovar, los últimos jobs podrían
+    superar LEASE_SECONDS (contado desde el reclamo) mientras esperan y otro
+    worker los volvería a tomar. attempts identifica el reclamo: si otro
+    worker ya lo tomó, attempts cambió y el lease no se renueva.
+
+    Args:
+        job (Job): Job reclamado
+        attempts (int): Valor de attempts leído al reclamarlo
+
+    Returns:
+        bool: False si el job ya no pertenece a este worker
+    """
+    result = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job.id, Job.status == 'running', Job.attempts == attempts)
+        .values(locked_at=db.func.now()),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def finish_job(job_id, attempts, **values):
+    """
+    Guarda el resultado de un job solo si sigue perteneciendo a este worker.
+
+    Si el handler tardó más que LEASE_SECONDS otro worker pudo reclamar el
+    job (attempts cambió); su estado no se pisa.
+
+    Returns:
+        bool: False si otro worker reclamó el job
+    """
+    result = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == 'running', Job.attempts == attempts)
+        .values(locked_at=None, **values),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    if result.rowcount != 1:
+        logger.warning(f"Job {job_id} reclamado por otro worker durante su ejecución, no se guarda el resultado")
+        return False
+    return True
+
+
+def run_job(job, attempts):
+    """
+    Ejecuta un job reclamado y registra el resultado.
+
+    Args:
+        job (Job): Job reclamado
+        attempts (int): Valor de attempts leído al reclamarlo
+
+    Returns:
+        bool: True si el job terminó correctamente
+    """
+    # El handler puede hacer commit y recargar el job: se leen los datos antes
+    job_id, kind, payload, max_attempts = job.id, job.kind, job.payload, job.max_attempts
+    handler = HANDLERS.get(kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No hay handler registrado para el job '{kind}'")
+        handler(json.loads(payload))
+    except Exception as e:
+        db.session.rollback()
+        last_error = traceback.format_exc()
+        if handler is None or attempts >= max_attempts:
+            if finish_job(job_id, attempts, status='dead', last_error=last_error):
+                logger.error(f"Job {job_id} ({kind}) movido a dead-letter: {str(e)}")
+        else:
+            delay = backoff_delay(attempts)
+            if finish_job(job_id, attempts, status='pending', last_error=last_error,
+                          run_at=db.func.now() + timedelta(seconds=delay)):
+                logger.warning(f"Job {job_id} ({kind}) falló, reintento en {delay}s: {str(e)}")
+        return False
+
+    return finish_job(job_id, attempts, status='done', last_error=None)
+
+
+def work_once(limit=10):
+    """Procesa un lote de jobs. Retorna cuántos jobs se procesaron"""
+    jobs = claim_jobs(limit)
+    # attempts se lee ahora: tras cada commit el job se recarga desde la base
+    claimed = [(job, job.attempts) for job in jobs]
+    for job, attempts in claimed:
+        if not renew_lease(job, attempts):
+            logger.warning(f"Job {job.id} ({job.kind}) reclamado por otro worker, se omite")
+            continue
+        run_job(job, attempts)
+    return len(jobs)
+
+
+def run_worker(app, batch_size=10, poll_interval=1.0, should_stop=None):
+    """
+    Bucle principal de un worker: procesa lotes y duerme si la cola está vacía.
+
+    Args:
+        app (Flask): Aplicación para el app context
+        batch_size (int): Jobs reclamados por iteración
+        poll_interval (float): Segundos de espera cuando no hay jobs
+        should_stop (callable, optional): Retorna True para terminar el bucle
+    """
+    with app.app_context():
+        logger.info("Worker de jobs iniciado")
+        while not (should_stop and should_stop()):
+            try:
+                processed = work_once(batch_size)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error al procesar la cola de jobs: {str(e)}")
+                processed = 0
+            if not processed:
+                time.sleep(poll_interval)
+        logger.info("Worker de jobs detenido")
+
+
+def requeue_dead_jobs(kind=None):
+    """
+    Devuelve a la cola los jobs en dead-letter, reiniciando sus intentos.
+
+    Args:
+        kind (str, optional): Solo reencolar jobs de este tipo
+
+    Returns:
+        int: Cantidad de jobs reencolados
+    """
+    stmt = db.update(Job).where(Job.status == 'dead')
+    if kind:
+        stmt = stmt.where(Job.kind == kind)
+    result = db.session.execute(
+        stmt.values(status='pending', attempts=0, run_at=db.func.now(), locked_at=None),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return result.rowcount
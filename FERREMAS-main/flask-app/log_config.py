@@ -0,0 +1,258 @@
+"""
+Configuración central del logging de la aplicación.
+
+Los registros pasan por una cola en memoria (QueueHandler) y un hilo
+aparte (QueueListener) los formatea y escribe, así las peticiones no
+esperan por la salida estándar ni por el disco. Antes de encolarse se
+aplican los niveles por módulo, el muestreo de eventos frecuentes y la
+redacción de credenciales y tokens.
+
+Variables de entorno:
+    LOG_LEVEL: Nivel raíz (por defecto INFO)
+    LOG_LEVELS: Niveles por módulo, p. ej. "webpay_plus=DEBUG,werkzeug=WARNING"
+    LOG_FORMAT: json (por defecto) o text
+    LOG_SAMPLING: Fracción de registros INFO/DEBUG que se conservan por módulo,
+                  p. ej. "currency_converter=0.1"
+    LOG_FILE: Archivo de salida (por defecto stderr)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Atributos estándar de LogRecord: el resto son campos de extra=
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample_rate'}
+
+# Claves cuyo valor nunca se escribe en los logs
+SENSITIVE_KEYS = re.compile(r'pass|password|secret|api_key|apikey|token|authorization|card_number', re.IGNORECASE)
+
+# Pares clave/valor dentro de texto libre: 'pass': 'x', pass=x, "token_ws": "x", Tbk-Api-Key-Secret: x,
+# Authorization: Bearer x. Un valor entre comillas se reemplaza completo (aunque tenga espacios
+# o le falte la comilla de cierre); uno sin comillas, junto con su esquema de autenticación
+SENSITIVE_PAIRS = re.compile(
+    r"""(?P<key>['"]?[\w-]*(?:pass|password|secret|api[_-]?key|token|authorization)[\w-]*['"]?\s*[:=]\s*)"""
+    r"""(?:(?P<quote>['"])(?:\\.|(?!(?P=quote))[^\\\n])*(?P=quote)?"""
+    r"""|(?:(?:bearer|basic|digest|token)\s+)?[^'",&\s}]+)""",
+    re.IGNORECASE
+)
+
+# Filtro rápido: la expresión completa solo se aplica si aparece alguna de estas palabras
+SENSITIVE_HINT = re.compile(r'pass|secret|api[_-]?key|token|authorization', re.IGNORECASE)
+
+# Variables de entorno cuyos valores se eliminan literalmente de cualquier mensaje
+SECRET_ENV_VARS = ('BDE_PASSWORD', 'MAIL_PASSWORD', 'DB_PASSWORD', 'SECRET_KEY',
+                   'WEBPAY_API_KEY', 'GOOGLE_OAUTH_CLIENT_SECRET')
+
+REDACTED = '[REDACTED]'
+
+_state = {'listener': None, 'handler': None}
+_lock = threading.Lock()
+
+
+def redact_text(text, secrets=()):
+    """Reemplaza credenciales y tokens en un texto"""
+    for secret in secrets:
+        if secret in text:
+            text = text.replace(secret, REDACTED)
+    if not SENSITIVE_HINT.search(text):
+        return text
+    return SENSITIVE_PAIRS.sub(_redact_pair, text)
+
+
+def _redact_pair(match):
+    quote = match.group('quote') or ''
+    return f"{match.group('key')}{quote}{REDACTED}{quote}"
+
+
+def redact_value(key, value, secrets=()):
+    if SENSITIVE_KEYS.search(key):
+        return REDACTED
+    if isinstance(value, str):
+        return redact_text(value, secrets)
+    if isinstance(value, dict):
+        return {k: redact_value(str(k), v, secrets) for k, v in value.items()}
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Elimina credenciales y tokens del mensaje y de los campos extra.
+
+    El mensaje se formatea aquí (con sus args) para que lo que llega a la
+    cola ya esté limpio.
+    """
+
+    def __init__(self, secrets=None):
+        super().__init__()
+        if secrets is None:
+            secrets = [os.getenv(name) for name in SECRET_ENV_VARS]
+        # Valores muy cortos producirían reemplazos en cualquier parte
+        self.secrets = sorted({s for s in secrets if s and len(s) >= 6}, key=len, reverse=True)
+
+    def filter(self, record):
+        message = record.getMessage()
+        record.msg = redact_text(message, self.secrets)
+        record.args = None
+        for key, value in list(vars(record).items()):
+            if key not in RESERVED_ATTRS:
+                setattr(record, key, redact_value(key, value, self.secrets))
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Conserva solo una fracción de los registros INFO/DEBUG frecuentes.
+
+    La fracción se toma de extra={'sample_rate': 0.01} en la llamada o de
+    LOG_SAMPLING por módulo. Las advertencias y errores nunca se descartan.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def rate_for(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, 'sample_rate', None)
+        if rate is None:
+            rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con los campos de extra= como claves propias"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato legible para desarrollo: los campos extra van al final como clave=valor"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        extras = ' '.join(f'{k}={v}' for k, v in vars(record).items() if k not in RESERVED_ATTRS)
+        return f'{line} {extras}' if extras else line
+
+
+def parse_mapping(value, convert):
+    """Convierte "a=1,b.c=2" en {'a': convert('1'), 'b.c': convert('2')}"""
+    result = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, raw = item.split('=', 1)
+            result[name.strip()] = convert(raw.strip())
+    return result
+
+
+class PreparedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que conserva exc_info formateado y los campos extra al encolar"""
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(level=None, levels=None, fmt=None, sampling=None, stream=None):
+    """
+    Instala el logging asíncrono en el logger raíz. Es idempotente: llamadas
+    posteriores reemplazan la configuración anterior.
+
+    Los parámetros tienen prioridad sobre las variables de entorno.
+
+    Args:
+        level (str): Nivel raíz
+        levels (dict): Niveles por módulo
+        fmt (str): 'json' o 'text'
+        sampling (dict): Fracción de registros INFO/DEBUG conservados por módulo
+        stream: Destino de la salida (por defecto LOG_FILE o stderr)
+    """
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    levels = levels if levels is not None else parse_mapping(os.getenv('LOG_LEVELS'), str.upper)
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+    sampling = sampling if sampling is not None else parse_mapping(os.getenv('LOG_SAMPLING'), float)
+
+    if stream is None and os.getenv('LOG_FILE'):
+        output = logging.FileHandler(os.getenv('LOG_FILE'), encoding='utf-8')
+    else:
+        output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    with _lock:
+        shutdown_logging()
+        handler = PreparedQueueHandler(queue.SimpleQueue())
+        handler.addFilter(SamplingFilter(sampling))
+        handler.addFilter(RedactingFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level.upper())
+        for name, module_level in levels.items():
+            logging.getLogger(name).setLevel(module_level)
+
+        listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        listener.start()
+        _state.update(listener=listener, handler=handler)
+
+
+def shutdown_logging():
+    """Detiene el hilo de escritura después de vaciar la cola"""
+    listener = _state['listener']
+    if listener is not None:
+        listener.stop()
+        for output in listener.handlers:
+            output.close()
+        _state['listener'] = None
+
+
+def _restart_after_fork():
+    # El hilo de escritura no sobrevive a fork(): el hijo crea una cola y un hilo propios
+    handler, listener = _state['handler'], _state['listener']
+    if handler is None or listener is None:
+        return
+    handler.queue = queue.SimpleQueue()
+    new_listener = logging.handlers.QueueListener(handler.queue, *listener.handlers, respect_handler_level=True)
+    new_listener.start()
+    _state['listener'] = new_listener
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,313 @@
+import hmac
+import ipaddress
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request
+
+from db_config import pool_status
+from page_cache import page_cache
+from query_metrics import query_metrics
+
+logger = logging.getLogger(__name__)
+
+# Mismos límites por defecto que los clientes oficiales de Prometheus (segundos)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base de las métricas: nombre, ayuda, etiquetas y valores por combinación de etiquetas"""
+
+    type_name = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} requiere las etiquetas {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_name}']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._sample_lines(list(zip(self.labelnames, key)), value))
+        return lines
+
+    def _sample_lines(self, labels, value):
+        return [f'{self.name}{format_labels(labels)} {format_value(value)}']
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _sample_lines(self, labels, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['buckets']):
+            cumulative += count
+            bucket_labels = labels + [('le', format_value(bound))]
+            lines.append(f'{self.name}_bucket{format_labels(bucket_labels)} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(labels)} {format_value(state["sum"])}')
+        lines.append(f'{self.name}_count{format_labels(labels)} {state["count"]}')
+        return lines
+
+
+class Metrics:
+    """
+    Registro de métricas en formato de exposición de texto de Prometheus.
+
+    Mide la latencia de todas las rutas de Flask y, con timer(), la de las
+    llamadas externas (Transbank, Banco Central, SMTP). Los collectors
+    registrados se evalúan al generar la salida, para valores que ya
+    existen en otro lado (caché de páginas, pool de conexiones).
+
+    Los valores son del proceso: con gunicorn cada worker expone los suyos.
+    No requiere prometheus_client ni ningún otro paquete.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.http_duration = self.histogram(
+            'http_request_duration_seconds', 'Latencia de las peticiones HTTP por ruta',
+            ('method', 'route', 'status')
+        )
+        self.external_duration = self.histogram(
+            'external_call_duration_seconds', 'Latencia de las llamadas a servicios externos',
+            ('service', 'operation', 'outcome')
+        )
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.token = app.config.get('METRICS_TOKEN') or None
+        self.allowed_networks = [ipaddress.ip_network(network.strip(), strict=False)
+                                 for network in app.config.get('METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+                                 if network.strip()]
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish_request)
+        self.register_collector(collect_page_cache)
+        self.register_collector(collect_database)
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector):
+        """
+        Registra una función que retorna métricas calculadas al momento de exponerlas.
+
+        La función retorna una lista de dicts con name, type, help y samples,
+        donde samples es una lista de (dict de etiquetas, valor).
+        """
+        self._collectors.append(collector)
+
+    def allows(self, remote_addr, authorization):
+        """
+        Indica si una petición puede leer /metrics: desde una dirección de
+        METRICS_ALLOWED_IPS o con la cabecera Authorization: Bearer METRICS_TOKEN.
+        """
+        if self.token and authorization and hmac.compare_digest(authorization.encode(),
+                                                                 f'Bearer {self.token}'.encode()):
+            return True
+        try:
+            address = ipaddress.ip_address(remote_addr or '')
+        except ValueError:
+            return False
+        return any(address in network for network in self.allowed_networks)
+
+    @contextmanager
+    def timer(self, service, operation):
+        """Mide una llamada externa; outcome queda en 'error' si lanza una excepción"""
+        start = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            self.external_duration.observe(time.perf_counter() - start, service=service,
+                                           operation=operation, outcome=outcome)
+
+    def timed(self, service, operation):
+        """Decorador equivalente a timer() para una función completa"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(service, operation):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _start_request(self):
+        g._metrics_start = time.perf_counter()
+
+    def _record_status(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _finish_request(self, exc=None):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        # Sin after_request (excepción no manejada) la respuesta es un 500
+        status = g.pop('_metrics_status', 500)
+        route = request.url_rule.rule if request.url_rule else '<sin ruta>'
+        self.http_duration.observe(time.perf_counter() - start, method=request.method,
+                                   route=route, status=status)
+
+    def render(self):
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.error(f"Error en el collector de métricas {collector.__name__}: {str(e)}")
+                continue
+            for family in families:
+                lines.append(f"# HELP {family['name']} {family['help']}")
+                lines.append(f"# TYPE {family['name']} {family['type']}")
+                for labels, value in family['samples']:
+                    lines.append(f"{family['name']}{format_labels(sorted(labels.items()))} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def collect_page_cache():
+    """Aciertos, fallos y tasa de aciertos de la caché de páginas"""
+    stats = page_cache.stats()
+    return [
+        {'name': 'page_cache_requests_total', 'type': 'counter',
+         'help': 'Consultas a la caché de páginas por resultado',
+         'samples': [({'namespace': ns, 'result': result}, counters[result])
+                     for ns, counters in stats.items()
+                     for result in ('hits', 'misses', 'not_modified', 'bypass')]},
+        {'name': 'page_cache_hit_ratio', 'type': 'gauge',
+         'help': 'Tasa de aciertos de la caché de páginas',
+         'samples': [({'namespace': ns}, counters['hit_ratio']) for ns, counters in stats.items()]}
+    ]
+
+
+def collect_database():
+    """Estado del pool de conexiones y consultas SQL acumuladas por ruta"""
+    families = []
+    if query_metrics.engine is not None:
+        status = pool_status(query_metrics.engine)
+        families.append({
+            'name': 'db_pool_connections', 'type': 'gauge',
+            'help': 'Conexiones del pool por estado',
+            # QueuePool reporta overflow negativo mientras el pool no se ha llenado
+            'samples': [({'state': state}, max(0, status[state]))
+                        for state in ('size', 'checkedin', 'checkedout', 'overflow') if state in status]
+        })
+
+    endpoints = query_metrics.snapshot()['endpoints'] if query_metrics.enabled else []
+    families.append({
+        'name': 'db_queries_total', 'type': 'counter',
+        'help': 'Sentencias SQL ejecutadas por ruta',
+        'samples': [({'endpoint': e['endpoint']}, e['queries']) for e in endpoints]
+    })
+    families.append({
+        'name': 'db_query_seconds_total', 'type': 'counter',
+        'help': 'Tiempo total en la base de datos por ruta',
+        'samples': [({'endpoint': e['endpoint']}, round(e['db_time_ms'] / 1000, 6)) for e in endpoints]
+    })
+    return families
+
+
+metrics = Metrics()
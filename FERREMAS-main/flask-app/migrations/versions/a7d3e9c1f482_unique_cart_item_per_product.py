@@ -0,0 +1,43 @@
+"""unique cart item per product
+
+Revision ID: a7d3e9c1f482
+Revises: f3b8d2e6a915
+Create Date: 2026-10-18 14:05:12.418337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3e9c1f482'
+down_revision = 'f3b8d2e6a915'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Consolidar líneas duplicadas en la de menor id antes de crear el índice único
+    op.execute("""
+        UPDATE cart_items AS c
+        SET quantity = d.total
+        FROM (
+            SELECT MIN(id) AS keep_id, SUM(quantity) AS total
+            FROM cart_items
+            GROUP BY user_id, product_id
+            HAVING COUNT(*) > 1
+        ) AS d
+        WHERE c.id = d.keep_id
+    """)
+    op.execute("""
+        DELETE FROM cart_items AS c
+        USING cart_items AS k
+        WHERE c.user_id = k.user_id AND c.product_id = k.product_id AND c.id > k.id
+    """)
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.create_index('idx_cart_items_user_product', ['user_id', 'product_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.drop_index('idx_cart_items_user_product')
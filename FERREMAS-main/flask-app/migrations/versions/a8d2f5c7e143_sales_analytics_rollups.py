@@ -0,0 +1,99 @@
+"""sales analytics rollups
+
+Revision ID: a8d2f5c7e143
+Revises: f1a6c8e4d392
+Create Date: 2026-10-18 23:52:41.106382
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d2f5c7e143'
+down_revision = 'f1a6c8e4d392'
+branch_labels = None
+depends_on = None
+
+FINAL_PAYMENT_STATUSES = "'completed', 'failed', 'cancelled'"
+
+
+def event_triggers(table, kind, statuses):
+    return f"""
+    CREATE TRIGGER {table}_analytics_insert AFTER INSERT ON {table}
+        FOR EACH ROW WHEN (NEW.status IN ({statuses}))
+        EXECUTE FUNCTION analytics_event('{kind}');
+
+    CREATE TRIGGER {table}_analytics_update AFTER UPDATE OF status ON {table}
+        FOR EACH ROW WHEN (NEW.status IN ({statuses}) AND OLD.status NOT IN ({statuses}))
+        EXECUTE FUNCTION analytics_event('{kind}');
+    """
+
+
+def upgrade():
+    op.create_table(
+        'analytics_events',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('ref_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'sales_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('product_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('order_lines', sa.Integer(), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('promo_units', sa.Integer(), nullable=False),
+        sa.Column('promo_revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('list_value', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'product_id')
+    )
+    op.create_table(
+        'order_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('units', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('promo_units', sa.Integer(), nullable=False),
+        sa.Column('promo_revenue', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('list_value', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table(
+        'payment_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('transactions', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'status')
+    )
+
+    # Los resúmenes de las órdenes existentes se calculan con python analytics.py --rebuild
+    # (el día depende de ANALYTICS_TIMEZONE)
+    op.execute("""
+    CREATE OR REPLACE FUNCTION analytics_event() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO analytics_events (kind, ref_id) VALUES (TG_ARGV[0], NEW.id);
+        RETURN NULL;
+    END $$;
+    """)
+    op.execute(event_triggers('orders', 'order', "'completed'")
+               + event_triggers('webpay_transactions', 'payment', FINAL_PAYMENT_STATUSES))
+
+
+def downgrade():
+    op.execute("""
+    DROP TRIGGER IF EXISTS webpay_transactions_analytics_update ON webpay_transactions;
+    DROP TRIGGER IF EXISTS webpay_transactions_analytics_insert ON webpay_transactions;
+    DROP TRIGGER IF EXISTS orders_analytics_update ON orders;
+    DROP TRIGGER IF EXISTS orders_analytics_insert ON orders;
+    DROP FUNCTION IF EXISTS analytics_event();
+    """)
+    op.drop_table('payment_daily')
+    op.drop_table('order_daily')
+    op.drop_table('sales_daily')
+    op.drop_table('analytics_events')
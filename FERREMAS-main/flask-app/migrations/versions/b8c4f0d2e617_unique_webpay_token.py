@@ -0,0 +1,47 @@
+"""unique webpay token
+
+Revision ID: b8c4f0d2e617
+Revises: a7d3e9c1f482
+Create Date: 2026-10-18 15:10:44.902113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8c4f0d2e617'
+down_revision = 'a7d3e9c1f482'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Dos filas con el mismo token no se pueden consolidar sin revisar cuál
+    # tiene el pago: la migración se detiene y las lista
+    duplicates = op.get_bind().execute(sa.text("""
+        SELECT token_ws, array_agg(id ORDER BY id) AS ids
+        FROM webpay_transactions
+        WHERE token_ws IS NOT NULL
+        GROUP BY token_ws
+        HAVING COUNT(*) > 1
+        ORDER BY token_ws
+        LIMIT 20
+    """)).all()
+    if duplicates:
+        detail = '; '.join(f"{token}: ids {ids}" for token, ids in duplicates)
+        raise RuntimeError(
+            "No se puede crear el índice único sobre webpay_transactions.token_ws: hay tokens "
+            f"repetidos ({detail}). Resolver los duplicados (por ejemplo, dejar token_ws en NULL "
+            "en las filas sin pago) y volver a ejecutar la migración."
+        )
+
+    # Los esquemas creados con database.sql tienen un índice no único con este nombre
+    op.execute("DROP INDEX IF EXISTS idx_webpay_transactions_token_ws")
+    with op.batch_alter_table('webpay_transactions', schema=None) as batch_op:
+        batch_op.create_index('idx_webpay_transactions_token_ws_unique', ['token_ws'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('webpay_transactions', schema=None) as batch_op:
+        batch_op.drop_index('idx_webpay_transactions_token_ws_unique')
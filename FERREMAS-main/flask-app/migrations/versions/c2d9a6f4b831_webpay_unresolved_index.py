@@ -0,0 +1,28 @@
+"""webpay unresolved index
+
+Revision ID: c2d9a6f4b831
+Revises: b8c4f0d2e617
+Create Date: 2026-10-18 16:02:31.517480
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d9a6f4b831'
+down_revision = 'b8c4f0d2e617'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('webpay_transactions', schema=None) as batch_op:
+        batch_op.create_index('idx_webpay_transactions_unresolved', ['id'], unique=False,
+                              postgresql_where=sa.text("status IN ('initiated', 'committing')"))
+
+
+def downgrade():
+    with op.batch_alter_table('webpay_transactions', schema=None) as batch_op:
+        batch_op.drop_index('idx_webpay_transactions_unresolved',
+                            postgresql_where=sa.text("status IN ('initiated', 'committing')"))
@@ -0,0 +1,26 @@
+"""product image variants
+
+Revision ID: d5e1b7a3c960
+Revises: c2d9a6f4b831
+Create Date: 2026-10-18 18:40:12.204913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e1b7a3c960'
+down_revision = 'c2d9a6f4b831'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
@@ -0,0 +1,30 @@
+"""add product listing indexes
+
+Revision ID: d91f3b6a7c20
+Revises: c4e8a1f2b3d7
+Create Date: 2026-10-18 11:02:17.804215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f3b6a7c20'
+down_revision = 'c4e8a1f2b3d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('idx_products_updated_at_id', ['updated_at', 'id'], unique=False)
+        batch_op.create_index('idx_products_category_id_id', ['category_id', 'id'], unique=False)
+        batch_op.create_index('idx_products_price', ['price'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('idx_products_price')
+        batch_op.drop_index('idx_products_category_id_id')
+        batch_op.drop_index('idx_products_updated_at_id')
@@ -0,0 +1,43 @@
+"""add product full-text search
+
+Revision ID: e2a7c5d9f104
+Revises: d91f3b6a7c20
+Create Date: 2026-10-18 11:48:05.117392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c5d9f104'
+down_revision = 'd91f3b6a7c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('spanish', coalesce(description, '')), 'B')",
+                persisted=True
+            ),
+            nullable=True
+        ))
+        batch_op.create_index('idx_products_search_vector', ['search_vector'], unique=False,
+                              postgresql_using='gin')
+        batch_op.create_index('idx_products_name_trgm', ['name'], unique=False,
+                              postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('idx_products_name_trgm')
+        batch_op.drop_index('idx_products_search_vector')
+        batch_op.drop_column('search_vector')
@@ -0,0 +1,139 @@
+"""product listings projection
+
+Revision ID: e7c3a9d1f526
+Revises: d5e1b7a3c960
+Create Date: 2026-10-18 20:14:37.551208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3a9d1f526'
+down_revision = 'd5e1b7a3c960'
+branch_labels = None
+depends_on = None
+
+LISTING_INCLUDE = ['name', 'price', 'image', 'is_promotion', 'promotion_price']
+
+LISTING_COLUMNS = ('id, name, summary, image, image_variants, price, promotion_price, effective_price, '
+                   'discount_percent, is_promotion, is_featured, in_stock, category_id, category_name, '
+                   'category_icon, updated_at')
+
+LISTING_UPDATE = ', '.join(f'{column} = EXCLUDED.{column}' for column in LISTING_COLUMNS.split(', ')[1:])
+
+
+def listing_upsert(source, condition=''):
+    return f"""
+    INSERT INTO product_listings ({LISTING_COLUMNS})
+    SELECT p.id, p.name, left(p.description, 100), p.image, p.image_variants, p.price, p.promotion_price,
+           e.price,
+           CASE WHEN p.price > 0 AND e.price < p.price THEN round(100 * (1 - e.price / p.price))::smallint
+                ELSE 0 END,
+           coalesce(p.is_promotion, false), coalesce(p.is_featured, false), coalesce(p.stock, 0) > 0,
+           p.category_id, c.name, c.icon, p.updated_at
+    FROM {source} p
+    CROSS JOIN LATERAL (SELECT CASE WHEN p.is_promotion AND p.promotion_price IS NOT NULL
+                                    THEN p.promotion_price ELSE p.price END AS price) e
+    LEFT JOIN categories c ON c.id = p.category_id
+    {condition}
+    ON CONFLICT (id) DO UPDATE SET {LISTING_UPDATE}"""
+
+
+CHANGED_ROWS = """JOIN old_rows o ON o.id = p.id
+    WHERE (p.name, left(p.description, 100), p.image, p.image_variants::text, p.price, p.promotion_price,
+           p.is_promotion, p.is_featured, coalesce(p.stock, 0) > 0, p.category_id)
+          IS DISTINCT FROM
+          (o.name, left(o.description, 100), o.image, o.image_variants::text, o.price, o.promotion_price,
+           o.is_promotion, o.is_featured, coalesce(o.stock, 0) > 0, o.category_id)"""
+
+
+def upgrade():
+    op.create_table(
+        'product_listings',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('summary', sa.String(length=100), nullable=True),
+        sa.Column('image', sa.String(length=200), nullable=True),
+        sa.Column('image_variants', sa.JSON(), nullable=True),
+        sa.Column('price', sa.Float(), nullable=False),
+        sa.Column('promotion_price', sa.Float(), nullable=True),
+        sa.Column('effective_price', sa.Float(), nullable=False),
+        sa.Column('discount_percent', sa.SmallInteger(), nullable=False),
+        sa.Column('is_promotion', sa.Boolean(), nullable=False),
+        sa.Column('is_featured', sa.Boolean(), nullable=False),
+        sa.Column('in_stock', sa.Boolean(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('category_name', sa.String(length=50), nullable=True),
+        sa.Column('category_icon', sa.String(length=50), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['id'], ['products.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(listing_upsert('products'))
+
+    with op.batch_alter_table('product_listings', schema=None) as batch_op:
+        batch_op.create_index('idx_product_listings_category_id_id', ['category_id', 'id'], unique=False,
+                              postgresql_include=LISTING_INCLUDE)
+        batch_op.create_index('idx_product_listings_updated_at_id', ['updated_at', 'id'], unique=False,
+                              postgresql_include=LISTING_INCLUDE)
+        batch_op.create_index('idx_product_listings_effective_price_id', ['effective_price', 'id'], unique=False,
+                              postgresql_include=LISTING_INCLUDE)
+        batch_op.create_index('idx_product_listings_featured', ['id'], unique=False,
+                              postgresql_include=LISTING_INCLUDE, postgresql_where=sa.text('is_featured'))
+        batch_op.create_index('idx_product_listings_promotion', ['id'], unique=False,
+                              postgresql_include=LISTING_INCLUDE, postgresql_where=sa.text('is_promotion'))
+
+    op.execute(f"""
+    CREATE OR REPLACE FUNCTION product_listings_insert_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        {listing_upsert('new_rows')};
+        RETURN NULL;
+    END $$;
+
+    CREATE OR REPLACE FUNCTION product_listings_update_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        {listing_upsert('new_rows', CHANGED_ROWS)};
+        RETURN NULL;
+    END $$;
+
+    CREATE OR REPLACE FUNCTION product_listings_category_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE product_listings SET category_name = NEW.name, category_icon = NEW.icon WHERE category_id = NEW.id;
+        RETURN NULL;
+    END $$;
+
+    CREATE TRIGGER products_listing_insert AFTER INSERT ON products
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_listings_insert_sync();
+
+    CREATE TRIGGER products_listing_update AFTER UPDATE ON products
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION product_listings_update_sync();
+
+    CREATE TRIGGER categories_listing_update AFTER UPDATE ON categories
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.icon IS DISTINCT FROM NEW.icon)
+        EXECUTE FUNCTION product_listings_category_sync();
+    """)
+
+    # Los listados ya no ordenan ni filtran products por fecha o precio
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('idx_products_price')
+        batch_op.drop_index('idx_products_updated_at_id')
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('idx_products_updated_at_id', ['updated_at', 'id'], unique=False)
+        batch_op.create_index('idx_products_price', ['price'], unique=False)
+
+    op.execute("""
+    DROP TRIGGER IF EXISTS categories_listing_update ON categories;
+    DROP TRIGGER IF EXISTS products_listing_update ON products;
+    DROP TRIGGER IF EXISTS products_listing_insert ON products;
+    DROP FUNCTION IF EXISTS product_listings_category_sync();
+    DROP FUNCTION IF EXISTS product_listings_update_sync();
+    DROP FUNCTION IF EXISTS product_listings_insert_sync();
+    """)
+    op.drop_table('product_listings')
@@ -0,0 +1,43 @@
+"""order listing indexes
+
+Revision ID: f1a6c8e4d392
+Revises: e7c3a9d1f526
+Create Date: 2026-10-18 22:41:09.318754
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a6c8e4d392'
+down_revision = 'e7c3a9d1f526'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index('idx_orders_user_id_created_at_id', ['user_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('idx_orders_status_created_at_id', ['status', 'created_at', 'id'], unique=False)
+        batch_op.create_index('idx_orders_created_at_id', ['created_at', 'id'], unique=False)
+
+    # database.sql ya crea estos dos índices con el mismo nombre y definición
+    with op.batch_alter_table('order_items', schema=None) as batch_op:
+        batch_op.create_index('idx_order_items_order_id', ['order_id'], unique=False, if_not_exists=True)
+
+    with op.batch_alter_table('webpay_transactions', schema=None) as batch_op:
+        batch_op.create_index('idx_webpay_transactions_order_id', ['order_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    with op.batch_alter_table('webpay_transactions', schema=None) as batch_op:
+        batch_op.drop_index('idx_webpay_transactions_order_id')
+
+    with op.batch_alter_table('order_items', schema=None) as batch_op:
+        batch_op.drop_index('idx_order_items_order_id')
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index('idx_orders_created_at_id')
+        batch_op.drop_index('idx_orders_status_created_at_id')
+        batch_op.drop_index('idx_orders_user_id_created_at_id')
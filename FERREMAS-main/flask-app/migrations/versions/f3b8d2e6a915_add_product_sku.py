@@ -0,0 +1,28 @@
+"""add product sku
+
+Revision ID: f3b8d2e6a915
+Revises: e2a7c5d9f104
+Create Date: 2026-10-18 12:21:40.362198
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d2e6a915'
+down_revision = 'e2a7c5d9f104'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sku', sa.String(length=50), nullable=True))
+        batch_op.create_unique_constraint('products_sku_key', ['sku'])
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_constraint('products_sku_key', type_='unique')
+        batch_op.drop_column('sku')
@@ -1,5 +1,6 @@
 from extensions import db
 from datetime import datetime
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -18,11 +19,23 @@ class Category(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Filtro por categoría de /api/search (los listados leen product_listings)
+        db.Index('idx_products_category_id_id', 'category_id', 'id'),
+        # Búsqueda de texto completo (el índice de trigramas vive solo en la migración,
+        # porque requiere la extensión pg_trgm)
+        db.Index('idx_products_search_vector', 'search_vector', postgresql_using='gin'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    # Código del proveedor; clave de las importaciones masivas
+    sku = db.Column(db.String(50), unique=True)
     name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
     image = db.Column(db.String(200), nullable=True)
+    # Variantes redimensionadas de una imagen subida (ver product_images.py);
+    # None mientras el job las genera o si la imagen es externa
+    image_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
     description = db.Column(db.Text)
     stock = db.Column(db.Integer, default=0)
     is_featured = db.Column(db.Boolean, default=False)
@@ -31,10 +44,69 @@ class Product(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
     updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now())
+    # Columna generada por Postgres; diferida para no cargarla en cada consulta
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed(
+        "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('spanish', coalesce(description, '')), 'B')",
+        persisted=True
+    )))
 
     def __repr__(self):
         return f'<Product {self.name}>'
 
+# Columnas que /api/products entrega por defecto: los índices de product_listings
+# las incluyen para responder con un index-only scan
+LISTING_INCLUDE = ['name', 'price', 'image', 'is_promotion', 'promotion_price']
+
+class ProductListing(db.Model):
+    """
+    Proyección de products para los listados de la tienda, con el precio
+    efectivo, el descuento, la categoría y la disponibilidad ya calculados.
+
+    La mantienen triggers de Postgres en la misma transacción que modifica
+    products o categories (ver product_listing.py); la aplicación solo la lee.
+    """
+    __tablename__ = 'product_listings'
+    __table_args__ = (
+        # Un índice por orden del catálogo: por ID dentro de una categoría,
+        # por fecha de modificación y por precio efectivo
+        db.Index('idx_product_listings_category_id_id', 'category_id', 'id',
+                 postgresql_include=LISTING_INCLUDE),
+        db.Index('idx_product_listings_updated_at_id', 'updated_at', 'id',
+                 postgresql_include=LISTING_INCLUDE),
+        db.Index('idx_product_listings_effective_price_id', 'effective_price', 'id',
+                 postgresql_include=LISTING_INCLUDE),
+        # Destacados y promociones de la portada
+        db.Index('idx_product_listings_featured', 'id', postgresql_include=LISTING_INCLUDE,
+                 postgresql_where=db.text('is_featured')),
+        db.Index('idx_product_listings_promotion', 'id', postgresql_include=LISTING_INCLUDE,
+                 postgresql_where=db.text('is_promotion')),
+    )
+
+    id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True,
+                   autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    # Primeros 100 caracteres de la descripción, los que muestran las tarjetas
+    summary = db.Column(db.String(100))
+    image = db.Column(db.String(200))
+    image_variants = db.Column(db.JSON(none_as_null=True))
+    price = db.Column(db.Float, nullable=False)
+    promotion_price = db.Column(db.Float)
+    # Misma regla que pricing.effective_price
+    effective_price = db.Column(db.Float, nullable=False)
+    discount_percent = db.Column(db.SmallInteger, nullable=False, default=0)
+    is_promotion = db.Column(db.Boolean, nullable=False, default=False)
+    is_featured = db.Column(db.Boolean, nullable=False, default=False)
+    in_stock = db.Column(db.Boolean, nullable=False, default=False)
+    category_id = db.Column(db.Integer)
+    category_name = db.Column(db.String(50))
+    category_icon = db.Column(db.String(50))
+    # Última modificación de products que cambió algún dato del listado
+    updated_at = db.Column(db.DateTime(timezone=True))
+
+    def __repr__(self):
+        return f'<ProductListing {self.name}>'
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -52,6 +124,10 @@ class User(db.Model):
 
 class CartItem(db.Model):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        # Una línea por producto: la escritura diferida del carrito usa ON CONFLICT
+        db.Index('idx_cart_items_user_product', 'user_id', 'product_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -67,6 +143,13 @@ class CartItem(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Historial del usuario, búsqueda por estado y por fecha, de la más reciente a la más antigua
+        # (ver order_service); created_at, id es la clave de la paginación por cursor
+        db.Index('idx_orders_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('idx_orders_status_created_at_id', 'status', 'created_at', 'id'),
+        db.Index('idx_orders_created_at_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'))
@@ -85,6 +168,10 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
+    __table_args__ = (
+        # selectinload de Order.items: WHERE order_id IN (...)
+        db.Index('idx_order_items_order_id', 'order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False)
@@ -101,12 +188,22 @@ class OrderItem(db.Model):
 
 class WebpayTransaction(db.Model):
     __tablename__ = 'webpay_transactions'
+    __table_args__ = (
+        # El retorno de Webpay busca (y bloquea) la transacción por token
+        db.Index('idx_webpay_transactions_token_ws_unique', 'token_ws', unique=True),
+        # La conciliación recorre por ID solo las transacciones sin resultado
+        db.Index('idx_webpay_transactions_unresolved', 'id',
+                 postgresql_where=db.text("status IN ('initiated', 'committing')")),
+        # selectinload de Order.transactions
+        db.Index('idx_webpay_transactions_order_id', 'order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id', ondelete='SET NULL'))
     buy_order = db.Column(db.String(50), unique=True, nullable=False)
     token_ws = db.Column(db.String(100))
     amount = db.Column(db.Numeric(10, 2), nullable=False)
+    # initiated -> committing -> completed | failed; initiated -> cancelled (ver payment_service)
     status = db.Column(db.String(20), nullable=False, default='initiated')
     transaction_date = db.Column(db.DateTime(timezone=True))
     authorization_code = db.Column(db.String(20))
@@ -150,4 +247,94 @@ class WebpayTransaction(db.Model):
         if response_data.get('response_code') == 0:
             self.status = 'completed'
         else:
-            self.status = 'failed' 
\ No newline at end of file
+            self.status = 'failed' 
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('idx_jobs_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # pending -> running -> done | pending (reintento) | dead (sin más intentos)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    locked_at = db.Column(db.DateTime(timezone=True))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now())
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} ({self.status})>'
+
+class AnalyticsEvent(db.Model):
+    """
+    Órdenes completadas y transacciones Webpay resueltas pendientes de
+    consolidar en los resúmenes diarios. Las insertan triggers de Postgres
+    en la misma transacción del cambio de estado (ver analytics.py).
+    """
+    __tablename__ = 'analytics_events'
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    # order | payment
+    kind = db.Column(db.String(10), nullable=False)
+    ref_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+
+    def __repr__(self):
+        return f'<AnalyticsEvent {self.id} {self.kind} {self.ref_id}>'
+
+class SalesDaily(db.Model):
+    """Unidades y montos vendidos por día (de creación de la orden) y producto"""
+    __tablename__ = 'sales_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    # 0: el producto se eliminó antes de consolidar la orden
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    category_id = db.Column(db.Integer)
+    # Un carrito tiene una línea por producto: order_lines es también la cantidad de órdenes
+    order_lines = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    promo_units = db.Column(db.Integer, nullable=False, default=0)
+    promo_revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    # Las mismas unidades a precio de lista: list_value - revenue es el descuento otorgado
+    list_value = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SalesDaily {self.day} {self.product_id}>'
+
+class OrderDaily(db.Model):
+    """
+    Órdenes completadas por día de creación. Repite por día los totales de
+    promoción de sales_daily: los reportes por día y los totales de un rango
+    no leen sales_daily.
+    """
+    __tablename__ = 'order_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    promo_units = db.Column(db.Integer, nullable=False, default=0)
+    promo_revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    list_value = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OrderDaily {self.day}>'
+
+class PaymentDaily(db.Model):
+    """Transacciones Webpay resueltas (completed, failed, cancelled) por día de creación"""
+    __tablename__ = 'payment_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<PaymentDaily {self.day} {self.status}>'
@@ -0,0 +1,257 @@
+"""
+Historial de órdenes del usuario y búsqueda de órdenes para administración.
+
+Ambos listados ordenan por (created_at, id) descendente con paginación por
+cursor (keyset): cada página es un rango de uno de los índices compuestos
+de orders, sin OFFSET, y cuesta lo mismo en la primera página que en la
+milésima. Los ítems con su producto, las transacciones de Webpay y (en la
+búsqueda de administración) el usuario se cargan con selectinload: una
+consulta por relación para toda la página en vez de una por orden.
+
+La búsqueda de administración corre con un statement_timeout local
+(ORDERS_ADMIN_TIMEOUT_MS): una combinación de filtros que el índice no
+acota (por ejemplo, un monto que casi ninguna orden cumple) se corta en vez
+de recorrer la tabla completa.
+"""
+import base64
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+
+from catalog_service import InvalidQueryError, parse_number
+from extensions import db
+from models import Order, OrderItem, Product, User, WebpayTransaction
+
+logger = logging.getLogger(__name__)
+
+ORDER_STATUSES = ('pending', 'completed', 'failed', 'cancelled')
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Clave de orden y de paginación; cada filtro principal tiene un índice que termina en ella
+ORDER_KEY = (Order.created_at, Order.id)
+
+ITEM_PRODUCT_COLUMNS = (Product.id, Product.name, Product.image)
+USER_COLUMNS = (User.id, User.username, User.email)
+
+
+class OrderSearchTimeoutError(Exception):
+    """La búsqueda superó ORDERS_ADMIN_TIMEOUT_MS"""
+
+
+def encode_cursor(order):
+    """Codifica la clave de la última orden de una página como cursor opaco"""
+    raw = json.dumps({'k': [order.created_at.isoformat(), order.id]}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodifica un cursor. Lanza InvalidQueryError si no es válido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, order_id = json.loads(raw)['k']
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, KeyError, TypeError):
+        raise InvalidQueryError("Cursor inválido")
+
+
+def parse_datetime(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidQueryError(f"{name} debe ser una fecha ISO 8601 (por ejemplo 2024-05-31)")
+
+
+def parse_history_args(args):
+    """
+    Valida los parámetros de /api/orders.
+
+    Args:
+        args (MultiDict): request.args
+
+    Returns:
+        dict: Parámetros normalizados para list_orders (sin user_id)
+    """
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidQueryError("limit debe ser entero")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit debe estar entre 1 y {MAX_LIMIT}")
+
+    status = args.get('status') or None
+    if status is not None and status not in ORDER_STATUSES:
+        raise InvalidQueryError(f"Estado no soportado: {status}. Use {', '.join(ORDER_STATUSES)}")
+
+    return {
+        'limit': limit,
+        'cursor': decode_cursor(args['cursor']) if args.get('cursor') else None,
+        'status': status
+    }
+
+
+def parse_admin_args(args):
+    """
+    Valida los parámetros de /api/admin/orders.
+
+    Args:
+        args (MultiDict): request.args
+
+    Returns:
+        dict: Parámetros normalizados para list_orders
+    """
+    params = parse_history_args(args)
+    try:
+        params['user_id'] = int(args['user_id']) if args.get('user_id') else None
+    except ValueError:
+        raise InvalidQueryError("user_id debe ser entero")
+
+    params.update(
+        email=(args.get('email') or '').strip() or None,
+        buy_order=(args.get('buy_order') or '').strip() or None,
+        date_from=parse_datetime(args.get('date_from'), 'date_from'),
+        date_to=parse_datetime(args.get('date_to'), 'date_to'),
+        min_total=parse_number(args.get('min_total'), 'min_total'),
+        max_total=parse_number(args.get('max_total'), 'max_total')
+    )
+    if params['date_from'] and params['date_to'] and params['date_from'] >= params['date_to']:
+        raise InvalidQueryError("date_from debe ser anterior a date_to")
+    return params
+
+
+def orders_query(limit, cursor=None, status=None, user_id=None, email=None, buy_order=None,
+                 date_from=None, date_to=None, min_total=None, max_total=None, include_user=False):
+    """
+    Consulta de una página de órdenes (limit + 1 filas) con sus relaciones.
+
+    user_id usa idx_orders_user_id_created_at_id, status
+    idx_orders_status_created_at_id y el resto idx_orders_created_at_id. El
+    correo y la orden de compra de Webpay se resuelven a user_id y order_id
+    por sus índices únicos antes de filtrar orders.
+    """
+    stmt = db.select(Order).where(Order.created_at.isnot(None))
+
+    if user_id is not None:
+        stmt = stmt.where(Order.user_id == user_id)
+    if email is not None:
+        stmt = stmt.where(Order.user_id.in_(db.select(User.id).where(User.email == email)))
+    if buy_order is not None:
+        stmt = stmt.where(Order.id.in_(
+            db.select(WebpayTransaction.order_id).where(WebpayTransaction.buy_order == buy_order)
+        ))
+    if status is not None:
+        stmt = stmt.where(Order.status == status)
+    if date_from is not None:
+        stmt = stmt.where(Order.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Order.created_at < date_to)
+    if min_total is not None:
+        stmt = stmt.where(Order.total_amount >= min_total)
+    if max_total is not None:
+        stmt = stmt.where(Order.total_amount <= max_total)
+    if cursor:
+        stmt = stmt.where(db.tuple_(*ORDER_KEY) < db.tuple_(*cursor))
+
+    options = [
+        selectinload(Order.items).selectinload(OrderItem.product).load_only(*ITEM_PRODUCT_COLUMNS),
+        selectinload(Order.transactions)
+    ]
+    if include_user:
+        options.append(selectinload(Order.user).load_only(*USER_COLUMNS))
+
+    return (stmt.options(*options)
+            .order_by(Order.created_at.desc(), Order.id.desc())
+            .limit(limit + 1))
+
+
+def amount(value):
+    return float(value) if value is not None else None
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def serialize_order(order, include_user=False):
+    data = {
+        'id': order.id,
+        'status': order.status,
+        'total_amount': amount(order.total_amount),
+        'created_at': isoformat(order.created_at),
+        'updated_at': isoformat(order.updated_at),
+        'items': [{
+            'product_id': item.product_id,
+            # El producto puede haberse eliminado (product_id queda en NULL)
+            'name': item.product.name if item.product else None,
+            'image': item.product.image if item.product else None,
+            'quantity': item.quantity,
+            'price_at_time': amount(item.price_at_time),
+            'subtotal': amount(item.price_at_time * item.quantity)
+        } for item in sorted(order.items, key=lambda item: item.id)],
+        'transactions': [{
+            'id': transaction.id,
+            'buy_order': transaction.buy_order,
+            'status': transaction.status,
+            'amount': amount(transaction.amount),
+            'authorization_code': transaction.authorization_code,
+            'payment_type_code': transaction.payment_type_code,
+            'card_number': transaction.card_number,
+            'transaction_date': isoformat(transaction.transaction_date),
+            'created_at': isoformat(transaction.created_at)
+        } for transaction in sorted(order.transactions, key=lambda transaction: transaction.id)]
+    }
+    if include_user:
+        data['user'] = {
+            'id': order.user.id,
+            'username': order.user.username,
+            'email': order.user.email
+        } if order.user else None
+    return data
+
+
+def list_orders(limit=DEFAULT_LIMIT, cursor=None, include_user=False, timeout_ms=None, **filters):
+    """
+    Lista órdenes de la más reciente a la más antigua con paginación por cursor.
+
+    Args:
+        limit (int): Órdenes por página
+        cursor (tuple, optional): (created_at, id) de la última orden de la página anterior
+        include_user (bool): Incluir el usuario de cada orden (búsqueda de administración)
+        timeout_ms (int, optional): statement_timeout de las consultas, en milisegundos
+        **filters: status, user_id, email, buy_order, date_from, date_to, min_total, max_total
+
+    Returns:
+        dict: items, next_cursor (None en la última página) y limit
+
+    Raises:
+        OrderSearchTimeoutError: Si la consulta superó timeout_ms
+    """
+    stmt = orders_query(limit, cursor, include_user=include_user, **filters)
+    try:
+        if timeout_ms:
+            db.session.execute(db.text("SELECT set_config('statement_timeout', :t, true)"),
+                               {'t': str(int(timeout_ms))})
+        orders = db.session.scalars(stmt).all()
+    except OperationalError as e:
+        db.session.rollback()
+        if getattr(e.orig, 'pgcode', None) != '57014':  # query_canceled
+            raise
+        logger.warning(f"Búsqueda de órdenes cancelada tras {timeout_ms} ms: {filters}")
+        raise OrderSearchTimeoutError(f"La búsqueda superó {timeout_ms} ms; agregue filtros más específicos")
+
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    page = {
+        'items': [serialize_order(order, include_user) for order in orders],
+        'next_cursor': encode_cursor(orders[-1]) if has_more else None,
+        'limit': limit
+    }
+    # Todo está serializado: se termina la transacción (y con ella el statement_timeout local)
+    db.session.rollback()
+    return page
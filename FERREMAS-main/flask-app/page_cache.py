@@ -0,0 +1,253 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from functools import wraps
+
+from flask import request, session, make_response
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+
+class LRUBackend:
+    """
+    Caché en memoria del proceso con desalojo LRU y expiración por entrada.
+
+    La versión de cada namespace se guarda como la fecha de modificación de
+    un archivo en instance/, de modo que una invalidación hecha por un
+    worker de gunicorn la ven todos los demás con un simple os.stat.
+    """
+
+    def __init__(self, maxsize=512, stamp_dir=INSTANCE_PATH):
+        self.maxsize = maxsize
+        self.stamp_dir = stamp_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(stamp_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _stamp(self, namespace):
+        return os.path.join(self.stamp_dir, f'page_cache_{namespace}.stamp')
+
+    def get_version(self, namespace):
+        try:
+            return os.stat(self._stamp(namespace)).st_mtime
+        except FileNotFoundError:
+            return self.bump_version(namespace)
+
+    def bump_version(self, namespace):
+        stamp = self._stamp(namespace)
+        with open(stamp, 'a'):
+            pass
+        now = time.time()
+        os.utime(stamp, (now, now))
+        # Las entradas antiguas de este proceso ya no se pueden alcanzar
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(f'{namespace}:')]:
+                del self._entries[key]
+        return now
+
+
+class RedisBackend:
+    """
+    Caché compartida en Redis (o cualquier servidor compatible con su protocolo).
+
+    Requiere el paquete `redis`, que no es parte de requirements.txt: solo se
+    importa si se configura PAGE_CACHE_BACKEND=redis.
+    """
+
+    def __init__(self, url, prefix='ferremas:page:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("PAGE_CACHE_BACKEND=redis requiere instalar el paquete 'redis'")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        entry['body'] = entry['body'].encode('utf-8')
+        return entry
+
+    def set(self, key, value, ttl):
+        entry = dict(value, body=value['body'].decode('utf-8'))
+        self.client.setex(self.prefix + key, int(ttl), json.dumps(entry))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def get_version(self, namespace):
+        version = self.client.get(f'{self.prefix}version:{namespace}')
+        if version is None:
+            return self.bump_version(namespace)
+        return float(version)
+
+    def bump_version(self, namespace):
+        now = time.time()
+        self.client.set(f'{self.prefix}version:{namespace}', repr(now))
+        return now
+
+
+class PageCache:
+    """
+    Caché de respuestas HTML para las páginas del catálogo.
+
+    Cada respuesta se guarda con su ETag y se identifica por namespace,
+    versión del namespace, ruta y usuario de la sesión (las plantillas
+    muestran el nombre del usuario). Invalidar un namespace cambia su
+    versión, por lo que todas sus entradas dejan de usarse a la vez.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.default_ttl = 300
+        self.enabled = True
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        self.default_ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        backend = app.config.get('PAGE_CACHE_BACKEND', 'lru')
+        if backend == 'redis':
+            self.backend = RedisBackend(app.config['PAGE_CACHE_REDIS_URL'])
+        else:
+            self.backend = LRUBackend(maxsize=app.config.get('PAGE_CACHE_MAXSIZE', 512))
+        logger.info(f"Caché de páginas inicializada con backend {backend}")
+
+    def _count(self, namespace, event):
+        with self._stats_lock:
+            counters = self._stats.setdefault(namespace, {'hits': 0, 'misses': 0, 'not_modified': 0, 'bypass': 0})
+            counters[event] += 1
+
+    def stats(self):
+        """Contadores por namespace, con la tasa de aciertos"""
+        with self._stats_lock:
+            result = {}
+            for namespace, counters in self._stats.items():
+                lookups = counters['hits'] + counters['misses']
+                result[namespace] = dict(counters, hit_ratio=round(counters['hits'] / lookups, 4) if lookups else 0.0)
+            return result
+
+    def invalidate(self, namespace):
+        """Descarta todas las respuestas en caché de un namespace"""
+        if self.backend is None:
+            return
+        try:
+            self.backend.bump_version(namespace)
+            logger.info(f"Caché de páginas invalidada: {namespace}")
+        except Exception as e:
+            logger.error(f"Error al invalidar la caché {namespace}: {str(e)}")
+
+    def _key(self, namespace, version):
+        user = session.get('user')
+        user_part = hashlib.sha1(json.dumps(user, sort_keys=True).encode()).hexdigest()[:16] if user else 'anon'
+        return f'{namespace}:{version!r}:{request.full_path}:{user_part}'
+
+    def cached(self, namespace, ttl=None):
+        """
+        Decorador para rutas GET que devuelven HTML.
+
+        Responde 304 si el cliente ya tiene la versión vigente (If-None-Match
+        o If-Modified-Since) y agrega ETag y Last-Modified a las respuestas.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Los mensajes flash se consumen al renderizar: no se cachean
+                if (not self.enabled or self.backend is None or request.method != 'GET'
+                        or session.get('_flashes')):
+                    self._count(namespace, 'bypass')
+                    return view(*args, **kwargs)
+
+                try:
+                    version = self.backend.get_version(namespace)
+                    key = self._key(namespace, version)
+                    entry = self.backend.get(key)
+                except Exception as e:
+                    logger.error(f"Error al leer la caché {namespace}: {str(e)}")
+                    self._count(namespace, 'bypass')
+                    return view(*args, **kwargs)
+
+                if entry is None:
+                    self._count(namespace, 'misses')
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'etag': hashlib.sha1(body).hexdigest(),
+                        'last_modified': version,
+                        'content_type': response.content_type
+                    }
+                    try:
+                        self.backend.set(key, entry, ttl or self.default_ttl)
+                    except Exception as e:
+                        logger.error(f"Error al guardar en la caché {namespace}: {str(e)}")
+                else:
+                    self._count(namespace, 'hits')
+
+                return self._respond(namespace, entry)
+            return wrapper
+        return decorator
+
+    def _respond(self, namespace, entry):
+        etag = entry['etag']
+        last_modified = int(entry['last_modified'])
+
+        not_modified = False
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        elif request.if_modified_since:
+            not_modified = int(request.if_modified_since.timestamp()) >= last_modified
+
+        if not_modified:
+            self._count(namespace, 'not_modified')
+            response = make_response('', 304)
+        else:
+            response = make_response(entry['body'])
+            response.content_type = entry['content_type']
+
+        response.set_etag(etag)
+        response.headers['Last-Modified'] = formatdate(last_modified, usegmt=True)
+        # Las páginas incluyen datos del usuario: solo el navegador puede guardarlas
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+page_cache = PageCache()
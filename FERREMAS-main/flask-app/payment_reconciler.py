@@ -0,0 +1,292 @@
+"""
+Conciliación de transacciones Webpay que quedaron sin resultado.
+
+Si el usuario cierra el navegador antes de volver del formulario de Webpay,
+/retorno-webpay nunca se ejecuta y la orden queda pendiente con su stock
+reservado. La conciliación recorre las transacciones en initiated más
+antiguas que un umbral (y las confirmaciones huérfanas en committing),
+consulta su estado en Transbank y cierra orden y transacción.
+
+Se ejecuta en el proceso de workers (python worker.py, opción
+--reconcile-interval) o una sola vez desde cron:
+
+    python payment_reconciler.py --batch-size 200 --concurrency 8
+"""
+import argparse
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from transbank.error.transbank_error import TransbankError
+
+from checkout_service import release_orders_stock
+from extensions import db
+from jobs import enqueue
+from models import Order, User, WebpayTransaction
+from payment_service import COMMIT_STALE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# El formulario de Webpay expira antes de esto: el usuario ya no va a volver
+RECONCILE_AFTER_SECONDS = 15 * 60
+
+# Sin resultado en Transbank pasado este plazo, la transacción se da por abandonada
+ABANDON_AFTER_SECONDS = 60 * 60
+
+
+def claim_batch(after_id, batch_size, reconcile_after=RECONCILE_AFTER_SECONDS):
+    """
+    Reclama (pasa a committing) un lote de transacciones por conciliar.
+
+    Usa SKIP LOCKED, de modo que varias instancias y los retornos de Webpay
+    en curso no se pisan; un retorno que llegue mientras tanto espera el
+    resultado como con cualquier otra confirmación en curso.
+
+    Args:
+        after_id (int): Recorre solo IDs mayores (paginación por llave dentro de una pasada)
+        batch_size (int): Tamaño máximo del lote
+        reconcile_after (int): Antigüedad mínima en segundos
+
+    Returns:
+        list: Filas (id, token_ws, created_at) reclamadas, en orden de ID
+    """
+    now = datetime.now(timezone.utc)
+    stmt = (
+        db.select(WebpayTransaction.id, WebpayTransaction.token_ws, WebpayTransaction.created_at)
+        .where(WebpayTransaction.id > after_id)
+        .where(WebpayTransaction.status.in_(('initiated', 'committing')))
+        .where(db.or_(
+            db.and_(WebpayTransaction.status == 'initiated',
+                    WebpayTransaction.created_at < now - timedelta(seconds=reconcile_after)),
+            db.and_(WebpayTransaction.status == 'committing',
+                    WebpayTransaction.updated_at < now - timedelta(seconds=COMMIT_STALE_SECONDS))
+        ))
+        .order_by(WebpayTransaction.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    try:
+        rows = db.session.execute(stmt).all()
+        if rows:
+            db.session.execute(
+                db.update(WebpayTransaction)
+                .where(WebpayTransaction.id.in_([row.id for row in rows]))
+                .values(status='committing', updated_at=db.func.now()),
+                execution_options={'synchronize_session': False}
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
+
+
+def query_status(gateway, token_ws):
+    """
+    Consulta el estado de una transacción (se ejecuta en los hilos del pool).
+
+    Solo una respuesta 4xx (token inexistente o expirado) o un token que no
+    pasa la validación local cuentan como rechazo: con un 5xx o cualquier
+    otro error no se sabe si el pago se autorizó, y cancelar la orden
+    liberaría el stock de una compra pagada.
+
+    Returns:
+        tuple: ('ok', respuesta), ('rejected', mensaje) si Transbank rechazó
+               el token o ('unreachable', None)
+    """
+    try:
+        return 'ok', gateway.status(token_ws)
+    except TransbankError as e:
+        # code 0: error de validación del cliente, la consulta no salió
+        if e.code == 0 or 400 <= e.code < 500:
+            return 'rejected', e.message
+        return 'unreachable', None
+    except Exception:
+        return 'unreachable', None
+
+
+def decide(row, result, abandon_before):
+    """
+    Nuevo estado de una transacción según la respuesta de Transbank.
+
+    Returns:
+        str: completed, failed, cancelled o initiated (se reintenta en otra pasada)
+    """
+    if row.token_ws is None:
+        # La orden nunca llegó a Webpay (el proceso cayó antes de guardar el token)
+        return 'failed'
+    kind, response = result
+    if kind == 'ok' and response.get('status') != 'INITIALIZED':
+        authorized = response.get('response_code') == 0 and response.get('status') == 'AUTHORIZED'
+        return 'completed' if authorized else 'failed'
+    if kind == 'unreachable':
+        return 'initiated'
+    # Sin pago en Transbank: se cancela solo cuando ya no puede completarse
+    return 'cancelled' if row.created_at < abandon_before else 'initiated'
+
+
+def apply_results(decisions):
+    """
+    Guarda el resultado de un lote en una sola transacción: actualiza las
+    transacciones, libera el stock de las órdenes no pagadas con un UPDATE,
+    cambia el estado de las órdenes con un UPDATE por estado y encola los
+    comprobantes de las pagadas.
+
+    Args:
+        decisions (list): Tuplas (fila reclamada, resultado de query_status, nuevo estado)
+
+    Returns:
+        Counter: Transacciones por nuevo estado
+    """
+    ids = [row.id for row, _, _ in decisions]
+    transactions = {
+        transaction.id: transaction
+        for transaction in db.session.execute(
+            db.select(WebpayTransaction)
+            .where(WebpayTransaction.id.in_(ids), WebpayTransaction.status == 'committing')
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ).scalars()
+    }
+
+    orders = {'completed': [], 'failed': [], 'cancelled': []}
+    counts = Counter()
+    for row, (kind, response), status in decisions:
+        transaction = transactions.get(row.id)
+        if transaction is None:
+            # Un retorno de Webpay la resolvió mientras se consultaba
+            counts['skipped'] += 1
+            continue
+        if kind == 'ok' and status in ('completed', 'failed'):
+            transaction.update_from_response(response)
+        transaction.status = status
+        counts[status] += 1
+        if status in orders and transaction.order_id is not None:
+            orders[status].append(transaction.order_id)
+
+    unpaid = orders['failed'] + orders['cancelled']
+    if unpaid:
+        # Solo las órdenes aún pendientes tienen stock reservado
+        pending = db.session.scalars(
+            db.select(Order.id).where(Order.id.in_(unpaid), Order.status == 'pending')
+        ).all()
+        release_orders_stock(pending)
+
+    for status, order_ids in orders.items():
+        if order_ids:
+            db.session.execute(
+                db.update(Order).where(Order.id.in_(order_ids), Order.status == 'pending').values(status=status),
+                execution_options={'synchronize_session': False}
+            )
+
+    if orders['completed']:
+        paid = db.session.execute(
+            db.select(Order.id, User.email).join(User, Order.user_id == User.id)
+            .where(Order.id.in_(orders['completed']))
+        )
+        for order_id, email in paid:
+            enqueue('send_receipt', {'order_id': order_id, 'email': email})
+
+    db.session.commit()
+    return counts
+
+
+def reconcile_payments(gateway, batch_size=100, concurrency=8,
+                       reconcile_after=RECONCILE_AFTER_SECONDS, abandon_after=ABANDON_AFTER_SECONDS):
+    """
+    Una pasada de conciliación sobre todas las transacciones pendientes.
+
+    Recorre lotes de hasta batch_size filas por ID; las consultas de estado
+    de cada lote se hacen en paralelo con a lo sumo `concurrency` llamadas a
+    Transbank simultáneas, sobre el pool de conexiones del cliente de Webpay.
+    Las que no se pueden resolver vuelven a initiated para la próxima pasada.
+
+    Args:
+        gateway (WebpayPlus): Cliente de Webpay (status)
+        batch_size (int): Transacciones por lote
+        concurrency (int): Consultas de estado simultáneas
+        reconcile_after (int): Segundos desde la creación para conciliar una transacción
+        abandon_after (int): Segundos desde la creación para cancelar una transacción sin pago
+
+    Returns:
+        Counter: Transacciones por nuevo estado
+    """
+    counts = Counter()
+    after_id = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='reconcile') as executor:
+        while True:
+            rows = claim_batch(after_id, batch_size, reconcile_after)
+            if not rows:
+                break
+            after_id = rows[-1].id
+
+            tokens = [row.token_ws for row in rows if row.token_ws]
+            results = dict(zip(tokens, executor.map(lambda token: query_status(gateway, token), tokens)))
+            abandon_before = datetime.now(timezone.utc) - timedelta(seconds=abandon_after)
+            decisions = []
+            for row in rows:
+                result = results.get(row.token_ws, ('rejected', None))
+                decisions.append((row, result, decide(row, result, abandon_before)))
+
+            # Si falla, las filas quedan en committing y se retoman al vencer COMMIT_STALE_SECONDS
+            try:
+                counts += apply_results(decisions)
+            except Exception:
+                db.session.rollback()
+                raise
+            logger.info("Lote de conciliación procesado", extra={'size': len(rows), 'last_id': after_id})
+
+            if len(rows) < batch_size:
+                break
+
+    if counts:
+        logger.info("Conciliación de pagos terminada", extra=dict(counts))
+    return counts
+
+
+class PaymentReconciler(threading.Thread):
+    """Hilo que ejecuta una pasada de conciliación cada `interval` segundos"""
+
+    def __init__(self, app, gateway, interval=60, batch_size=100, concurrency=8):
+        super().__init__(name='payment-reconciler', daemon=True)
+        self.app = app
+        self.gateway = gateway
+        self.interval = interval
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    reconcile_payments(self.gateway, self.batch_size, self.concurrency,
+                                       self.app.config['PAYMENT_RECONCILE_AFTER'],
+                                       self.app.config['PAYMENT_ABANDON_AFTER'])
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error en la conciliación de pagos: {str(e)}")
+                self._stopping.wait(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concilia las transacciones Webpay sin resultado')
+    parser.add_argument('--batch-size', type=int, default=100, help='Transacciones por lote')
+    parser.add_argument('--concurrency', type=int, default=8, help='Consultas de estado simultáneas')
+    args = parser.parse_args()
+
+    from app import app, webpay
+
+    with app.app_context():
+        counts = reconcile_payments(webpay, args.batch_size, args.concurrency,
+                                    app.config['PAYMENT_RECONCILE_AFTER'], app.config['PAYMENT_ABANDON_AFTER'])
+    print(', '.join(f'{status}: {count}' for status, count in sorted(counts.items())) or 'Nada que conciliar')
+
+
+if __name__ == '__main__':
+    main()
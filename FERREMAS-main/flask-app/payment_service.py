@@ -0,0 +1,239 @@
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from checkout_service import release_stock
+from extensions import db
+from jobs import enqueue
+from models import User, WebpayTransaction
+
+logger = logging.getLogger(__name__)
+
+# Estados de WebpayTransaction y transiciones permitidas:
+#
+#   initiated  -> committing   (un retorno reclama la confirmación)
+#   committing -> completed | failed
+#   committing -> initiated    (Transbank no respondió: queda para reintento/conciliación)
+#   initiated  -> cancelled    (pago abortado o formulario expirado)
+#   initiated  -> failed       (la creación en Webpay falló, ver iniciar_pago)
+#
+# completed, failed y cancelled son finales: un retorno repetido entrega el
+# resultado guardado sin volver a llamar a Transbank.
+FINAL_OUTCOMES = {'completed': 'success', 'failed': 'error', 'cancelled': 'cancelled'}
+
+# Un 'committing' más antiguo que esto quedó huérfano (el proceso cayó a mitad
+# del commit): el siguiente retorno lo resuelve consultando el estado en Transbank
+COMMIT_STALE_SECONDS = 60
+
+# Espera entre intentos mientras otro retorno del mismo token está en curso
+POLL_INTERVAL = 0.05
+
+_BUSY = object()
+
+
+class UnknownTransactionError(LookupError):
+    """No existe una transacción con el token recibido"""
+
+
+def _locked(*criteria, skip_locked=False):
+    stmt = (
+        db.select(WebpayTransaction)
+        .where(*criteria)
+        .with_for_update(skip_locked=skip_locked)
+        .execution_options(populate_existing=True)
+    )
+    return db.session.execute(stmt).scalar_one_or_none()
+
+
+def _claim(token_ws):
+    """
+    Reclama la confirmación de un token en una transacción corta.
+
+    Returns:
+        str | object: 'commit' o 'status' si este retorno debe consultar a
+                      Transbank, el resultado final si ya se conoce, o _BUSY
+                      si otro retorno del mismo token está en curso
+    """
+    transaction = _locked(WebpayTransaction.token_ws == token_ws, skip_locked=True)
+    if transaction is None:
+        db.session.rollback()
+        exists = db.session.scalar(db.select(WebpayTransaction.id).where(WebpayTransaction.token_ws == token_ws))
+        if exists is None:
+            raise UnknownTransactionError(token_ws)
+        # Fila bloqueada por otro retorno
+        return _BUSY
+
+    if transaction.status in FINAL_OUTCOMES:
+        db.session.rollback()
+        return FINAL_OUTCOMES[transaction.status]
+
+    if transaction.status == 'committing':
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=COMMIT_STALE_SECONDS)
+        if transaction.updated_at is None or transaction.updated_at > stale_before:
+            db.session.rollback()
+            return _BUSY
+        logger.warning("Confirmación huérfana, se consulta el estado en Webpay",
+                       extra={'buy_order': transaction.buy_order})
+        action = 'status'
+    else:
+        action = 'commit'
+
+    transaction.status = 'committing'
+    transaction.updated_at = db.func.now()
+    db.session.commit()
+    return action
+
+
+def _as_dict(response):
+    if response is None or isinstance(response, dict):
+        return response
+    return vars(response)
+
+
+def _call_gateway(gateway, token_ws, action):
+    """
+    Confirma (o consulta) el pago en Transbank.
+
+    Si el commit falla (rechazado por estar ya confirmado, expirado o sin
+    respuesta) el estado real se obtiene con status.
+
+    Returns:
+        dict: Respuesta de Webpay, o None si Transbank no respondió
+    """
+    if action == 'commit':
+        try:
+            return _as_dict(gateway.commit_transaction(token_ws))
+        except Exception:
+            logger.warning("Commit de Webpay fallido, se consulta el estado", exc_info=True)
+    try:
+        return _as_dict(gateway.status(token_ws))
+    except Exception:
+        logger.exception("No se pudo consultar el estado en Webpay")
+        return None
+
+
+def apply_gateway_response(transaction, response):
+    """
+    Registra el resultado de Webpay en una transacción en estado committing
+    (bloqueada por el llamador) y en su orden.
+
+    Returns:
+        str: 'success', 'error' o 'pending' si Transbank aún no tiene un resultado
+    """
+    if response is None or response.get('status') == 'INITIALIZED':
+        # Sin resultado: vuelve a initiated para que otro retorno o la conciliación lo resuelvan
+        transaction.status = 'initiated'
+        return 'pending'
+
+    authorized = response.get('response_code') == 0 and response.get('status') == 'AUTHORIZED'
+    transaction.update_from_response(response)
+    order = transaction.order
+    if authorized:
+        transaction.status = 'completed'
+        transaction.amount = response.get('amount', transaction.amount)
+        order.status = 'completed'
+        user = db.session.get(User, order.user_id) if order.user_id else None
+        if user:
+            # El comprobante se encola en la misma transacción que el resultado,
+            # una sola vez: solo en la transición a completed
+            enqueue('send_receipt', {'order_id': order.id, 'email': user.email})
+        return 'success'
+
+    if order.status == 'pending':
+        release_stock(order.id)
+    transaction.status = 'failed'
+    order.status = 'failed'
+    return 'error'
+
+
+def confirm_payment(token_ws, gateway, wait=10.0):
+    """
+    Procesa el retorno de Webpay de forma idempotente.
+
+    El retorno que reclama el token (SELECT ... FOR UPDATE SKIP LOCKED y paso
+    a committing en una transacción corta) es el único que llama a Transbank;
+    la fila no queda bloqueada durante la llamada. Los retornos concurrentes
+    del mismo token esperan el resultado hasta `wait` segundos, y los
+    repetidos después del cierre reciben el resultado guardado.
+
+    Args:
+        token_ws (str): Token de la transacción
+        gateway (WebpayPlus): Cliente de Webpay (commit_transaction y status)
+        wait (float): Segundos máximos de espera si otro retorno está en curso
+
+    Returns:
+        str: 'success', 'error', 'cancelled' o 'pending' (resultado aún desconocido)
+
+    Raises:
+        UnknownTransactionError: Si no hay una transacción con ese token
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        claim = _claim(token_ws)
+        if claim is not _BUSY:
+            break
+        if time.monotonic() >= deadline:
+            return 'pending'
+        time.sleep(POLL_INTERVAL)
+
+    if claim in ('commit', 'status'):
+        response = _call_gateway(gateway, token_ws, claim)
+        try:
+            transaction = _locked(WebpayTransaction.token_ws == token_ws)
+            if transaction.status != 'committing':
+                # Resuelta por otro retorno tras considerar huérfana esta confirmación
+                db.session.rollback()
+                return FINAL_OUTCOMES.get(transaction.status, 'pending')
+            outcome = apply_gateway_response(transaction, response)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        logger.info("Retorno de Webpay procesado",
+                    extra={'buy_order': transaction.buy_order, 'order_id': transaction.order_id,
+                           'response_code': transaction.response_code, 'status': outcome})
+        return outcome
+
+    return claim
+
+
+def cancel_payment(token_ws=None, buy_order=None):
+    """
+    Anula una transacción abortada por el usuario o expirada en el formulario de Webpay.
+
+    Solo cancela transacciones en initiated (y libera su stock); en cualquier
+    otro estado entrega el resultado vigente sin modificarla.
+
+    Args:
+        token_ws (str, optional): Token de la transacción (TBK_TOKEN)
+        buy_order (str, optional): Orden de compra (TBK_ORDEN_COMPRA), si no hay token
+
+    Returns:
+        str: 'cancelled', 'success', 'error' o 'pending'
+    """
+    if token_ws:
+        criteria = WebpayTransaction.token_ws == token_ws
+    elif buy_order:
+        criteria = WebpayTransaction.buy_order == buy_order
+    else:
+        return 'cancelled'
+
+    try:
+        transaction = _locked(criteria)
+        if transaction is None:
+            db.session.rollback()
+            return 'cancelled'
+        if transaction.status != 'initiated':
+            db.session.rollback()
+            return FINAL_OUTCOMES.get(transaction.status, 'pending')
+
+        if transaction.order.status == 'pending':
+            release_stock(transaction.order_id)
+        transaction.status = 'cancelled'
+        transaction.order.status = 'cancelled'
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    logger.info("Pago abortado por el usuario", extra={'buy_order': transaction.buy_order})
+    return 'cancelled'
@@ -0,0 +1,336 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import Product
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+# Los precios del catálogo incluyen IVA
+VAT_RATE = Decimal('0.19')
+
+CENT = Decimal('0.01')
+
+# Desde cuántas líneas conviene evaluar con arreglos de NumPy
+VECTORIZE_THRESHOLD = 64
+
+PricedLine = namedtuple('PricedLine', 'product_id quantity unit_price line_total')
+
+# Datos de un producto que necesitan el carrito y sus totales
+PriceEntry = namedtuple('PriceEntry', 'product_id name image price is_promotion promotion_price effective_price')
+
+
+def to_decimal(value):
+    """
+    Precio como Decimal con dos decimales (None se mantiene).
+
+    Los precios de Product son Float y los de Order/OrderItem son Numeric:
+    todo se convierte a Decimal antes de operar. str() de un float da su
+    representación más corta (24990.0 -> '24990.0'), sin arrastrar el error
+    binario a los centavos.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def cents_array(values):
+    """Precios como arreglo de centavos enteros (exacto para precios con dos decimales)"""
+    floats = np.fromiter((float(value) for value in values), dtype=np.float64)
+    return np.rint(floats * 100).astype(np.int64)
+
+
+def effective_price(price, is_promotion, promotion_price):
+    """
+    Regla única del precio de venta: el de promoción si el producto está en
+    promoción y lo tiene definido; si no, el de lista.
+
+    Returns:
+        Decimal: Precio efectivo con dos decimales
+    """
+    if is_promotion and promotion_price is not None:
+        return to_decimal(promotion_price)
+    return to_decimal(price)
+
+
+def split_vat(total):
+    """
+    Separa el neto y el IVA de un total con IVA incluido (el neto se redondea a pesos).
+
+    Returns:
+        tuple: (subtotal, tax) en Decimal
+    """
+    subtotal = (total / (1 + VAT_RATE)).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+    return subtotal, total - subtotal
+
+
+class CartPricing:
+    """
+    Resultado de valorizar un conjunto de líneas.
+
+    La evaluación vectorizada guarda los montos como arreglos de centavos;
+    las líneas en Decimal se construyen solo si se piden, así quien necesita
+    únicamente los totales no paga la conversión de cada línea.
+    """
+
+    def __init__(self, product_ids, quantities, unit_prices, line_totals, total):
+        self.product_ids = product_ids
+        self.quantities = quantities
+        self.unit_prices = unit_prices
+        self.line_totals = line_totals
+        self.total = total
+        self._cents = None
+        self._lines = None
+
+    @classmethod
+    def from_cents(cls, product_ids, quantities, unit_cents, line_cents):
+        pricing = cls(product_ids, quantities, None, None, Decimal(int(line_cents.sum())).scaleb(-2))
+        pricing._cents = (unit_cents, line_cents)
+        return pricing
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            if self.unit_prices is None:
+                unit_cents, line_cents = self._cents
+                self.unit_prices = [Decimal(int(cents)).scaleb(-2) for cents in unit_cents]
+                self.line_totals = [Decimal(int(cents)).scaleb(-2) for cents in line_cents]
+            self._lines = [
+                PricedLine(product_id, int(quantity), unit_price, line_total)
+                for product_id, quantity, unit_price, line_total
+                in zip(self.product_ids, self.quantities, self.unit_prices, self.line_totals)
+            ]
+        return self._lines
+
+    @property
+    def item_count(self):
+        return int(sum(self.quantities))
+
+    @property
+    def subtotal(self):
+        return split_vat(self.total)[0]
+
+    @property
+    def tax(self):
+        return split_vat(self.total)[1]
+
+    def to_dict(self):
+        """Totales para respuestas JSON (en float, como los precios de la API)"""
+        subtotal, tax = split_vat(self.total)
+        return {
+            'item_count': self.item_count,
+            'subtotal': float(subtotal),
+            'tax': float(tax),
+            'total': float(self.total)
+        }
+
+
+def price_lines(lines, vectorize=None):
+    """
+    Valoriza líneas cuyo precio unitario ya es el precio de venta.
+
+    Args:
+        lines (list): Tuplas (product_id, quantity, unit_price); unit_price en Decimal o float
+        vectorize (bool, optional): Forzar (o no) la evaluación con NumPy. Por defecto,
+                                    se usa desde VECTORIZE_THRESHOLD líneas
+
+    Returns:
+        CartPricing: Líneas y totales
+    """
+    lines = list(lines)
+    if vectorize is None:
+        vectorize = len(lines) >= VECTORIZE_THRESHOLD
+    product_ids = [line[0] for line in lines]
+
+    if vectorize:
+        quantities = np.fromiter((line[1] for line in lines), dtype=np.int64, count=len(lines))
+        unit_cents = cents_array(line[2] for line in lines)
+        return CartPricing.from_cents(product_ids, quantities, unit_cents, unit_cents * quantities)
+
+    quantities = [line[1] for line in lines]
+    unit_prices = [to_decimal(line[2]) for line in lines]
+    line_totals = [unit_price * quantity for unit_price, quantity in zip(unit_prices, quantities)]
+    return CartPricing(product_ids, quantities, unit_prices, line_totals, sum(line_totals, Decimal('0.00')))
+
+
+def price_products(rows, vectorize=None):
+    """
+    Valoriza líneas a partir de las columnas de Product, aplicando la regla de promoción.
+
+    Args:
+        rows (list): Tuplas (product_id, quantity, price, is_promotion, promotion_price)
+        vectorize (bool, optional): Igual que en price_lines
+
+    Returns:
+        CartPricing: Líneas y totales
+    """
+    rows = list(rows)
+    if vectorize is None:
+        vectorize = len(rows) >= VECTORIZE_THRESHOLD
+    if not vectorize:
+        return price_lines(
+            [(product_id, quantity, effective_price(price, is_promotion, promotion_price))
+             for product_id, quantity, price, is_promotion, promotion_price in rows],
+            vectorize=False
+        )
+
+    quantities = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    prices = cents_array(row[2] for row in rows)
+    on_promotion = np.fromiter((bool(row[3]) and row[4] is not None for row in rows), dtype=bool, count=len(rows))
+    promotion_prices = cents_array(row[4] if row[4] is not None else 0 for row in rows)
+    unit_cents = np.where(on_promotion, promotion_prices, prices)
+    return CartPricing.from_cents([row[0] for row in rows], quantities, unit_cents, unit_cents * quantities)
+
+
+class PriceCache:
+    """
+    Caché en memoria del proceso de los precios efectivos (y nombre e imagen)
+    de cada producto, para leer y totalizar carritos sin ir a Postgres.
+
+    Las modificaciones de Product hechas con el ORM invalidan sus entradas
+    al confirmarse la transacción; las masivas (importación, SQL directo)
+    deben llamar a invalidate(). Como en la caché de páginas, una
+    invalidación cambia la fecha de un archivo en instance/ y los demás
+    workers descartan su copia en la siguiente lectura. El TTL acota el
+    tiempo que puede sobrevivir un precio modificado por otra vía.
+
+    El checkout no usa la caché: valoriza con los precios leídos en la
+    misma transacción que reserva el stock.
+    """
+
+    def __init__(self, app=None, maxsize=10000, ttl=300, stamp_dir=INSTANCE_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stamp_dir = stamp_dir
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('PRICE_CACHE_MAXSIZE', self.maxsize)
+        self.ttl = app.config.get('PRICE_CACHE_TTL', self.ttl)
+        os.makedirs(self.stamp_dir, exist_ok=True)
+        if not event.contains(Product, 'after_update', _collect_changed_product):
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(Product, name, _collect_changed_product)
+            event.listen(Session, 'after_commit', _invalidate_committed)
+            event.listen(Session, 'after_soft_rollback', _discard_pending)
+
+    @property
+    def _stamp(self):
+        return os.path.join(self.stamp_dir, 'price_cache.stamp')
+
+    def _shared_version(self):
+        try:
+            return os.stat(self._stamp).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def get_many(self, product_ids):
+        """
+        Precios de varios productos; los que faltan se leen en una sola consulta.
+
+        Args:
+            product_ids (iterable): IDs de producto
+
+        Returns:
+            dict: {product_id: PriceEntry}; los productos inexistentes no aparecen
+        """
+        product_ids = set(product_ids)
+        version = self._shared_version()
+        now = time.time()
+        found = {}
+        with self._lock:
+            if version != self._version:
+                # Otro proceso invalidó precios
+                self._entries.clear()
+                self._version = version
+            for product_id in product_ids:
+                cached = self._entries.get(product_id)
+                if cached is not None and cached[1] > now:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = cached[0]
+            self._stats['hits'] += len(found)
+            self._stats['misses'] += len(product_ids) - len(found)
+
+        missing = product_ids - found.keys()
+        if missing:
+            rows = db.session.execute(
+                db.select(Product.id, Product.name, Product.image, Product.price,
+                          Product.is_promotion, Product.promotion_price)
+                .where(Product.id.in_(missing))
+            ).all()
+            loaded = {
+                row.id: PriceEntry(row.id, row.name, row.image, to_decimal(row.price), bool(row.is_promotion),
+                                   to_decimal(row.promotion_price),
+                                   effective_price(row.price, row.is_promotion, row.promotion_price))
+                for row in rows
+            }
+            with self._lock:
+                # Si hubo una invalidación mientras se consultaba, no se guardan
+                if self._version == version:
+                    for product_id, entry in loaded.items():
+                        self._entries[product_id] = (entry, now + self.ttl)
+                        self._entries.move_to_end(product_id)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, product_ids=None):
+        """
+        Descarta precios en caché. Sin argumentos, todos.
+
+        En este proceso se descartan solo los productos indicados; los demás
+        workers descartan su caché completa al ver el cambio del archivo.
+        """
+        with open(self._stamp, 'a'):
+            pass
+        os.utime(self._stamp, None)
+        with self._lock:
+            if product_ids is None:
+                self._entries.clear()
+            else:
+                for product_id in product_ids:
+                    self._entries.pop(product_id, None)
+            self._version = self._shared_version()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(self._stats, size=len(self._entries),
+                        hit_ratio=round(self._stats['hits'] / lookups, 4) if lookups else 0.0)
+
+
+def _collect_changed_product(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('price_cache_changed', set()).add(target.id)
+
+
+def _invalidate_committed(session):
+    changed = session.info.pop('price_cache_changed', None)
+    if changed:
+        price_cache.invalidate(changed)
+
+
+def _discard_pending(session, previous_transaction):
+    session.info.pop('price_cache_changed', None)
+
+
+price_cache = PriceCache()
@@ -0,0 +1,420 @@
+import csv
+import io
+import logging
+import os
+import re
+import time
+
+from extensions import db
+from models import Category
+from page_cache import page_cache
+from pricing import price_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+STAGING_TABLE = 'product_import_staging'
+
+# Nombres de columna aceptados en las planillas de proveedores
+HEADER_ALIASES = {
+    'sku': ('sku', 'codigo', 'código'),
+    'name': ('name', 'nombre'),
+    'price': ('price', 'precio'),
+    'description': ('description', 'descripcion', 'descripción'),
+    'stock': ('stock',),
+    'category': ('category', 'categoria', 'categoría'),
+    'image': ('image', 'imagen'),
+    'is_featured': ('is_featured', 'destacado'),
+    'is_promotion': ('is_promotion', 'oferta', 'promocion', 'promoción'),
+    'promotion_price': ('promotion_price', 'precio_oferta')
+}
+REQUIRED_COLUMNS = ('sku', 'name', 'price')
+
+# Columnas de la tabla de staging, en el orden del COPY
+STAGING_COLUMNS = ('sku', 'name', 'price', 'description', 'stock', 'category_id',
+                   'image', 'is_featured', 'is_promotion', 'promotion_price')
+
+# Columna del archivo -> columna de products que actualiza
+UPDATABLE_COLUMNS = {
+    'name': 'name',
+    'price': 'price',
+    'description': 'description',
+    'stock': 'stock',
+    'category': 'category_id',
+    'image': 'image',
+    'is_featured': 'is_featured',
+    'is_promotion': 'is_promotion',
+    'promotion_price': 'promotion_price'
+}
+
+THOUSANDS_RE = re.compile(r'^\d{1,3}(\.\d{3})+$')
+
+
+class ImportFormatError(ValueError):
+    """El archivo no se puede leer o le faltan columnas obligatorias"""
+
+
+class RowError(ValueError):
+    """Una fila del archivo tiene valores inválidos"""
+
+
+def normalize_header(header):
+    """Mapea los encabezados del archivo a los nombres de HEADER_ALIASES"""
+    lookup = {alias: column for column, aliases in HEADER_ALIASES.items() for alias in aliases}
+    columns = [lookup.get(str(h or '').strip().lower()) for h in header]
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ImportFormatError(f"Faltan columnas obligatorias: {', '.join(missing)}")
+    return columns
+
+
+def row_dict(columns, values):
+    """Valores de una fila por columna reconocida (None si la fila viene corta)"""
+    return {c: (values[i] if i < len(values) else None) for i, c in enumerate(columns) if c}
+
+
+def read_csv_rows(path):
+    """
+    Lee un CSV fila a fila. Detecta el separador (',', ';' o tabulación),
+    ya que Excel en español exporta con ';'.
+
+    Yields:
+        tuple: (número de línea, dict con las columnas reconocidas)
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f, dialect)
+        header = next(reader, None)
+        if header is None:
+            raise ImportFormatError("El archivo está vacío")
+        columns = normalize_header(header)
+        for values in reader:
+            if not any(v.strip() for v in values):
+                continue
+            yield reader.line_num, row_dict(columns, values)
+
+
+def read_xlsx_rows(path):
+    """
+    Lee la primera hoja de un XLSX en modo read-only (sin cargar el libro completo).
+
+    Requiere el paquete `openpyxl`, que no es parte de requirements.txt: solo
+    se importa al leer archivos Excel.
+
+    Yields:
+        tuple: (número de fila, dict con las columnas reconocidas)
+    """
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportFormatError("Importar archivos .xlsx requiere instalar el paquete 'openpyxl'")
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ImportFormatError("La planilla está vacía")
+        columns = normalize_header(header)
+        for line, values in enumerate(rows, start=2):
+            if all(v is None or str(v).strip() == '' for v in values):
+                continue
+            yield line, row_dict(columns, values)
+    finally:
+        workbook.close()
+
+
+def read_rows(path):
+    """Elige el lector según la extensión del archivo"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.csv', '.txt'):
+        return read_csv_rows(path)
+    if extension in ('.xlsx', '.xlsm'):
+        return read_xlsx_rows(path)
+    raise ImportFormatError(f"Formato no soportado: {extension}. Use .csv o .xlsx")
+
+
+def clean_text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_price(value, column):
+    """
+    Convierte un precio a float. Acepta números de Excel, '$15.990',
+    '15990', '15.990' (separador de miles) y '15990,5' (coma decimal).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace('$', '').replace(' ', '')
+    if not text:
+        return None
+    if ',' in text:
+        text = text.replace('.', '').replace(',', '.')
+    elif THOUSANDS_RE.match(text):
+        text = text.replace('.', '')
+    try:
+        price = float(text)
+    except ValueError:
+        raise RowError(f"{column} inválido: {value}")
+    if price < 0:
+        raise RowError(f"{column} no puede ser negativo")
+    return price
+
+
+def parse_int(value, column):
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        return int(float(str(value).strip()))
+    except ValueError:
+        raise RowError(f"{column} inválido: {value}")
+
+
+def parse_flag(value, column):
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in ('1', 'true', 'si', 'sí', 'yes', 'x'):
+        return True
+    if text in ('0', 'false', 'no'):
+        return False
+    raise RowError(f"{column} inválido: {value}")
+
+
+def copy_value(value):
+    """Representación de un valor para COPY en formato CSV (vacío sin comillas = NULL)"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return value
+
+
+class ProductImporter:
+    """
+    Importación masiva de productos desde planillas de proveedores.
+
+    El archivo se lee por streaming y se procesa en bloques de chunk_size
+    filas: cada bloque se carga con COPY a una tabla temporal y se pasa a
+    products con un único INSERT ... ON CONFLICT (sku) DO UPDATE. Solo hay
+    un bloque en memoria a la vez, sin importar el tamaño del archivo.
+
+    Las columnas que no vienen en el archivo no se modifican en los
+    productos existentes, y las filas sin cambios no se reescriben.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, create_categories=False):
+        self.chunk_size = chunk_size
+        self.create_categories = create_categories
+        self.categories = None
+
+    def load_categories(self):
+        """Mapa nombre de categoría (sin distinguir mayúsculas) -> id, en una sola consulta"""
+        rows = db.session.execute(db.select(Category.id, Category.name)).all()
+        self.categories = {name.strip().lower(): id for id, name in rows}
+
+    def resolve_category(self, name):
+        if name is None:
+            return None
+        key = name.lower()
+        if key not in self.categories:
+            if not self.create_categories:
+                raise RowError(f"Categoría desconocida: {name}")
+            category = Category(name=name)
+            db.session.add(category)
+            db.session.commit()
+            self.categories[key] = category.id
+            logger.info(f"Categoría creada durante la importación: {name}")
+        return self.categories[key]
+
+    def to_record(self, row):
+        """Valida una fila y la convierte en una tupla con el orden de STAGING_COLUMNS"""
+        sku = clean_text(row.get('sku'))
+        name = clean_text(row.get('name'))
+        price = parse_price(row.get('price'), 'price')
+        if not sku:
+            raise RowError("sku vacío")
+        if not name:
+            raise RowError("name vacío")
+        if price is None:
+            raise RowError("price vacío")
+        if len(sku) > 50 or len(name) > 100:
+            raise RowError("sku o name demasiado largo")
+        image = clean_text(row.get('image'))
+        if image and len(image) > 200:
+            raise RowError("image demasiado largo")
+
+        return (
+            sku,
+            name,
+            price,
+            clean_text(row.get('description')),
+            parse_int(row.get('stock'), 'stock'),
+            self.resolve_category(clean_text(row.get('category'))),
+            image,
+            parse_flag(row.get('is_featured'), 'is_featured'),
+            parse_flag(row.get('is_promotion'), 'is_promotion'),
+            parse_price(row.get('promotion_price'), 'promotion_price')
+        )
+
+    def upsert_sql(self, columns):
+        """
+        Sentencias que cargan un bloque de staging en products.
+
+        Una celda vacía (NULL en staging) conserva el valor del producto
+        existente; los valores por defecto (stock 0, marcas en false) solo se
+        aplican a productos nuevos. Por eso la carga son dos sentencias y no
+        un INSERT ... ON CONFLICT, cuyo EXCLUDED ya trae los valores por
+        defecto aplicados.
+
+        Returns:
+            tuple: (UPDATE de los productos existentes que cambian,
+                    INSERT de los sku nuevos)
+        """
+        targets = [UPDATABLE_COLUMNS[c] for c in UPDATABLE_COLUMNS if c in columns]
+        values = [f'coalesce(s.{c}, p.{c})' for c in targets]
+        update = f"""
+            UPDATE products p
+            SET {', '.join(f'{c} = {v}' for c, v in zip(targets, values))}, updated_at = now()
+            FROM {STAGING_TABLE} s
+            WHERE p.sku = s.sku
+              AND ({', '.join(f'p.{c}' for c in targets)}) IS DISTINCT FROM ({', '.join(values)})
+        """
+        # Se ejecuta después del UPDATE: los sku existentes ya están actualizados y no se tocan
+        insert = f"""
+            INSERT INTO products (sku, name, price, description, stock, category_id,
+                                  image, is_featured, is_promotion, promotion_price)
+            SELECT sku, name, price, description, coalesce(stock, 0), category_id,
+                   image, coalesce(is_featured, false), coalesce(is_promotion, false), promotion_price
+            FROM {STAGING_TABLE}
+            ON CONFLICT (sku) DO NOTHING
+        """
+        return update, insert
+
+    def import_file(self, path, progress=None):
+        """
+        Importa un archivo CSV o XLSX.
+
+        Args:
+            path (str): Ruta del archivo
+            progress (callable): Se llama con las estadísticas después de cada bloque
+
+        Returns:
+            dict: rows, inserted, updated, unchanged, skipped, errors (las primeras
+                  MAX_REPORTED_ERRORS), seconds y rows_per_sec
+
+        Raises:
+            ImportFormatError: Si el archivo no se puede leer o le faltan columnas
+        """
+        return self.import_rows(read_rows(path), progress=progress)
+
+    def import_rows(self, rows, progress=None):
+        """
+        Importa filas ya leídas: un iterable de (número de línea, dict).
+
+        Ver import_file para el formato del resultado.
+        """
+        if self.categories is None:
+            self.load_categories()
+
+        stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'errors': []}
+        start = time.perf_counter()
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            return self._finish(stats, start)
+        columns = set(first[1])
+        sql = self.upsert_sql(columns)
+
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+                    sku VARCHAR(50), name VARCHAR(100), price DOUBLE PRECISION, description TEXT,
+                    stock INTEGER, category_id INTEGER, image VARCHAR(200), is_featured BOOLEAN,
+                    is_promotion BOOLEAN, promotion_price DOUBLE PRECISION
+                ) ON COMMIT DELETE ROWS
+            """)
+            connection.commit()
+
+            chunk = {}
+            for line, row in self._chain(first, rows):
+                stats['rows'] += 1
+                try:
+                    record = self.to_record(row)
+                except RowError as e:
+                    stats['skipped'] += 1
+                    if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                        stats['errors'].append({'line': line, 'error': str(e)})
+                    continue
+                # Un mismo sku dos veces en el bloque: gana la última fila
+                chunk[record[0]] = record
+                if len(chunk) >= self.chunk_size:
+                    self._load_chunk(connection, cursor, sql, chunk, stats)
+                    chunk = {}
+                    if progress:
+                        progress(self._finish(dict(stats), start))
+            if chunk:
+                self._load_chunk(connection, cursor, sql, chunk, stats)
+
+            cursor.execute(f'DROP TABLE IF EXISTS {STAGING_TABLE}')
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+        if stats['inserted'] or stats['updated']:
+            page_cache.invalidate('catalog')
+            # El upsert es SQL directo: no pasa por los eventos del ORM
+            price_cache.invalidate()
+        return self._finish(stats, start)
+
+    @staticmethod
+    def _chain(first, rows):
+        yield first
+        yield from rows
+
+    def _load_chunk(self, connection, cursor, sql, chunk, stats):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([copy_value(v) for v in record] for record in chunk.values())
+        buffer.seek(0)
+
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        update, insert = sql
+        cursor.execute(update)
+        updated = cursor.rowcount
+        cursor.execute(insert)
+        inserted = cursor.rowcount
+        # ON COMMIT DELETE ROWS vacía la tabla de staging para el siguiente bloque
+        connection.commit()
+
+        stats['inserted'] += inserted
+        stats['updated'] += updated
+        stats['unchanged'] += len(chunk) - inserted - updated
+
+    @staticmethod
+    def _finish(stats, start):
+        seconds = time.perf_counter() - start
+        stats['seconds'] = round(seconds, 3)
+        stats['rows_per_sec'] = round(stats['rows'] / seconds) if seconds > 0 else 0
+        return stats
@@ -0,0 +1,170 @@
+"""
+Proyección de productos para los listados (tabla product_listings).
+
+Los listados de la tienda (portada, categorías, /api/products) leen una
+fila por producto con el precio efectivo, el porcentaje de descuento, el
+nombre e ícono de la categoría y la disponibilidad ya calculados, en vez de
+calcularlos en cada petición sobre products y categories.
+
+La proyección la mantienen triggers de Postgres, en la misma transacción
+que la escritura: así cubre también las escrituras que no pasan por el ORM
+(la reserva de stock del checkout, la importación masiva con COPY, el job
+de variantes de imágenes). Los triggers de products son por sentencia y
+usan tablas de transición: una importación de miles de filas actualiza la
+proyección con un solo INSERT ... SELECT. Una actualización que no cambia
+datos del listado (por ejemplo, el stock de 20 a 19) no la toca. Los
+productos eliminados se borran por ON DELETE CASCADE.
+
+Se prefirió una tabla a una vista materializada porque REFRESH
+MATERIALIZED VIEW recalcula el catálogo completo en cada escritura (ver
+python -m benchmarks.bench_listing).
+
+Para reconstruirla completa (por ejemplo, tras restaurar un respaldo):
+
+    python product_listing.py --rebuild
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import DDL, event
+
+from extensions import db
+from models import ProductListing
+
+logger = logging.getLogger(__name__)
+
+LISTING_COLUMNS = (
+    'id', 'name', 'summary', 'image', 'image_variants', 'price', 'promotion_price', 'effective_price',
+    'discount_percent', 'is_promotion', 'is_featured', 'in_stock', 'category_id', 'category_name',
+    'category_icon', 'updated_at'
+)
+
+# Misma regla que pricing.effective_price
+EFFECTIVE_PRICE = 'CASE WHEN p.is_promotion AND p.promotion_price IS NOT NULL THEN p.promotion_price ELSE p.price END'
+
+# Datos de products de los que depende una fila del listado ({t}: alias de la tabla).
+# json no tiene operador de igualdad: image_variants se compara como texto
+SOURCE_COLUMNS = ('{t}.name', 'left({t}.description, 100)', '{t}.image', '{t}.image_variants::text', '{t}.price',
+                  '{t}.promotion_price', '{t}.is_promotion', '{t}.is_featured', 'coalesce({t}.stock, 0) > 0',
+                  '{t}.category_id')
+
+# Filas actualizadas cuyos datos del listado cambiaron
+CHANGED_ROWS = (
+    'JOIN old_rows o ON o.id = p.id\n'
+    f"        WHERE ({', '.join(column.format(t='p') for column in SOURCE_COLUMNS)})\n"
+    f"              IS DISTINCT FROM ({', '.join(column.format(t='o') for column in SOURCE_COLUMNS)})"
+)
+
+
+def listing_select(source, condition=''):
+    """
+    SELECT que calcula filas de product_listings.
+
+    Args:
+        source (str): products o una tabla de transición de los triggers
+        condition (str, optional): JOIN/WHERE adicional sobre el alias p
+    """
+    return f"""
+        SELECT p.id, p.name, left(p.description, 100), p.image, p.image_variants, p.price, p.promotion_price,
+               e.price,
+               CASE WHEN p.price > 0 AND e.price < p.price THEN round(100 * (1 - e.price / p.price))::smallint
+                    ELSE 0 END,
+               coalesce(p.is_promotion, false), coalesce(p.is_featured, false), coalesce(p.stock, 0) > 0,
+               p.category_id, c.name, c.icon, p.updated_at
+        FROM {source} p
+        CROSS JOIN LATERAL (SELECT {EFFECTIVE_PRICE} AS price) e
+        LEFT JOIN categories c ON c.id = p.category_id
+        {condition}"""
+
+
+def listing_upsert(select):
+    """INSERT ... ON CONFLICT que escribe en product_listings las filas de `select`"""
+    return (f"INSERT INTO product_listings ({', '.join(LISTING_COLUMNS)}) {select}\n"
+            f"    ON CONFLICT (id) DO UPDATE SET "
+            + ', '.join(f'{column} = EXCLUDED.{column}' for column in LISTING_COLUMNS[1:]))
+
+
+TRIGGERS_SQL = f"""
+CREATE OR REPLACE FUNCTION product_listings_insert_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    {listing_upsert(listing_select('new_rows'))};
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION product_listings_update_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    {listing_upsert(listing_select('new_rows', CHANGED_ROWS))};
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION product_listings_category_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE product_listings SET category_name = NEW.name, category_icon = NEW.icon WHERE category_id = NEW.id;
+    RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS products_listing_insert ON products;
+CREATE TRIGGER products_listing_insert AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_listings_insert_sync();
+
+DROP TRIGGER IF EXISTS products_listing_update ON products;
+CREATE TRIGGER products_listing_update AFTER UPDATE ON products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_listings_update_sync();
+
+DROP TRIGGER IF EXISTS categories_listing_update ON categories;
+CREATE TRIGGER categories_listing_update AFTER UPDATE ON categories
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.icon IS DISTINCT FROM NEW.icon)
+    EXECUTE FUNCTION product_listings_category_sync();
+"""
+
+DROP_TRIGGERS_SQL = """
+DROP TRIGGER IF EXISTS categories_listing_update ON categories;
+DROP TRIGGER IF EXISTS products_listing_update ON products;
+DROP TRIGGER IF EXISTS products_listing_insert ON products;
+DROP FUNCTION IF EXISTS product_listings_category_sync();
+DROP FUNCTION IF EXISTS product_listings_update_sync();
+DROP FUNCTION IF EXISTS product_listings_insert_sync();
+"""
+
+# db.create_all() (init_db.py, reset_db.py) también instala los triggers; en
+# producción los crea la migración
+event.listen(ProductListing.__table__, 'after_create', DDL(TRIGGERS_SQL).execute_if(dialect='postgresql'))
+event.listen(ProductListing.__table__, 'before_drop', DDL(DROP_TRIGGERS_SQL).execute_if(dialect='postgresql'))
+
+
+def rebuild():
+    """
+    Recalcula todas las filas de product_listings desde products y hace commit.
+
+    Returns:
+        int: Filas escritas
+    """
+    result = db.session.execute(db.text(listing_upsert(listing_select('products'))))
+    db.session.execute(db.text(
+        'DELETE FROM product_listings l WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.id = l.id)'
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Proyección de productos para los listados')
+    parser.add_argument('--rebuild', action='store_true', help='Recalcula product_listings desde products')
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    from app import app
+
+    with app.app_context():
+        start = time.perf_counter()
+        count = rebuild()
+    print(f'Filas de product_listings escritas: {count} en {time.perf_counter() - start:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import heapq
+import logging
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from db_config import pool_status
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+MAX_STATEMENT_LENGTH = 300
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class QueryMetrics:
+    """
+    Instrumentación de las consultas SQL por endpoint.
+
+    Escucha los eventos before/after_cursor_execute del engine y acumula,
+    para cada petición, la cantidad de sentencias y el tiempo en la base de
+    datos. Al terminar la petición los suma a los totales del endpoint y
+    conserva las sentencias más lentas (sin parámetros, que pueden tener
+    datos personales). Las métricas son del proceso: con gunicorn cada
+    worker tiene las suyas.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slowest_count = 5
+        self.slow_query_ms = 200
+        self.engine = None
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('DB_METRICS_ENABLED', True)
+        self.slowest_count = app.config.get('DB_METRICS_SLOWEST', 5)
+        self.slow_query_ms = app.config.get('DB_SLOW_QUERY_MS', 200)
+        with app.app_context():
+            self.engine = db.engine
+        if not self.enabled:
+            return
+
+        event.listen(self.engine, 'before_cursor_execute', self._before_execute)
+        event.listen(self.engine, 'after_cursor_execute', self._after_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._add_timing_header)
+        app.teardown_request(self._finish_request)
+        logger.info("Instrumentación de consultas SQL activada")
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        if start is None or not has_request_context():
+            return
+        stats = g.get('_query_stats')
+        if stats is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats['count'] += 1
+        stats['time_ms'] += elapsed_ms
+        # Montículo acotado: solo se guardan las slowest_count más lentas de la petición
+        if len(stats['slowest']) < self.slowest_count:
+            heapq.heappush(stats['slowest'], (elapsed_ms, statement))
+        elif elapsed_ms > stats['slowest'][0][0]:
+            heapq.heapreplace(stats['slowest'], (elapsed_ms, statement))
+        if elapsed_ms >= self.slow_query_ms:
+            logger.warning(f"Consulta lenta ({elapsed_ms:.0f} ms) en {request.path}: "
+                           f"{self._normalize(statement)}")
+
+    def _start_request(self):
+        g._query_stats = {'count': 0, 'time_ms': 0.0, 'slowest': []}
+
+    def _add_timing_header(self, response):
+        stats = g.get('_query_stats')
+        if stats is not None:
+            # Visible en la pestaña Network de las herramientas del navegador
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats["time_ms"]:.1f};desc="{stats["count"]} queries"'
+            )
+        return response
+
+    def _finish_request(self, exc=None):
+        stats = g.pop('_query_stats', None)
+        if stats is None:
+            return
+        rule = request.url_rule.rule if request.url_rule else '<sin ruta>'
+        endpoint = f'{request.method} {rule}'
+        with self._lock:
+            totals = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time_ms': 0.0, 'slowest': []
+            })
+            totals['requests'] += 1
+            totals['queries'] += stats['count']
+            totals['max_queries'] = max(totals['max_queries'], stats['count'])
+            totals['db_time_ms'] += stats['time_ms']
+            merged = totals['slowest'] + [(ms, self._normalize(sql)) for ms, sql in stats['slowest']]
+            totals['slowest'] = heapq.nlargest(self.slowest_count, merged, key=lambda s: s[0])
+
+    @staticmethod
+    def _normalize(statement):
+        statement = WHITESPACE_RE.sub(' ', statement).strip()
+        if len(statement) > MAX_STATEMENT_LENGTH:
+            statement = statement[:MAX_STATEMENT_LENGTH] + '...'
+        return statement
+
+    def snapshot(self):
+        """
+        Métricas acumuladas por endpoint y estado del pool de conexiones.
+
+        Returns:
+            dict: endpoints (lista ordenada por tiempo total en la base de datos) y pool
+        """
+        with self._lock:
+            endpoints = []
+            for endpoint, totals in sorted(self._endpoints.items(), key=lambda item: -item[1]['db_time_ms']):
+                requests = totals['requests']
+                endpoints.append({
+                    'endpoint': endpoint,
+                    'requests': requests,
+                    'queries': totals['queries'],
+                    'avg_queries': round(totals['queries'] / requests, 2),
+                    'max_queries': totals['max_queries'],
+                    'db_time_ms': round(totals['db_time_ms'], 2),
+                    'avg_db_time_ms': round(totals['db_time_ms'] / requests, 2),
+                    'slowest': [{'ms': round(ms, 2), 'statement': sql} for ms, sql in totals['slowest']]
+                })
+        return {
+            'enabled': self.enabled,
+            'endpoints': endpoints,
+            'pool': pool_status(self.engine) if self.engine is not None else None
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+query_metrics = QueryMetrics()
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# Carpeta con las series históricas (dos archivos .npy por moneda)
+RATE_HISTORY_PATH = os.getenv(
+    'RATE_HISTORY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'rate_history')
+)
+
+
+class RateHistory:
+    """
+    Series históricas de tasas en formato columnar.
+
+    Cada moneda se guarda como dos arreglos NumPy del mismo largo, ordenados
+    por fecha: <moneda>.dates.npy (datetime64[D]) y <moneda>.values.npy
+    (float64). Se leen con memory-map, así que consultar miles de fechas no
+    carga ni copia la serie completa, y todos los procesos comparten las
+    páginas del archivo.
+    """
+
+    def __init__(self, path=RATE_HISTORY_PATH):
+        self.path = path
+        self._cache = {}
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+    def _files(self, code):
+        return (os.path.join(self.path, f'{code}.dates.npy'),
+                os.path.join(self.path, f'{code}.values.npy'))
+
+    def load(self, code):
+        """
+        Retorna los arreglos (fechas, valores) de una moneda.
+
+        Los arreglos se recargan solo si el archivo cambió (por ejemplo,
+        porque otro proceso ingirió nuevas observaciones).
+        """
+        dates_file, values_file = self._files(code)
+        try:
+            mtime = os.stat(values_file).st_mtime_ns
+        except FileNotFoundError:
+            return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+
+        cached = self._cache.get(code)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        with self._lock:
+            for _ in range(3):
+                dates = np.load(dates_file, mmap_mode='r')
+                values = np.load(values_file, mmap_mode='r')
+                # Otro proceso puede estar entre el reemplazo de ambos archivos
+                if len(dates) == len(values):
+                    break
+                time.sleep(0.01)
+            else:
+                raise RuntimeError(f"Serie histórica inconsistente para {code}")
+            self._cache[code] = (mtime, dates, values)
+        return dates, values
+
+    def ingest(self, code, observations):
+        """
+        Agrega observaciones a la serie, reemplazando las fechas repetidas.
+
+        Args:
+            code (str): Código de moneda
+            observations (list): Tuplas (fecha 'YYYY-MM-DD', valor)
+
+        Returns:
+            int: Largo de la serie después de la ingesta
+        """
+        if not observations:
+            return len(self.load(code)[0])
+
+        new_dates = np.array([obs[0] for obs in observations], dtype='datetime64[D]')
+        new_values = np.array([obs[1] for obs in observations], dtype=np.float64)
+
+        with self._lock:
+            old_dates, old_values = self.load(code)
+            dates = np.concatenate([new_dates, old_dates])
+            values = np.concatenate([new_values, old_values])
+            # np.unique se queda con la primera aparición: las nuevas tienen prioridad
+            dates, first = np.unique(dates, return_index=True)
+            values = values[first]
+
+            dates_file, values_file = self._files(code)
+            # Escritura atómica: se escribe a un temporal y se reemplaza. Las
+            # fechas van primero porque load() detecta cambios por el archivo de valores
+            for target, array in ((dates_file, dates), (values_file, values)):
+                tmp = f'{target}.{os.getpid()}.tmp'
+                with open(tmp, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp, target)
+            self._cache.pop(code, None)
+        return len(dates)
+
+    def rate_on(self, code, date):
+        """
+        Tasa vigente en una fecha: la última observación igual o anterior.
+
+        Args:
+            code (str): Código de moneda
+            date (str | date): Fecha de consulta
+
+        Returns:
+            dict: date y value, o None si la serie no tiene datos hasta esa fecha
+        """
+        dates, values = self.load(code)
+        index = np.searchsorted(dates, np.datetime64(date, 'D'), side='right') - 1
+        if index < 0:
+            return None
+        return {'date': str(dates[index]), 'value': float(values[index])}
+
+    def rates_on(self, code, query_dates):
+        """
+        Versión vectorizada de rate_on para muchas fechas (reportes de órdenes).
+
+        Args:
+            code (str): Código de moneda
+            query_dates (list): Fechas de consulta
+
+        Returns:
+            numpy.ndarray: Tasa vigente por fecha (NaN si no hay datos previos)
+        """
+        dates, values = self.load(code)
+        query = np.asarray(query_dates, dtype='datetime64[D]')
+        index = np.searchsorted(dates, query, side='right') - 1
+        result = np.full(query.shape, np.nan)
+        found = index >= 0
+        result[found] = values[index[found]]
+        return result
+
+    def range(self, code, start, end):
+        """
+        Observaciones entre dos fechas, ambas inclusive.
+
+        Returns:
+            list: Diccionarios con date y value
+        """
+        dates, values = self.load(code)
+        lo = np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+        hi = np.searchsorted(dates, np.datetime64(end, 'D'), side='right')
+        return [
+            {'date': str(d), 'value': float(v)}
+            for d, v in zip(dates[lo:hi].tolist(), values[lo:hi].tolist())
+        ]
+
+    def bounds(self, code):
+        """Primera y última fecha de la serie, o (None, None) si está vacía"""
+        dates, _ = self.load(code)
+        if not len(dates):
+            return None, None
+        return str(dates[0]), str(dates[-1])
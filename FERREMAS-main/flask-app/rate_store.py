@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Archivo SQLite compartido por todos los procesos de la aplicación
+RATE_STORE_PATH = os.getenv(
+    'RATE_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'rates.db')
+)
+
+
+class RateStore:
+    """
+    Almacén local de tasas de cambio indexado por serie y fecha de observación.
+
+    Cada fila guarda el valor publicado por el Banco Central para una fecha y
+    el momento en que se descargó (fetched_at, epoch en segundos), lo que
+    permite calcular la antigüedad de la tasa y decidir si debe refrescarse.
+    """
+
+    def __init__(self, path=RATE_STORE_PATH):
+        self.path = path
+        # Archivo de bloqueo de los procesos que refrescan este almacén (None: en memoria, no se comparte)
+        self.lock_path = None if path == ':memory:' else path + '.lock'
+        self._local = threading.local()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._init_schema()
+
+    def _connection(self):
+        # Una conexión por hilo; SQLite en modo WAL permite lectores concurrentes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rates (
+                    series TEXT NOT NULL,
+                    obs_date TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (series, obs_date)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS fetches (
+                    series TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+
+    def save(self, series, observations, fetched_at=None):
+        """
+        Guarda observaciones de una serie y registra la hora de descarga.
+
+        Args:
+            series (str): Código de moneda (USD, EUR, UF, UTM)
+            observations (list): Tuplas (fecha 'YYYY-MM-DD', valor)
+            fetched_at (float, optional): Epoch de la descarga. Por defecto, ahora
+        """
+        fetched_at = fetched_at or time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO rates (series, obs_date, value, fetched_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (series, obs_date) DO UPDATE SET value = excluded.value, '
+                'fetched_at = excluded.fetched_at',
+                [(series, obs_date, value, fetched_at) for obs_date, value in observations]
+            )
+            conn.execute(
+                'INSERT INTO fetches (series, fetched_at) VALUES (?, ?) '
+                'ON CONFLICT (series) DO UPDATE SET fetched_at = excluded.fetched_at',
+                (series, fetched_at)
+            )
+
+    def latest(self, series, on_date=None):
+        """
+        Retorna la última observación disponible hasta una fecha.
+
+        Args:
+            series (str): Código de moneda
+            on_date (str, optional): Fecha 'YYYY-MM-DD'. Por defecto, sin límite
+
+        Returns:
+            dict: value, date y fetched_at, o None si no hay datos
+        """
+        query = 'SELECT value, obs_date, fetched_at FROM rates WHERE series = ?'
+        params = [series]
+        if on_date:
+            query += ' AND obs_date <= ?'
+            params.append(on_date)
+        row = self._connection().execute(
+            query + ' ORDER BY obs_date DESC LIMIT 1', params
+        ).fetchone()
+        if row is None:
+            return None
+        return {'value': row[0], 'date': row[1], 'fetched_at': row[2]}
+
+    def last_fetch(self, series):
+        """Epoch de la última descarga exitosa de la serie, o None"""
+        row = self._connection().execute(
+            'SELECT fetched_at FROM fetches WHERE series = ?', (series,)
+        ).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,155 @@
+import logging
+
+from sqlalchemy.exc import ProgrammingError
+
+from catalog_service import InvalidQueryError
+from extensions import db
+from models import Product
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'spanish'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_QUERY_LENGTH = 200
+# Umbral de similitud de pg_trgm para la búsqueda tolerante a errores
+FUZZY_THRESHOLD = 0.3
+
+SEARCH_COLUMNS = (
+    Product.id,
+    Product.name,
+    Product.price,
+    Product.image,
+    Product.is_promotion,
+    Product.promotion_price,
+    Product.category_id
+)
+
+
+def parse_search_args(args):
+    """
+    Valida los parámetros de /api/search.
+
+    Args:
+        args (MultiDict): request.args
+
+    Returns:
+        dict: Parámetros normalizados para search_products
+    """
+    query = (args.get('q') or '').strip()
+    if not query:
+        raise InvalidQueryError("El parámetro q es obligatorio")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise InvalidQueryError(f"La búsqueda no puede superar {MAX_QUERY_LENGTH} caracteres")
+
+    try:
+        page = int(args.get('page', 1))
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        category_id = int(args['category_id']) if args.get('category_id') else None
+    except ValueError:
+        raise InvalidQueryError("page, limit y category_id deben ser enteros")
+    if page < 1:
+        raise InvalidQueryError("page debe ser mayor o igual a 1")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidQueryError(f"limit debe estar entre 1 y {MAX_LIMIT}")
+
+    mode = args.get('mode') or None
+    if mode not in (None, 'fulltext', 'fuzzy'):
+        raise InvalidQueryError("mode debe ser fulltext o fuzzy")
+
+    return {'query': query, 'page': page, 'limit': limit, 'category_id': category_id, 'mode': mode}
+
+
+def fulltext_query(query, category_id=None):
+    """
+    Consulta de texto completo sobre products.search_vector (índice GIN).
+
+    websearch_to_tsquery acepta la sintaxis habitual de buscadores
+    ("frase exacta", -excluir, OR) y nunca falla por errores de sintaxis.
+    El nombre pesa más que la descripción (pesos A y B del vector).
+    """
+    tsquery = db.func.websearch_to_tsquery(SEARCH_CONFIG, query)
+    rank = db.func.ts_rank_cd(Product.search_vector, tsquery)
+    stmt = (
+        db.select(*SEARCH_COLUMNS, rank.label('rank'))
+        .where(Product.search_vector.op('@@')(tsquery))
+        .order_by(rank.desc(), Product.id)
+    )
+    if category_id is not None:
+        stmt = stmt.where(Product.category_id == category_id)
+    return stmt
+
+
+def fuzzy_query(query, category_id=None):
+    """
+    Consulta por similitud de trigramas sobre el nombre (pg_trgm).
+
+    Se usa cuando la búsqueda de texto completo no encuentra nada, por
+    ejemplo por errores de tipeo ("talador" en vez de "taladro").
+    """
+    similarity = db.func.similarity(Product.name, query)
+    stmt = (
+        db.select(*SEARCH_COLUMNS, similarity.label('rank'))
+        .where(Product.name.op('%')(query))
+        .order_by(similarity.desc(), Product.id)
+    )
+    if category_id is not None:
+        stmt = stmt.where(Product.category_id == category_id)
+    return stmt
+
+
+def fetch_page(stmt, page, limit):
+    # Se pide una fila extra para saber si hay una página siguiente
+    rows = db.session.execute(stmt.offset((page - 1) * limit).limit(limit + 1)).mappings().all()
+    return rows[:limit], len(rows) > limit
+
+
+def fetch_fuzzy_page(query, category_id, page, limit):
+    try:
+        # El umbral del operador % es local a la transacción
+        db.session.execute(db.text("SELECT set_config('pg_trgm.similarity_threshold', :t, true)"),
+                           {'t': str(FUZZY_THRESHOLD)})
+        return fetch_page(fuzzy_query(query, category_id), page, limit)
+    except ProgrammingError as e:
+        # Sin la extensión pg_trgm la búsqueda sigue funcionando, solo sin tolerancia a errores
+        db.session.rollback()
+        logger.warning(f"Búsqueda aproximada no disponible (¿falta pg_trgm?): {str(e.orig).strip()}")
+        return [], False
+
+
+def search_products(query, page=1, limit=DEFAULT_LIMIT, category_id=None, mode=None):
+    """
+    Busca productos por nombre y descripción.
+
+    Primero intenta la búsqueda de texto completo; si la primera página no
+    tiene resultados, recurre a la búsqueda aproximada por trigramas. Para
+    las páginas siguientes el cliente debe enviar el mode de la respuesta.
+
+    Args:
+        query (str): Texto a buscar
+        page (int): Página (desde 1)
+        limit (int): Resultados por página
+        category_id (int): Filtrar por categoría
+        mode (str): Forzar 'fulltext' o 'fuzzy'. Por defecto se elige automáticamente
+
+    Returns:
+        dict: query, mode, items (con su puntaje rank), page, limit y has_more
+    """
+    if mode in (None, 'fulltext'):
+        rows, has_more = fetch_page(fulltext_query(query, category_id), page, limit)
+        if rows or mode == 'fulltext' or page > 1:
+            used_mode = 'fulltext'
+        else:
+            mode = 'fuzzy'
+    if mode == 'fuzzy':
+        rows, has_more = fetch_fuzzy_page(query, category_id, page, limit)
+        used_mode = 'fuzzy'
+
+    return {
+        'query': query,
+        'mode': used_mode,
+        'items': [dict(row, rank=round(float(row['rank']), 4)) for row in rows],
+        'page': page,
+        'limit': limit,
+        'has_more': has_more
+    }
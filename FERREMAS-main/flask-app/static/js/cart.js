@@ -48,13 +48,6 @@ async function addToCart() {
                 return;
             }
             
-            const isLoggedIn = document.getElementById('user-status')?.value === 'true';
-            
-            if (!isLoggedIn) {
-                window.location.href = '/login';
-                return;
-            }
-            
             try {
                 const requestData = {
                     product_id: parseInt(productId),
@@ -108,7 +101,8 @@ async function addToCart() {
 // Cargar el carrito completo
 async function loadCart() {
     try {
-        const response = await fetch('/api/cart');
+        // Los totales los calcula el servidor (motor de precios)
+        const response = await fetch('/api/cart?totals=1');
         
         // Si la respuesta no es exitosa (ej. no autenticado), mostrar carrito vacío
         if (!response.ok) {
@@ -128,22 +122,22 @@ async function loadCart() {
             return [];
         }
         
-        const cartItems = await response.json();
+        const data = await response.json();
         
         // Actualizar la UI solo si estamos en la página del carrito
         if (document.getElementById('cart-items')) {
-            updateCartUI(cartItems);
+            updateCartUI(data.items, data.totals);
         }
         
-        return cartItems;
+        return data.items;
     } catch (error) {
         console.error('Error:', error);
         return [];
     }
 }
 
-// Actualizar la interfaz del carrito
-function updateCartUI(cartItems) {
+// Actualizar la interfaz del carrito (totals viene del servidor)
+function updateCartUI(cartItems, totals) {
     const cartItemsContainer = document.getElementById('cart-items');
     if (!cartItemsContainer) return;
     
@@ -169,26 +163,23 @@ function updateCartUI(cartItems) {
     }
     
     let cartHTML = '';
-    let total = 0;
     
     cartItems.forEach(item => {
         const product = item.product;
-        let priceToShow = product.price;
         let priceHtml = '';
         // Si el producto está en promoción, mostrar ambos precios
         if (product.is_promotion && product.promotion_price !== null && product.promotion_price !== undefined) {
-            priceToShow = product.promotion_price;
             priceHtml = `<span class="text-decoration-line-through text-muted">$${product.price.toLocaleString('es-CL')}</span> <span class="text-danger ms-2">$${product.promotion_price.toLocaleString('es-CL')}</span>`;
         } else {
             priceHtml = `<span class="h5 mb-0">$${product.price.toLocaleString('es-CL')}</span>`;
         }
-        const itemTotal = item.quantity * priceToShow;
-        total += itemTotal;
+        const itemTotal = item.line_total;
         
         // Preparar la URL de la imagen correctamente
         let imgSrc = product.image;
         if (imgSrc && !imgSrc.startsWith('http') && !imgSrc.startsWith('/static/')) {
-            imgSrc = `/static/images/products/${imgSrc}`;
+            // Las imágenes subidas viven en static/uploads; las de ejemplo en static/images/products
+            imgSrc = imgSrc.startsWith('uploads/') ? `/static/${imgSrc}` : `/static/images/products/${imgSrc}`;
         }
         
         cartHTML += `
@@ -224,10 +215,7 @@ function updateCartUI(cartItems) {
     
     cartItemsContainer.innerHTML = cartHTML;
     
-    // Calcular subtotal e IVA (el precio ya incluye IVA)
-    const subtotal = Math.round(total / 1.19);
-    const tax = total - subtotal;
-    updateCartTotals(subtotal, tax, total);
+    updateCartTotals(totals.subtotal, totals.tax, totals.total);
 }
 
 // Actualizar totales del carrito
@@ -240,32 +228,39 @@ function updateCartTotals(subtotal, tax, total) {
     document.getElementById('cart-total').textContent = `$${total.toFixed(2)}`;
 }
 
+// Aplicar varias operaciones al carrito en una sola solicitud
+// (operations: [{op: 'add' | 'set' | 'remove', product_id, quantity}])
+async function applyCartOperations(operations) {
+    const response = await fetch('/api/cart/batch', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ operations: operations }),
+    });
+    
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || 'Error al actualizar el carrito');
+    }
+    
+    // La respuesta ya trae el carrito completo: no es necesario volver a pedirlo
+    if (document.getElementById('cart-items')) {
+        updateCartUI(data.items, data.totals);
+    }
+    await updateCartCount(data.items);
+    return data;
+}
+
 // Actualizar cantidad de un producto en el carrito
 async function updateQuantity(itemId, newQuantity) {
     if (newQuantity < 1) newQuantity = 1;
     if (newQuantity > 99) newQuantity = 99;
     
     try {
-        const response = await fetch(`/api/cart/update/${itemId}`, {
-            method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ quantity: parseInt(newQuantity) }),
-        });
-        
-        if (!response.ok) {
-            throw new Error('Error al actualizar la cantidad');
-        }
-        
-        // Verificar si estamos en la página del carrito antes de intentar recargar la vista
-        const isCartPage = document.getElementById('cart-items') !== null;
-        if (isCartPage) {
-            await loadCart();
-        }
-        
-        // Actualizar contador del carrito (esto funciona en todas las páginas)
-        await updateCartCount();
+        await applyCartOperations([
+            { op: 'set', product_id: itemId, quantity: parseInt(newQuantity) }
+        ]);
     } catch (error) {
         console.error('Error:', error);
     }
@@ -311,32 +306,8 @@ async function removeItem(itemId) {
                 setTimeout(async () => {
                     cartItem.remove();
                     
-                    // Recalcular totales
-                    const cartItems = await fetch('/api/cart').then(r => r.json());
-                    if (cartItems.length === 0) {
-                        const emptyCartMessage = document.getElementById('empty-cart-message');
-                        const checkoutBtn = document.getElementById('checkout-btn');
-                        
-                        if (emptyCartMessage) {
-                            emptyCartMessage.style.display = 'block';
-                        }
-                        if (checkoutBtn) {
-                            checkoutBtn.disabled = true;
-                        }
-                        
-                        updateCartTotals(0, 0, 0);
-                    } else {
-                        // Calcular nuevos totales
-                        let total = 0;
-                        cartItems.forEach(item => {
-                            total += item.quantity * item.product.price;
-                        });
-                        
-                        // Calcular subtotal e IVA (el precio ya incluye IVA)
-                        const subtotal = Math.round(total / 1.19);
-                        const tax = total - subtotal;
-                        updateCartTotals(subtotal, tax, total);
-                    }
+                    // Recargar el carrito con los totales del servidor
+                    await loadCart();
                 }, 300);
             }
         }
@@ -354,20 +325,22 @@ async function removeItem(itemId) {
     }
 }
 
-// Actualizar el contador del carrito
-async function updateCartCount() {
+// Actualizar el contador del carrito (cartItems opcional, si ya se tiene el carrito)
+async function updateCartCount(cartItems = null) {
     const cartCountElement = document.getElementById('cart-count');
     if (!cartCountElement) return;
     
     try {
-        const response = await fetch('/api/cart');
-        // Si no estamos autenticados o hay otro error, ocultar el contador
-        if (!response.ok) {
-            cartCountElement.style.display = 'none';
-            return;
+        if (cartItems === null) {
+            const response = await fetch('/api/cart');
+            // Si hay un error, ocultar el contador
+            if (!response.ok) {
+                cartCountElement.style.display = 'none';
+                return;
+            }
+            cartItems = await response.json();
         }
         
-        const cartItems = await response.json();
         const count = cartItems.reduce((total, item) => total + item.quantity, 0);
         
         if (count > 0) {
@@ -419,6 +392,12 @@ async function iniciarPago() {
 
         console.log('Respuesta recibida:', response);
 
+        // El carrito anónimo se conserva: se fusiona con el del usuario al iniciar sesión
+        if (response.status === 401) {
+            window.location.href = '/login';
+            return;
+        }
+
         if (!response.ok) {
             const errorData = await response.json();
             console.error('Error en la respuesta:', errorData);
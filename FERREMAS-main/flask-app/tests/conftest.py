@@ -0,0 +1,106 @@
+"""
+Fixtures compartidas por las pruebas.
+
+Las pruebas se ejecutan desde la carpeta flask-app:
+
+    python -m pytest
+
+Usan la base de datos configurada en .env, igual que los benchmarks, y el
+Webpay falso de fakes/webpay.py en vez de Transbank. Los datos que crean
+llevan el prefijo TEST_PREFIX y se eliminan al terminar cada prueba. Si la
+base de datos no está disponible, las pruebas se omiten.
+"""
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import app as flask_app, webpay
+from extensions import db
+from fakes.server import FakeBehavior, start_in_thread
+from fakes.webpay import FakeWebpayServer
+from models import Job, Order, Product, User, WebpayTransaction
+
+TEST_PREFIX = 'TEST-'
+TEST_EMAIL_DOMAIN = 'test.local'
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        try:
+            db.session.execute(db.text('SELECT 1'))
+        except OperationalError as e:
+            pytest.skip(f"Base de datos no disponible: {e.orig}")
+        finally:
+            db.session.rollback()
+    return flask_app
+
+
+@pytest.fixture
+def app_context(app):
+    """App context de la prueba; al salir elimina los datos con TEST_PREFIX"""
+    with app.app_context():
+        cleanup()
+        try:
+            yield
+        finally:
+            db.session.rollback()
+            cleanup()
+
+
+@pytest.fixture
+def user_id(app_context):
+    user = User(username=f'{TEST_PREFIX}buyer', email=f'buyer@{TEST_EMAIL_DOMAIN}', password='x')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+@pytest.fixture
+def product_id(app_context):
+    product = Product(name=f'{TEST_PREFIX}product', price=1990, stock=0)
+    db.session.add(product)
+    db.session.commit()
+    return product.id
+
+
+@pytest.fixture
+def fake_webpay(app):
+    """
+    Fábrica que levanta un Webpay falso con el comportamiento indicado
+    (argumentos de FakeBehavior) y apunta el cliente de Webpay a él.
+    """
+    original = {key: app.config[key] for key in ('WEBPAY_BASE_URL', 'WEBPAY_POOL_SIZE')}
+    servers = []
+
+    def start(pool_size=None, **behavior):
+        server = start_in_thread(FakeWebpayServer(behavior=FakeBehavior(**behavior)))
+        servers.append(server)
+        app.config['WEBPAY_BASE_URL'] = server.base_url
+        if pool_size:
+            app.config['WEBPAY_POOL_SIZE'] = pool_size
+        webpay.init_app(app)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    app.config.update(original)
+    webpay.init_app(app)
+
+
+def operation_counts(server, operation):
+    """Respuestas del servidor falso para una operación, por código HTTP"""
+    return {status: count for (name, status), count in server.counters.items() if name == operation}
+
+
+def cleanup():
+    """Borra usuarios, órdenes, transacciones, jobs y productos creados por las pruebas"""
+    users = db.session.query(User.id).filter(User.username.like(f'{TEST_PREFIX}%')).scalar_subquery()
+    orders = db.session.query(Order.id).filter(Order.user_id.in_(users)).scalar_subquery()
+    WebpayTransaction.query.filter(WebpayTransaction.order_id.in_(orders)).delete(synchronize_session=False)
+    Order.query.filter(Order.user_id.in_(users)).delete(synchronize_session=False)
+    Job.query.filter(Job.payload.like(f'%@{TEST_EMAIL_DOMAIN}%')).delete(synchronize_session=False)
+    Product.query.filter(Product.name.like(f'{TEST_PREFIX}%')).delete(synchronize_session=False)
+    User.query.filter(User.username.like(f'{TEST_PREFIX}%')).delete(synchronize_session=False)
+    db.session.commit()
@@ -0,0 +1,146 @@
+"""
+Conciliación de pagos sin retorno (payment_reconciler) contra el Webpay falso.
+
+Como el benchmark, reconcile_payments recorre todas las transacciones
+pendientes de la base de datos; las de las pruebas se crean con la
+antigüedad de cada escenario.
+"""
+import json
+import secrets
+from collections import Counter
+
+from app import app, webpay
+from extensions import db
+from models import Job, Order, OrderItem, Product, WebpayTransaction
+from payment_reconciler import ABANDON_AFTER_SECONDS, RECONCILE_AFTER_SECONDS, reconcile_payments
+from tests.conftest import operation_counts
+
+STOCK = 1000
+BATCH_SIZE = 30
+CONCURRENCY = 8
+
+# Escenario -> (cantidad, estado final esperado de la transacción)
+SCENARIOS = {
+    'paid': (40, 'completed'),             # pagada en Transbank, sin resultado en la base
+    'declined': (20, 'failed'),            # rechazada en Transbank
+    'abandoned': (20, 'cancelled'),        # sin pago y más antigua que el plazo de abandono
+    'unknown_token': (5, 'cancelled'),     # Transbank no conoce el token (4xx)
+    'recent': (10, 'initiated'),           # sin pago pero aún dentro del plazo
+    'no_token': (5, 'failed'),             # nunca llegó a Webpay
+}
+
+# Estado de la orden según el de su transacción
+ORDER_STATUS = {'completed': 'completed', 'failed': 'failed', 'cancelled': 'cancelled', 'initiated': 'pending'}
+
+
+def create_stuck_payments(server, user_id, product_id, kinds):
+    """Órdenes pendientes con una unidad reservada y su transacción según el escenario; retorna {order_id: escenario}"""
+    order_ids = db.session.execute(
+        db.insert(Order).returning(Order.id),
+        [{'user_id': user_id, 'total_amount': 1990, 'status': 'pending'} for _ in kinds]
+    ).scalars().all()
+    db.session.execute(db.insert(OrderItem), [
+        {'order_id': order_id, 'product_id': product_id, 'quantity': 1, 'price_at_time': 1990}
+        for order_id in order_ids
+    ])
+    db.session.execute(db.update(Product).where(Product.id == product_id).values(stock=STOCK - len(order_ids)))
+
+    for order_id, kind in zip(order_ids, kinds):
+        buy_order = f'OC-{order_id}'
+        token = None
+        if kind == 'unknown_token':
+            token = secrets.token_hex(32)
+        elif kind != 'no_token':
+            token = webpay.tx.create(buy_order, str(user_id), 1990, 'http://localhost/retorno-webpay')['token']
+            if kind == 'paid':
+                webpay.tx.commit(token)
+            elif kind == 'declined':
+                server.state.transactions[token]['status'] = 'FAILED'
+        age = RECONCILE_AFTER_SECONDS + 60 if kind == 'recent' else ABANDON_AFTER_SECONDS + 60
+        db.session.execute(db.insert(WebpayTransaction).values(
+            order_id=order_id, buy_order=buy_order, token_ws=token, amount=1990, session_id=str(user_id),
+            status='initiated', created_at=db.func.now() - db.text(f"interval '{age} seconds'")
+        ))
+    db.session.commit()
+    return dict(zip(order_ids, kinds))
+
+
+def reconcile():
+    return reconcile_payments(webpay, batch_size=BATCH_SIZE, concurrency=CONCURRENCY,
+                              reconcile_after=RECONCILE_AFTER_SECONDS, abandon_after=ABANDON_AFTER_SECONDS)
+
+
+def statuses(order_ids):
+    """(estado de la transacción, estado de la orden) por orden"""
+    db.session.expire_all()
+    return {
+        order_id: (transaction_status, order_status)
+        for order_id, transaction_status, order_status in db.session.execute(
+            db.select(WebpayTransaction.order_id, WebpayTransaction.status, Order.status)
+            .join(Order, Order.id == WebpayTransaction.order_id)
+            .where(Order.id.in_(order_ids))
+        )
+    }
+
+
+def stock(product_id):
+    return db.session.scalar(db.select(Product.stock).where(Product.id == product_id))
+
+
+def receipts_by_order():
+    jobs = Job.query.filter(Job.kind == 'send_receipt', Job.payload.like('%@test.local%')).all()
+    return Counter(json.loads(job.payload)['order_id'] for job in jobs)
+
+
+def test_reconcile_resolves_stuck_payments(user_id, product_id, fake_webpay):
+    server = fake_webpay(latency={'status': 0.01}, pool_size=CONCURRENCY)
+    kinds = create_stuck_payments(server, user_id, product_id,
+                                  [kind for kind, (count, _) in SCENARIOS.items() for _ in range(count)])
+    server.counters.clear()
+
+    counts = reconcile()
+
+    expected = {order_id: (SCENARIOS[kind][1], ORDER_STATUS[SCENARIOS[kind][1]]) for order_id, kind in kinds.items()}
+    assert statuses(kinds) == expected
+    assert counts == Counter(SCENARIOS[kind][1] for kind in kinds.values())
+    # Una consulta de estado por transacción con token
+    with_token = sum(1 for kind in kinds.values() if kind != 'no_token')
+    assert sum(operation_counts(server, 'status').values()) == with_token
+
+    # Solo siguen reservadas las unidades de las pagadas y de las que siguen en initiated
+    reserved = sum(1 for kind in kinds.values() if SCENARIOS[kind][1] in ('completed', 'initiated'))
+    assert stock(product_id) == STOCK - reserved
+    paid = [order_id for order_id, kind in kinds.items() if kind == 'paid']
+    assert receipts_by_order() == Counter(paid)
+
+    # Una segunda pasada solo vuelve a consultar las recientes y no cambia nada
+    again = reconcile()
+    assert again == Counter({'initiated': SCENARIOS['recent'][0]})
+    assert statuses(kinds) == expected
+    assert stock(product_id) == STOCK - reserved
+    assert receipts_by_order() == Counter(paid)
+
+
+def test_reconcile_keeps_payments_while_transbank_fails(user_id, product_id, fake_webpay):
+    server = fake_webpay(pool_size=CONCURRENCY)
+    kinds = create_stuck_payments(server, user_id, product_id, ['paid'] * 5 + ['abandoned'] * 5)
+
+    # Transbank responde 500 a todo: sin respuesta no se cancela ni se libera stock
+    server.behavior.error_rate = 1.0
+    counts = reconcile()
+
+    assert counts == Counter({'initiated': len(kinds)})
+    assert statuses(kinds) == {order_id: ('initiated', 'pending') for order_id in kinds}
+    assert stock(product_id) == STOCK - len(kinds)
+    assert receipts_by_order() == Counter()
+
+    # Con Transbank de vuelta (cliente nuevo, circuito cerrado) se resuelven
+    server.behavior.error_rate = 0.0
+    webpay.init_app(app)
+    reconcile()
+
+    expected = {order_id: ('completed', 'completed') if kind == 'paid' else ('cancelled', 'cancelled')
+                for order_id, kind in kinds.items()}
+    assert statuses(kinds) == expected
+    assert stock(product_id) == STOCK - 5
+    assert receipts_by_order() == Counter(order_id for order_id, kind in kinds.items() if kind == 'paid')
@@ -0,0 +1,119 @@
+"""
+Retorno de Webpay concurrente (payment_service.confirm_payment vía /retorno-webpay).
+
+Transbank reintenta el retorno y el usuario puede enviar el formulario dos
+veces: cada token debe confirmarse una sola vez en Transbank, encolar un
+solo comprobante por orden y entregar el mismo resultado a todos los
+retornos.
+"""
+import json
+import threading
+from collections import Counter
+
+import pytest
+
+from app import webpay
+from extensions import db
+from models import Job, Order, WebpayTransaction
+from tests.conftest import operation_counts
+
+ORDERS = 5
+CALLBACKS = 8
+COMMIT_LATENCY = 0.2
+
+
+def create_payments(user_id):
+    """Órdenes pendientes con su transacción creada en el Webpay falso; retorna {token: order_id}"""
+    payments = {}
+    for _ in range(ORDERS):
+        order = Order(user_id=user_id, total_amount=1990, status='pending')
+        db.session.add(order)
+        db.session.flush()
+        buy_order = f'OC-{order.id}'
+        created = webpay.create_transaction(amount=1990, buy_order=buy_order, session_id=str(user_id),
+                                            return_url='http://localhost/retorno-webpay')
+        db.session.add(WebpayTransaction(order=order, buy_order=buy_order, token_ws=created['token'],
+                                         amount=1990, session_id=str(user_id)))
+        payments[created['token']] = order.id
+    db.session.commit()
+    return payments
+
+
+def webpay_return(client, token_ws):
+    """Resultado (status de /comprobante-pago) de un retorno de Webpay"""
+    response = client.get('/retorno-webpay', query_string={'token_ws': token_ws})
+    assert response.status_code == 302
+    return response.headers['Location'].rsplit('status=', 1)[-1]
+
+
+def concurrent_returns(app, tokens):
+    """CALLBACKS retornos por token, liberados a la vez; retorna los resultados por token"""
+    outcomes = {token: [] for token in tokens}
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(len(tokens) * CALLBACKS)
+
+    def worker(token):
+        try:
+            with app.app_context():
+                client = app.test_client()
+                barrier.wait()
+                outcome = webpay_return(client, token)
+            with lock:
+                outcomes[token].append(outcome)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(token,)) for token in tokens for _ in range(CALLBACKS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return outcomes
+
+
+def receipts_by_order():
+    jobs = Job.query.filter(Job.kind == 'send_receipt', Job.payload.like('%@test.local%')).all()
+    return Counter(json.loads(job.payload)['order_id'] for job in jobs)
+
+
+@pytest.mark.parametrize('decline_rate, outcome, status', [
+    (0.0, 'success', 'completed'),
+    (1.0, 'error', 'failed'),
+])
+def test_concurrent_returns_commit_once(app, user_id, fake_webpay, decline_rate, outcome, status):
+    server = fake_webpay(latency={'commit': COMMIT_LATENCY}, decline_rate=decline_rate)
+    payments = create_payments(user_id)
+
+    outcomes = concurrent_returns(app, list(payments))
+
+    # Un commit exitoso por token y ninguno rechazado por repetido
+    assert operation_counts(server, 'commit') == {200: ORDERS}
+    assert outcomes == {token: [outcome] * CALLBACKS for token in payments}
+
+    db.session.expire_all()
+    transactions = WebpayTransaction.query.filter(WebpayTransaction.token_ws.in_(list(payments))).all()
+    assert {transaction.token_ws: transaction.status for transaction in transactions} == \
+        {token: status for token in payments}
+    orders = Order.query.filter(Order.id.in_(list(payments.values()))).all()
+    assert {order.status for order in orders} == {status}
+
+    expected = Counter(payments.values()) if outcome == 'success' else Counter()
+    assert receipts_by_order() == expected
+
+
+def test_repeated_return_uses_stored_result(app, user_id, fake_webpay):
+    server = fake_webpay()
+    payments = create_payments(user_id)
+    token = next(iter(payments))
+    client = app.test_client()
+
+    assert webpay_return(client, token) == 'success'
+    server.counters.clear()
+    assert [webpay_return(client, token) for _ in range(3)] == ['success'] * 3
+
+    # La transacción ya está cerrada: no hay llamadas a Transbank ni comprobantes nuevos
+    assert server.counters == {}
+    assert receipts_by_order() == Counter({payments[token]: 1})
@@ -1,14 +1,107 @@
-from transbank.webpay.webpay_plus.transaction import Transaction, WebpayOptions
-from transbank.common.integration_type import IntegrationType
+from transbank.common.api_constants import ApiConstants
+from transbank.common.integration_type import IntegrationType, webpay_host
+from transbank.common.validation_util import ValidationUtil
+from transbank.error.transbank_error import TransbankError
+from transbank.error.transaction_create_error import TransactionCreateError
+from transbank.error.transaction_commit_error import TransactionCommitError
+from transbank.error.transaction_status_error import TransactionStatusError
+from transbank.error.transaction_refund_error import TransactionRefundError
 import os
 from dotenv import load_dotenv
 from datetime import datetime
+from decimal import Decimal
 import uuid
-import json
+import logging
+from metrics import metrics
+from http_client import outbound
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Credenciales públicas del ambiente de integración de Transbank
+TEST_COMMERCE_CODE = "597055555532"
+TEST_API_KEY = "579B532A7440BB0C9079DED94D31EA1615BACEB56610332264630D42D0A36B1C"
+
+WEBPAY_ENDPOINT = "/rswebpaytransaction/api/webpay/v1.2/transactions"
+
+
+class RestTransaction:
+    """
+    Cliente de la API REST de Webpay Plus contra una URL base configurable.
+
+    Usa las mismas rutas, cabeceras y errores que el SDK, pero el SDK fija el
+    host según el tipo de integración y abre una conexión nueva por llamada.
+    Este cliente permite apuntar a otro servidor (por ejemplo, el Webpay falso
+    de fakes/webpay.py) y usa el cliente 'webpay' de http_client: pool de
+    conexiones compartido por los hilos del proceso (nunca más de pool_size
+    conexiones simultáneas), circuit breaker y reintentos solo para status,
+    que es idempotente. Con el circuito abierto las llamadas fallan de
+    inmediato con CircuitOpenError en vez de esperar el timeout.
+
+    Se usa en todos los ambientes, también en producción, en lugar de
+    Transaction del SDK. Cada método aplica antes de llamar a Webpay las
+    mismas validaciones que el SDK (ValidationUtil: textos vacíos y largos
+    máximos de ApiConstants) y además exige un monto positivo, de modo que un
+    valor inválido lanza TransbankError sin llegar a Transbank.
+    """
+
+    def __init__(self, base_url, commerce_code, api_key, timeout=10, pool_size=10):
+        self.http = outbound.configure('webpay', base_url=base_url.rstrip('/') + WEBPAY_ENDPOINT,
+                                       timeout=timeout, pool_size=pool_size)
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Tbk-Api-Key-Id': commerce_code,
+            'Tbk-Api-Key-Secret': api_key
+        }
+
+    def _request(self, method, path, error_class, payload=None):
+        response = self.http.request(method, path, json=payload, headers=self.headers)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if not 200 <= response.status_code < 300:
+            message = data.get('error_message') if isinstance(data, dict) else None
+            raise error_class(message or f"HTTP {response.status_code}", response.status_code)
+        return data
+
+    @staticmethod
+    def _validate_token(token):
+        ValidationUtil.has_text_with_max_length(token, ApiConstants.TOKEN_LENGTH, "token")
+
+    @staticmethod
+    def _validate_amount(amount):
+        if isinstance(amount, bool) or not isinstance(amount, (int, float, Decimal)) or amount <= 0:
+            raise TransbankError("'amount' must be a positive number")
+
+    def create(self, buy_order, session_id, amount, return_url):
+        ValidationUtil.has_text_with_max_length(buy_order, ApiConstants.BUY_ORDER_LENGTH, "buy_order")
+        ValidationUtil.has_text_with_max_length(session_id, ApiConstants.SESSION_ID_LENGTH, "session_id")
+        ValidationUtil.has_text_with_max_length(return_url, ApiConstants.RETURN_URL_LENGTH, "return_url")
+        self._validate_amount(amount)
+        return self._request('POST', '/', TransactionCreateError, {
+            'buy_order': buy_order,
+            'session_id': session_id,
+            'amount': amount,
+            'return_url': return_url
+        })
+
+    def commit(self, token):
+        self._validate_token(token)
+        return self._request('PUT', f'/{token}', TransactionCommitError, {})
+
+    def status(self, token):
+        self._validate_token(token)
+        return self._request('GET', f'/{token}', TransactionStatusError)
+
+    def refund(self, token, amount):
+        self._validate_token(token)
+        self._validate_amount(amount)
+        return self._request('POST', f'/{token}/refunds', TransactionRefundError, {'amount': amount})
+
+
 class WebpayPlus:
     def __init__(self, app=None):
         self.app = app
@@ -17,21 +110,20 @@ class WebpayPlus:
     
     def init_app(self, app):
         self.app = app
-        # Configurar Webpay en modo integración
-        integration_type = IntegrationType.TEST
-        commerce_code = "597055555532"  # Código de comercio de prueba
-        api_key = "579B532A7440BB0C9079DED94D31EA1615BACEB56610332264630D42D0A36B1C"  # Clave de prueba
+        # Por defecto, ambiente de integración con las credenciales de prueba
+        commerce_code = app.config.get('WEBPAY_COMMERCE_CODE') or TEST_COMMERCE_CODE
+        api_key = app.config.get('WEBPAY_API_KEY') or TEST_API_KEY
+        integration_type = IntegrationType[app.config.get('WEBPAY_INTEGRATION_TYPE') or 'TEST']
+        # Host de Transbank según el ambiente, o un servidor alternativo (Webpay falso)
+        base_url = app.config.get('WEBPAY_BASE_URL') or webpay_host(integration_type)
         
-        print("\n=== CONFIGURACIÓN DE WEBPAY ===")
-        print(f"Tipo de integración: {integration_type}")
-        print(f"Código de comercio: {commerce_code}")
-        print(f"API Key: {api_key[:10]}...{api_key[-10:]}")
+        logger.info("Webpay Plus configurado",
+                    extra={'integration_type': str(integration_type), 'base_url': base_url,
+                           'commerce_code': commerce_code})
         
-        self.tx = Transaction(WebpayOptions(
-            commerce_code=commerce_code,
-            api_key=api_key,
-            integration_type=integration_type
-        ))
+        self.tx = RestTransaction(base_url, commerce_code, api_key,
+                                  timeout=app.config.get('WEBPAY_TIMEOUT', 10),
+                                  pool_size=app.config.get('WEBPAY_POOL_SIZE', 10))
     
     def generate_buy_order(self):
         """Genera un número de orden único"""
@@ -40,24 +132,20 @@ class WebpayPlus:
     def create_transaction(self, amount, buy_order, session_id, return_url):
         """Crea una transacción en Webpay Plus"""
         try:
-            print("\n=== CREANDO TRANSACCIÓN EN WEBPAY ===")
-            print("Datos de entrada:")
-            print(f"- Monto: {amount}")
-            print(f"- Orden de compra: {buy_order}")
-            print(f"- ID de sesión: {session_id}")
-            print(f"- URL de retorno: {return_url}")
-            
+            logger.info("Creando transacción en Webpay",
+                        extra={'buy_order': buy_order, 'amount': amount, 'return_url': return_url})
+
             # Crear la transacción usando la instancia de Transaction
-            response = self.tx.create(
-                buy_order=buy_order,
-                session_id=session_id,
-                amount=amount,
-                return_url=return_url
-            )
-            
-            print("\nRespuesta de Webpay:")
-            print(json.dumps(response, indent=2))
-            
+            with metrics.timer('webpay', 'create'):
+                response = self.tx.create(
+                    buy_order=buy_order,
+                    session_id=session_id,
+                    amount=amount,
+                    return_url=return_url
+                )
+            
+            logger.debug("Respuesta de Webpay create", extra={'buy_order': buy_order, 'response': response})
+
             # La respuesta de Webpay puede tener token/token_ws y url
             if isinstance(response, dict):
                 token = response.get('token_ws') or response.get('token')
@@ -67,8 +155,8 @@ class WebpayPlus:
                 url = getattr(response, 'url', None)
             
             if not token or not url:
-                print("Error: No se pudo obtener token o url de la respuesta")
-                print("Respuesta completa:", response)
+                logger.error("Respuesta de Webpay sin token o url",
+                             extra={'buy_order': buy_order, 'response': response})
                 raise ValueError("Respuesta de Webpay inválida")
             
             # Preparar la respuesta en el formato que espera el frontend
@@ -77,67 +165,53 @@ class WebpayPlus:
                 'url': url
             }
             
-            print("\nDatos de redirección preparados:")
-            print(json.dumps(result, indent=2))
             return result
-            
-        except Exception as e:
-            print("\n=== ERROR AL CREAR TRANSACCIÓN ===")
-            print(f"Error: {str(e)}")
-            print(f"Tipo de error: {type(e)}")
-            import traceback
-            print("Traceback completo:")
-            print(traceback.format_exc())
+
+        except Exception:
+            logger.exception("Error al crear la transacción en Webpay", extra={'buy_order': buy_order})
             raise
     
     def commit_transaction(self, token):
         """Confirma una transacción en Webpay Plus"""
         try:
-            print(f"\n=== CONFIRMANDO TRANSACCIÓN ===")
-            print(f"Token: {token}")
-            
-            response = self.tx.commit(token=token)
+            logger.info("Confirmando transacción en Webpay")
+
+            with metrics.timer('webpay', 'commit'):
+                response = self.tx.commit(token=token)
             
-            print("\nRespuesta de commit:")
-            print(json.dumps(response, indent=2))
+            logger.debug("Respuesta de Webpay commit", extra={'response': response})
             return response
-            
-        except Exception as e:
-            print("\n=== ERROR AL CONFIRMAR TRANSACCIÓN ===")
-            print(f"Error: {str(e)}")
+
+        except Exception:
+            logger.exception("Error al confirmar la transacción en Webpay")
             raise
     
     def status(self, token):
         """Consulta el estado de una transacción"""
         try:
-            print(f"\n=== CONSULTANDO ESTADO DE TRANSACCIÓN ===")
-            print(f"Token: {token}")
-            
-            response = self.tx.status(token=token)
+            logger.info("Consultando estado de transacción en Webpay")
+
+            with metrics.timer('webpay', 'status'):
+                response = self.tx.status(token=token)
             
-            print("\nRespuesta de status:")
-            print(json.dumps(response, indent=2))
+            logger.debug("Respuesta de Webpay status", extra={'response': response})
             return response
-            
-        except Exception as e:
-            print("\n=== ERROR AL CONSULTAR ESTADO ===")
-            print(f"Error: {str(e)}")
+
+        except Exception:
+            logger.exception("Error al consultar el estado en Webpay")
             raise
     
     def refund(self, token, amount):
         """Realiza la devolución de una transacción"""
         try:
-            print(f"\n=== INICIANDO DEVOLUCIÓN ===")
-            print(f"Token: {token}")
-            print(f"Monto: {amount}")
-            
-            response = self.tx.refund(token=token, amount=amount)
+            logger.info("Solicitando devolución en Webpay", extra={'amount': amount})
+
+            with metrics.timer('webpay', 'refund'):
+                response = self.tx.refund(token=token, amount=amount)
             
-            print("\nRespuesta de refund:")
-            print(json.dumps(response, indent=2))
+            logger.debug("Respuesta de Webpay refund", extra={'response': response})
             return response
-            
-        except Exception as e:
-            print("\n=== ERROR AL REALIZAR DEVOLUCIÓN ===")
-            print(f"Error: {str(e)}")
+
+        except Exception:
+            logger.exception("Error al realizar la devolución en Webpay")
             raise 
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Workers de la cola de jobs (correos y tareas posteriores al pago).
+
+El primer proceso también concilia periódicamente las transacciones Webpay
+sin retorno (ver payment_reconciler.py) y consolida los resúmenes diarios de
+ventas (ver analytics.py).
+
+Uso:
+    python worker.py --processes 2 --reconcile-interval 60 --rollup-interval 30
+"""
+import argparse
+import multiprocessing
+import signal
+import threading
+
+
+def run_process(batch_size, poll_interval, reconcile_interval=0, rollup_interval=0):
+    # Cada proceso importa la app por separado para tener su propio pool de conexiones
+    from app import app, webpay
+    from analytics import AnalyticsRollup
+    from jobs import run_worker
+    from payment_reconciler import PaymentReconciler
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    reconciler = None
+    if reconcile_interval > 0:
+        reconciler = PaymentReconciler(app, webpay, interval=reconcile_interval)
+        reconciler.start()
+    rollup = None
+    if rollup_interval > 0:
+        rollup = AnalyticsRollup(app, interval=rollup_interval)
+        rollup.start()
+    try:
+        run_worker(app, batch_size=batch_size, poll_interval=poll_interval, should_stop=stop.is_set)
+    finally:
+        if reconciler:
+            reconciler.stop()
+        if rollup:
+            rollup.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workers de la cola de jobs de Ferremas')
+    parser.add_argument('--processes', type=int, default=1, help='Cantidad de procesos worker')
+    parser.add_argument('--batch-size', type=int, default=10, help='Jobs reclamados por iteración')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Segundos de espera con la cola vacía')
+    parser.add_argument('--reconcile-interval', type=float, default=60,
+                        help='Segundos entre conciliaciones de pagos Webpay (0 = desactivada)')
+    parser.add_argument('--rollup-interval', type=float, default=30,
+                        help='Segundos entre actualizaciones de los resúmenes de ventas (0 = desactivada)')
+    args = parser.parse_args()
+
+    if args.processes == 1:
+        run_process(args.batch_size, args.poll_interval, args.reconcile_interval, args.rollup_interval)
+        return
+
+    # Basta un conciliador y un consolidador: las demás instancias solo competirían por los mismos lotes
+    processes = [
+        multiprocessing.Process(target=run_process,
+                                args=(args.batch_size, args.poll_interval,
+                                      args.reconcile_interval if i == 0 else 0,
+                                      args.rollup_interval if i == 0 else 0))
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+if __name__ == '__main__':
+    main()